@@ -5,19 +5,9 @@ RETURNS TABLE(id INTEGER) AS $$
 BEGIN
     RETURN QUERY
     SELECT DISTINCT kr.kohde_id
-    FROM jkr.kohteen_rakennukset kr
-    WHERE EXISTS (
-        SELECT 1
-        FROM jkr.rakennus r
-        WHERE 
-            kr.rakennus_id = r.id
-            AND EXISTS (
-                SELECT 1
-                FROM jkr.taajama t
-                WHERE
-                    t.vaesto_lkm >= min_vaesto_lkm AND ST_Contains(t.geom, r.geom)
-            ) 
-    );
+    FROM jkr.rakennuksen_taajama rt
+    JOIN jkr.kohteen_rakennukset kr ON kr.rakennus_id = rt.rakennus_id
+    WHERE rt.vaesto_lkm >= min_vaesto_lkm;
 END;
 $$ LANGUAGE plpgsql;
 
@@ -75,25 +65,21 @@ BEGIN
             )
         )
         AND (is_taajama_yli_10000 IS NULL OR
-            (
-                is_taajama_yli_10000 = true
-                AND k.id IN (SELECT kohde_ids_in_taajama FROM jkr.kohde_ids_in_taajama(10000))
-            )
-            OR (
-                is_taajama_yli_10000 = false
-                AND k.id NOT IN (SELECT kohde_ids_in_taajama FROM jkr.kohde_ids_in_taajama(10000))
+            is_taajama_yli_10000 = EXISTS (
+                SELECT 1
+                FROM jkr.kohteen_rakennukset kr
+                JOIN jkr.rakennuksen_taajama rt ON rt.rakennus_id = kr.rakennus_id
+                WHERE kr.kohde_id = k.id AND rt.vaesto_lkm >= 10000
             )
         )
         AND (is_taajama_yli_200 IS NULL OR
-            (
-                is_taajama_yli_200 = true
-                AND k.id IN (SELECT kohde_ids_in_taajama FROM jkr.kohde_ids_in_taajama(200))
-            )
-            OR (
-                is_taajama_yli_200 = false
-                AND k.id NOT IN (SELECT kohde_ids_in_taajama FROM jkr.kohde_ids_in_taajama(200))
+            is_taajama_yli_200 = EXISTS (
+                SELECT 1
+                FROM jkr.kohteen_rakennukset kr
+                JOIN jkr.rakennuksen_taajama rt ON rt.rakennus_id = kr.rakennus_id
+                WHERE kr.kohde_id = k.id AND rt.vaesto_lkm >= 200
             )
-        ) 
+        )
         AND (kohde_tyyppi_id IS NULL OR k.kohdetyyppi_id = kohde_tyyppi_id)
         AND (onko_viemari IS NULL OR
             (
@@ -463,49 +449,20 @@ BEGIN
 				KR.KOHDE_ID = K.ID
 		),
 		(
-			SELECT
-				T.NIMI
-			FROM
-				JKR.TAAJAMA T
-			WHERE
-				T.vaesto_lkm >= 10000
-				AND EXISTS (
-					SELECT
-						1
-					FROM
-						JKR.RAKENNUS R
-					WHERE
-						ST_CONTAINS (T.GEOM, R.GEOM)
-						AND EXISTS (
-							SELECT
-								1
-							FROM
-								JKR.KOHTEEN_RAKENNUKSET KR
-							WHERE
-								KR.KOHDE_ID = K.ID
-								AND KR.RAKENNUS_ID = R.ID
-						)
-				)
+			SELECT t.nimi
+			FROM jkr.kohteen_rakennukset kr
+			JOIN jkr.rakennuksen_taajama rt ON rt.rakennus_id = kr.rakennus_id
+			JOIN jkr.taajama t ON t.id = rt.taajama_id
+			WHERE kr.kohde_id = k.id AND rt.vaesto_lkm >= 10000
 			LIMIT 1
 		),
 		(
 			SELECT t.nimi
-				FROM jkr.taajama t
-				WHERE 
-					t.vaesto_lkm >= 200
-					AND EXISTS (
-						SELECT 1
-						FROM jkr.rakennus r
-						WHERE
-							ST_Contains(t.geom, r.geom)
-		                    AND EXISTS (
-		                        SELECT 1
-		                        FROM jkr.kohteen_rakennukset kr
-		                        WHERE
-		                            kr.kohde_id = k.id AND kr.rakennus_id = r.id
-		                    )
-		            ) 
-		        LIMIT 1
+			FROM jkr.kohteen_rakennukset kr
+			JOIN jkr.rakennuksen_taajama rt ON rt.rakennus_id = kr.rakennus_id
+			JOIN jkr.taajama t ON t.id = rt.taajama_id
+			WHERE kr.kohde_id = k.id AND rt.vaesto_lkm >= 200
+			LIMIT 1
 		),
         kt.selite as kohdetyyppi,
         v.viemariverkosto_alkupvm as viemarissa
@@ -1520,6 +1477,23 @@ BEGIN
         onko_viemari
     ) AS id;
 
+    -- Jos tarkastelupäivän rivit on laskettu valmiiksi (jkr.paivita_raportin_kohteet),
+    -- luetaan suodatettujen kohteiden rivit taulusta jkr.raportti_kohde.
+    IF EXISTS (
+        SELECT 1
+        FROM jkr.raportti_kohde_paivitys p
+        WHERE p.tarkastelupvm = print_report.tarkastelupvm
+    ) THEN
+        RETURN QUERY
+        SELECT rk.*
+        FROM jkr.raportti_kohde rk
+        WHERE
+            rk.tarkastelupvm_out = print_report.tarkastelupvm
+            AND rk.kohde_id = ANY(kohde_ids)
+        ORDER BY rk.kohde_id;
+        RETURN;
+    END IF;
+
     RETURN QUERY
     SELECT
         fil.kohde_id,
@@ -1698,3 +1672,100 @@ BEGIN
     ) rak ON fil.kohde_id = rak.kohde_id;
 END;
 $$ LANGUAGE plpgsql;
+
+
+-- Valmiiksi lasketut rivit ovat taulussa jkr.raportti_kohde, joka luodaan
+-- migraatiossa V3.05.29. Tarkistetaan, että taulun sarakkeet vastaavat yhä
+-- print_report-funktion sarakkeita. Jos funktion sarakkeita muutetaan, taulu
+-- muutetaan uudella versioidulla migraatiolla.
+DO $$
+DECLARE
+    taulun_sarakkeet TEXT;
+    funktion_sarakkeet TEXT;
+BEGIN
+    CREATE TEMP TABLE print_report_sarakkeet AS
+    SELECT * FROM jkr.print_report(NULL, NULL, NULL, NULL, NULL, NULL, NULL)
+    WITH NO DATA;
+
+    SELECT string_agg(a.attname || ' ' || format_type(a.atttypid, a.atttypmod), ', ' ORDER BY a.attnum)
+    INTO taulun_sarakkeet
+    FROM pg_attribute a
+    WHERE a.attrelid = 'jkr.raportti_kohde'::regclass AND a.attnum > 0 AND NOT a.attisdropped;
+
+    SELECT string_agg(a.attname || ' ' || format_type(a.atttypid, a.atttypmod), ', ' ORDER BY a.attnum)
+    INTO funktion_sarakkeet
+    FROM pg_attribute a
+    WHERE a.attrelid = 'pg_temp.print_report_sarakkeet'::regclass AND a.attnum > 0 AND NOT a.attisdropped;
+
+    DROP TABLE print_report_sarakkeet;
+
+    IF taulun_sarakkeet IS DISTINCT FROM funktion_sarakkeet THEN
+        RAISE EXCEPTION 'jkr.raportti_kohde-taulun sarakkeet eivät vastaa jkr.print_report-funktiota. Muuta taulua versioidulla migraatiolla.';
+    END IF;
+END;
+$$;
+
+
+-- Laskee tarkastelupäivän raporttirivit kaikille kohteille ja palauttaa
+-- kohteiden määrän. Vanhat rivit poistetaan ensin, joten print_report laskee
+-- rivit tässä suoraan lähdetauluista.
+CREATE OR REPLACE FUNCTION jkr.paivita_raportin_kohteet(tarkastelupvm DATE)
+RETURNS INTEGER AS $$
+DECLARE
+    kohteita INTEGER;
+BEGIN
+    DELETE FROM jkr.raportti_kohde_paivitys p
+    WHERE p.tarkastelupvm = paivita_raportin_kohteet.tarkastelupvm;
+    DELETE FROM jkr.raportti_kohde rk
+    WHERE rk.tarkastelupvm_out = paivita_raportin_kohteet.tarkastelupvm;
+
+    INSERT INTO jkr.raportti_kohde
+    SELECT * FROM jkr.print_report(paivita_raportin_kohteet.tarkastelupvm, NULL, 0, NULL, NULL, NULL, NULL);
+    GET DIAGNOSTICS kohteita = ROW_COUNT;
+
+    INSERT INTO jkr.raportti_kohde_paivitys (tarkastelupvm, kohteita)
+    VALUES (paivita_raportin_kohteet.tarkastelupvm, kohteita);
+    RETURN kohteita;
+END;
+$$ LANGUAGE plpgsql;
+
+
+-- Poistaa tarkastelupäivän valmiiksi lasketut rivit tai kaikki rivit, jos
+-- päivää ei anneta. Tämän jälkeen print_report laskee rivit lähdetauluista.
+CREATE OR REPLACE FUNCTION jkr.poista_raportin_kohteet(tarkastelupvm DATE DEFAULT NULL)
+RETURNS void AS $$
+BEGIN
+    IF tarkastelupvm IS NULL THEN
+        DELETE FROM jkr.raportti_kohde_paivitys;
+        DELETE FROM jkr.raportti_kohde;
+    ELSE
+        DELETE FROM jkr.raportti_kohde_paivitys p
+        WHERE p.tarkastelupvm = poista_raportin_kohteet.tarkastelupvm;
+        DELETE FROM jkr.raportti_kohde rk
+        WHERE rk.tarkastelupvm_out = poista_raportin_kohteet.tarkastelupvm;
+    END IF;
+END;
+$$ LANGUAGE plpgsql;
+
+
+-- Laskee uudelleen kaikki valmiiksi lasketut tarkastelupäivät ja palauttaa
+-- niiden määrän. Ajetaan erikseen tietoja muuttavien tuontien jälkeen.
+CREATE OR REPLACE FUNCTION jkr.paivita_lasketut_raportit()
+RETURNS INTEGER AS $$
+DECLARE
+    pvmt DATE[];
+    pvm DATE;
+BEGIN
+    SELECT array_agg(p.tarkastelupvm ORDER BY p.tarkastelupvm) INTO pvmt
+    FROM jkr.raportti_kohde_paivitys p;
+
+    IF pvmt IS NULL THEN
+        RETURN 0;
+    END IF;
+
+    FOREACH pvm IN ARRAY pvmt LOOP
+        PERFORM jkr.paivita_raportin_kohteet(pvm);
+    END LOOP;
+    RETURN array_length(pvmt, 1);
+END;
+$$ LANGUAGE plpgsql;
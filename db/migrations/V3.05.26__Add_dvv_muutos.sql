@@ -0,0 +1,29 @@
+CREATE TABLE IF NOT EXISTS jkr.dvv_muutos (
+    id SERIAL PRIMARY KEY,
+    poimintapvm DATE NOT NULL,
+    rakennus_id INTEGER NOT NULL REFERENCES jkr.rakennus(id) ON DELETE CASCADE,
+    muutos TEXT NOT NULL CHECK (muutos IN ('uusi', 'muuttunut', 'poistunut', 'omistaja', 'asukas')),
+    kiinteistotunnus TEXT,
+    vanha_kiinteistotunnus TEXT,
+    CONSTRAINT dvv_muutos_uniq UNIQUE (poimintapvm, rakennus_id, muutos)
+);
+
+CREATE INDEX IF NOT EXISTS idx_dvv_muutos_poimintapvm
+    ON jkr.dvv_muutos USING btree (poimintapvm);
+
+ALTER TABLE IF EXISTS jkr.dvv_muutos
+    OWNER TO jkr_admin;
+
+COMMENT ON TABLE jkr.dvv_muutos IS 'DVV-aineiston sisäänluvussa muuttuneet rakennukset poimintapäivittäin. Kohteiden päivitys voi käsitellä vain näiden rakennusten kiinteistöt.';
+COMMENT ON COLUMN jkr.dvv_muutos.poimintapvm IS 'DVV-aineiston poimintapäivä, jonka sisäänluvussa muutos havaittiin';
+COMMENT ON COLUMN jkr.dvv_muutos.rakennus_id IS 'Muuttunut rakennus';
+COMMENT ON COLUMN jkr.dvv_muutos.muutos IS 'Muutoksen laji: uusi, muuttunut (rakennuksen tiedot), poistunut (käytöstä), omistaja tai asukas';
+COMMENT ON COLUMN jkr.dvv_muutos.kiinteistotunnus IS 'Rakennuksen kiinteistötunnus sisäänluvun jälkeen';
+COMMENT ON COLUMN jkr.dvv_muutos.vanha_kiinteistotunnus IS 'Rakennuksen kiinteistötunnus ennen sisäänlukua, jos se muuttui';
+
+GRANT ALL ON TABLE jkr.dvv_muutos TO jkr_admin;
+GRANT DELETE, INSERT, UPDATE ON TABLE jkr.dvv_muutos TO jkr_editor;
+GRANT SELECT ON TABLE jkr.dvv_muutos TO jkr_viewer;
+
+GRANT ALL ON SEQUENCE jkr.dvv_muutos_id_seq TO jkr_admin;
+GRANT USAGE ON SEQUENCE jkr.dvv_muutos_id_seq TO jkr_editor;
@@ -0,0 +1,136 @@
+-- Korvataan materialisoitu näkymä jkr.nearby_buildings tavallisella taululla,
+-- jota päivitetään vain niiden rakennusten osalta, joiden geometria muuttuu.
+-- Koko taulun uudelleenrakennus tehdään tarvittaessa id-väleittäin
+-- (jkr.rebuild_nearby_buildings, jkr rebuild_nearby_buildings).
+
+DROP FUNCTION IF EXISTS jkr.refresh_nearby_buildings();
+DROP MATERIALIZED VIEW IF EXISTS jkr.nearby_buildings;
+
+CREATE TABLE IF NOT EXISTS jkr.nearby_buildings (
+    rakennus1_id INTEGER NOT NULL REFERENCES jkr.rakennus(id) ON DELETE CASCADE,
+    rakennus2_id INTEGER NOT NULL REFERENCES jkr.rakennus(id) ON DELETE CASCADE,
+    distance DOUBLE PRECISION NOT NULL,
+    CONSTRAINT nearby_buildings_pk PRIMARY KEY (rakennus1_id, rakennus2_id),
+    CONSTRAINT nearby_buildings_order CHECK (rakennus1_id < rakennus2_id)
+);
+
+CREATE INDEX IF NOT EXISTS idx_nearby_buildings_r2
+ON jkr.nearby_buildings (rakennus2_id);
+
+CREATE INDEX IF NOT EXISTS idx_nearby_buildings_dist
+ON jkr.nearby_buildings (distance);
+
+ALTER TABLE IF EXISTS jkr.nearby_buildings
+    OWNER TO jkr_admin;
+
+COMMENT ON TABLE jkr.nearby_buildings IS 'Alle 300 metrin päässä toisistaan olevat rakennusparit. Päivittyy rakennusten geometrian muuttuessa.';
+COMMENT ON COLUMN jkr.nearby_buildings.rakennus1_id IS 'Parin pienempi rakennus-id';
+COMMENT ON COLUMN jkr.nearby_buildings.rakennus2_id IS 'Parin suurempi rakennus-id';
+COMMENT ON COLUMN jkr.nearby_buildings.distance IS 'Rakennusten etäisyys metreinä';
+
+GRANT ALL ON TABLE jkr.nearby_buildings TO jkr_admin;
+GRANT DELETE, INSERT, UPDATE ON TABLE jkr.nearby_buildings TO jkr_editor;
+GRANT SELECT ON TABLE jkr.nearby_buildings TO jkr_viewer;
+
+
+-- Laskee annettujen rakennusten parit uudelleen
+CREATE OR REPLACE FUNCTION jkr.update_nearby_buildings(rakennus_ids INTEGER[])
+RETURNS void AS $$
+BEGIN
+    DELETE FROM jkr.nearby_buildings
+    WHERE rakennus1_id = ANY(rakennus_ids) OR rakennus2_id = ANY(rakennus_ids);
+
+    INSERT INTO jkr.nearby_buildings (rakennus1_id, rakennus2_id, distance)
+    SELECT
+        LEAST(r1.id, r2.id),
+        GREATEST(r1.id, r2.id),
+        ST_Distance(r1.geom, r2.geom)
+    FROM jkr.rakennus r1
+    JOIN jkr.rakennus r2 ON
+        r1.id <> r2.id AND
+        ST_DWithin(r1.geom, r2.geom, 300)
+    WHERE
+        r1.id = ANY(rakennus_ids) AND
+        r1.geom IS NOT NULL AND
+        r2.geom IS NOT NULL
+    ON CONFLICT DO NOTHING;
+END;
+$$ LANGUAGE plpgsql;
+
+
+-- Rakentaa parit uudelleen rakennuksille, joiden id on välillä [alku_id, loppu_id].
+-- Kukin pari kuuluu pienemmän id:n väliin, joten välit voidaan ajaa erikseen.
+CREATE OR REPLACE FUNCTION jkr.rebuild_nearby_buildings(alku_id INTEGER, loppu_id INTEGER)
+RETURNS INTEGER AS $$
+DECLARE
+    parit INTEGER;
+BEGIN
+    DELETE FROM jkr.nearby_buildings
+    WHERE rakennus1_id BETWEEN alku_id AND loppu_id;
+
+    INSERT INTO jkr.nearby_buildings (rakennus1_id, rakennus2_id, distance)
+    SELECT
+        r1.id,
+        r2.id,
+        ST_Distance(r1.geom, r2.geom)
+    FROM jkr.rakennus r1
+    JOIN jkr.rakennus r2 ON
+        r1.id < r2.id AND
+        ST_DWithin(r1.geom, r2.geom, 300)
+    WHERE
+        r1.id BETWEEN alku_id AND loppu_id AND
+        r1.geom IS NOT NULL AND
+        r2.geom IS NOT NULL;
+
+    GET DIAGNOSTICS parit = ROW_COUNT;
+    RETURN parit;
+END;
+$$ LANGUAGE plpgsql;
+
+
+-- Päivitetään parit lisätyille rakennuksille lauseen lopuksi ja
+-- muutetuille rakennuksille vain, kun geometria muuttuu. Muiden sarakkeiden
+-- päivitykset eivät laukaise triggeriä. Sarakelistallinen trigger ei voi
+-- käyttää siirtymätauluja, joten muutokset käsitellään riveittäin.
+-- Poistetut rakennukset poistuvat viiteavaimen kautta.
+CREATE OR REPLACE FUNCTION jkr.nearby_buildings_insert_trigger()
+RETURNS trigger AS $$
+DECLARE
+    muuttuneet INTEGER[];
+BEGIN
+    SELECT array_agg(uudet.id) INTO muuttuneet
+    FROM uudet
+    WHERE uudet.geom IS NOT NULL;
+
+    IF muuttuneet IS NOT NULL THEN
+        PERFORM jkr.update_nearby_buildings(muuttuneet);
+    END IF;
+    RETURN NULL;
+END;
+$$ LANGUAGE plpgsql;
+
+CREATE OR REPLACE FUNCTION jkr.nearby_buildings_update_trigger()
+RETURNS trigger AS $$
+BEGIN
+    PERFORM jkr.update_nearby_buildings(ARRAY[NEW.id]);
+    RETURN NULL;
+END;
+$$ LANGUAGE plpgsql;
+
+DROP TRIGGER IF EXISTS nearby_buildings_insert ON jkr.rakennus;
+CREATE TRIGGER nearby_buildings_insert
+    AFTER INSERT ON jkr.rakennus
+    REFERENCING NEW TABLE AS uudet
+    FOR EACH STATEMENT
+    EXECUTE FUNCTION jkr.nearby_buildings_insert_trigger();
+
+DROP TRIGGER IF EXISTS nearby_buildings_update ON jkr.rakennus;
+CREATE TRIGGER nearby_buildings_update
+    AFTER UPDATE OF geom ON jkr.rakennus
+    FOR EACH ROW
+    WHEN (OLD.geom IS DISTINCT FROM NEW.geom)
+    EXECUTE FUNCTION jkr.nearby_buildings_update_trigger();
+
+
+-- Alkutäyttö
+SELECT jkr.rebuild_nearby_buildings(min(id), max(id)) FROM jkr.rakennus;
@@ -0,0 +1,172 @@
+-- Rakennusten sijainti taajamissa lasketaan valmiiksi tauluun
+-- jkr.rakennuksen_taajama, jotta raportin taajamarajaus on tavallinen
+-- indeksoitu liitos eikä ST_Contains-vertailu kaikille rakennuksille.
+-- Taulu päivittyy triggereillä, kun rakennuksen geometria tai taajama muuttuu.
+
+CREATE TABLE IF NOT EXISTS jkr.rakennuksen_taajama (
+    rakennus_id INTEGER NOT NULL REFERENCES jkr.rakennus(id) ON DELETE CASCADE,
+    taajama_id INTEGER NOT NULL REFERENCES jkr.taajama(id) ON DELETE CASCADE,
+    vaesto_lkm BIGINT,
+    CONSTRAINT rakennuksen_taajama_pk PRIMARY KEY (rakennus_id, taajama_id)
+);
+
+CREATE INDEX IF NOT EXISTS idx_rakennuksen_taajama_taajama
+ON jkr.rakennuksen_taajama (taajama_id);
+
+CREATE INDEX IF NOT EXISTS idx_rakennuksen_taajama_vaesto
+ON jkr.rakennuksen_taajama (vaesto_lkm, rakennus_id);
+
+ALTER TABLE IF EXISTS jkr.rakennuksen_taajama
+    OWNER TO jkr_admin;
+
+COMMENT ON TABLE jkr.rakennuksen_taajama IS 'Taajamat, joiden alueella rakennus sijaitsee. Päivittyy rakennuksen geometrian tai taajaman muuttuessa.';
+COMMENT ON COLUMN jkr.rakennuksen_taajama.rakennus_id IS 'Rakennuksen id';
+COMMENT ON COLUMN jkr.rakennuksen_taajama.taajama_id IS 'Taajaman id';
+COMMENT ON COLUMN jkr.rakennuksen_taajama.vaesto_lkm IS 'Taajaman väestömäärä (jkr.taajama.vaesto_lkm)';
+
+GRANT ALL ON TABLE jkr.rakennuksen_taajama TO jkr_admin;
+GRANT DELETE, INSERT, UPDATE ON TABLE jkr.rakennuksen_taajama TO jkr_editor;
+GRANT SELECT ON TABLE jkr.rakennuksen_taajama TO jkr_viewer;
+
+
+-- Laskee annettujen rakennusten taajamat uudelleen
+CREATE OR REPLACE FUNCTION jkr.update_rakennuksen_taajama(rakennus_ids INTEGER[])
+RETURNS void AS $$
+BEGIN
+    DELETE FROM jkr.rakennuksen_taajama
+    WHERE rakennus_id = ANY(rakennus_ids);
+
+    INSERT INTO jkr.rakennuksen_taajama (rakennus_id, taajama_id, vaesto_lkm)
+    SELECT r.id, t.id, t.vaesto_lkm
+    FROM jkr.rakennus r
+    JOIN jkr.taajama t ON ST_Contains(t.geom, r.geom)
+    WHERE
+        r.id = ANY(rakennus_ids) AND
+        r.geom IS NOT NULL;
+END;
+$$ LANGUAGE plpgsql;
+
+
+-- Laskee annettujen taajamien rakennukset uudelleen
+CREATE OR REPLACE FUNCTION jkr.update_taajaman_rakennukset(taajama_ids INTEGER[])
+RETURNS void AS $$
+BEGIN
+    DELETE FROM jkr.rakennuksen_taajama
+    WHERE taajama_id = ANY(taajama_ids);
+
+    INSERT INTO jkr.rakennuksen_taajama (rakennus_id, taajama_id, vaesto_lkm)
+    SELECT r.id, t.id, t.vaesto_lkm
+    FROM jkr.taajama t
+    JOIN jkr.rakennus r ON ST_Contains(t.geom, r.geom)
+    WHERE t.id = ANY(taajama_ids);
+END;
+$$ LANGUAGE plpgsql;
+
+
+-- Rakentaa koko taulun uudelleen ja palauttaa rivien määrän
+CREATE OR REPLACE FUNCTION jkr.rebuild_rakennuksen_taajama()
+RETURNS INTEGER AS $$
+DECLARE
+    riveja INTEGER;
+BEGIN
+    DELETE FROM jkr.rakennuksen_taajama;
+
+    INSERT INTO jkr.rakennuksen_taajama (rakennus_id, taajama_id, vaesto_lkm)
+    SELECT r.id, t.id, t.vaesto_lkm
+    FROM jkr.taajama t
+    JOIN jkr.rakennus r ON ST_Contains(t.geom, r.geom);
+
+    GET DIAGNOSTICS riveja = ROW_COUNT;
+    RETURN riveja;
+END;
+$$ LANGUAGE plpgsql;
+
+
+-- Rakennusten lisäys ja geometrian muutos. Lisäykset käsitellään lauseen
+-- lopuksi, geometrian muutokset riveittäin, koska sarakelistallinen trigger
+-- ei voi käyttää siirtymätauluja. Muiden sarakkeiden päivitykset eivät
+-- laukaise triggeriä.
+CREATE OR REPLACE FUNCTION jkr.rakennuksen_taajama_insert_trigger()
+RETURNS trigger AS $$
+DECLARE
+    muuttuneet INTEGER[];
+BEGIN
+    SELECT array_agg(uudet.id) INTO muuttuneet
+    FROM uudet
+    WHERE uudet.geom IS NOT NULL;
+
+    IF muuttuneet IS NOT NULL THEN
+        PERFORM jkr.update_rakennuksen_taajama(muuttuneet);
+    END IF;
+    RETURN NULL;
+END;
+$$ LANGUAGE plpgsql;
+
+CREATE OR REPLACE FUNCTION jkr.rakennuksen_taajama_update_trigger()
+RETURNS trigger AS $$
+BEGIN
+    PERFORM jkr.update_rakennuksen_taajama(ARRAY[NEW.id]);
+    RETURN NULL;
+END;
+$$ LANGUAGE plpgsql;
+
+DROP TRIGGER IF EXISTS rakennuksen_taajama_insert ON jkr.rakennus;
+CREATE TRIGGER rakennuksen_taajama_insert
+    AFTER INSERT ON jkr.rakennus
+    REFERENCING NEW TABLE AS uudet
+    FOR EACH STATEMENT
+    EXECUTE FUNCTION jkr.rakennuksen_taajama_insert_trigger();
+
+DROP TRIGGER IF EXISTS rakennuksen_taajama_update ON jkr.rakennus;
+CREATE TRIGGER rakennuksen_taajama_update
+    AFTER UPDATE OF geom ON jkr.rakennus
+    FOR EACH ROW
+    WHEN (OLD.geom IS DISTINCT FROM NEW.geom)
+    EXECUTE FUNCTION jkr.rakennuksen_taajama_update_trigger();
+
+
+-- Taajamien lisäys (import_taajama) sekä geometrian ja väestömäärän muutos.
+-- Poistetut taajamat poistuvat viiteavaimen kautta.
+CREATE OR REPLACE FUNCTION jkr.taajaman_rakennukset_insert_trigger()
+RETURNS trigger AS $$
+DECLARE
+    muuttuneet INTEGER[];
+BEGIN
+    SELECT array_agg(uudet.id) INTO muuttuneet
+    FROM uudet;
+
+    IF muuttuneet IS NOT NULL THEN
+        PERFORM jkr.update_taajaman_rakennukset(muuttuneet);
+    END IF;
+    RETURN NULL;
+END;
+$$ LANGUAGE plpgsql;
+
+CREATE OR REPLACE FUNCTION jkr.taajaman_rakennukset_update_trigger()
+RETURNS trigger AS $$
+BEGIN
+    PERFORM jkr.update_taajaman_rakennukset(ARRAY[NEW.id]);
+    RETURN NULL;
+END;
+$$ LANGUAGE plpgsql;
+
+DROP TRIGGER IF EXISTS taajaman_rakennukset_insert ON jkr.taajama;
+CREATE TRIGGER taajaman_rakennukset_insert
+    AFTER INSERT ON jkr.taajama
+    REFERENCING NEW TABLE AS uudet
+    FOR EACH STATEMENT
+    EXECUTE FUNCTION jkr.taajaman_rakennukset_insert_trigger();
+
+DROP TRIGGER IF EXISTS taajaman_rakennukset_update ON jkr.taajama;
+CREATE TRIGGER taajaman_rakennukset_update
+    AFTER UPDATE OF geom, vaesto_lkm ON jkr.taajama
+    FOR EACH ROW
+    WHEN (
+        OLD.geom IS DISTINCT FROM NEW.geom OR
+        OLD.vaesto_lkm IS DISTINCT FROM NEW.vaesto_lkm
+    )
+    EXECUTE FUNCTION jkr.taajaman_rakennukset_update_trigger();
+
+
+-- Alkutäyttö
+SELECT jkr.rebuild_rakennuksen_taajama();
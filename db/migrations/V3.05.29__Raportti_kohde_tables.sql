@@ -0,0 +1,185 @@
+-- Kohdekohtaiset raporttirivit tarkastelupäivittäin. Rivit eivät riipu
+-- raportin suodattimista, joten jkr.print_report voi suodattaa kohteet ja
+-- lukea niiden rivit taulusta laskematta niitä uudelleen. Taulut ovat
+-- versioidussa migraatiossa, jotta raporttifunktioiden toistettavan
+-- migraation muutokset eivät poista laskettuja rivejä. Sarakkeet vastaavat
+-- print_report-funktion palauttamia sarakkeita; jos niitä muutetaan, taulu
+-- muutetaan uudella versioidulla migraatiolla.
+
+CREATE TABLE IF NOT EXISTS jkr.raportti_kohde (
+    kohde_id INTEGER,
+    tarkastelupvm_out DATE,
+    kunta_out TEXT,
+    huoneistomaara_out BIGINT,
+    taajama_yli_10000 TEXT,
+    taajama_yli_200 TEXT,
+    "kohdetyyppi" TEXT,
+    "Liitetty viemäriin" TEXT,
+    "Komposti-ilmoituksen tekijän nimi" TEXT,
+    "Lietteen kompostointi-ilmoituksen tekijän nimi" TEXT,
+    "Lietteen tilaajan nimi" TEXT,
+    "Lietteen tilaajan katuosoite" TEXT,
+    "Lietteen tilaajan postinumero" TEXT,
+    "Lietteen tilaajan postitoimipaikka" TEXT,
+    "Sekajätteen tilaajan nimi" TEXT,
+    "Sekajätteen tilaajan katuosoite" TEXT,
+    "Sekajätteen tilaajan postinumero" TEXT,
+    "Sekajätteen tilaajan postitoimipaikka" TEXT,
+    "Salpakierron tilaajan nimi" TEXT,
+    "Salpakierron tilaajan katuosoite" TEXT,
+    "Salpakierron postinumero" TEXT,
+    "Salpakierron postitoimipaikka" TEXT,
+    "Omistaja 1 nimi" TEXT,
+    "Omistaja 1 katuosoite" TEXT,
+    "Omistaja 1 postinumero" TEXT,
+    "Omistaja 1 postitoimipaikka" TEXT,
+    "Omistaja 2 nimi" TEXT,
+    "Omistaja 2 katuosoite" TEXT,
+    "Omistaja 2 postinumero" TEXT,
+    "Omistaja 2 postitoimipaikka" TEXT,
+    "Omistaja 3 nimi" TEXT,
+    "Omistaja 3 katuosoite" TEXT,
+    "Omistaja 3 postinumero" TEXT,
+    "Omistaja 3 postitoimipaikka" TEXT,
+    "Vahimman asukkaan nimi" TEXT,
+    "Viemäriverkostossa" DATE,
+    "Kantovesi" DATE,
+    "Kaivotieto saostussäiliö" DATE,
+    "Kaivotieto umpisäiliö" DATE,
+    "Kaivotieto pienpuhdistamo" DATE,
+    "Kompostoi lietteen" DATE,
+    "Vain harmaita vesiä" DATE,
+    "Velvoitteen tallennuspvm" DATE,
+    Velvoiteyhteenveto TEXT,
+    Sekajätevelvoite TEXT,
+    Biojätevelvoite TEXT,
+    Muovipakkausvelvoite TEXT,
+    Kartonkipakkausvelvoite TEXT,
+    Lasipakkausvelvoite TEXT,
+    Metallipakkausvelvoite TEXT,
+    "Velvoiteyhteenveto liete" TEXT,
+    Muovi DATE,
+    Kartonki DATE,
+    Metalli DATE,
+    Lasi DATE,
+    Biojäte DATE,
+    Monilokero DATE,
+    Sekajate DATE,
+    Akp DATE,
+    "Lietekuljetus saostussäiliö" DATE,
+    "Lietekuljetus umpisäiliö" DATE,
+    "Lietekuljetus pienpuhdistamo" DATE,
+    "Lietetyyppi ei tiedossa" DATE,
+    "Lietteen kuljetusliikkeen nimi" TEXT,
+    Kompostoi DATE,
+    "Perusmaksupäätös voimassa" DATE,
+    "Perusmaksupäätös" TEXT,
+    "Tyhjennysvälipäätös voimassa" DATE,
+    "Tyhjennysvälipäätös" TEXT,
+    "Akp-kohtuullistaminen voimassa" DATE,
+    "Akp-kohtuullistaminen" TEXT,
+    "Keskeytys voimassa" DATE,
+    "Keskeytys" TEXT,
+    "Erilliskeräysvelvoitteesta poikkeaminen voimassa" DATE,
+    "Erilliskeräysvelvoitteesta poikkeaminen" TEXT,
+    "PRT 1" TEXT,
+    "Käyttötila 1" TEXT,
+    "Käyttötarkoitus 1" TEXT,
+    "Rakennusluokka_2018 1" TEXT,
+    Katuosoite TEXT,
+    Postinumero TEXT,
+    Postitoimipaikka TEXT,
+    Sijaintikiinteistö TEXT,
+    "X-koordinaatti" FLOAT,
+    "Y-koordinaatti" FLOAT,
+    "PRT 2" TEXT,
+    "Käyttötila 2" TEXT,
+    "Käyttötarkoitus 2" TEXT,
+    "Rakennusluokka_2018 2" TEXT,
+    "PRT 3" TEXT,
+    "Käyttötila 3" TEXT,
+    "Käyttötarkoitus 3" TEXT,
+    "Rakennusluokka_2018 3" TEXT,
+    "PRT 4" TEXT,
+    "Käyttötila 4" TEXT,
+    "Käyttötarkoitus 4" TEXT,
+    "Rakennusluokka_2018 4" TEXT,
+    "PRT 5" TEXT,
+    "Käyttötila 5" TEXT,
+    "Käyttötarkoitus 5" TEXT,
+    "Rakennusluokka_2018 5" TEXT,
+    "PRT 6" TEXT,
+    "Käyttötila 6" TEXT,
+    "Käyttötarkoitus 6" TEXT,
+    "Rakennusluokka_2018 6" TEXT,
+    "PRT 7" TEXT,
+    "Käyttötila 7" TEXT,
+    "Käyttötarkoitus 7" TEXT,
+    "Rakennusluokka_2018 7" TEXT,
+    "PRT 8" TEXT,
+    "Käyttötila 8" TEXT,
+    "Käyttötarkoitus 8" TEXT,
+    "Rakennusluokka_2018 8" TEXT,
+    "PRT 9" TEXT,
+    "Käyttötila 9" TEXT,
+    "Käyttötarkoitus 9" TEXT,
+    "Rakennusluokka_2018 9" TEXT,
+    "PRT 10" TEXT,
+    "Käyttötila 10" TEXT,
+    "Käyttötarkoitus 10" TEXT,
+    "Rakennusluokka_2018 10" TEXT,
+    "PRT 11" TEXT,
+    "Käyttötila 11" TEXT,
+    "Käyttötarkoitus 11" TEXT,
+    "Rakennusluokka_2018 11" TEXT,
+    "PRT 12" TEXT,
+    "Käyttötila 12" TEXT,
+    "Käyttötarkoitus 12" TEXT,
+    "Rakennusluokka_2018 12" TEXT,
+    "PRT 13" TEXT,
+    "Käyttötila 13" TEXT,
+    "Käyttötarkoitus 13" TEXT,
+    "Rakennusluokka_2018 13" TEXT,
+    "PRT 14" TEXT,
+    "Käyttötila 14" TEXT,
+    "Käyttötarkoitus 14" TEXT,
+    "Rakennusluokka_2018 14" TEXT,
+    "PRT 15" TEXT,
+    "Käyttötila 15" TEXT,
+    "Käyttötarkoitus 15" TEXT,
+    "Rakennusluokka_2018 15" TEXT,
+    "PRT 16" TEXT,
+    "Käyttötila 16" TEXT,
+    "Käyttötarkoitus 16" TEXT,
+    "Rakennusluokka_2018 16" TEXT,
+    "PRT 17" TEXT,
+    "Käyttötila 17" TEXT,
+    "Käyttötarkoitus 17" TEXT,
+    "Rakennusluokka_2018 17" TEXT
+);
+
+CREATE INDEX IF NOT EXISTS idx_raportti_kohde_tarkastelupvm_kohde
+ON jkr.raportti_kohde (tarkastelupvm_out, kohde_id);
+
+CREATE TABLE IF NOT EXISTS jkr.raportti_kohde_paivitys (
+    tarkastelupvm DATE PRIMARY KEY,
+    paivitetty TIMESTAMPTZ NOT NULL DEFAULT now(),
+    kohteita INTEGER NOT NULL
+);
+
+ALTER TABLE IF EXISTS jkr.raportti_kohde
+    OWNER TO jkr_admin;
+ALTER TABLE IF EXISTS jkr.raportti_kohde_paivitys
+    OWNER TO jkr_admin;
+
+COMMENT ON TABLE jkr.raportti_kohde IS 'print_report-funktion rivit kaikille tarkastelupäivänä voimassa oleville kohteille. Päivitetään funktiolla jkr.paivita_raportin_kohteet.';
+COMMENT ON TABLE jkr.raportti_kohde_paivitys IS 'Tarkastelupäivät, joiden raporttirivit ovat taulussa jkr.raportti_kohde';
+COMMENT ON COLUMN jkr.raportti_kohde_paivitys.paivitetty IS 'Rivien laskenta-aika';
+COMMENT ON COLUMN jkr.raportti_kohde_paivitys.kohteita IS 'Laskettujen kohteiden määrä';
+
+GRANT ALL ON TABLE jkr.raportti_kohde TO jkr_admin;
+GRANT DELETE, INSERT, UPDATE ON TABLE jkr.raportti_kohde TO jkr_editor;
+GRANT SELECT ON TABLE jkr.raportti_kohde TO jkr_viewer;
+GRANT ALL ON TABLE jkr.raportti_kohde_paivitys TO jkr_admin;
+GRANT DELETE, INSERT, UPDATE ON TABLE jkr.raportti_kohde_paivitys TO jkr_editor;
+GRANT SELECT ON TABLE jkr.raportti_kohde_paivitys TO jkr_viewer;
@@ -1,27 +1,17 @@
 import subprocess
 import csv
+import logging
 from dataclasses import dataclass
 from datetime import datetime
 from pathlib import Path
-from typing import Optional
+from typing import Annotated, Optional
 
 import typer
-import pandas as pd
 from sqlalchemy import text
-from sqlalchemy.orm import scoped_session
-from sqlalchemy.orm.session import sessionmaker
-import openpyxl
-from openpyxl.utils import get_column_letter
+from sqlalchemy.orm import Session
 
 from jkrimporter import __version__
-from jkrimporter.providers.db.dbprovider import DbProvider, engine
-from jkrimporter.providers.db.services.tiedontuottaja import (
-    get_tiedontuottaja,
-    insert_tiedontuottaja,
-    list_tiedontuottajat,
-    remove_tiedontuottaja,
-    rename_tiedontuottaja,
-)
+from jkrimporter.providers.db.database import engine, set_application_name
 
 from jkrimporter.providers.lahti.lahtiprovider import (
     IlmoitusTranslator,
@@ -54,6 +44,16 @@ from jkrimporter.providers.nokia.siirtotiedosto import NokiaSiirtotiedosto
 from jkrimporter.providers.pjh.pjhprovider import PjhTranslator
 from jkrimporter.providers.pjh.siirtotiedosto import PjhSiirtotiedosto
 from jkrimporter.utils.date import parse_date_string
+from jkrimporter.utils.osoite import address_parser
+from jkrimporter.utils.raportti import (
+    Raporttimuoto,
+    import_pyarrow,
+    raporttimuoto_polusta,
+)
+from jkrimporter.providers.db.services.raportti import (
+    kirjoita_raportti,
+    raportin_parametrit,
+)
 from jkrimporter.providers.db.sisaanlukutapahtuma import sisaanlukutapahtuma
 
 
@@ -71,6 +71,20 @@ PROVIDERS = {
 }
 
 
+# Tietokantamallit muodostetaan vasta, kun komento käyttää tietokantaa,
+# joten esim. --version ja --help eivät ota yhteyttä tietokantaan.
+def _db_provider():
+    from jkrimporter.providers.db.dbprovider import DbProvider
+
+    return DbProvider()
+
+
+def _get_tiedontuottaja(tunnus: str):
+    from jkrimporter.providers.db.services.tiedontuottaja import get_tiedontuottaja
+
+    return get_tiedontuottaja(tunnus)
+
+
 def version_callback(value: bool):
     if value:
         print(__version__)
@@ -78,6 +92,7 @@ def version_callback(value: bool):
 
 
 def main_callback(
+    ctx: typer.Context,
     version: Optional[bool] = typer.Option(
         None,
         "--version",
@@ -85,8 +100,34 @@ def main_callback(
         is_eager=True,
         help="Kertoo lataustyökalun versionumeron.",
     ),
+    log_level: str = typer.Option(
+        "WARNING",
+        "--log-level",
+        envvar="JKR_LOG_LEVEL",
+        help="Lokitaso (DEBUG, INFO, WARNING, ...). DEBUG tulostaa rivikohtaiset tiedot.",
+    ),
+    paivita_raportit: bool = typer.Option(
+        False,
+        "--paivita-raportit",
+        help="Laskee valmiiksi lasketut raportit uudelleen komennon jälkeen.",
+    ),
 ):
-    ...
+    logging.getLogger().setLevel(log_level.upper())
+    set_application_name(ctx.invoked_subcommand)
+    if paivita_raportit:
+        # Päivitys on oma vaiheensa komennon ja sen transaktioiden jälkeen
+        ctx.call_on_close(_paivita_lasketut_raportit)
+
+
+def _paivita_lasketut_raportit():
+    from jkrimporter.providers.db.services.raportti import paivita_lasketut_raportit
+
+    with Session(engine) as session:
+        paivitetyt = paivita_lasketut_raportit(session)
+    if not paivitetyt:
+        print("Ei päivitettyjä valmiiksi laskettuja raportteja.")
+    for tarkastelupvm, kohteita in paivitetyt.items():
+        print(f"Raportin rivit päivitetty {tarkastelupvm}: {kohteita} kohdetta.")
 
 
 app = typer.Typer(callback=main_callback)
@@ -105,11 +146,18 @@ def import_data(
     ),
     alkupvm: str = typer.Argument(None, help="Importoitavan datan alkupvm"),
     loppupvm: str = typer.Argument(None, help="Importoitavan datan loppupvm"),
+    bulk: Annotated[
+        bool,
+        typer.Option(
+            "--bulk",
+            help="Vie asiakastiedot kantaan joukko-operaatioina yhdessä transaktiossa.",
+        ),
+    ] = False,
 ):
     with sisaanlukutapahtuma():
         ala_paivita_yhteystietoja = False
         ala_paivita_kohdetta = True
-        tiedontuottaja = get_tiedontuottaja(tiedontuottajatunnus)
+        tiedontuottaja = _get_tiedontuottaja(tiedontuottajatunnus)
         if not tiedontuottaja:
             typer.echo(
                 f"Tiedontuottajaa {tiedontuottaja} ei löydy järjestelmästä. Lisää komennolla `jkr tiedontuottaja add`"
@@ -125,9 +173,11 @@ def import_data(
 
         translator = provider.Translator(data, tiedontuottajatunnus)
         jkr_data = translator.as_jkr_data(alkupvm, loppupvm)
+        print(f"Osoitteiden jäsennys: {address_parser.stats()}")
         print('writing to db...')
-        db = DbProvider()
-        db.write(jkr_data, tiedontuottajatunnus, ala_paivita_yhteystietoja, ala_paivita_kohdetta, siirtotiedosto)
+        db = _db_provider()
+        write = db.write_bulk if bulk else db.write
+        write(jkr_data, tiedontuottajatunnus, ala_paivita_yhteystietoja, ala_paivita_kohdetta, siirtotiedosto)
 
         print("VALMIS!")
 
@@ -138,9 +188,17 @@ def create_dvv_kohteet(
     perusmaksutiedosto: Optional[Path] = typer.Argument(
         None, help="Perusmaksurekisteritiedosto"
     ),
+    workers: int = typer.Option(
+        1, "--workers", help="Kiinteistöjen rakennusryhmittelyn prosessien määrä"
+    ),
+    incremental: bool = typer.Option(
+        False,
+        "--incremental",
+        help="Käsittele vain poimintapäivän DVV-sisäänluvussa muuttuneet kiinteistöt",
+    ),
 ):
     with sisaanlukutapahtuma():
-        db = DbProvider()
+        db = _db_provider()
         # Currently, typer does not support Union[datetime, None] argument type, so we will
         # have to parse the datetime string ourselves.
         # support all combinations of known and unknown alku- and loppupvm
@@ -150,7 +208,7 @@ def create_dvv_kohteet(
             start = datetime.strptime(poimintapvm, "%d.%m.%Y").date()
         end = None
 
-        db.write_dvv_kohteet(start, end, perusmaksutiedosto)
+        db.write_dvv_kohteet(start, end, perusmaksutiedosto, workers, incremental)
 
         print("VALMIS!")
 
@@ -174,9 +232,9 @@ def import_and_create_kohteet(
         subprocess.call(cmd_args)
 
         if perusmaksutiedosto is not None:
-            create_dvv_kohteet(poimintapvm, perusmaksutiedosto)
+            create_dvv_kohteet(poimintapvm, perusmaksutiedosto, workers=1, incremental=False)
         else:
-            create_dvv_kohteet(poimintapvm, None)
+            create_dvv_kohteet(poimintapvm, None, workers=1, incremental=False)
 
         print("VALMIS!")
 
@@ -195,6 +253,20 @@ def update_huoneistomaara(
     print("Huoneistolukumäärät päivitetty!")
 
 
+@app.command("rebuild_nearby_buildings",
+             help="Rebuilds the table of buildings within 300 m of each other.")
+def rebuild_nearby_buildings_table(
+    chunk_size: int = typer.Option(
+        50000, "--chunk-size", help="Yhdellä kertaa käsiteltävien rakennus-id:iden määrä"
+    ),
+):
+    from jkrimporter.providers.db.services.buildings import rebuild_nearby_buildings
+
+    parit = rebuild_nearby_buildings(chunk_size)
+
+    print(f"Lähirakennukset laskettu, {parit} rakennusparia.")
+
+
 @app.command("import_paatokset", help="Import decisions to JKR.")
 def import_paatokset(
     siirtotiedosto: Path = typer.Argument(..., help="Polku siirtotiedostoon")
@@ -202,7 +274,7 @@ def import_paatokset(
     with sisaanlukutapahtuma():
         translator = PaatosTranslator(Paatostiedosto(siirtotiedosto))
         paatos_data = translator.as_jkr_data()
-        db = DbProvider()
+        db = _db_provider()
         db.write_paatokset(paatos_data, siirtotiedosto)
 
         print("VALMIS!")
@@ -215,7 +287,7 @@ def import_ilmoitukset(
     with sisaanlukutapahtuma():
         translator = IlmoitusTranslator(Ilmoitustiedosto(siirtotiedosto))
         ilmoitus_data = translator.as_jkr_data()
-        db = DbProvider()
+        db = _db_provider()
         db.write_ilmoitukset(ilmoitus_data, siirtotiedosto)
 
         print("VALMIS!")
@@ -228,7 +300,7 @@ def import_liete_ilmoitukset(
     with sisaanlukutapahtuma():
         translator = LieteIlmoitusTranslator(LieteIlmoitustiedosto(siirtotiedosto))
         ilmoitus_data = translator.as_jkr_data()
-        db = DbProvider()
+        db = _db_provider()
         db.write_lieteIlmoitukset(ilmoitus_data, siirtotiedosto)
 
         print("VALMIS!")
@@ -241,7 +313,7 @@ def import_lopetusilmoitukset(
     with sisaanlukutapahtuma():
         translator = LopetusIlmoitusTranslator(LopetusIlmoitustiedosto(siirtotiedosto))
         lopetusilmoitus_data = translator.as_jkr_data()
-        db = DbProvider()
+        db = _db_provider()
         db.write_lopetusilmoitukset(lopetusilmoitus_data, siirtotiedosto)
 
         print("VALMIS!")
@@ -269,7 +341,7 @@ def import_liete(
         ala_paivita_kohdetta = True
 
         # Tarkista että tiedontuottaja on olemassa
-        tiedontuottaja = get_tiedontuottaja(tiedontuottajatunnus)
+        tiedontuottaja = _get_tiedontuottaja(tiedontuottajatunnus)
         if not tiedontuottaja:
             typer.echo(
                 f"Tiedontuottajaa {tiedontuottajatunnus} ei löydy järjestelmästä. "
@@ -296,7 +368,7 @@ def import_liete(
         print(f"Kirjoitetaan tietokantaan...")
 
         # Kirjoita tietokantaan
-        db = DbProvider()
+        db = _db_provider()
         db.write(jkr_data, tiedontuottajatunnus, ala_paivita_yhteystietoja, ala_paivita_kohdetta, siirtotiedosto)
 
         print("VALMIS!")
@@ -315,7 +387,7 @@ def import_viemarointi(
     with sisaanlukutapahtuma():
         translator = ViemariIlmoitusTranslator(ViemariIlmoitustiedosto(siirtotiedosto))
         viemari_ilmoitus_data = translator.as_jkr_data()
-        db = DbProvider()
+        db = _db_provider()
         db.write_viemariliitos(viemari_ilmoitus_data, siirtotiedosto)
 
         print("VALMIS!")
@@ -334,102 +406,49 @@ def import_viemari_lopetusilmoitukset(
     with sisaanlukutapahtuma():
         translator = ViemariLopetusIlmoitusTranslator(ViemariLopetustiedosto(siirtotiedosto))
         lopetusilmoitus_data = translator.as_jkr_data()
-        db = DbProvider()
+        db = _db_provider()
         db.write_viermariliitosten_lopetukset(lopetusilmoitus_data, siirtotiedosto)
 
         print("VALMIS!")
 
 @app.command("raportti")
 def raportti(
-    output_path: Path = typer.Argument(..., help="Excel-raportin tallennuspolku (.xlsx)"),
+    output_path: Path = typer.Argument(..., help="Raportin tallennuspolku (.xlsx, .csv tai .parquet)"),
     tarkastelupvm: str = typer.Argument(None, help="Tarkastelupäivämäärä (YYYY-MM-DD tai DD.MM.YYYY)"),
     kunta: str = typer.Argument(None, help="Kunnan nimi (esim. 'Lahti'). Käytä 0 jos ei rajausta."),
     huoneistomaara: int = typer.Argument(0, help="Huoneistomäärä (4 = neljä tai vähemmän, 5 = viisi tai enemmän, 0 = ei rajausta)"),
     taajama: int = typer.Argument(None, help="Taajama (0 = ei rajausta, 2 = yli 10000, 1 = yli 200, 3 = molemmat, 10000 = yli 10000, 200 = yli 200)"),
     kohde_tyyppi: int = typer.Argument(None, help="Kohdetyyppi 5 = hapa, 6 = biohapa, 7 = asuinkiinteistö, 8 = muu, 0 = ei rajausta"),
     onko_viemari: int = typer.Argument(None, help="Viemäriliitoksen tila 0 = ei väliä, 1 = Viemäriverkossa, 2 = Ei viemäriverkossa"),
+    formaatti: Optional[Raporttimuoto] = typer.Option(
+        None,
+        "--format",
+        help="Raportin tiedostomuoto. Oletuksena päätellään tallennuspolun päätteestä. "
+        "Parquet vaatii pyarrow-paketin.",
+    ),
 ):
     """
-    Luo Excel-raportin kohteista annetuilla hakuehdoilla.
+    Luo raportin kohteista annetuilla hakuehdoilla.
     """
     try:
+        formaatti = raporttimuoto_polusta(output_path, formaatti)
+        if formaatti == Raporttimuoto.parquet:
+            # Valinnainen riippuvuus tarkistetaan ennen raskasta kyselyä
+            import_pyarrow()
+
         if(tarkastelupvm != '0'):
             tarkastelupvm_date = parse_date_string(tarkastelupvm)
         else:
             tarkastelupvm_date = None
-        
-        # Convert "0" to None for kunta
-        kunta_filter = None if kunta == "0" else kunta
-
-        # Convert "0" to None for taajama
-        taajama_filter = None if taajama == "0" else taajama
-
-        # Convert "0" to None for onko_viemari
-        onko_viemari_filter = None if onko_viemari == 0 else (True if onko_viemari == 1 else False)
-
-        # Convert "0" to None for kohdetyyppi
-        kohde_filter = None if kohde_tyyppi == 0 else kohde_tyyppi
-
-        taajama_10000_filter = None if taajama_filter == None else (None if taajama_filter not in (2,3, 10000) else (taajama_filter in (2,3, 10000)))
-        taajama_200_filter = None if taajama_filter == None else (None if taajama_filter not in (1,3, 200) else (taajama_filter in (1,3, 200)))
-        
-        print(f"Haetaan raportille ehdoilla: tarkastelupvm={tarkastelupvm_date}, kunta={kunta_filter}, huoneistomaara={huoneistomaara},\
- taajama_10000={taajama_10000_filter}, taajama_200={taajama_200_filter}, kohde_tyyppi={kohde_filter}, viemariverkossa={onko_viemari_filter}")
-        # Create SQLAlchemy session
-        Session = scoped_session(sessionmaker(bind=engine))
-        with Session() as session:
-            # Execute report query
-            
-            result = session.execute(
-                text("SELECT * FROM jkr.print_report(:tarkastelupvm, :kunta, :huoneistomaara, :taajama_10000, :taajama_200, :kohde_tyyppi_id, :onko_viemari)"),
-                {
-                    "tarkastelupvm": tarkastelupvm_date,
-                    "kunta": kunta_filter,
-                    "huoneistomaara": huoneistomaara,
-                    "taajama_10000": taajama_10000_filter,  # is_taajama_yli_10000
-                    "taajama_200": taajama_200_filter,  # is_taajama_yli_200
-                    "kohde_tyyppi_id": kohde_filter,
-                    "onko_viemari": onko_viemari_filter
-                }
-            )
 
-            
-            # Get column names
-            columns = result.keys()
-            
-            # Fetch all results
-            results = result.fetchall()
-            
-            # Create DataFrame
-            df = pd.DataFrame(results, columns=columns)
-            
-            # Save to Excel
-            df.to_excel(output_path, index=False, engine='openpyxl')
-            
-            # Open the workbook to adjust column widths
-            wb = openpyxl.load_workbook(output_path)
-            ws = wb.active
-            
-            # Adjust column widths based on content
-            for column in ws.columns:
-                max_length = 0
-                column_letter = get_column_letter(column[0].column)
-                
-                # Find the maximum length of content in each column
-                for cell in column:
-                    try:
-                        if len(str(cell.value)) > max_length:
-                            max_length = len(str(cell.value))
-                    except:
-                        pass
-                
-                # Set width with a small padding
-                adjusted_width = max_length + 2
-                ws.column_dimensions[column_letter].width = adjusted_width
-            
-            # Save the workbook with adjusted column widths
-            wb.save(output_path)
-            
+        params = raportin_parametrit(
+            tarkastelupvm_date, kunta, huoneistomaara, taajama, kohde_tyyppi, onko_viemari
+        )
+        print(f"Haetaan raportille ehdoilla: tarkastelupvm={params['tarkastelupvm']}, kunta={params['kunta']}, huoneistomaara={huoneistomaara},\
+ taajama_10000={params['taajama_10000']}, taajama_200={params['taajama_200']}, kohde_tyyppi={params['kohde_tyyppi_id']}, viemariverkossa={params['onko_viemari']}")
+        with Session(engine) as session:
+            kirjoita_raportti(session, params, output_path, formaatti)
+
             typer.echo(f"Raportti luotu onnistuneesti: {output_path}")
             
     except ValueError as e:
@@ -440,11 +459,129 @@ def raportti(
         raise typer.Exit(1)
 
 
+@app.command("raportti_laske", help="Laskee raportin rivit valmiiksi tarkastelupäivälle.")
+def raportti_laske(
+    tarkastelupvm: str = typer.Argument(
+        None,
+        help="Tarkastelupäivämäärä (YYYY-MM-DD tai DD.MM.YYYY). Ilman päivämäärää "
+        "lasketaan uudelleen kaikki valmiiksi lasketut päivät.",
+    ),
+    poista: bool = typer.Option(
+        False, "--poista", help="Poistaa tarkastelupäivän valmiiksi lasketut rivit."
+    ),
+):
+    """
+    Valmiiksi lasketuista riveistä raportti-komento suodattaa vain kohteet,
+    joten saman tarkastelupäivän raportit eri rajauksilla valmistuvat
+    nopeasti. Lasketut päivät eivät päivity tuonneissa, joten ne lasketaan
+    uudelleen tällä komennolla tuontien jälkeen.
+    """
+    from jkrimporter.providers.db.services.raportti import (
+        paivita_raportin_kohteet,
+        poista_raportin_kohteet,
+    )
+
+    if tarkastelupvm is None:
+        if poista:
+            with Session(engine) as session:
+                poista_raportin_kohteet(session)
+            print("Kaikki valmiiksi lasketut raportin rivit poistettu.")
+        else:
+            _paivita_lasketut_raportit()
+        return
+
+    tarkastelupvm_date = parse_date_string(tarkastelupvm)
+    with Session(engine) as session:
+        if poista:
+            poista_raportin_kohteet(session, tarkastelupvm_date)
+            print(f"Raportin rivit poistettu {tarkastelupvm_date}.")
+        else:
+            kohteita = paivita_raportin_kohteet(session, tarkastelupvm_date)
+            print(f"Raportin rivit laskettu {tarkastelupvm_date}: {kohteita} kohdetta.")
+
+
+@app.command("raportti_erat", help="Luo useita raportteja rinnakkain.")
+def raportti_erat(
+    ajot_path: Path = typer.Argument(
+        ...,
+        help="Raporttiajojen CSV-tiedosto (puolipiste-erotin), sarakkeet: tarkastelupvm;kunta;"
+        "huoneistomaara;taajama;kohde_tyyppi;onko_viemari. Arvot kuten raportti-komennolla, "
+        "kunta * = jokainen kunta erikseen.",
+    ),
+    output_dir: Path = typer.Argument(..., help="Kansio, johon raportit tallennetaan"),
+    formaatti: Raporttimuoto = typer.Option(
+        Raporttimuoto.xlsx,
+        "--format",
+        help="Raporttien tiedostomuoto. Parquet vaatii pyarrow-paketin.",
+    ),
+    rinnakkain: Optional[int] = typer.Option(
+        None,
+        "--rinnakkain",
+        help="Samanaikaisten raporttien enimmäismäärä. Oletuksena yhteyspoolin koko.",
+    ),
+):
+    """
+    Jokainen raportti haetaan omalla tietokantayhteydellään ja kirjoitetaan
+    omaan tiedostoonsa. Saman tarkastelupäivän raportit kannattaa laskea
+    ensin valmiiksi raportti_laske-komennolla.
+    """
+    import time
+
+    from jkrimporter.conf import engineconf
+    from jkrimporter.providers.db.services.raportti import (
+        aja_raportit,
+        kunnat,
+        lue_raporttiajot,
+    )
+
+    if formaatti == Raporttimuoto.parquet:
+        import_pyarrow()
+
+    yhteyksia = engineconf["pool_size"] + max(engineconf["max_overflow"], 0)
+    if rinnakkain is None:
+        rinnakkain = engineconf["pool_size"]
+    if rinnakkain > yhteyksia:
+        print(
+            f"Rinnakkaisuus {rinnakkain} on suurempi kuin yhteyspoolin koko {yhteyksia}, "
+            f"käytetään {yhteyksia}."
+        )
+        rinnakkain = yhteyksia
+
+    with Session(engine) as session:
+        kaikki_kunnat = kunnat(session)
+    try:
+        ajot = lue_raporttiajot(ajot_path, kaikki_kunnat)
+    except ValueError as e:
+        typer.echo(f"Virhe raporttiajojen luvussa: {str(e)}", err=True)
+        raise typer.Exit(1)
+
+    print(f"Luodaan {len(ajot)} raporttia, {rinnakkain} rinnakkain.")
+    alku = time.perf_counter()
+    tulokset = aja_raportit(ajot, output_dir, formaatti, rinnakkain)
+    kesto = time.perf_counter() - alku
+
+    for tulos in tulokset:
+        if tulos.virhe:
+            print(f"VIRHE {tulos.polku}: {tulos.virhe} ({tulos.kesto:.1f} s)")
+        else:
+            print(f"{tulos.polku}: {tulos.riveja} riviä, {tulos.kesto:.1f} s")
+    onnistuneet = [tulos for tulos in tulokset if not tulos.virhe]
+    print(
+        f"Valmis: {len(onnistuneet)}/{len(tulokset)} raporttia, "
+        f"{sum(tulos.riveja for tulos in onnistuneet)} riviä, {kesto:.1f} s "
+        f"(raporttien yhteenlaskettu kesto {sum(tulos.kesto for tulos in tulokset):.1f} s)"
+    )
+    if len(onnistuneet) < len(tulokset):
+        raise typer.Exit(1)
+
+
 @provider_app.command("add", help="Lisää uusi tiedontuottaja järjestelmään.")
 def tiedontuottaja_add_new(
     tunnus: str = typer.Argument(..., help="Tiedontuottajan tunnus. Esim. 'PJH'"),
     name: str = typer.Argument(..., help="Tiedontuottajan nimi."),
 ):
+    from jkrimporter.providers.db.services.tiedontuottaja import insert_tiedontuottaja
+
     insert_tiedontuottaja(tunnus.upper(), name)
 
 
@@ -453,6 +590,8 @@ def tiedontuottaja_rename(
     tunnus: str = typer.Argument(..., help="Tiedontuottajan tunnus. Esim. 'PJH'"),
     name: str = typer.Argument(..., help="Tiedontuottajan uusi nimi."),
 ):
+    from jkrimporter.providers.db.services.tiedontuottaja import rename_tiedontuottaja
+
     rename_tiedontuottaja(tunnus.upper(), name)
 
 
@@ -460,11 +599,15 @@ def tiedontuottaja_rename(
 def tiedontuottaja_remove(
     tunnus: str = typer.Argument(..., help="Tiedontuottajan tunnus. Esim. 'PJH'")
 ):
+    from jkrimporter.providers.db.services.tiedontuottaja import remove_tiedontuottaja
+
     remove_tiedontuottaja(tunnus.upper())
 
 
 @provider_app.command("list", help="Listaa järjestelmästä löytyvät tiedontuottajat.")
 def tiedontuottaja_list():
+    from jkrimporter.providers.db.services.tiedontuottaja import list_tiedontuottajat
+
     for tiedontuottaja in list_tiedontuottajat():
         print(f"{tiedontuottaja.tunnus}\t{tiedontuottaja.nimi}")
 
@@ -490,9 +633,7 @@ def import_hapa(
 
             typer.echo(f"Importing HAPA data from {aineistopolku}")
 
-            # Create SQLAlchemy session
-            Session = scoped_session(sessionmaker(bind=engine))
-            with Session() as session:
+            with Session(engine) as session:
                 # Read CSV file to verify structure before importing
                 with open(aineistopolku, 'r', encoding='utf-8') as f:
                     reader = csv.reader(f, delimiter=';')
@@ -544,15 +685,14 @@ def import_hapa(
                 """
 
                 # Execute the COPY command with the temporary file using copy_expert
-                with Session() as session:
-                    connection = session.connection().connection
-                    cursor = connection.cursor()
+                connection = session.connection().connection
+                cursor = connection.cursor()
 
-                    # Open the file and use copy_expert
-                    with open(temp_path, 'r', encoding='utf-8') as f:
-                        cursor.copy_expert(copy_sql, f)
+                # Open the file and use copy_expert
+                with open(temp_path, 'r', encoding='utf-8') as f:
+                    cursor.copy_expert(copy_sql, f)
 
-                    connection.commit()
+                session.commit()
 
                 # Clean up the temporary file
                 try:
@@ -561,9 +701,8 @@ def import_hapa(
                     pass
 
                 # Get count of imported rows
-                with Session() as session:
-                    result = session.execute(text("SELECT COUNT(*) FROM jkr.hapa_aineisto WHERE tuonti_pvm >= CURRENT_DATE"))
-                    count = result.scalar()
+                result = session.execute(text("SELECT COUNT(*) FROM jkr.hapa_aineisto WHERE tuonti_pvm >= CURRENT_DATE"))
+                count = result.scalar()
 
                 typer.echo(f"Successfully imported {count} HAPA records")
                 typer.echo("VALMIS!")
@@ -595,7 +734,7 @@ def import_kaivotiedot(
     """
     with sisaanlukutapahtuma():
         # Tarkista että tiedontuottaja on olemassa
-        tiedontuottaja = get_tiedontuottaja(tiedontuottajatunnus)
+        tiedontuottaja = _get_tiedontuottaja(tiedontuottajatunnus)
         if not tiedontuottaja:
             typer.echo(
                 f"Tiedontuottajaa {tiedontuottajatunnus} ei löydy järjestelmästä. "
@@ -617,7 +756,7 @@ def import_kaivotiedot(
         print(f"Luettu {len(kaivotiedot_list)} kaivotietoriviä")
 
         # Kirjoita tietokantaan
-        db = DbProvider()
+        db = _db_provider()
         db.write_kaivotiedot(kaivotiedot_list, tiedontuottajatunnus, siirtotiedosto)
 
         print("VALMIS!")
@@ -639,7 +778,7 @@ def import_kaivotiedon_lopetukset(
     """
     with sisaanlukutapahtuma():
         # Tarkista että tiedontuottaja on olemassa
-        tiedontuottaja = get_tiedontuottaja(tiedontuottajatunnus)
+        tiedontuottaja = _get_tiedontuottaja(tiedontuottajatunnus)
         if not tiedontuottaja:
             typer.echo(
                 f"Tiedontuottajaa {tiedontuottajatunnus} ei löydy järjestelmästä. "
@@ -661,7 +800,7 @@ def import_kaivotiedon_lopetukset(
         print(f"Luettu {len(lopetukset_list)} lopetusriviä")
 
         # Kirjoita tietokantaan
-        db = DbProvider()
+        db = _db_provider()
         db.write_kaivotiedon_lopetukset(lopetukset_list, tiedontuottajatunnus, siirtotiedosto)
 
         print("VALMIS!")
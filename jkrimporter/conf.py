@@ -1,12 +1,12 @@
 import os
 import platform
 import sys
+from pathlib import Path
 
 from dotenv import dotenv_values
 
 
 # Path to the .env file in the user's %APPDATA%/jkr directory
-print('checking system and loading env')
 if platform.system() == 'Windows':
     dotenv_path = os.path.join(os.getenv("APPDATA"), "jkr", ".env")
 else:
@@ -37,7 +37,44 @@ if (
     dbconf["password"] = env.get("JKR_TEST_PASSWORD", None)
     dbconf["dbname"] = env.get("JKR_TEST_DB", None)
 
-__all__ = ["dbconf"]
+
+def _env_int(name: str, default=None):
+    value = env.get(name)
+    if value in (None, ""):
+        return default
+    return int(value)
+
+
+# Tietokantayhteyden asetukset. Oletukset vastaavat SQLAlchemyn oletuksia,
+# paitsi executemany_mode: values_plus_batch lähettää monirivisten INSERTien
+# lisäksi myös UPDATE- ja DELETE-lauseet psycopg2:n execute_batch-sivuina.
+engineconf = {
+    "pool_size": _env_int("JKR_DB_POOL_SIZE", 5),
+    "max_overflow": _env_int("JKR_DB_MAX_OVERFLOW", 10),
+    "pool_recycle": _env_int("JKR_DB_POOL_RECYCLE", -1),
+    "executemany_mode": env.get("JKR_DB_EXECUTEMANY_MODE") or "values_plus_batch",
+    # millisekunteina, 0 = ei aikarajaa
+    "statement_timeout": _env_int("JKR_DB_STATEMENT_TIMEOUT", 0),
+    # palvelinpuolen kursorilla luettavien kyselyiden puskurin koko riveinä
+    "stream_buffer_size": _env_int("JKR_DB_STREAM_BUFFER_SIZE", 10000),
+    "application_name": env.get("JKR_DB_APPLICATION_NAME") or "jkr",
+}
+
+__all__ = ["dbconf", "engineconf"]
+
+
+def get_cache_dir() -> Path:
+    """
+    Paikallisten välimuistitiedostojen hakemisto. Oletuksena Windowsissa
+    %LOCALAPPDATA%/jkr/cache ja muualla ~/.cache/jkr. Hakemiston voi vaihtaa
+    JKR_CACHE_DIR-ympäristömuuttujalla.
+    """
+    if env.get("JKR_CACHE_DIR"):
+        return Path(env["JKR_CACHE_DIR"])
+    if platform.system() == "Windows":
+        return Path(os.getenv("LOCALAPPDATA") or os.getenv("APPDATA")) / "jkr" / "cache"
+    return Path(os.getenv("XDG_CACHE_HOME") or Path.home() / ".cache") / "jkr"
+
 
 kohdentumattomat_filename = "kohdentumattomat"
 csv_fileext = ".csv"
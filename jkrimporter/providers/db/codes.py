@@ -1,10 +1,11 @@
 import logging
+import weakref
 from enum import Enum
-from functools import lru_cache
-from typing import TYPE_CHECKING
+from typing import TYPE_CHECKING, Any, Dict, Optional, Tuple
 
-from sqlalchemy import select
-from sqlalchemy.exc import NoResultFound
+from sqlalchemy import select, text
+from sqlalchemy.exc import SQLAlchemyError
+from sqlalchemy.orm import Session
 
 from jkrimporter.model import AKPPoistoSyy as AKPPoistoSyyEnum
 from jkrimporter.model import Jatelaji
@@ -29,21 +30,115 @@ from .models import (
 )
 
 if TYPE_CHECKING:
-    from sqlalchemy.orm import Session
+    from sqlalchemy.engine import Engine
 
 logger = logging.getLogger(__name__)
 
+# Koodistotaulut, jotka luetaan välimuistiin kokonaisina
+KOODISTOT = (
+    Rakennuksenkayttotarkoitus,
+    Rakennuksenolotila,
+    Kohdetyyppi,
+    Osapuolenlaji,
+    Jatetyyppi,
+    Osapuolenrooli,
+    SopimusTyyppi,
+    Keraysvalinetyyppi,
+    Tapahtumalaji,
+    Paatostulos,
+    AKPPoistoSyy,
+)
 
-@lru_cache(maxsize=32)
-def get_code_id(session: "Session", model, selite: str):
-    statement = select(model).where(model.selite == selite)
-    result = session.execute(statement)
+# Koodistojen rivit tietokantaolioina selitteen mukaan:
+# taulu -> selite -> koodi
+Koodistot = Dict[Any, Dict[str, Any]]
+
+# Prosessin välimuisti moottoreittain: moottori -> (koodistoversio, koodistot).
+# Oliot eivät kuulu mihinkään istuntoon, vaan ne liitetään kuhunkin
+# istuntoon get_koodistot-funktiolla.
+_koodistot_by_engine: "Dict[Engine, Tuple[Optional[Tuple], Koodistot]]" = {}
+
+# Istuntoon liitetyt koodit istunnoittain
+_koodistot_by_session: "weakref.WeakKeyDictionary[Session, Koodistot]" = (
+    weakref.WeakKeyDictionary()
+)
+
+
+def koodisto_version(engine: "Engine") -> Optional[Tuple]:
+    """
+    Palauttaa koodistomigraatioiden (R__import_koodisto_*) tarkistussummat
+    Flywayn historiataulusta. Koodistot luetaan uudelleen vain, kun jokin
+    näistä migraatioista on ajettu uudelleen. Jos historiaa ei voi lukea,
+    palautetaan None eikä välimuistia käytetä.
+    """
     try:
-        return result.scalar_one()
-    except NoResultFound:
+        with engine.connect() as connection:
+            return tuple(
+                connection.execute(
+                    text(
+                        """
+                        SELECT script, checksum, installed_rank
+                        FROM jkr.flyway_schema_history
+                        WHERE script LIKE 'R!_!_import!_koodisto%' ESCAPE '!' AND success
+                        ORDER BY installed_rank
+                        """
+                    )
+                ).all()
+            )
+    except SQLAlchemyError as e:
+        logger.debug(f"Koodistojen versiota ei voitu lukea: {e}")
         return None
 
 
+def _load_koodistot(engine: "Engine") -> Koodistot:
+    """
+    Lukee kaikki koodistotaulut, kunkin yhdellä kyselyllä, tai palauttaa ne
+    välimuistista, jos koodistomigraatiot eivät ole muuttuneet.
+    """
+    version = koodisto_version(engine)
+    cached = _koodistot_by_engine.get(engine)
+    if version is not None and cached is not None and cached[0] == version:
+        return cached[1]
+
+    koodistot: Koodistot = {}
+    with Session(engine) as session:
+        for model in KOODISTOT:
+            koodistot[model] = {
+                code.selite: code for code in session.execute(select(model)).scalars()
+            }
+    _koodistot_by_engine[engine] = (version, koodistot)
+    logger.debug(f"Luettu {len(koodistot)} koodistotaulua")
+    return koodistot
+
+
+def get_koodistot(session: "Session") -> Koodistot:
+    """
+    Palauttaa koodistot istuntoon liitettyinä olioina. Oliot liitetään
+    istuntoon ilman tietokantakyselyjä (merge, load=False), joten niitä voi
+    käyttää suoraan uusien rivien viitteinä. Välimuisti on moottorikohtainen
+    myös silloin, kun istunto on sidottu yksittäiseen yhteyteen.
+    """
+    koodistot = _koodistot_by_session.get(session)
+    if koodistot is None:
+        koodistot = {
+            model: {
+                selite: session.merge(code, load=False)
+                for selite, code in codes.items()
+            }
+            for model, codes in _load_koodistot(session.get_bind().engine).items()
+        }
+        _koodistot_by_session[session] = koodistot
+    return koodistot
+
+
+def get_code_id(session: "Session", model, selite: str):
+    if model in KOODISTOT:
+        return get_koodistot(session)[model].get(selite)
+    return session.execute(
+        select(model).where(model.selite == selite)
+    ).scalar_one_or_none()
+
+
 class KohdeTyyppi(Enum):
     ALUEKERAYS = "aluekeräys"
     LAHIKERAYS = "lähikeräys"
@@ -145,22 +240,23 @@ class KiinteatJatelajit(Enum):
 
 
 def _init_lookup_codes(session, model, enumtype: Enum):
-    codes = {enum: get_code_id(session, model, enum.value) for enum in enumtype}
+    koodisto = get_koodistot(session)[model]
+    codes = {enum: koodisto.get(enum.value) for enum in enumtype}
 
     return codes
 
 
-kohdetyypit = {}
-osapuolenlajit = {}
-jatetyypit = {}
-osapuolenroolit = {}
-rakennuksenkayttotarkoitukset = {}
-rakennuksenolotilat = {}
-sopimustyypit = {}
-keraysvalinetyypit = {}
-tapahtumalajit = {}
-paatostulokset = {}
-akppoistosyyt = {}
+kohdetyypit: Dict[KohdeTyyppi, Any] = {}
+osapuolenlajit: Dict[OsapuolenlajiTyyppi, Any] = {}
+jatetyypit: Dict[Jatelaji, Any] = {}
+osapuolenroolit: Dict[OsapuolenrooliTyyppi, Any] = {}
+rakennuksenkayttotarkoitukset: Dict[RakennuksenKayttotarkoitusTyyppi, Any] = {}
+rakennuksenolotilat: Dict[RakennuksenOlotilaTyyppi, Any] = {}
+sopimustyypit: Dict[SopimusTyyppiEnum, Any] = {}
+keraysvalinetyypit: Dict[KeraysvalineTyyppiEnum, Any] = {}
+tapahtumalajit: Dict[TapahtumalajiEnum, Any] = {}
+paatostulokset: Dict[PaatostulosEnum, Any] = {}
+akppoistosyyt: Dict[AKPPoistoSyyEnum, Any] = {}
 
 
 def init_code_objects(session):
@@ -1,6 +1,7 @@
 import json
+from typing import Optional
 
-from sqlalchemy import create_engine
+from sqlalchemy import create_engine, event
 
 from jkrimporter import conf
 from jkrimporter.providers.db.utils import JSONEncoderWithDateSupport
@@ -10,9 +11,64 @@ def json_dumps(value):
     return json.dumps(value, cls=JSONEncoderWithDateSupport)
 
 
+def _connect_args(engineconf) -> dict:
+    options = []
+    if engineconf["statement_timeout"]:
+        options.append(f"-c statement_timeout={engineconf['statement_timeout']}")
+    return {"options": " ".join(options)} if options else {}
+
+
 engine = create_engine(
     "postgresql://{username}:{password}@{host}:{port}/{dbname}".format(**conf.dbconf),
     future=True,
-    json_serializer=json_dumps
+    json_serializer=json_dumps,
+    pool_size=conf.engineconf["pool_size"],
+    max_overflow=conf.engineconf["max_overflow"],
+    pool_recycle=conf.engineconf["pool_recycle"],
+    executemany_mode=conf.engineconf["executemany_mode"],
+    connect_args=_connect_args(conf.engineconf),
     # echo=False,
 )
+
+_application_name = conf.engineconf["application_name"]
+
+
+def set_application_name(komento: Optional[str] = None) -> None:
+    """
+    Asettaa yhteyksien application_name-arvon, jotta ajossa olevan komennon
+    kyselyt erottuvat pg_stat_activity-näkymässä. Arvo on muotoa
+    "jkr import" ja se päivitetään myös jo avattuihin yhteyksiin, kun ne
+    otetaan poolista käyttöön.
+    """
+    global _application_name
+    nimi = conf.engineconf["application_name"]
+    _application_name = f"{nimi} {komento}" if komento else nimi
+
+
+@event.listens_for(engine, "checkout")
+def _set_application_name(dbapi_connection, connection_record, connection_proxy):
+    if connection_record.info.get("application_name") == _application_name:
+        return
+    cursor = dbapi_connection.cursor()
+    try:
+        cursor.execute("SELECT set_config('application_name', %s, false)", (_application_name,))
+    finally:
+        cursor.close()
+    # set_config avaa psycopg2:lla transaktion, joka suljetaan heti
+    dbapi_connection.commit()
+    connection_record.info["application_name"] = _application_name
+
+
+def stream_options(buffer_size: Optional[int] = None) -> dict:
+    """
+    Suoritusasetukset suurille SELECT-kyselyille. Rivit luetaan palvelinpuolen
+    kursorilla enintään buffer_size rivin erissä, joten koko tulosjoukkoa ei
+    ladata kerralla muistiin.
+
+    Käyttö:
+        session.execute(select(...), execution_options=stream_options())
+    """
+    return {
+        "stream_results": True,
+        "max_row_buffer": buffer_size or conf.engineconf["stream_buffer_size"],
+    }
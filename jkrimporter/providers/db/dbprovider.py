@@ -42,6 +42,7 @@ from .database import engine
 from .models import (
     AKPPoistoSyy,
     Jatetyyppi,
+    Kohde,
     Kompostori,
     KompostorinKohteet,
     Kuljetus,
@@ -62,9 +63,16 @@ from .services.buildings import (
     find_inactive_buildings,
     RakennusData
 )
+from .services.dvv_muutos import (
+    changed_kiinteistotunnukset,
+    changed_rakennus_ids,
+    count_dvv_muutokset,
+)
 from .services.dvv_poimintapvm import (
     find_last_dvv_poiminta
 )
+from .services.dvv_rakennustiedot import DvvRakennustiedot
+from .services.kohdennus import KohdeLookup
 from .services.kohde import (
     add_ulkoinen_asiakastieto_for_kohde,
     create_perusmaksurekisteri_kohteet,
@@ -74,6 +82,7 @@ from .services.kohde import (
     check_and_update_old_other_building_kohde_kohdetyyppi,
     get_or_create_single_asunto_kohteet,
     get_ulkoinen_asiakastieto,
+    kohde_counts,
     remove_buildings_from_kohde,
     update_kohde,
     update_ulkoinen_asiakastieto,
@@ -98,13 +107,17 @@ from .services.viemariliitos import (
 from .services.osapuoli import (
     create_or_update_haltija_osapuoli,
     create_or_update_komposti_yhteyshenkilo,
-    should_remove_from_kohde_via_asukas,
-    should_remove_from_kohde_via_omistaja,
+    find_buildings_to_remove_via_asukas,
+    find_buildings_to_remove_via_omistaja,
 )
+from .services.kuljetus import get_kuljetuksen_pvmt_ja_massa, import_asiakastiedot_bulk
 from .services.sopimus import update_sopimukset_for_kohde
 
 logger = logging.getLogger(__name__)
 
+# Kuljetustietojen tuonnin vaihekohtaiset laskurit
+import_counts: Dict[str, int] = defaultdict(int)
+
 
 def count(jkr_data: JkrData):
     prt_counts: Dict[str, IntervalCounter] = defaultdict(IntervalCounter)
@@ -133,15 +146,10 @@ def insert_kuljetukset(
     urakoitsija: Tiedontuottaja,
 ):
     for tyhjennys in tyhjennystapahtumat:
-        print("importing tyhjennys")
-        print(tyhjennys)
-        if not tyhjennys.alkupvm:
-            # In many cases, only one date is known for tyhjennys. Looks like
-            # in those cases the date is marked as the end date.
-            alkupvm = tyhjennys.loppupvm or raportointi_alkupvm
-        else:
-            alkupvm = tyhjennys.alkupvm
-        loppupvm = tyhjennys.loppupvm or raportointi_loppupvm
+        logger.debug("importing tyhjennys %s", tyhjennys)
+        alkupvm, loppupvm, massa = get_kuljetuksen_pvmt_ja_massa(
+            tyhjennys, raportointi_alkupvm, raportointi_loppupvm
+        )
 
         jatetyyppi = codes.jatetyypit[tyhjennys.jatelaji]
         if not jatetyyppi:
@@ -150,10 +158,6 @@ def insert_kuljetukset(
                 f"'{tyhjennys.jatelaji}' unknown"
             )
             continue
-        if tyhjennys.jatelaji not in codes.KiinteatJatelajit:
-            massa = None
-        else:
-            massa = tyhjennys.massa
 
         exists = any(
             k.jatetyyppi == jatetyyppi
@@ -176,35 +180,54 @@ def insert_kuljetukset(
                 jatteen_kuvaus=tyhjennys.jatteen_kuvaus,  # LAH-449: Jätteen kuvaus
             )
             session.add(db_kuljetus)
+            import_counts["kuljetuksia lisätty"] += 1
+        else:
+            import_counts["kuljetus oli jo olemassa"] += 1
 
 
-def find_and_update_kohde(session, asiakas, do_update_kohde, prt_counts, kitu_counts, address_counts):
+def find_and_update_kohde(
+    session,
+    asiakas,
+    do_update_kohde,
+    prt_counts,
+    kitu_counts,
+    address_counts,
+    kohde_lookup: Optional[KohdeLookup] = None,
+):
     """
     Etsii olemassa olevan kohteen asiakkaalle tai luo uuden.
+
+    Jos `kohde_lookup` on annettu, kohde haetaan muistissa olevasta
+    hakemistosta asiakaskohtaisten tietokantakyselyjen sijaan.
     """
+    if kohde_lookup is not None:
+        return _find_and_update_kohde_from_lookup(
+            session, asiakas, do_update_kohde, kohde_lookup
+        )
+
     kohde = None
 
     # 1. Etsi kohde rakennustietojen perusteella
-    print("Searching for kohde by customer data...")
+    logger.debug("Searching for kohde by customer data...")
     if asiakas.rakennukset:
         kohde = find_kohde_by_prt(session, asiakas)
 
     if kohde and do_update_kohde:
-        print("Kohde found, updating dates...")
+        logger.debug("Kohde found, updating dates...")
         update_kohde(kohde, asiakas)
 
     if kohde:
         add_ulkoinen_asiakastieto_for_kohde(session, kohde, asiakas)
     else:
-        print("Could not find kohde.")
+        logger.debug("Could not find kohde.")
 
     if not kohde:
-        print("trying to find via customer id.")
+        logger.debug("trying to find via customer id.")
         ulkoinen_asiakastieto = get_ulkoinen_asiakastieto(session, asiakas.asiakasnumero)
 
         # 2. Etsi kohde asiakasnumeron perusteella
         if ulkoinen_asiakastieto:
-            print("Kohde found by customer id.")
+            logger.debug("Kohde found by customer id.")
 
             kohde = ulkoinen_asiakastieto.kohde
             if do_update_kohde:
@@ -213,6 +236,40 @@ def find_and_update_kohde(session, asiakas, do_update_kohde, prt_counts, kitu_co
     return kohde
 
 
+def _find_and_update_kohde_from_lookup(
+    session: Session,
+    asiakas: Asiakas,
+    do_update_kohde: bool,
+    kohde_lookup: KohdeLookup,
+) -> Optional[Kohde]:
+    kohde = None
+
+    # 1. Etsi kohde rakennustietojen perusteella
+    if asiakas.rakennukset:
+        kohde_id = kohde_lookup.find_kohde_id_by_prt(asiakas)
+        if kohde_id is not None:
+            kohde = session.get(Kohde, kohde_id)
+
+    if kohde:
+        if do_update_kohde:
+            update_kohde(kohde, asiakas)
+            kohde_lookup.update_kohde(kohde)
+        if not kohde_lookup.has_ulkoinen_asiakastieto(asiakas.asiakasnumero):
+            add_ulkoinen_asiakastieto_for_kohde(session, kohde, asiakas)
+            kohde_lookup.add_ulkoinen_asiakastieto(asiakas.asiakasnumero, kohde.id)
+        return kohde
+
+    # 2. Etsi kohde asiakasnumeron perusteella
+    kohde_id = kohde_lookup.find_kohde_id_by_asiakasnumero(asiakas.asiakasnumero)
+    if kohde_id is None:
+        return None
+    kohde = session.get(Kohde, kohde_id)
+    if kohde and do_update_kohde:
+        update_kohde(kohde, asiakas)
+        kohde_lookup.update_kohde(kohde)
+    return kohde
+
+
 def set_end_dates_to_kohteet(
     session: Session,
     poimintapvm: date,
@@ -236,6 +293,7 @@ def import_asiakastiedot(
     prt_counts: Dict[str, IntervalCounter],
     kitu_counts: Dict[str, IntervalCounter],
     address_counts: Dict[str, IntervalCounter],
+    kohde_lookup: Optional[KohdeLookup] = None,
 ):
 
     kohde = find_and_update_kohde(
@@ -245,10 +303,13 @@ def import_asiakastiedot(
         prt_counts,
         kitu_counts,
         address_counts,
+        kohde_lookup,
     )
     if not kohde:
-        print(f"Could not find kohde for asiakas {asiakas}, skipping...")
+        logger.debug("Could not find kohde for asiakas %s, skipping...", asiakas)
+        import_counts["kohdentumattomia asiakkaita"] += 1
         return asiakas
+    import_counts["kohdentuneita asiakkaita"] += 1
 
     # Update osapuolet from the same tiedontuottaja. This function will not
     # touch data from other tiedontuottajat.
@@ -272,6 +333,8 @@ def import_dvv_kohteet(
     poimintapvm: Optional[date],
     loppupvm: Optional[date] = None,
     perusmaksutiedosto: Optional[Path] = None,
+    workers: int = 1,
+    incremental: bool = False,
 ) -> None:
     """
     Luo kohteet DVV rakennustiedoista määritysten mukaisessa järjestyksessä.
@@ -286,6 +349,10 @@ def import_dvv_kohteet(
         poimintapvm: Uusien kohteiden alkupäivämäärä ja vanhojen loppupäivämäärä-1
         loppupvm: Uusien kohteiden loppupäivämäärä (None = ei loppupäivää)
         perusmaksutiedosto: Polku perusmaksurekisterin Excel-tiedostoon
+        workers: Kiinteistöjen rakennusryhmittelyn prosessien määrä
+        incremental: Käsittele vain poimintapäivän DVV-muutosjoukon
+            (jkr.dvv_muutos) rakennukset ja kiinteistöt. Jos muutosjoukkoa ei
+            ole kirjattu, käsitellään kaikki rakennukset.
     """
     logger = logging.getLogger(__name__)
     print("Aloitetaan DVV-kohteiden luonti...")
@@ -310,13 +377,18 @@ def import_dvv_kohteet(
     #     print("Loppupäivämäärät asetettu")
     #     logger.info("Loppupäivämäärät asetettu")
 
+    # Kohteettomien rakennusten DVV-tiedot ladataan kerran ja päivitetään
+    # vaiheiden välillä vain muuttuneiden rakennusten osalta.
+    dvv: Optional[DvvRakennustiedot] = None
+
     # 1. Perusmaksurekisterin kohteet (jos tiedosto annettu)
     if perusmaksutiedosto:
         print(f"\nLuodaan perusmaksurekisterin kohteet...")
         logger.info("\nLuodaan perusmaksurekisterin kohteet...")
         try:
+            dvv = DvvRakennustiedot.load(session, poimintapvm, loppupvm)
             perusmaksukohteet = create_perusmaksurekisteri_kohteet(
-                session, perusmaksutiedosto, poimintapvm, loppupvm
+                session, perusmaksutiedosto, poimintapvm, loppupvm, dvv=dvv
             )
             session.commit()
             print(
@@ -333,15 +405,34 @@ def import_dvv_kohteet(
         print(f"Ei perusmaksurekisteritiedostoa, ohitetaan vaihe 1")
         logger.info("Ei perusmaksurekisteritiedostoa, ohitetaan vaihe 1")
 
+    # Inkrementaalisessa ajossa tarkastellaan vain muuttuneita rakennuksia
+    muuttuneet_rakennukset = None
+    if incremental:
+        muutosten_maara = count_dvv_muutokset(session, poimintapvm)
+        if muutosten_maara:
+            logger.info(
+                f"Käsitellään {muutosten_maara} DVV-muutosta poimintapäivältä {poimintapvm}"
+            )
+            muuttuneet_rakennukset = changed_rakennus_ids(poimintapvm)
+        else:
+            logger.warning(
+                f"Poimintapäivälle {poimintapvm} ei ole kirjattu DVV-muutoksia, "
+                "käsitellään kaikki rakennukset"
+            )
+
     print("Päätetään vanhat kohteet ennen uusien luomista")
     # Haetaan rakennukset, joita ei enää löydy aineistoista
-    poistettavat_paattyneet_rakennukset = find_inactive_buildings(session)
+    poistettavat_paattyneet_rakennukset = find_inactive_buildings(
+        session, muuttuneet_rakennukset
+    )
     print(f"Löydettiin {len(poistettavat_paattyneet_rakennukset)} päättynyttä rakennusta")
 
     poistettavat_rakennukset: list[RakennusData] = poistettavat_paattyneet_rakennukset
 
     # Haetaan rakennukset, joiden omistajat tai asukkaat ovat vaihtuneet kohteilta
-    tarkistettava_rakennus_id_lists = find_active_buildings_with_moved_residents_or_owners(session)
+    tarkistettava_rakennus_id_lists = find_active_buildings_with_moved_residents_or_owners(
+        session, muuttuneet_rakennukset
+    )
     print(f"Tarkistetaan {len(tarkistettava_rakennus_id_lists['asukasRakennukset'])} asukasta vaihtanutta rakennusta")
 
     # Asukaspohjaiset päätökset
@@ -351,9 +442,15 @@ def import_dvv_kohteet(
         dvv_poimintapvm = find_last_dvv_poiminta(session)
 
 
+    # Tarkastetaan rakennusten asukastietojen muutokset kerralla
+    poistettavat_asukas_idt = find_buildings_to_remove_via_asukas(
+        session,
+        [rakennus["id"] for rakennus in tarkistettava_rakennus_id_lists['asukasRakennukset']],
+        poimintapvm,
+        dvv_poimintapvm,
+    )
     for rakennus in tarkistettava_rakennus_id_lists['asukasRakennukset']:
-        # Tarkastetaan kunkin rakennuksen asukastietojen muutokset
-        if should_remove_from_kohde_via_asukas(session, rakennus["id"], poimintapvm, dvv_poimintapvm):
+        if rakennus["id"] in poistettavat_asukas_idt:
             poistettavat_rakennukset.append(rakennus)
         else:
             pysyvat_rakennukset_asukastiedolla.append(rakennus)
@@ -363,9 +460,15 @@ def import_dvv_kohteet(
     # Omistajapohjaiset päätökset
     pysyvat_rakennukset_omistajatiedolla = []
     poistettavat_rakennukset_omistaja: list[RakennusData] = []
+    # Tarkastetaan rakennusten omistajatietojen muutokset kerralla
+    poistettavat_omistaja_idt = find_buildings_to_remove_via_omistaja(
+        session,
+        [rakennus["id"] for rakennus in tarkistettava_rakennus_id_lists['omistajaRakennukset']],
+        poimintapvm,
+        dvv_poimintapvm,
+    )
     for rakennus in tarkistettava_rakennus_id_lists['omistajaRakennukset']:
-        # Tarkastetaan kunkin rakennuksen omistajatietojen muutokset
-        if should_remove_from_kohde_via_omistaja(session, rakennus["id"], poimintapvm, dvv_poimintapvm):
+        if rakennus["id"] in poistettavat_omistaja_idt:
             poistettavat_rakennukset_omistaja.append(rakennus)
         else:
             pysyvat_rakennukset_omistajatiedolla.append(rakennus)
@@ -386,12 +489,30 @@ def import_dvv_kohteet(
 
     session.commit()
 
+    # Muodostetaan kohteet uudelleen vain muuttuneilla kiinteistöillä ja
+    # kiinteistöillä, joiden kohteilta poistettiin rakennuksia
+    kiinteistorajaus = None
+    if muuttuneet_rakennukset is not None:
+        kiinteistorajaus = changed_kiinteistotunnukset(
+            poimintapvm,
+            {kohteen_rakennus.kohde_id for kohteen_rakennus in poistettujen_rakennusten_kohteet},
+        )
+
+    if dvv is None:
+        dvv = DvvRakennustiedot.load(session, poimintapvm, loppupvm, kiinteistorajaus)
+
     # 2. Yhden asunnon kohteet (omakotitalot ja paritalot)
     logger.info("\nLuodaan yhden asunnon kohteet...")
     print("\nLuodaan yhden asunnon kohteet...")
 
     single_asunto_kohteet = get_or_create_single_asunto_kohteet(
-        session, poimintapvm, loppupvm, poistettujen_rakennusten_kohteet
+        session,
+        poimintapvm,
+        loppupvm,
+        poistettujen_rakennusten_kohteet,
+        workers=workers,
+        kiinteistorajaus=kiinteistorajaus,
+        dvv=dvv,
     )
     session.commit()
     logger.info(f"Luotu {len(single_asunto_kohteet)} yhden asunnon kohdetta")
@@ -401,7 +522,13 @@ def import_dvv_kohteet(
     logger.info("\nLuodaan loput kohteet...")
     print("\nLuodaan loput kohteet...")
     multiple_and_uninhabited_kohteet = get_or_create_multiple_and_uninhabited_kohteet(
-        session, poimintapvm, loppupvm, poistettujen_rakennusten_kohteet
+        session,
+        poimintapvm,
+        loppupvm,
+        poistettujen_rakennusten_kohteet,
+        workers=workers,
+        kiinteistorajaus=kiinteistorajaus,
+        dvv=dvv,
     )
     session.commit()
     logger.info(f"Luotu {len(multiple_and_uninhabited_kohteet)} muuta kohdetta")
@@ -430,6 +557,236 @@ def import_dvv_kohteet(
     logger.info(f"\nDVV-kohteiden luonti valmis. Luotu yhteensä {total_kohteet} kohdetta.")
 
 
+def create_urakoitsijat(session: Session, jkr_data: JkrData) -> Dict[str, Tiedontuottaja]:
+    # The same tiedontuottaja may contain data from multiple
+    # urakoitsijat. Create all urakoitsijat in the db first.
+    print("Importoidaan urakoitsijat")
+    urakoitsijat: Set[str] = set()
+    for asiakas in jkr_data.asiakkaat.values():
+        if asiakas.asiakasnumero.jarjestelma not in urakoitsijat:
+            print(f"found urakoitsija {asiakas.asiakasnumero.jarjestelma}")
+            urakoitsijat.add(asiakas.asiakasnumero.jarjestelma)
+    tiedontuottajat: Dict[str, Tiedontuottaja] = {}
+    for urakoitsija_tunnus in urakoitsijat:
+        print("checking or adding urakoitsija")
+        tiedontuottaja = session.get(Tiedontuottaja, urakoitsija_tunnus)
+        print(tiedontuottaja)
+        if not tiedontuottaja:
+            print("not found, adding")
+            tiedontuottaja = Tiedontuottaja(
+                # let's create the urakoitsijat using only y-tunnus for now.
+                # We can create tiedontuottaja-nimi maps later.
+                tunnus=urakoitsija_tunnus,
+                nimi=urakoitsija_tunnus,
+            )
+            session.add(tiedontuottaja)
+        tiedontuottajat[urakoitsija_tunnus] = tiedontuottaja
+    session.commit()
+    return tiedontuottajat
+
+
+def export_kohdentumattomat_kuljetukset(
+    kohdentumattomat: List[dict], siirtotiedosto: Path
+):
+    """
+    Kirjoittaa kohdentumattomat asiakkaat käynteineen siirtotiedoston
+    kansion kohdentumattomat-tiedostoon.
+    """
+    if kohdentumattomat:
+        kohdentumattomatRivit = 0
+        csv_path = None
+
+        for kohdentumaton in kohdentumattomat:
+
+            # Rebuild rows to insert into the error .csv
+            rows = []
+
+            # Tarkista onko ulkoinen_asiakastieto dict vai LIETE-data
+            ulkoinen = kohdentumaton["ulkoinen_asiakastieto"]
+            if isinstance(ulkoinen, dict):
+                # Dict-muotoinen data
+                # Ohitetaan kohdentumattomien tallennus, koska rakenne on erilainen
+                logger.warning(
+                    f"Ohitetaan kohdentumattoman tiedon tallennus: "
+                    f"ulkoinen_asiakastieto on dict-muodossa"
+                )
+                continue
+
+            # Tarkista onko Lahden siirtotiedoston rivi (jolla on kaynnit-attribuutti)
+            if not hasattr(ulkoinen, 'kaynnit'):
+                # LIETE-data tai muu data jolla ei ole kaynnit-attribuuttia
+                logger.warning(
+                    f"Ohitetaan kohdentumattoman tiedon tallennus: "
+                    f"ulkoinen_asiakastieto ei ole Lahden siirtotiedoston rivi "
+                    f"(tyyppi: {type(ulkoinen).__name__})"
+                )
+                continue
+
+            for ii, _ in enumerate(
+                kohdentumaton["ulkoinen_asiakastieto"].kaynnit
+            ):
+                row_data = {
+                    "UrakoitsijaId": kohdentumaton[
+                        "ulkoinen_asiakastieto"
+                    ].UrakoitsijaId,
+                    "UrakoitsijankohdeId": kohdentumaton[
+                        "ulkoinen_asiakastieto"
+                    ].UrakoitsijankohdeId,
+                    "Kiinteistotunnus": kohdentumaton[
+                        "ulkoinen_asiakastieto"
+                    ].Kiinteistotunnus,
+                    "Kiinteistonkatuosoite": kohdentumaton[
+                        "ulkoinen_asiakastieto"
+                    ].Kiinteistonkatuosoite,
+                    "Kiinteistonposti": kohdentumaton[
+                        "ulkoinen_asiakastieto"
+                    ].Kiinteistonposti,
+                    "Haltijannimi": kohdentumaton[
+                        "ulkoinen_asiakastieto"
+                    ].Haltijannimi,
+                    "Haltijanyhteyshlo": kohdentumaton[
+                        "ulkoinen_asiakastieto"
+                    ].Haltijanyhteyshlo,
+                    "Haltijankatuosoite": kohdentumaton[
+                        "ulkoinen_asiakastieto"
+                    ].Haltijankatuosoite,
+                    "Haltijanposti": kohdentumaton[
+                        "ulkoinen_asiakastieto"
+                    ].Haltijanposti,
+                    "Haltijanmaakoodi": kohdentumaton[
+                        "ulkoinen_asiakastieto"
+                    ].Haltijanmaakoodi,
+                    "Pvmalk": kohdentumaton["voimassa"].lower.strftime(
+                        "%d.%m.%Y"
+                    ),
+                    "Pvmasti": kohdentumaton["voimassa"].upper.strftime(
+                        "%d.%m.%Y"
+                    ),
+                    "tyyppiIdEWC": kohdentumaton[
+                        "ulkoinen_asiakastieto"
+                    ].tyyppiIdEWC,
+                    "COUNT(kaynnit)": kohdentumaton[
+                        "ulkoinen_asiakastieto"
+                    ].kaynnit[ii],
+                    "SUM(astiamaara)": kohdentumaton[
+                        "ulkoinen_asiakastieto"
+                    ].astiamaara,
+                    "koko": kohdentumaton["ulkoinen_asiakastieto"].koko,
+                    "SUM(paino)": kohdentumaton[
+                        "ulkoinen_asiakastieto"
+                    ].paino[ii],
+                    "tyhjennysvali": kohdentumaton[
+                        "ulkoinen_asiakastieto"
+                    ].tyhjennysvali[
+                        ii * 2
+                    ],  # two tyhjennysvalis per row
+                    "kertaaviikossa": kohdentumaton[
+                        "ulkoinen_asiakastieto"
+                    ].kertaaviikossa[ii * 2],
+                    "Voimassaoloviikotalkaen": kohdentumaton[
+                        "ulkoinen_asiakastieto"
+                    ].Voimassaoloviikotalkaen[ii * 2],
+                    "Voimassaoloviikotasti": kohdentumaton[
+                        "ulkoinen_asiakastieto"
+                    ].Voimassaoloviikotasti[ii * 2],
+                    "palveluKimppakohdeId": kohdentumaton[
+                        "ulkoinen_asiakastieto"
+                    ].palveluKimppakohdeId,
+                    "KimpanNimi": kohdentumaton[
+                        "ulkoinen_asiakastieto"
+                    ].kimpanNimi,
+                    "Kimpanyhteyshlo": kohdentumaton[
+                        "ulkoinen_asiakastieto"
+                    ].Kimpanyhteyshlo,
+                    "Kimpankatuosoite": kohdentumaton[
+                        "ulkoinen_asiakastieto"
+                    ].Kimpankatuosoite,
+                    "Kimpanposti": kohdentumaton[
+                        "ulkoinen_asiakastieto"
+                    ].Kimpanposti,
+                    "Kuntatun": kohdentumaton[
+                        "ulkoinen_asiakastieto"
+                    ].Kuntatun,
+                    "Keskeytysalkaen": kohdentumaton[
+                        "ulkoinen_asiakastieto"
+                    ].Keskeytysalkaen,
+                    "Keskeytysasti": kohdentumaton[
+                        "ulkoinen_asiakastieto"
+                    ].Keskeytysasti,
+                }
+                if (
+                    kohdentumaton["ulkoinen_asiakastieto"].tyhjennysvali[
+                        ii * 2 + 1
+                    ]
+                    is not None
+                ):
+                    row_data["tyhjennysvali2"] = kohdentumaton[
+                        "ulkoinen_asiakastieto"
+                    ].tyhjennysvali[ii * 2 + 1]
+                if (
+                    kohdentumaton["ulkoinen_asiakastieto"].kertaaviikossa[
+                        ii * 2 + 1
+                    ]
+                    is not None
+                ):
+                    row_data["kertaaviikossa2"] = kohdentumaton[
+                        "ulkoinen_asiakastieto"
+                    ].kertaaviikossa[ii * 2 + 1]
+                if (
+                    kohdentumaton[
+                        "ulkoinen_asiakastieto"
+                    ].Voimassaoloviikotalkaen[ii * 2 + 1]
+                    is not None
+                ):
+                    row_data["Voimassaoloviikotalkaen2"] = kohdentumaton[
+                        "ulkoinen_asiakastieto"
+                    ].Voimassaoloviikotalkaen[ii * 2 + 1]
+                if (
+                    kohdentumaton[
+                        "ulkoinen_asiakastieto"
+                    ].Voimassaoloviikotasti[ii * 2 + 1]
+                    is not None
+                ):
+                    row_data["Voimassaoloviikotasti2"] = kohdentumaton[
+                        "ulkoinen_asiakastieto"
+                    ].Voimassaoloviikotasti[ii * 2 + 1]
+                rows.append(row_data)
+
+
+            csv_path = (
+                siirtotiedosto
+                / get_kohdentumattomat_siirtotiedosto_filename()
+            )
+            with open(
+                csv_path, mode="a", encoding="cp1252", newline=""
+            ) as csv_file:
+                csv_writer = csv.DictWriter(
+                    csv_file,
+                    fieldnames=get_siirtotiedosto_headers(),
+                    delimiter=";",
+                    quotechar='"',
+                )
+                for rd in rows:
+                    kohdentumattomatRivit = kohdentumattomatRivit + 1
+                    csv_writer.writerow(rd)
+
+        if csv_path and kohdentumattomatRivit > 0:
+            lisaa_lisatieto(f"Kohdentumattomat tiedot ({len(kohdentumattomat)}) kpl eli käynteineen {kohdentumattomatRivit} riviä lisätty CSV-tiedostoon: {csv_path}")
+        elif kohdentumattomatRivit == 0 and kohdentumattomat:
+            # LIETE-data tai muu data jota ei voitu tallentaa Lahden muodossa
+            lisaa_lisatieto(f"Kohdentumattomia tietoja ({len(kohdentumattomat)}) kpl, tallennetaan erilliseen tiedostoon")
+            try:
+                # Käytä siirtotiedoston hakemistoa, ei tiedostoa itseään
+                output_dir = os.path.dirname(str(siirtotiedosto)) if siirtotiedosto else "."
+                export_kohdentumattomat_liete_kuljetukset(
+                    output_dir, kohdentumattomat
+                )
+            except Exception as export_error:
+                logger.exception(f"LIETE-kohdentumattomien tallennus epäonnistui: {export_error}")
+    else:
+        lisaa_lisatieto("Ei kohdentumattomia tietoja.")
+
+
 class DbProvider:
     def write(
         self,
@@ -442,7 +799,7 @@ class DbProvider:
         try:
             kohdentumattomat = []
             kohdentuneet_count = 0
-            print(len(jkr_data.asiakkaat))
+            import_counts.clear()
             progress = Progress(len(jkr_data.asiakkaat))
 
             prt_counts, kitu_counts, address_counts = count(jkr_data)
@@ -451,36 +808,12 @@ class DbProvider:
 
                 tiedoston_tuottaja = session.get(Tiedontuottaja, tiedontuottaja_lyhenne)
 
-                # The same tiedontuottaja may contain data from multiple
-                # urakoitsijat. Create all urakoitsijat in the db first.
-                print("Importoidaan urakoitsijat")
-                urakoitsijat: Set[str] = set()
-                for asiakas in jkr_data.asiakkaat.values():
-                    if asiakas.asiakasnumero.jarjestelma not in urakoitsijat:
-                        print(f"found urakoitsija {asiakas.asiakasnumero.jarjestelma}")
-                        urakoitsijat.add(asiakas.asiakasnumero.jarjestelma)
-                tiedontuottajat: Dict[str, Tiedontuottaja] = {}
-                for urakoitsija_tunnus in urakoitsijat:
-                    print("checking or adding urakoitsija")
-                    tiedontuottaja = session.get(Tiedontuottaja, urakoitsija_tunnus)
-                    print(tiedontuottaja)
-                    if not tiedontuottaja:
-                        print("not found, adding")
-                        tiedontuottaja = Tiedontuottaja(
-                            # let's create the urakoitsijat using only y-tunnus for now.
-                            # We can create tiedontuottaja-nimi maps later.
-                            tunnus=urakoitsija_tunnus,
-                            nimi=urakoitsija_tunnus,
-                        )
-                        session.add(tiedontuottaja)
-                    tiedontuottajat[urakoitsija_tunnus] = tiedontuottaja
-                session.commit()
+                tiedontuottajat = create_urakoitsijat(session, jkr_data)
+                kohde_lookup = KohdeLookup.build(session, tiedontuottajat.keys())
 
                 print("Importoidaan asiakastiedot")
                 for asiakas in jkr_data.asiakkaat.values():
-                    print("---------")
-                    print("importing")
-                    print(asiakas)
+                    logger.debug("importing %s", asiakas)
                     progress.tick()
 
                     # Asiakastieto may come from different urakoitsija than the
@@ -499,6 +832,7 @@ class DbProvider:
                         prt_counts,
                         kitu_counts,
                         address_counts,
+                        kohde_lookup,
                     )
                     if kohdentumaton:
                         asiakas_dict = kohdentumaton.__dict__
@@ -507,232 +841,98 @@ class DbProvider:
                         kohdentuneet_count += 1
                 session.commit()
                 progress.complete()
+                logger.info(
+                    "Kohdennusindeksi: osumat %s, ohitukset %s",
+                    kohde_lookup.hits,
+                    kohde_lookup.misses,
+                )
 
                 lisaa_lisatieto(f"Asiakkaita yhteensä: {len(jkr_data.asiakkaat)}, kohdentuneet: {kohdentuneet_count}, kohdentumattomat: {len(kohdentumattomat)}")
 
-                if kohdentumattomat:
-                    kohdentumattomatRivit = 0
-                    csv_path = None
-                    
-                    for kohdentumaton in kohdentumattomat:
-
-                        # Rebuild rows to insert into the error .csv
-                        rows = []
-                        
-                        # Tarkista onko ulkoinen_asiakastieto dict vai LIETE-data
-                        ulkoinen = kohdentumaton["ulkoinen_asiakastieto"]
-                        if isinstance(ulkoinen, dict):
-                            # Dict-muotoinen data
-                            # Ohitetaan kohdentumattomien tallennus, koska rakenne on erilainen
-                            logger.warning(
-                                f"Ohitetaan kohdentumattoman tiedon tallennus: "
-                                f"ulkoinen_asiakastieto on dict-muodossa"
-                            )
-                            continue
-                        
-                        # Tarkista onko Lahden siirtotiedoston rivi (jolla on kaynnit-attribuutti)
-                        if not hasattr(ulkoinen, 'kaynnit'):
-                            # LIETE-data tai muu data jolla ei ole kaynnit-attribuuttia
-                            logger.warning(
-                                f"Ohitetaan kohdentumattoman tiedon tallennus: "
-                                f"ulkoinen_asiakastieto ei ole Lahden siirtotiedoston rivi "
-                                f"(tyyppi: {type(ulkoinen).__name__})"
-                            )
-                            continue
-                        
-                        for ii, _ in enumerate(
-                            kohdentumaton["ulkoinen_asiakastieto"].kaynnit
-                        ):
-                            row_data = {
-                                "UrakoitsijaId": kohdentumaton[
-                                    "ulkoinen_asiakastieto"
-                                ].UrakoitsijaId,
-                                "UrakoitsijankohdeId": kohdentumaton[
-                                    "ulkoinen_asiakastieto"
-                                ].UrakoitsijankohdeId,
-                                "Kiinteistotunnus": kohdentumaton[
-                                    "ulkoinen_asiakastieto"
-                                ].Kiinteistotunnus,
-                                "Kiinteistonkatuosoite": kohdentumaton[
-                                    "ulkoinen_asiakastieto"
-                                ].Kiinteistonkatuosoite,
-                                "Kiinteistonposti": kohdentumaton[
-                                    "ulkoinen_asiakastieto"
-                                ].Kiinteistonposti,
-                                "Haltijannimi": kohdentumaton[
-                                    "ulkoinen_asiakastieto"
-                                ].Haltijannimi,
-                                "Haltijanyhteyshlo": kohdentumaton[
-                                    "ulkoinen_asiakastieto"
-                                ].Haltijanyhteyshlo,
-                                "Haltijankatuosoite": kohdentumaton[
-                                    "ulkoinen_asiakastieto"
-                                ].Haltijankatuosoite,
-                                "Haltijanposti": kohdentumaton[
-                                    "ulkoinen_asiakastieto"
-                                ].Haltijanposti,
-                                "Haltijanmaakoodi": kohdentumaton[
-                                    "ulkoinen_asiakastieto"
-                                ].Haltijanmaakoodi,
-                                "Pvmalk": kohdentumaton["voimassa"].lower.strftime(
-                                    "%d.%m.%Y"
-                                ),
-                                "Pvmasti": kohdentumaton["voimassa"].upper.strftime(
-                                    "%d.%m.%Y"
-                                ),
-                                "tyyppiIdEWC": kohdentumaton[
-                                    "ulkoinen_asiakastieto"
-                                ].tyyppiIdEWC,
-                                "COUNT(kaynnit)": kohdentumaton[
-                                    "ulkoinen_asiakastieto"
-                                ].kaynnit[ii],
-                                "SUM(astiamaara)": kohdentumaton[
-                                    "ulkoinen_asiakastieto"
-                                ].astiamaara,
-                                "koko": kohdentumaton["ulkoinen_asiakastieto"].koko,
-                                "SUM(paino)": kohdentumaton[
-                                    "ulkoinen_asiakastieto"
-                                ].paino[ii],
-                                "tyhjennysvali": kohdentumaton[
-                                    "ulkoinen_asiakastieto"
-                                ].tyhjennysvali[
-                                    ii * 2
-                                ],  # two tyhjennysvalis per row
-                                "kertaaviikossa": kohdentumaton[
-                                    "ulkoinen_asiakastieto"
-                                ].kertaaviikossa[ii * 2],
-                                "Voimassaoloviikotalkaen": kohdentumaton[
-                                    "ulkoinen_asiakastieto"
-                                ].Voimassaoloviikotalkaen[ii * 2],
-                                "Voimassaoloviikotasti": kohdentumaton[
-                                    "ulkoinen_asiakastieto"
-                                ].Voimassaoloviikotasti[ii * 2],
-                                "palveluKimppakohdeId": kohdentumaton[
-                                    "ulkoinen_asiakastieto"
-                                ].palveluKimppakohdeId,
-                                "KimpanNimi": kohdentumaton[
-                                    "ulkoinen_asiakastieto"
-                                ].kimpanNimi,
-                                "Kimpanyhteyshlo": kohdentumaton[
-                                    "ulkoinen_asiakastieto"
-                                ].Kimpanyhteyshlo,
-                                "Kimpankatuosoite": kohdentumaton[
-                                    "ulkoinen_asiakastieto"
-                                ].Kimpankatuosoite,
-                                "Kimpanposti": kohdentumaton[
-                                    "ulkoinen_asiakastieto"
-                                ].Kimpanposti,
-                                "Kuntatun": kohdentumaton[
-                                    "ulkoinen_asiakastieto"
-                                ].Kuntatun,
-                                "Keskeytysalkaen": kohdentumaton[
-                                    "ulkoinen_asiakastieto"
-                                ].Keskeytysalkaen,
-                                "Keskeytysasti": kohdentumaton[
-                                    "ulkoinen_asiakastieto"
-                                ].Keskeytysasti,
-                            }
-                            if (
-                                kohdentumaton["ulkoinen_asiakastieto"].tyhjennysvali[
-                                    ii * 2 + 1
-                                ]
-                                is not None
-                            ):
-                                row_data["tyhjennysvali2"] = kohdentumaton[
-                                    "ulkoinen_asiakastieto"
-                                ].tyhjennysvali[ii * 2 + 1]
-                            if (
-                                kohdentumaton["ulkoinen_asiakastieto"].kertaaviikossa[
-                                    ii * 2 + 1
-                                ]
-                                is not None
-                            ):
-                                row_data["kertaaviikossa2"] = kohdentumaton[
-                                    "ulkoinen_asiakastieto"
-                                ].kertaaviikossa[ii * 2 + 1]
-                            if (
-                                kohdentumaton[
-                                    "ulkoinen_asiakastieto"
-                                ].Voimassaoloviikotalkaen[ii * 2 + 1]
-                                is not None
-                            ):
-                                row_data["Voimassaoloviikotalkaen2"] = kohdentumaton[
-                                    "ulkoinen_asiakastieto"
-                                ].Voimassaoloviikotalkaen[ii * 2 + 1]
-                            if (
-                                kohdentumaton[
-                                    "ulkoinen_asiakastieto"
-                                ].Voimassaoloviikotasti[ii * 2 + 1]
-                                is not None
-                            ):
-                                row_data["Voimassaoloviikotasti2"] = kohdentumaton[
-                                    "ulkoinen_asiakastieto"
-                                ].Voimassaoloviikotasti[ii * 2 + 1]
-                            rows.append(row_data)
-                            
-
-                        csv_path = (
-                            siirtotiedosto
-                            / get_kohdentumattomat_siirtotiedosto_filename()
-                        )
-                        with open(
-                            csv_path, mode="a", encoding="cp1252", newline=""
-                        ) as csv_file:
-                            csv_writer = csv.DictWriter(
-                                csv_file,
-                                fieldnames=get_siirtotiedosto_headers(),
-                                delimiter=";",
-                                quotechar='"',
-                            )
-                            for rd in rows:
-                                kohdentumattomatRivit = kohdentumattomatRivit + 1
-                                csv_writer.writerow(rd)
-
-                    if csv_path and kohdentumattomatRivit > 0:
-                        lisaa_lisatieto(f"Kohdentumattomat tiedot ({len(kohdentumattomat)}) kpl eli käynteineen {kohdentumattomatRivit} riviä lisätty CSV-tiedostoon: {csv_path}")
-                    elif kohdentumattomatRivit == 0 and kohdentumattomat:
-                        # LIETE-data tai muu data jota ei voitu tallentaa Lahden muodossa
-                        lisaa_lisatieto(f"Kohdentumattomia tietoja ({len(kohdentumattomat)}) kpl, tallennetaan erilliseen tiedostoon")
-                        try:
-                            # Käytä siirtotiedoston hakemistoa, ei tiedostoa itseään
-                            output_dir = os.path.dirname(str(siirtotiedosto)) if siirtotiedosto else "."
-                            export_kohdentumattomat_liete_kuljetukset(
-                                output_dir, kohdentumattomat
-                            )
-                        except Exception as export_error:
-                            logger.exception(f"LIETE-kohdentumattomien tallennus epäonnistui: {export_error}")
-                else:
-                    lisaa_lisatieto("Ei kohdentumattomia tietoja.")
+                export_kohdentumattomat_kuljetukset(kohdentumattomat, siirtotiedosto)
 
         except Exception as e:
             logger.exception(e)
             raise
         finally:
             logger.debug(building_counts)
+            logger.info("Kuljetustietojen tuonti: %s", dict(import_counts))
+
+    def write_bulk(
+        self,
+        jkr_data: JkrData,
+        tiedontuottaja_lyhenne: str,
+        ala_paivita_yhteystietoja: bool,
+        ala_paivita_kohdetta: bool,
+        siirtotiedosto: Path,
+    ):
+        """
+        Sama kuin `write`, mutta asiakkaat viedään kantaan joukko-operaatioina
+        yhdessä transaktiossa asiakaskohtaisten kyselyjen ja committien sijaan.
+        """
+        try:
+            with Session(engine) as session:
+                init_code_objects(session)
+
+                create_urakoitsijat(session, jkr_data)
+
+                print("Importoidaan asiakastiedot joukkotuontina")
+                kohdentumattomat = [
+                    asiakas.__dict__
+                    for asiakas in import_asiakastiedot_bulk(
+                        session, jkr_data, not ala_paivita_kohdetta
+                    )
+                ]
+                session.commit()
+
+                kohdentuneet_count = len(jkr_data.asiakkaat) - len(kohdentumattomat)
+                lisaa_lisatieto(f"Asiakkaita yhteensä: {len(jkr_data.asiakkaat)}, kohdentuneet: {kohdentuneet_count}, kohdentumattomat: {len(kohdentumattomat)}")
+
+                export_kohdentumattomat_kuljetukset(kohdentumattomat, siirtotiedosto)
+
+        except Exception as e:
+            logger.exception(e)
+            raise
 
     def write_dvv_kohteet(
         self,
         poimintapvm: Optional[datetime.date],
         loppupvm: Optional[datetime.date],
         perusmaksutiedosto: Optional[Path],
+        workers: int = 1,
+        incremental: bool = False,
     ):
         """
         This method creates kohteet from dvv data existing in the database.
 
         Optionally, a perusmaksurekisteri xlsx file may be provided to
         combine dvv buildings with the same customer id.
+
+        Grouping buildings of each kiinteistö may be run in `workers`
+        processes. Kohteet are always written from this process.
+
+        If `incremental` is set, only buildings and kiinteistöt in the
+        change set recorded by import_dvv.sql for poimintapvm are processed.
         """
         try:
             with Session(engine) as session:
                 init_code_objects(session)
                 print("Luodaan kohteet")
-                import_dvv_kohteet(session, poimintapvm, loppupvm, perusmaksutiedosto)
+                import_dvv_kohteet(
+                    session,
+                    poimintapvm,
+                    loppupvm,
+                    perusmaksutiedosto,
+                    workers=workers,
+                    incremental=incremental,
+                )
 
         except Exception as e:
             logger.exception(e)
             raise
         finally:
             logger.debug(building_counts)
+            logger.info("Kohteiden muodostus: %s", dict(kohde_counts))
 
     def write_ilmoitukset(
             self,
@@ -1,13 +1,136 @@
+"""
+Tietokannan taulujen ORM-luokat.
+
+Luokat muodostetaan automapilla tietokannan jkr-skeemasta vasta, kun jotain
+luokkaa käytetään ensimmäisen kerran (moduulin __getattr__). Heijastettu
+MetaData tallennetaan paikalliseen välimuistitiedostoon Flywayn migraatioiden
+tarkistussummien mukaan, joten skeeman ollessa ennallaan käynnistys tekee
+heijastuksen sijaan vain yhden versiokyselyn. Välimuistitiedosto luetaan vain,
+jos sen otsake vastaa skeeman tarkistussummaa ja sisällön tiiviste täsmää.
+Muuten, tai jos luokkien muodostus välimuistista epäonnistuu, skeema
+heijastetaan uudelleen. Välimuistin sijainnin voi vaihtaa JKR_CACHE_DIR-
+ympäristömuuttujalla.
+"""
+
+import hashlib
+import logging
+import os
+import pickle
+import threading
 import warnings
+from typing import Any, Optional
 
 from geoalchemy2 import Geometry  # noqa: F401, must be imported for Geometry reflect
-from sqlalchemy import Column, ForeignKey, Integer, String, Table, Date
+from sqlalchemy import Column, ForeignKey, Integer, MetaData, Date, text
+from sqlalchemy import __version__ as sqlalchemy_version
+from sqlalchemy.exc import SQLAlchemyError
 from sqlalchemy.ext.automap import automap_base
-from sqlalchemy.orm import relationship
 
+from jkrimporter import conf
 from jkrimporter.providers.db.database import engine
 
-Base = automap_base()
+logger = logging.getLogger(__name__)
+
+# Automapin luokat taulujen nimien mukaan
+_AUTOMAP_CLASSES = {
+    "AKPPoistoSyy": "akppoistosyy",
+    "DVVMuutos": "dvv_muutos",
+    "Jatetyyppi": "jatetyyppi",
+    "Jatteenkuljetusalue": "jatteenkuljetusalue",
+    "Katu": "katu",
+    "Keraysvaline": "keraysvaline",
+    "Keraysvalinetyyppi": "keraysvalinetyyppi",
+    "Keskeytys": "keskeytys",
+    "Kiinteisto": "kiinteisto",
+    "Kohde": "kohde",
+    "HapaAineisto": "hapa_aineisto",
+    "Kohdetyyppi": "kohdetyyppi",
+    "KohteenOsapuolet": "kohteen_osapuolet",
+    "Kompostori": "kompostori",
+    "Kuljetus": "kuljetus",
+    "Kunta": "kunta",
+    "Osapuolenlaji": "osapuolenlaji",
+    "Osapuoli": "osapuoli",
+    "Osapuolenrooli": "osapuolenrooli",
+    "Osoite": "osoite",
+    "Paatostulos": "paatostulos",
+    "Pohjavesialue": "pohjavesialue",
+    "Posti": "posti",
+    "Rakennuksenkayttotarkoitus": "rakennuksenkayttotarkoitus",
+    "Rakennuksenolotila": "rakennuksenolotila",
+    "RakennuksenOmistajat": "rakennuksen_omistajat",
+    "RakennuksenVanhimmat": "rakennuksen_vanhimmat",
+    "Sopimus": "sopimus",
+    "SopimusTyyppi": "sopimustyyppi",
+    "Taajama": "taajama",
+    "Tapahtumalaji": "tapahtumalaji",
+    "Tiedontuottaja": "tiedontuottaja",
+    "Tyhjennysvali": "tyhjennysvali",
+    "UlkoinenAsiakastieto": "ulkoinen_asiakastieto",
+    "Velvoite": "velvoite",
+    "Velvoitemalli": "velvoitemalli",
+    "ViemariLiitos": "viemari_liitos",
+    "Viranomaispaatokset": "viranomaispaatokset",
+    "Kaivotiedot": "kaivotieto",
+}
+
+# Itse määritellyt luokat, jotka luodaan samalla kertaa automapin kanssa
+_DECLARED_CLASSES = ("KohteenRakennukset", "KompostorinKohteet", "DVVPoimintaPvm", "Rakennus")
+
+# Luokat ovat moduulin attribuutteja vasta prepare-kutsun jälkeen. Pelkät
+# tyyppimäärittelyt kertovat nimet staattisille tarkistimille sitomatta niitä,
+# joten ensimmäinen käyttö kulkee edelleen moduulin __getattr__-funktion kautta.
+Base: Any
+AKPPoistoSyy: Any
+DVVMuutos: Any
+Jatetyyppi: Any
+Jatteenkuljetusalue: Any
+Katu: Any
+Keraysvaline: Any
+Keraysvalinetyyppi: Any
+Keskeytys: Any
+Kiinteisto: Any
+Kohde: Any
+HapaAineisto: Any
+Kohdetyyppi: Any
+KohteenOsapuolet: Any
+Kompostori: Any
+Kuljetus: Any
+Kunta: Any
+Osapuolenlaji: Any
+Osapuoli: Any
+Osapuolenrooli: Any
+Osoite: Any
+Paatostulos: Any
+Pohjavesialue: Any
+Posti: Any
+Rakennuksenkayttotarkoitus: Any
+Rakennuksenolotila: Any
+RakennuksenOmistajat: Any
+RakennuksenVanhimmat: Any
+Sopimus: Any
+SopimusTyyppi: Any
+Taajama: Any
+Tapahtumalaji: Any
+Tiedontuottaja: Any
+Tyhjennysvali: Any
+UlkoinenAsiakastieto: Any
+Velvoite: Any
+Velvoitemalli: Any
+ViemariLiitos: Any
+Viranomaispaatokset: Any
+Kaivotiedot: Any
+KohteenRakennukset: Any
+KompostorinKohteet: Any
+DVVPoimintaPvm: Any
+Rakennus: Any
+
+_prepare_lock = threading.Lock()
+_prepared = False
+
+# Välimuistitiedoston otsake: tunniste, skeeman tarkistussumma ja sisällön
+# SHA-256-tiiviste omilla riveillään ennen MetaDatan picklea.
+_CACHE_MAGIC = b"jkr-metadata-1"
 
 def name_for_scalar(base, local_cls, referred_cls, constraint):
     """Returns a property name for the many side of a one-to-many relationship
@@ -56,133 +179,248 @@ def name_for_collection(base, local_cls, referred_cls, constraint):
             collection_name = "ehdokaskohde_collection"
     return collection_name
 
-# Define any association tables that need to be directly insertable.
-# Sqlalchemy only generates them automatically if they have extra columns.
-class KohteenRakennukset(Base):
-    __tablename__ = "kohteen_rakennukset"
-    __table_args__ = {"schema": "jkr"}
-    rakennus_id = Column(ForeignKey("jkr.rakennus.id"), primary_key=True)
-    kohde_id = Column(ForeignKey("jkr.kohde.id"), primary_key=True)
-
-class KompostorinKohteet(Base):
-    __tablename__ = "kompostorin_kohteet"
-    __table_args__ = {"schema": "jkr"}
-    kompostori_id = Column(ForeignKey("jkr.kompostori.id"), primary_key=True)
-    kohde_id = Column(ForeignKey("jkr.kohde.id"), primary_key=True)
-
-class DVVPoimintaPvm(Base):
-    __tablename__ = "dvv_poimintapvm"
-    __table_args__ = {"schema": "jkr"}
-
-    id = Column(Integer, primary_key=True)
-    poimintapvm = Column(Date, nullable=False)
-
-# Määritellään Rakennus-luokka ennen automap_base valmistelua
-# jotta voidaan lisätä uusi kenttä
-class Rakennus(Base):
-    __tablename__ = 'rakennus'
-    __table_args__ = {'schema': 'jkr'}
-
-# class HapaAineisto(Base):
-#     __tablename__ = "hapa_aineisto"
-#     __table_args__ = {"schema": "jkr"}
-
-#     id = Column(Integer, primary_key=True)
-#     rakennus_id_tunnus = Column(String(50))     # PRT tunnus
-#     kohde_tunnus = Column(String(50))           # Esim. "098"
-#     sijaintikunta = Column(String(100))         # Esim. "001"
-#     asiakasnro = Column(String(50))             # Esim. "03-0009352-00"
-#     rakennus_id_tunnus2 = Column(String(50))    # Toistuva Rakennus-ID
-#     katunimi_fi = Column(String(100))           # Esim. "Aikkalantie"
-#     talon_numero = Column(String(20))           # Esim. "205"
-#     postinumero = Column(String(5))             # Esim. "15880"
-#     postitoimipaikka_fi = Column(String(100))   # Esim. "Hollola"
-#     kohdetyyppi = Column(String(10))            # "hapa" tai "biohapa"
-#     tuonti_pvm = Column(DateTime(timezone=True))
-#     voimassa = Column(DateRange, nullable=False)
-
-# # Lisätään HapaAineisto __all__ listaan
-# __all__ = [
-#     # ... olemassa olevat ...
-#     "HapaAineisto",
-# ]
-
-
-# Reflect database with warnings filtered
-with warnings.catch_warnings():
-    warnings.filterwarnings(
-        "ignore",
-        message="Skipped unsupported reflection of expression-based index idx_osoite_lower_katu_fi",
-    )
-    Base.prepare(
-        engine,
-        name_for_scalar_relationship=name_for_scalar,
-        name_for_collection_relationship=name_for_collection,
-        reflect=True,
-        reflection_options={"schema": "jkr"},
+def _declare_classes(Base):
+    # Define any association tables that need to be directly insertable.
+    # Sqlalchemy only generates them automatically if they have extra columns.
+    # extend_existing: välimuistista luetussa MetaDatassa taulut ovat jo valmiina.
+    class KohteenRakennukset(Base):
+        __tablename__ = "kohteen_rakennukset"
+        __table_args__ = {"schema": "jkr", "extend_existing": True}
+        rakennus_id = Column(ForeignKey("jkr.rakennus.id"), primary_key=True)
+        kohde_id = Column(ForeignKey("jkr.kohde.id"), primary_key=True)
+
+    class KompostorinKohteet(Base):
+        __tablename__ = "kompostorin_kohteet"
+        __table_args__ = {"schema": "jkr", "extend_existing": True}
+        kompostori_id = Column(ForeignKey("jkr.kompostori.id"), primary_key=True)
+        kohde_id = Column(ForeignKey("jkr.kohde.id"), primary_key=True)
+
+    class DVVPoimintaPvm(Base):
+        __tablename__ = "dvv_poimintapvm"
+        __table_args__ = {"schema": "jkr", "extend_existing": True}
+
+        id = Column(Integer, primary_key=True)
+        poimintapvm = Column(Date, nullable=False)
+
+    # Määritellään Rakennus-luokka ennen automap_base valmistelua
+    # jotta voidaan lisätä uusi kenttä
+    class Rakennus(Base):
+        __tablename__ = 'rakennus'
+        __table_args__ = {'schema': 'jkr', 'extend_existing': True}
+
+    return {
+        "KohteenRakennukset": KohteenRakennukset,
+        "KompostorinKohteet": KompostorinKohteet,
+        "DVVPoimintaPvm": DVVPoimintaPvm,
+        "Rakennus": Rakennus,
+    }
+
+
+def _schema_checksum() -> Optional[str]:
+    """
+    Tiiviste Flywayn onnistuneiden migraatioiden järjestysnumeroista,
+    versioista, skriptien nimistä ja tarkistussummista. Tiiviste muuttuu, kun
+    mikä tahansa migraatio lisätään tai ajetaan uudelleen.
+    """
+    try:
+        with engine.connect() as connection:
+            return connection.execute(
+                text(
+                    """
+                    SELECT md5(string_agg(
+                        concat_ws(':', installed_rank, version, script, checksum),
+                        ',' ORDER BY installed_rank
+                    ))
+                    FROM jkr.flyway_schema_history
+                    WHERE success
+                    """
+                )
+            ).scalar()
+    except SQLAlchemyError as e:
+        logger.warning(f"Skeemaversiota ei voitu lukea, MetaDataa ei välimuisteta: {e}")
+        return None
+
+
+def _metadata_cache_prefix() -> str:
+    tietokanta = "|".join(
+        str(conf.dbconf[avain]) for avain in ("host", "port", "dbname")
     )
+    return f"metadata-{hashlib.sha1(tietokanta.encode('utf-8')).hexdigest()[:12]}-"
+
+
+def _metadata_cache_path(checksum: str):
+    return conf.get_cache_dir() / f"{_metadata_cache_prefix()}{checksum}-{sqlalchemy_version}.pickle"
+
+
+def _cache_header(checksum: str, payload: bytes) -> bytes:
+    digest = hashlib.sha256(payload).hexdigest()
+    return b"\n".join((_CACHE_MAGIC, checksum.encode("ascii"), digest.encode("ascii"))) + b"\n"
+
+
+def _load_cached_metadata(path, checksum: str) -> Optional[MetaData]:
+    """
+    Lukee MetaDatan välimuistista. Tiedosto ohitetaan ja poistetaan, jos se
+    ei ole käyttäjän oma, muut voivat kirjoittaa siihen, sen otsake ei vastaa
+    skeeman tarkistussummaa tai sisällön tiiviste ei täsmää.
+    """
+    try:
+        with open(path, "rb") as f:
+            tila = os.fstat(f.fileno())
+            data = f.read()
+    except FileNotFoundError:
+        return None
+    except OSError as e:
+        logger.warning(f"MetaData-välimuistin {path} luku epäonnistui: {e}")
+        return None
+
+    if hasattr(os, "getuid") and (tila.st_uid != os.getuid() or tila.st_mode & 0o022):
+        logger.warning(f"MetaData-välimuistin {path} omistaja tai oikeudet ovat väärät, ohitetaan")
+        return None
+
+    magic, tallennettu_checksum, digest, payload = (data.split(b"\n", 3) + [b"", b"", b""])[:4]
+    if (
+        magic != _CACHE_MAGIC
+        or tallennettu_checksum != checksum.encode("ascii")
+        or digest != hashlib.sha256(payload).hexdigest().encode("ascii")
+    ):
+        logger.warning(f"MetaData-välimuisti {path} ei vastaa skeemaa, heijastetaan uudelleen")
+        path.unlink(missing_ok=True)
+        return None
+
+    try:
+        metadata = pickle.loads(payload)
+    except Exception as e:
+        logger.warning(f"MetaData-välimuistin {path} luku epäonnistui: {e}")
+        path.unlink(missing_ok=True)
+        return None
+    if not isinstance(metadata, MetaData):
+        path.unlink(missing_ok=True)
+        return None
+    logger.debug(f"MetaData luettu välimuistista {path}")
+    return metadata
+
+
+def _save_cached_metadata(path, checksum: str, metadata: MetaData) -> None:
+    try:
+        path.parent.mkdir(parents=True, exist_ok=True)
+        payload = pickle.dumps(metadata, protocol=pickle.HIGHEST_PROTOCOL)
+        tmp_path = path.with_suffix(f".{os.getpid()}.tmp")
+        fd = os.open(tmp_path, os.O_WRONLY | os.O_CREAT | os.O_TRUNC, 0o600)
+        with os.fdopen(fd, "wb") as f:
+            f.write(_cache_header(checksum, payload))
+            f.write(payload)
+        os.replace(tmp_path, path)
+        # Saman tietokannan vanhemmat versiot eivät ole enää käyttökelpoisia
+        for vanha in path.parent.glob(f"{_metadata_cache_prefix()}*.pickle"):
+            if vanha != path:
+                vanha.unlink(missing_ok=True)
+    except OSError as e:
+        logger.warning(f"MetaData-välimuistin {path} kirjoitus epäonnistui: {e}")
+
+
+def _prepare_base(metadata: Optional[MetaData]):
+    """
+    Muodostaa automap-luokat annetusta MetaDatasta tai, jos sitä ei anneta,
+    heijastamalla tietokannan.
+    """
+    Base = automap_base(metadata=metadata if metadata is not None else MetaData())
+    declared = _declare_classes(Base)
+
+    # Reflect database with warnings filtered
+    with warnings.catch_warnings():
+        warnings.filterwarnings(
+            "ignore",
+            message="Skipped unsupported reflection of expression-based index idx_osoite_lower_katu_fi",
+        )
+        if metadata is None:
+            Base.prepare(
+                engine,
+                name_for_scalar_relationship=name_for_scalar,
+                name_for_collection_relationship=name_for_collection,
+                reflect=True,
+                reflection_options={"schema": "jkr"},
+            )
+        else:
+            Base.prepare(
+                name_for_scalar_relationship=name_for_scalar,
+                name_for_collection_relationship=name_for_collection,
+            )
+    return Base, declared
+
+
+def prepare() -> None:
+    """
+    Muodostaa ORM-luokat. Jos välimuistissa on saman skeeman MetaData,
+    tietokantaa ei heijasteta. Kutsutaan automaattisesti, kun jotain luokkaa
+    käytetään ensimmäisen kerran.
+    """
+    global _prepared
+    with _prepare_lock:
+        if _prepared:
+            return
+
+        checksum = _schema_checksum()
+        cache_path = _metadata_cache_path(checksum) if checksum is not None else None
+        metadata = (
+            _load_cached_metadata(cache_path, checksum) if cache_path is not None else None
+        )
+
+        Base = None
+        if metadata is not None:
+            try:
+                Base, declared = _prepare_base(metadata)
+            except Exception as e:
+                logger.warning(
+                    f"Luokkien muodostus MetaData-välimuistista {cache_path} "
+                    f"epäonnistui, heijastetaan uudelleen: {e}"
+                )
+                cache_path.unlink(missing_ok=True)
+        if Base is None:
+            Base, declared = _prepare_base(None)
+            if cache_path is not None:
+                _save_cached_metadata(cache_path, checksum, Base.metadata)
+
+        # Get references to all tables through the generated Base classes
+        globals()["Base"] = Base
+        globals().update(declared)
+        for name, table_name in _AUTOMAP_CLASSES.items():
+            globals()[name] = getattr(Base.classes, table_name)
+        _prepared = True
+
+
+def __getattr__(name):
+    if name == "Base" or name in _AUTOMAP_CLASSES or name in _DECLARED_CLASSES:
+        prepare()
+        return globals()[name]
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
 
-# Get references to all tables through the generated Base classes
-AKPPoistoSyy = Base.classes.akppoistosyy
-Jatetyyppi = Base.classes.jatetyyppi
-Jatteenkuljetusalue = Base.classes.jatteenkuljetusalue
-Katu = Base.classes.katu
-Keraysvaline = Base.classes.keraysvaline
-Keraysvalinetyyppi = Base.classes.keraysvalinetyyppi
-Keskeytys = Base.classes.keskeytys
-Kiinteisto = Base.classes.kiinteisto
-Kohde = Base.classes.kohde
-HapaAineisto = Base.classes.hapa_aineisto
-Kohdetyyppi = Base.classes.kohdetyyppi
-KohteenOsapuolet = Base.classes.kohteen_osapuolet
-Kompostori = Base.classes.kompostori
-Kuljetus = Base.classes.kuljetus
-Kunta = Base.classes.kunta
-Osapuolenlaji = Base.classes.osapuolenlaji
-Osapuoli = Base.classes.osapuoli
-Osapuolenrooli = Base.classes.osapuolenrooli
-Osoite = Base.classes.osoite
-Paatostulos = Base.classes.paatostulos
-Pohjavesialue = Base.classes.pohjavesialue
-Posti = Base.classes.posti
-Rakennuksenkayttotarkoitus = Base.classes.rakennuksenkayttotarkoitus
-Rakennuksenolotila = Base.classes.rakennuksenolotila
-RakennuksenOmistajat = Base.classes.rakennuksen_omistajat
-RakennuksenVanhimmat = Base.classes.rakennuksen_vanhimmat
-# Rakennus already defined above
-Sopimus = Base.classes.sopimus
-SopimusTyyppi = Base.classes.sopimustyyppi
-Taajama = Base.classes.taajama
-Tapahtumalaji = Base.classes.tapahtumalaji
-Tiedontuottaja = Base.classes.tiedontuottaja
-Tyhjennysvali = Base.classes.tyhjennysvali
-UlkoinenAsiakastieto = Base.classes.ulkoinen_asiakastieto
-Velvoite = Base.classes.velvoite
-Velvoitemalli = Base.classes.velvoitemalli
-ViemariLiitos = Base.classes.viemari_liitos
-Viranomaispaatokset = Base.classes.viranomaispaatokset
-Kaivotiedot = Base.classes.kaivotieto
 
 # Let SQLAlchemy handle all relationships through reflection
 # Remove redundant relationship definitions that were causing warnings
 
 __all__ = [
     "AKPPoistoSyy",
+    "DVVMuutos",
+    "DVVPoimintaPvm",
+    "HapaAineisto",
     "Jatetyyppi",
-    "Jatteenkuljetusalue", 
+    "Jatteenkuljetusalue",
+    "Kaivotiedot",
     "Katu",
     "Keraysvaline",
+    "Keraysvalinetyyppi",
     "Keskeytys",
     "Kiinteisto",
     "Kohde",
     "Kohdetyyppi",
     "KohteenOsapuolet",
     "KohteenRakennukset",
+    "Kompostori",
     "KompostorinKohteet",
     "Kuljetus",
     "Kunta",
     "Osapuolenlaji",
-    "Osapuoli", 
+    "Osapuoli",
     "Osapuolenrooli",
     "Osoite",
     "Paatostulos",
@@ -191,7 +429,7 @@ __all__ = [
     "Rakennuksenkayttotarkoitus",
     "Rakennuksenolotila",
     "RakennuksenOmistajat",
-    "RakennuksenVanhimmat", 
+    "RakennuksenVanhimmat",
     "Rakennus",
     "Sopimus",
     "SopimusTyyppi",
@@ -202,5 +440,6 @@ __all__ = [
     "UlkoinenAsiakastieto",
     "Velvoite",
     "Velvoitemalli",
+    "ViemariLiitos",
     "Viranomaispaatokset",
-]
\ No newline at end of file
+]
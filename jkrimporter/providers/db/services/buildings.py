@@ -1,15 +1,19 @@
 import logging
+import weakref
 from collections import defaultdict
-from typing import TYPE_CHECKING, Dict, List, Set, Union, cast, TypedDict
+from typing import TYPE_CHECKING, Dict, Iterable, List, Optional, Set, Tuple, Union, cast, TypedDict
 from datetime import date
 
 
+import numpy as np
+import shapely
 from geoalchemy2.shape import to_shape
-from shapely.geometry import MultiPoint
+from shapely import STRtree
+from shapely.geometry.base import BaseGeometry
 from sqlalchemy import func as sqlalchemyFunc
-from sqlalchemy import or_, select, exists, and_
+from sqlalchemy import or_, select, exists, and_, text
 from sqlalchemy.orm import Session
-from ..database import engine
+from ..database import engine, stream_options
 
 from jkrimporter.model import Rakennustunnus
 from jkrimporter.providers.db.utils import clean_asoy_name, is_asoy
@@ -34,10 +38,43 @@ AREA_LIMIT = 30000
 
 if TYPE_CHECKING:
     from sqlalchemy.orm import Session
+    from sqlalchemy.sql.selectable import Select
 
     from jkrimporter.model import Asiakas, Yhteystieto, JkrIlmoitukset, LopetusIlmoitus
 
 
+# Rakennusten geometriat puretaan WKB:stä kerran ja pidetään muistissa niin
+# kauan kuin rakennusolio on olemassa. Välimuisti vanhenee, jos rakennuksen
+# geom-arvo vaihtuu (esim. istunnon päivityksen jälkeen).
+_geometry_cache: "weakref.WeakKeyDictionary[Rakennus, Tuple[object, BaseGeometry, np.ndarray]]" = (
+    weakref.WeakKeyDictionary()
+)
+
+
+def _cached_geometry(building: Rakennus) -> Tuple[BaseGeometry, np.ndarray]:
+    """Palauttaa rakennuksen shapely-geometrian ja pisteen koordinaatit (x, y)."""
+    cached = _geometry_cache.get(building)
+    if cached is not None and cached[0] is building.geom:
+        return cached[1], cached[2]
+    geom = to_shape(building.geom)
+    coordinates = shapely.get_coordinates(geom)[0]
+    _geometry_cache[building] = (building.geom, geom, coordinates)
+    return geom, coordinates
+
+
+def building_geometries(buildings: Iterable[Rakennus]) -> List[BaseGeometry]:
+    """Geometriallisten rakennusten shapely-geometriat välimuistista."""
+    return [_cached_geometry(building)[0] for building in buildings if building.geom]
+
+
+def building_coordinates(buildings: Iterable[Rakennus]) -> np.ndarray:
+    """Geometriallisten rakennusten pistekoordinaatit (n, 2)-taulukkona."""
+    coordinates = [_cached_geometry(building)[1] for building in buildings if building.geom]
+    if not coordinates:
+        return np.empty((0, 2))
+    return np.stack(coordinates)
+
+
 def maximum_distance_of_buildings(buildings: List[Rakennus]) -> float:
     """
     Palauttaa pisimmän etäisyyden rakennusten välillä.
@@ -47,35 +84,126 @@ def maximum_distance_of_buildings(buildings: List[Rakennus]) -> float:
     """
     if len(buildings) < 2:
         return float('inf')
-        
-    max_distance = 0
-    points = [to_shape(building.geom) for building in buildings if building.geom]
-    
-    for i, first_point in enumerate(points[:-1]):
-        for second_point in points[i+1:]:
-            distance = first_point.distance(second_point)
-            max_distance = max(max_distance, distance)
-            
-    return max_distance
+
+    coordinates = building_coordinates(buildings)
+    if len(coordinates) < 2:
+        return 0
+
+    # Kaikki parit kerralla, etäisyys lasketaan kuten GEOS:ssa.
+    dx = coordinates[:, np.newaxis, 0] - coordinates[np.newaxis, :, 0]
+    dy = coordinates[:, np.newaxis, 1] - coordinates[np.newaxis, :, 1]
+    return float(np.sqrt(dx * dx + dy * dy).max())
 
 
 def convex_hull_area_of_buildings(buildings):
-    points = [to_shape(building.geom) for building in buildings if building.geom]
-    multipoint = MultiPoint(points)
+    multipoint = shapely.multipoints(building_coordinates(buildings))
 
     convex_hull = multipoint.convex_hull.buffer(6)
     area = convex_hull.area
 
     return area
 
+class ClusterDistances:
+    """
+    Pitää kirjaa klusterin halkaisijasta rakennuksia klusteriin lisättäessä.
+
+    Rakennusten naapurit (etäisyys < distance_limit) haetaan kerran
+    STRtree-hakemistosta. Klusterin muuttuessa päivitetään vain lisätyn
+    rakennuksen naapurien laskurit, joten tarkistus `fits` on vakioaikainen.
+    Tulos vastaa ehtoa
+    `maximum_distance_of_buildings(klusteri + [rakennus]) < distance_limit`.
+    """
+
+    def __init__(self, buildings: Iterable[Rakennus], distance_limit: float):
+        self._distance_limit = distance_limit
+        self._index: Dict[int, int] = {}
+        geoms = []
+        for building in buildings:
+            if building.geom is not None and building.id not in self._index:
+                self._index[building.id] = len(geoms)
+                geoms.append(_cached_geometry(building)[0])
+        self._geoms = np.array(geoms, dtype=object)
+
+        self._neighbours: List[np.ndarray] = [np.empty(0, dtype=np.intp)] * len(geoms)
+        if len(geoms):
+            tree = STRtree(self._geoms)
+            # Haetaan pienellä varalla ja rajataan tarkalla etäisyydellä.
+            first, second = tree.query(
+                self._geoms,
+                predicate="dwithin",
+                distance=distance_limit * (1 + 1e-9) + 1e-9,
+            )
+            pairs = first != second
+            first, second = first[pairs], second[pairs]
+            close = shapely.distance(self._geoms[first], self._geoms[second]) < distance_limit
+            first, second = first[close], second[close]
+            order = np.argsort(first, kind="stable")
+            first, second = first[order], second[order]
+            bounds = np.searchsorted(first, np.arange(len(geoms) + 1))
+            self._neighbours = [
+                second[bounds[i]:bounds[i + 1]] for i in range(len(geoms))
+            ]
+
+        self._near_counts = np.zeros(len(geoms), dtype=np.intp)
+        self._members: List[int] = []
+        self._diameter = 0.0
+
+    def start(self, buildings: Iterable[Rakennus]) -> None:
+        """Aloittaa uuden klusterin annetuista rakennuksista."""
+        self._near_counts[:] = 0
+        self._members = []
+        indices = [
+            self._index[building.id] for building in buildings if building.id in self._index
+        ]
+        self._diameter = 0.0
+        if len(indices) > 1:
+            geoms = self._geoms[indices]
+            self._diameter = float(
+                shapely.distance(geoms[:, np.newaxis], geoms[np.newaxis, :]).max()
+            )
+        for index in indices:
+            self._add_index(index)
+
+    def fits(self, building: Rakennus) -> bool:
+        """Mahtuuko rakennus klusteriin etäisyysrajan puolesta."""
+        if self._diameter >= self._distance_limit:
+            return False
+        index = self._index.get(building.id)
+        if index is None:
+            return True
+        return self._near_counts[index] == len(self._members)
+
+    def max_distance_to(self, building: Rakennus) -> float:
+        """Klusterin halkaisija rakennus mukaan lukien (lokitusta varten)."""
+        index = self._index.get(building.id)
+        if index is None or not self._members:
+            return self._diameter
+        distances = shapely.distance(self._geoms[index], self._geoms[self._members])
+        return max(self._diameter, float(distances.max()))
+
+    def add(self, building: Rakennus) -> None:
+        index = self._index.get(building.id)
+        if index is None:
+            return
+        if self._members:
+            self._diameter = self.max_distance_to(building)
+        self._add_index(index)
+
+    def _add_index(self, index: int) -> None:
+        self._members.append(index)
+        self._near_counts[self._neighbours[index]] += 1
+
+
 def create_nearby_buildings_lookup(
-    dvv_rakennustiedot: Dict[int, "Rakennustiedot"]
+    dvv_rakennustiedot: Dict[int, "Rakennustiedot"],
+    session: Optional[Session] = None,
 ) -> Dict[int, Set[int]]:
     """
-    Luo hakutaulukko lähekkäisistä rakennuksista hyödyntäen materialisoitua näkymää.
+    Luo hakutaulukko lähekkäisistä rakennuksista hyödyntäen taulua nearby_buildings.
     
     Args:
         dvv_rakennustiedot: Sanakirja rakennustiedoista joille etsitään lähellä olevia rakennuksia
+        session: Kutsujan istunto. Jos istuntoa ei anneta, avataan oma.
         
     Returns:
         Dict[int, Set[int]]: Sanakirja muotoa {rakennus_id: {lähellä_oleva_id1, ...}}
@@ -86,43 +214,75 @@ def create_nearby_buildings_lookup(
     # Käytetään vain kokonaislukuja SQL kyselyssä (suorituskyky)
     building_ids = list(dvv_rakennustiedot.keys())
     
-    with Session(engine) as session:
-        # Hae kaikki rakennusparit jotka ovat alle 300m päässä toisistaan
-        query = """
-        SELECT rakennus1_id, rakennus2_id 
-        FROM jkr.nearby_buildings 
-        WHERE rakennus1_id = ANY(:ids) 
-          AND rakennus2_id = ANY(:ids)
-          AND distance <= 300
-        """
-        
-        result = session.execute(
-            query,
-            {"ids": building_ids}
-        )
+    if session is None:
+        with Session(engine) as session:
+            return create_nearby_buildings_lookup(dvv_rakennustiedot, session)
+
+    # Hae kaikki rakennusparit jotka ovat alle 300m päässä toisistaan
+    query = text("""
+    SELECT rakennus1_id, rakennus2_id 
+    FROM jkr.nearby_buildings 
+    WHERE rakennus1_id = ANY(:ids) 
+      AND rakennus2_id = ANY(:ids)
+      AND distance <= 300
+    """)
+    
+    result = session.execute(
+        query,
+        {"ids": building_ids},
+        execution_options=stream_options(),
+    )
+    
+    # Lisää molemmat suunnat hakutaulukkoon
+    pairs_added = 0
+    for r1_id, r2_id in result:
+        nearby_lookup[r1_id].add(r2_id)
+        nearby_lookup[r2_id].add(r1_id)
+        pairs_added += 1
         
-        # Lisää molemmat suunnat hakutaulukkoon
-        pairs_added = 0
-        for r1_id, r2_id in result:
-            nearby_lookup[r1_id].add(r2_id)
-            nearby_lookup[r2_id].add(r1_id)
-            pairs_added += 1
-            
-        logger.debug(
-            f"Haettu {pairs_added} lähellä olevaa rakennusparia "
-            f"({len(building_ids)} rakennukselle)"
-        )
+    logger.debug(
+        f"Haettu {pairs_added} lähellä olevaa rakennusparia "
+        f"({len(building_ids)} rakennukselle)"
+    )
             
     return nearby_lookup
 
-def refresh_nearby_buildings_materialized_view() -> None:
+def rebuild_nearby_buildings(chunk_size: int = 50000) -> int:
     """
-    Päivitä materialisoitu näkymä nearby_buildings.
-    Tätä tulee kutsua kun rakennusten sijaintitiedot muuttuvat.
+    Rakentaa taulun nearby_buildings kokonaan uudelleen rakennus-id:n
+    väleittäin. Jokainen väli ajetaan omassa transaktiossaan, joten
+    keskeytynyt ajo voidaan aloittaa alusta ilman pitkiä lukituksia.
+
+    Taulu päivittyy muuten triggerillä niiden rakennusten osalta, joiden
+    geometria lisätään tai muuttuu, joten uudelleenrakennusta tarvitaan vain
+    poikkeustilanteissa.
+
+    Args:
+        chunk_size: Yhdellä kertaa käsiteltävän id-välin pituus
+
+    Returns:
+        int: Lisättyjen rakennusparien määrä
     """
+    logger = logging.getLogger(__name__)
     with Session(engine) as session:
-        session.execute("REFRESH MATERIALIZED VIEW CONCURRENTLY jkr.nearby_buildings")
-        session.commit()
+        min_id, max_id = session.execute(
+            select(sqlalchemyFunc.min(Rakennus.id), sqlalchemyFunc.max(Rakennus.id))
+        ).one()
+        if min_id is None:
+            return 0
+
+        parit = 0
+        for alku_id in range(min_id, max_id + 1, chunk_size):
+            loppu_id = min(alku_id + chunk_size - 1, max_id)
+            parit += session.execute(
+                text("SELECT jkr.rebuild_nearby_buildings(:alku_id, :loppu_id)"),
+                {"alku_id": alku_id, "loppu_id": loppu_id},
+            ).scalar_one()
+            session.commit()
+            logger.info(
+                f"Lähirakennukset laskettu id-välille {alku_id}-{loppu_id} ({parit} paria)"
+            )
+    return parit
 
 
 def match_omistaja(rakennus, haltija, preprocessor=lambda x: x):
@@ -253,12 +413,15 @@ class RakennusMuutokset(TypedDict):
     asukasRakennukset: List[RakennusData]
     omistajaRakennukset: List[RakennusData]
 
-def find_inactive_buildings(session: "Session") -> List[RakennusData]:
+def find_inactive_buildings(
+    session: "Session", rakennus_ids: "Optional[Select]" = None
+) -> List[RakennusData]:
     """
     Etsii rakennukset, jotka eivät ole enää käytössä.
 
     Args:
         session: SQLAlchemy-tietokantaistunto
+        rakennus_ids: Jos annettu, etsitään vain näiden rakennusten joukosta
 
     Returns:
         List[{id: int, loppupvm: date}]: Lista löydetyistä rakennuksista,
@@ -279,6 +442,8 @@ def find_inactive_buildings(session: "Session") -> List[RakennusData]:
         )
         .distinct()
     )
+    if rakennus_ids is not None:
+        rakennukset_query = rakennukset_query.where(Rakennus.id.in_(rakennus_ids))
 
     rakennukset_rows = session.execute(rakennukset_query).all()
     rakennukset: List[RakennusData] =[
@@ -287,12 +452,15 @@ def find_inactive_buildings(session: "Session") -> List[RakennusData]:
 
     return rakennukset
 
-def find_active_buildings_with_moved_residents_or_owners(session: "Session") -> RakennusMuutokset:
+def find_active_buildings_with_moved_residents_or_owners(
+    session: "Session", rakennus_ids: "Optional[Select]" = None
+) -> RakennusMuutokset:
     """
     Etsii rakennukset, joista on muutettu pois.
 
     Args:
         session: SQLAlchemy-tietokantaistunto
+        rakennus_ids: Jos annettu, etsitään vain näiden rakennusten joukosta
 
     Returns:
         List[int]: Lista löydetyistä rakennuksista. Lista voi olla tyhjä jos
@@ -324,6 +492,8 @@ def find_active_buildings_with_moved_residents_or_owners(session: "Session") ->
         )
         .distinct()
     )
+    if rakennus_ids is not None:
+        muuttajat_query = muuttajat_query.where(Rakennus.id.in_(rakennus_ids))
 
     muuttaja_rows = session.execute(muuttajat_query).all()
     muuttaja_rakennukset: List[RakennusData] =[
@@ -357,6 +527,8 @@ def find_active_buildings_with_moved_residents_or_owners(session: "Session") ->
         )
         .distinct()
     )
+    if rakennus_ids is not None:
+        omistajat_query = omistajat_query.where(Rakennus.id.in_(rakennus_ids))
 
     omistaja_rows = session.execute(omistajat_query).all()
     omistaja_rakennukset: List[RakennusData] = [
@@ -0,0 +1,74 @@
+"""
+DVV-aineiston muutosjoukot.
+
+import_dvv.sql kirjaa jokaisen sisäänluvun lopuksi tauluun jkr.dvv_muutos
+rakennukset, jotka ovat uusia, joiden tiedot tai käytössäolo muuttuivat tai
+joiden omistajat tai asukkaat vaihtuivat. Kohteiden päivitys voi näiden
+avulla käsitellä vain muuttuneet kiinteistöt koko rekisterin sijaan.
+"""
+
+import logging
+from datetime import date
+from typing import TYPE_CHECKING, Iterable, Optional
+
+from sqlalchemy import func, select, union
+
+from ..models import DVVMuutos, KohteenRakennukset, Rakennus
+
+if TYPE_CHECKING:
+    from sqlalchemy.orm import Session
+    from sqlalchemy.sql.selectable import Select
+
+logger = logging.getLogger(__name__)
+
+
+def count_dvv_muutokset(session: "Session", poimintapvm: Optional[date]) -> int:
+    """Palauttaa poimintapäivälle kirjattujen muutosten määrän."""
+    if poimintapvm is None:
+        return 0
+    return session.execute(
+        select(func.count(DVVMuutos.id)).where(DVVMuutos.poimintapvm == poimintapvm)
+    ).scalar_one()
+
+
+def changed_rakennus_ids(poimintapvm: date) -> "Select":
+    """Poimintapäivänä muuttuneiden rakennusten id:t."""
+    return (
+        select(DVVMuutos.rakennus_id)
+        .where(DVVMuutos.poimintapvm == poimintapvm)
+        .distinct()
+    )
+
+
+def changed_kiinteistotunnukset(
+    poimintapvm: date, kohde_ids: Iterable[int] = ()
+) -> "Select":
+    """
+    Kiinteistöt, joiden kohteet on muodostettava uudelleen poimintapäivän
+    muutosten jälkeen.
+
+    Mukana ovat muuttuneiden rakennusten nykyiset ja aiemmat kiinteistöt sekä
+    annettujen kohteiden (esim. kohteet, joilta rakennuksia poistettiin)
+    rakennusten kiinteistöt.
+    """
+    kiinteistotunnukset = [
+        select(DVVMuutos.kiinteistotunnus).where(
+            DVVMuutos.poimintapvm == poimintapvm,
+            DVVMuutos.kiinteistotunnus.isnot(None),
+        ),
+        select(DVVMuutos.vanha_kiinteistotunnus).where(
+            DVVMuutos.poimintapvm == poimintapvm,
+            DVVMuutos.vanha_kiinteistotunnus.isnot(None),
+        ),
+    ]
+    kohde_ids = list(kohde_ids)
+    if kohde_ids:
+        kiinteistotunnukset.append(
+            select(Rakennus.kiinteistotunnus)
+            .join(KohteenRakennukset, KohteenRakennukset.rakennus_id == Rakennus.id)
+            .where(
+                KohteenRakennukset.kohde_id.in_(kohde_ids),
+                Rakennus.kiinteistotunnus.isnot(None),
+            )
+        )
+    return select(union(*kiinteistotunnukset).subquery().c[0])
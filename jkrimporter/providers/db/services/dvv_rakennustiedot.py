@@ -0,0 +1,364 @@
+"""
+DVV-rakennustietojen muistikuva kohteiden muodostusta varten.
+
+Rakennukset, asukkaat, omistajat, osapuolet ja osoitteet haetaan kukin
+yhdellä kyselyllä tavallisina riveinä ja koostetaan rakennuksen id:n mukaan
+indeksoiduiksi sanakirjoiksi. Näin vältetään rakennus × asukkaat ×
+omistajat × osoitteet -liitoksen tuottama ristitulo sekä ORM-olioiden
+lataaminen jokaiselle riville.
+
+Muistikuvan oliot ovat kevyitä korvikkeita ORM-olioille: niillä on samat
+attribuutit, joita klusterointi, omistajaryhmittely, kohteen nimeäminen ja
+kohdetyypin päättely käyttävät. Oliot vertautuvat identiteetin perusteella
+kuten ORM-oliot, mutta niiden hajautusarvo lasketaan tietokannan id:stä.
+Joukkojen läpikäyntijärjestys on siten sama jokaisella ajolla ja myös
+rinnakkaisen ryhmittelyn aliprosesseissa.
+
+Sama muistikuva voidaan käyttää kohteiden muodostuksen kaikissa vaiheissa:
+refresh päivittää sen vaiheiden välillä hakemalla vain muuttuneet rakennukset.
+"""
+
+import logging
+from collections import defaultdict
+from datetime import date
+from typing import TYPE_CHECKING, DefaultDict, Dict, FrozenSet, List, Optional, Set, Tuple, Union
+
+from psycopg2.extras import DateRange
+from sqlalchemy import or_, select
+
+from ..database import stream_options
+from ..models import (
+    Katu,
+    Kohde,
+    KohteenRakennukset,
+    Osapuoli,
+    Osoite,
+    RakennuksenOmistajat,
+    RakennuksenVanhimmat,
+    Rakennus,
+)
+from .kohdetyyppi import classify_rakennukset
+
+if TYPE_CHECKING:
+    from sqlalchemy.orm import Session
+    from sqlalchemy.sql.selectable import Select
+
+    from ..codes import KohdeTyyppi
+
+logger = logging.getLogger(__name__)
+
+
+class DvvRakennus:
+    """Rakennuksen kohteen muodostuksessa tarvittavat sarakkeet."""
+
+    __slots__ = (
+        "id",
+        "prt",
+        "kiinteistotunnus",
+        "geom",
+        "rakennusluokka_2018",
+        "rakennuksenkayttotarkoitus_koodi",
+        "huoneistomaara",
+        "rakennuksenolotila_koodi",
+        "__weakref__",
+    )
+
+    def __init__(
+        self,
+        id,
+        prt,
+        kiinteistotunnus,
+        geom,
+        rakennusluokka_2018,
+        rakennuksenkayttotarkoitus_koodi,
+        huoneistomaara,
+        rakennuksenolotila_koodi,
+    ):
+        self.id = id
+        self.prt = prt
+        self.kiinteistotunnus = kiinteistotunnus
+        self.geom = geom
+        self.rakennusluokka_2018 = rakennusluokka_2018
+        self.rakennuksenkayttotarkoitus_koodi = rakennuksenkayttotarkoitus_koodi
+        self.huoneistomaara = huoneistomaara
+        self.rakennuksenolotila_koodi = rakennuksenolotila_koodi
+
+    def __hash__(self):
+        return hash(self.id)
+
+
+class DvvOsapuoli:
+    """Asukkaan tai omistajan tunnistamiseen ja kohteen nimeämiseen tarvittavat sarakkeet."""
+
+    __slots__ = ("id", "nimi", "katuosoite", "ytunnus", "henkilotunnus")
+
+    def __init__(self, id, nimi, katuosoite, ytunnus, henkilotunnus):
+        self.id = id
+        self.nimi = nimi
+        self.katuosoite = katuosoite
+        self.ytunnus = ytunnus
+        self.henkilotunnus = henkilotunnus
+
+    def __hash__(self):
+        return hash(self.id)
+
+
+class DvvKatu:
+    __slots__ = ("id", "katunimi_fi")
+
+    def __init__(self, id, katunimi_fi):
+        self.id = id
+        self.katunimi_fi = katunimi_fi
+
+
+class DvvOsoite:
+    __slots__ = ("id", "katu_id", "katu", "osoitenumero")
+
+    def __init__(self, id, katu_id, katu, osoitenumero):
+        self.id = id
+        self.katu_id = katu_id
+        self.katu = katu
+        self.osoitenumero = osoitenumero
+
+    def __hash__(self):
+        return hash(self.id)
+
+
+RakennustiedotTuple = Tuple[
+    DvvRakennus, FrozenSet[DvvOsapuoli], FrozenSet[DvvOsapuoli], FrozenSet[DvvOsoite]
+]
+
+
+def rakennus_ids_without_kohde(
+    poimintapvm: Optional[date],
+    loppupvm: Optional[date],
+    kiinteistorajaus: "Optional[Select]" = None,
+) -> "Select":
+    """
+    Rakennukset, jotka eivät kuulu voimassaolevaan kohteeseen annetulla
+    aikavälillä eivätkä ole poistuneet käytöstä ennen poimintapäivää.
+    Jos kiinteistorajaus on annettu, mukana ovat vain sen palauttamien
+    kiinteistöjen rakennukset.
+    """
+    if loppupvm is None:
+        rakennus_id_with_current_kohde = (
+            select(Rakennus.id)
+            .join(KohteenRakennukset)
+            .join(Kohde)
+            .filter(
+                or_(
+                    Kohde.loppupvm.is_(None),
+                    poimintapvm < Kohde.loppupvm
+                )
+            )
+        )
+    else:
+        rakennus_id_with_current_kohde = (
+            select(Rakennus.id)
+            .join(KohteenRakennukset)
+            .join(Kohde)
+            .filter(
+                Kohde.voimassaolo.overlaps(DateRange(poimintapvm, loppupvm))
+            )
+        )
+
+    rakennus_ids = (
+        select(Rakennus.id)
+        .filter(~Rakennus.id.in_(rakennus_id_with_current_kohde))
+        .filter(
+            or_(
+                Rakennus.kaytostapoisto_pvm.is_(None),
+                Rakennus.kaytostapoisto_pvm > poimintapvm
+            )
+        )
+    )
+    if kiinteistorajaus is not None:
+        rakennus_ids = rakennus_ids.filter(Rakennus.kiinteistotunnus.in_(kiinteistorajaus))
+    return rakennus_ids
+
+
+class DvvRakennustiedot:
+    """
+    Kohteettomien rakennusten DVV-tiedot.
+
+    - rakennustiedot: rakennus_id -> (rakennus, asukkaat, omistajat, osoitteet)
+    - owners_by_rakennus_id: rakennus_id -> omistajat
+    - inhabitants_by_rakennus_id: rakennus_id -> asukkaat (vanhimmat)
+    - addresses_by_rakennus_id: rakennus_id -> osoitteet
+    - kohdetyypit: rakennus_id -> rakennuksen oma kohdetyyppi ilman asukkaita
+
+    Sama osapuoli on kaikissa rakennuksissa sama olio, kuten ORM-istunnon
+    identiteettikartassa.
+    """
+
+    def __init__(self):
+        self.rakennustiedot: Dict[int, RakennustiedotTuple] = {}
+        self.owners_by_rakennus_id: DefaultDict[int, Set[DvvOsapuoli]] = defaultdict(set)
+        self.inhabitants_by_rakennus_id: DefaultDict[int, Set[DvvOsapuoli]] = defaultdict(set)
+        self.addresses_by_rakennus_id: DefaultDict[int, Set[DvvOsoite]] = defaultdict(set)
+        self.kohdetyypit: Dict[int, "KohdeTyyppi"] = {}
+        self._osapuolet: Dict[int, DvvOsapuoli] = {}
+        self._kadut: Dict[int, DvvKatu] = {}
+
+    @classmethod
+    def load(
+        cls,
+        session: "Session",
+        poimintapvm: Optional[date],
+        loppupvm: Optional[date],
+        kiinteistorajaus: "Optional[Select]" = None,
+    ) -> "DvvRakennustiedot":
+        """
+        Hakee kohteettomien rakennusten tiedot. Jokainen taulu luetaan kerran.
+
+        Args:
+            session: Tietokantaistunto
+            poimintapvm: Uusien kohteiden alkupäivämäärä
+            loppupvm: Uusien kohteiden loppupäivämäärä. Jos None, ei aikarajausta.
+            kiinteistorajaus: Select-kysely, joka palauttaa käsiteltävät
+                kiinteistötunnukset. Jos None, haetaan kaikki rakennukset.
+        """
+        snapshot = cls()
+        snapshot._add(session, rakennus_ids_without_kohde(poimintapvm, loppupvm, kiinteistorajaus))
+        return snapshot
+
+    def refresh(
+        self,
+        session: "Session",
+        poimintapvm: Optional[date],
+        loppupvm: Optional[date],
+        kiinteistorajaus: "Optional[Select]" = None,
+    ) -> None:
+        """
+        Päivittää muistikuvan vastaamaan load-kutsua samoilla parametreilla,
+        kun kohteita on välillä luotu tai rakennuksia poistettu kohteilta.
+
+        Kohteettomat rakennukset tarkistetaan yhdellä id-kyselyllä. Kohteen
+        saaneet ja rajauksen ulkopuoliset rakennukset poistetaan muistikuvasta,
+        ja vain uusien kohteettomien rakennusten tiedot haetaan. Muistikuvassa
+        jo olevien rakennusten tietoja ei lueta uudelleen.
+        """
+        rakennus_ids = set(
+            session.execute(
+                rakennus_ids_without_kohde(poimintapvm, loppupvm, kiinteistorajaus)
+            ).scalars()
+        )
+        poistettavat = self.rakennustiedot.keys() - rakennus_ids
+        for rakennus_id in poistettavat:
+            self._discard(rakennus_id)
+        uudet = rakennus_ids - self.rakennustiedot.keys()
+        if uudet:
+            self._add(session, sorted(uudet))
+        logger.info(
+            f"DVV-rakennustiedot päivitetty: {len(poistettavat)} poistettu, "
+            f"{len(uudet)} lisätty, {len(self.rakennustiedot)} rakennusta"
+        )
+
+    def _discard(self, rakennus_id: int) -> None:
+        self.rakennustiedot.pop(rakennus_id, None)
+        self.owners_by_rakennus_id.pop(rakennus_id, None)
+        self.inhabitants_by_rakennus_id.pop(rakennus_id, None)
+        self.addresses_by_rakennus_id.pop(rakennus_id, None)
+        self.kohdetyypit.pop(rakennus_id, None)
+
+    def _add(self, session: "Session", rakennus_ids: "Union[Select, List[int]]") -> None:
+        """
+        Lisää muistikuvaan annettujen rakennusten tiedot. Aiemmin haetut
+        osapuolet ja kadut käytetään uudelleen, jotta sama osapuoli on
+        kaikissa rakennuksissa sama olio.
+        """
+        rakennukset: Dict[int, DvvRakennus] = {}
+        for row in session.execute(
+            select(
+                Rakennus.id,
+                Rakennus.prt,
+                Rakennus.kiinteistotunnus,
+                Rakennus.geom,
+                Rakennus.rakennusluokka_2018,
+                Rakennus.rakennuksenkayttotarkoitus_koodi,
+                Rakennus.huoneistomaara,
+                Rakennus.rakennuksenolotila_koodi,
+            ).where(Rakennus.id.in_(rakennus_ids)),
+            execution_options=stream_options(),
+        ):
+            rakennukset[row[0]] = DvvRakennus(*row)
+
+        vanhimmat = session.execute(
+            select(RakennuksenVanhimmat.rakennus_id, RakennuksenVanhimmat.osapuoli_id)
+            .where(RakennuksenVanhimmat.rakennus_id.in_(rakennus_ids))
+        ).all()
+        omistajat = session.execute(
+            select(RakennuksenOmistajat.rakennus_id, RakennuksenOmistajat.osapuoli_id)
+            .where(RakennuksenOmistajat.rakennus_id.in_(rakennus_ids))
+        ).all()
+
+        osapuoli_ids = (
+            select(RakennuksenVanhimmat.osapuoli_id)
+            .where(RakennuksenVanhimmat.rakennus_id.in_(rakennus_ids))
+            .union(
+                select(RakennuksenOmistajat.osapuoli_id)
+                .where(RakennuksenOmistajat.rakennus_id.in_(rakennus_ids))
+            )
+        )
+        osapuolet = self._osapuolet
+        for row in session.execute(
+            select(
+                Osapuoli.id,
+                Osapuoli.nimi,
+                Osapuoli.katuosoite,
+                Osapuoli.ytunnus,
+                Osapuoli.henkilotunnus,
+            ).where(Osapuoli.id.in_(osapuoli_ids))
+        ):
+            if row[0] not in osapuolet:
+                osapuolet[row[0]] = DvvOsapuoli(*row)
+
+        for rakennus_id, osapuoli_id in vanhimmat:
+            osapuoli = osapuolet.get(osapuoli_id)
+            if osapuoli is not None:
+                self.inhabitants_by_rakennus_id[rakennus_id].add(osapuoli)
+        for rakennus_id, osapuoli_id in omistajat:
+            osapuoli = osapuolet.get(osapuoli_id)
+            if osapuoli is not None:
+                self.owners_by_rakennus_id[rakennus_id].add(osapuoli)
+
+        kadut = self._kadut
+        for osoite_id, rakennus_id, katu_id, osoitenumero, loytynyt_katu_id, katunimi_fi in session.execute(
+            select(
+                Osoite.id,
+                Osoite.rakennus_id,
+                Osoite.katu_id,
+                Osoite.osoitenumero,
+                Katu.id,
+                Katu.katunimi_fi,
+            )
+            .outerjoin(Katu, Katu.id == Osoite.katu_id)
+            .where(Osoite.rakennus_id.in_(rakennus_ids)),
+            execution_options=stream_options(),
+        ):
+            katu = None
+            if loytynyt_katu_id is not None:
+                katu = kadut.get(loytynyt_katu_id)
+                if katu is None:
+                    katu = kadut[loytynyt_katu_id] = DvvKatu(loytynyt_katu_id, katunimi_fi)
+            self.addresses_by_rakennus_id[rakennus_id].add(
+                DvvOsoite(osoite_id, katu_id, katu, osoitenumero)
+            )
+
+        self.rakennustiedot.update(
+            (
+                rakennus_id,
+                (
+                    rakennus,
+                    frozenset(self.inhabitants_by_rakennus_id.get(rakennus_id, ())),
+                    frozenset(self.owners_by_rakennus_id.get(rakennus_id, ())),
+                    frozenset(self.addresses_by_rakennus_id.get(rakennus_id, ())),
+                ),
+            )
+            for rakennus_id, rakennus in rakennukset.items()
+        )
+        self.kohdetyypit.update(classify_rakennukset(rakennukset.values()))
+        logger.info(
+            f"DVV-rakennustiedot: {len(rakennukset)} rakennusta, "
+            f"{len(osapuolet)} osapuolta, {len(kadut)} katua"
+        )
@@ -3,14 +3,15 @@ import datetime
 import re
 import logging
 from collections import defaultdict
+from concurrent.futures import ProcessPoolExecutor
 from datetime import date, datetime as dt
 from datetime import timedelta
 from functools import lru_cache
-from typing import TypeVar, DefaultDict, Set, List, Dict,TYPE_CHECKING,NamedTuple, FrozenSet, Optional, Generic, Iterable, Callable, Union
+from typing import TypeVar, DefaultDict, Set, List, Dict,TYPE_CHECKING,NamedTuple, FrozenSet, Optional, Generic, Iterable, Callable, Tuple, Union
 
 from openpyxl import load_workbook
 from psycopg2.extras import DateRange
-from sqlalchemy import and_, exists, or_, select, update, case, delete, text, func
+from sqlalchemy import and_, exists, or_, select, update, case, delete, text, func, insert, tuple_
 from sqlalchemy.exc import NoResultFound, SQLAlchemyError
 from sqlalchemy.orm.decl_api import DeclarativeMeta
 from sqlalchemy.orm import Session
@@ -40,8 +41,10 @@ from ..models import (
     Kaivotiedot,
     ViemariLiitos
 )
-from ..utils import clean_asoy_name, form_display_name, is_asoy, is_company, is_yhteiso
-from .buildings import DISTANCE_LIMIT, create_nearby_buildings_lookup, maximum_distance_of_buildings, RakennusData
+from ..utils import clean_asoy_name, form_display_name, is_asoy, is_company, is_yhteiso, reserve_ids
+from .buildings import DISTANCE_LIMIT, ClusterDistances, create_nearby_buildings_lookup, RakennusData
+from .dvv_rakennustiedot import DvvRakennustiedot
+from .kohdetyyppi import classify_rakennukset, kohdetyyppi_for_rakennukset
 
 T = TypeVar('T')
 
@@ -73,6 +76,11 @@ if TYPE_CHECKING:
         asukkaat: FrozenSet[KohteenOsapuolet]
         omistajat: FrozenSet[KohteenOsapuolet]
 
+logger = logging.getLogger(__name__)
+
+# Kohteiden muodostuksen vaihekohtaiset laskurit
+kohde_counts: DefaultDict[str, int] = defaultdict(int)
+
 @dataclass
 class BuildingInfo:
     """Apurakennuksen tiedot"""
@@ -240,10 +248,10 @@ def add_ulkoinen_asiakastieto_for_kohde(
     try:
         vanha_tieto = session.execute(query).scalar_one()
         if vanha_tieto:
-            print("UlkoinenAsiakastieto löytyi ennestään, palautetaan")
+            logger.debug("UlkoinenAsiakastieto löytyi ennestään, palautetaan")
             return vanha_tieto
     except NoResultFound:
-        print("UlkoinenAsiakastieto ei löydy ennestään, luodaan uusi")
+        logger.debug("UlkoinenAsiakastieto ei löydy ennestään, luodaan uusi")
 
     asiakastieto = UlkoinenAsiakastieto(
         tiedontuottaja_tunnus=asiakas.asiakasnumero.jarjestelma,
@@ -286,7 +294,7 @@ def find_kohde_by_prt(
             asiakas
         )
     elif isinstance(asiakas, Asiakas):
-        print(f'Haetaan rakennukset prt:n mukaan kuljetukselle {asiakas.rakennukset}')
+        logger.debug("Haetaan rakennukset prt:n mukaan kuljetukselle %s", asiakas.rakennukset)
         return _find_kohde_by_asiakastiedot(
             session, and_(Rakennus.prt.in_(asiakas.rakennukset), Kohde.loppupvm.is_(None)), asiakas
         )
@@ -490,19 +498,19 @@ def _find_kohde_by_asiakastiedot(
     try:
         kohde_ids = session.execute(kohde_ids_query).scalars().all()
     except Exception as e:
-        print(f"Virhe kohde-ID:iden haussa: {e}")
+        logger.warning("Virhe kohde-ID:iden haussa: %s", e)
         return None
 
     if not kohde_ids:
-        print("Ei löytynyt voimassaolevaa kohdetta, ohitetaan...")
+        logger.debug("Ei löytynyt voimassaolevaa kohdetta, ohitetaan...")
         return None
 
     # 2 Kohteita kuuluu löytyä vain yksi, otetaan ensimmäinen ja lokitetaan määrä jos on useampi
     if len(kohde_ids) > 1:
         if isinstance(asiakas, JkrIlmoitukset):
-            print(f"Löytyi {len(kohde_ids)} kohdetta rakennuksille {asiakas.prt}. Käytetään ensimmäistä, ID: {kohde_ids[0]}")
+            logger.debug("Löytyi %s kohdetta rakennuksille %s. Käytetään ensimmäistä, ID: %s", len(kohde_ids), asiakas.prt, kohde_ids[0])
         if isinstance(asiakas, Asiakas):
-            print(f"Löytyi {len(kohde_ids)} kohdetta kuljetuksen rakennuksille {asiakas.rakennukset}. Käytetään ensimmäistä, ID: {kohde_ids[0]}")
+            logger.debug("Löytyi %s kohdetta kuljetuksen rakennuksille %s. Käytetään ensimmäistä, ID: %s", len(kohde_ids), asiakas.rakennukset, kohde_ids[0])
 
     return session.get(Kohde, kohde_ids[0])
 
@@ -565,80 +573,10 @@ def get_dvv_rakennustiedot_without_kohde(
 
     Returns:
         Dict[int, Rakennustiedot]: Sanakirja jossa avaimena rakennuksen id ja
-        arvona tuple (rakennus, vanhimmat set, omistajat set, osoitteet set)
+        arvona tuple (rakennus, vanhimmat set, omistajat set, osoitteet set).
+        Asukkaat ja omistajat ovat osapuolia, ks. `DvvRakennustiedot`.
     """
-    # 1. Hae ensin rakennukset joilla ON voimassaoleva kohde
-    if loppupvm is None:
-        rakennus_id_with_current_kohde = (
-            select(Rakennus.id)
-            .join(KohteenRakennukset)
-            .join(Kohde)
-            .filter(
-                or_(
-                    Kohde.loppupvm.is_(None),
-                    poimintapvm < Kohde.loppupvm
-                )
-            )
-        )
-    else:
-        rakennus_id_with_current_kohde = (
-            select(Rakennus.id)
-            .join(KohteenRakennukset)
-            .join(Kohde)
-            .filter(
-                Kohde.voimassaolo.overlaps(DateRange(poimintapvm, loppupvm))
-            )
-        )
-
-    # 2. Hae kaikki rakennukset jotka:
-    # - Eivät ole yllä haetussa kohdelistassa
-    # - Eivät ole poistuneet käytöstä
-    query = (
-        select(Rakennus, RakennuksenVanhimmat, RakennuksenOmistajat, Osoite)
-        .select_from(Rakennus)
-        .outerjoin(RakennuksenVanhimmat)
-        .outerjoin(RakennuksenOmistajat)
-        .outerjoin(Osoite)
-        .filter(
-            ~Rakennus.id.in_(rakennus_id_with_current_kohde)
-        )
-        .filter(
-            or_(
-                Rakennus.kaytostapoisto_pvm.is_(None),
-                Rakennus.kaytostapoisto_pvm > poimintapvm
-            )
-        )
-    )
-
-    rows = session.execute(query).all()
-
-    # 3. Ryhmittele rakennustiedot rakennuksen id:n mukaan
-    rakennustiedot_by_id = {}
-    for row in rows:
-        rakennus_id = row[0].id
-        if rakennus_id not in rakennustiedot_by_id:
-            # Luo uusi tuple (rakennus, vanhimmat set, omistajat set, osoitteet set)
-            rakennustiedot_by_id[rakennus_id] = (row[0], set(), set(), set())
-
-        # Lisää vanhimmat, omistajat ja osoitteet setteihin jos niitä on
-        if row[1]:  # Vanhimmat
-            rakennustiedot_by_id[rakennus_id][1].add(row[1])
-        if row[2]:  # Omistajat
-            rakennustiedot_by_id[rakennus_id][2].add(row[2])
-        if row[3]:  # Osoitteet 
-            rakennustiedot_by_id[rakennus_id][3].add(row[3])
-
-    # 4. Muunna setit frozenset:eiksi että niitä voi käyttää esim. avaimina
-    return {
-        id: (
-            rakennus,
-            frozenset(vanhimmat),
-            frozenset(omistajat),
-            frozenset(osoitteet)
-        )
-        for id, (rakennus, vanhimmat, omistajat, osoitteet) 
-        in rakennustiedot_by_id.items()
-    }
+    return DvvRakennustiedot.load(session, poimintapvm, loppupvm).rakennustiedot
 
 
 def _get_identifiers(osapuolet: Union[Set[Osapuoli], FrozenSet[RakennuksenOmistajat], FrozenSet[RakennuksenVanhimmat]]) -> Set[str]:
@@ -680,10 +618,10 @@ def _match_ownership_or_residents(
         residents1 = _get_identifiers(building[1])
         residents2 = _get_identifiers(building2[1])
 
-        print(f"asukkaat 1: {residents1} {len(residents1)}, 2: {residents2} {len(residents2)}")
+        logger.debug("asukkaat 1: %s %s, 2: %s %s", residents1, len(residents1), residents2, len(residents2))
         if len(residents1) > 0 and len(residents2) > 0:
-            print(f"yhteiset asukkaat: {residents1 and residents2 and (residents1 & residents2)}")
-            print(f"yhteiset omistajat: {owners1 and owners2 and (owners1 & owners2)}")
+            logger.debug("yhteiset asukkaat: %s", residents1 and residents2 and (residents1 & residents2))
+            logger.debug("yhteiset omistajat: %s", owners1 and owners2 and (owners1 & owners2))
             yhteensopivat.add(bool(
                 (owners1 and owners2 and (owners1 & owners2)) and
                 (residents1 and residents2 and (residents1 & residents2))
@@ -697,8 +635,8 @@ def _match_ownership_or_residents(
         #     print(f"{building1[0].prt} {building2[0].prt} Match by: {owners1} {owners2} {residents1} {residents2}")
         # else:
         #     print(f"{building1[0].prt} {building2[0].prt} No match by: {owners1} {owners2} {residents1} {residents2}")
-        print(f"omistajavertaus 1. {owners1} 2. {owners2}")
-        print(f"omistajavertaus osumat: {(owners1 and owners2 and (owners1 & owners2))}")
+        logger.debug("omistajavertaus 1. %s 2. %s", owners1, owners2)
+        logger.debug("omistajavertaus osumat: %s", owners1 and owners2 and (owners1 & owners2))
         yhteensopivat.add(bool(
             (owners1 and owners2 and (owners1 & owners2))
         ))
@@ -1114,13 +1052,13 @@ def determine_kohdetyyppi(session: "Session", rakennus: "Rakennus", asukkaat: "O
             try:
                 luokka = int(rakennus.rakennusluokka_2018)
                 if 110 <= luokka <= 211:
-                    print(f"-> ASUINKIINTEISTO (rakennusluokka_2018: {luokka})")
+                    logger.debug("-> ASUINKIINTEISTO (rakennusluokka_2018: %s)", luokka)
                     return KohdeTyyppi.ASUINKIINTEISTO
             except (ValueError, TypeError):
-                print(f"- rakennusluokka_2018 ei ole validi numero: {rakennus.rakennusluokka_2018}")
+                logger.debug("- rakennusluokka_2018 ei ole validi numero: %s", rakennus.rakennusluokka_2018)
                 pass
         else:
-            print("- rakennusluokka_2018 ei ole annettu")
+            logger.debug("- rakennusluokka_2018 ei ole annettu")
 
     # 2. Jos ei rakennusluokkaa 2018, tarkista käyttötarkoitus
     try:
@@ -1128,21 +1066,21 @@ def determine_kohdetyyppi(session: "Session", rakennus: "Rakennus", asukkaat: "O
             if rakennus.rakennuksenkayttotarkoitus_koodi is not None:
                 kayttotarkoitus = int(rakennus.rakennuksenkayttotarkoitus_koodi if rakennus.rakennuksenkayttotarkoitus_koodi else None)       
                 if 11 <= kayttotarkoitus <= 41:
-                    print(f"-> ASUINKIINTEISTO (käyttötarkoitus): {kayttotarkoitus} {rakennus.rakennuksenkayttotarkoitus_koodi}")
+                    logger.debug("-> ASUINKIINTEISTO (käyttötarkoitus): %s %s", kayttotarkoitus, rakennus.rakennuksenkayttotarkoitus_koodi)
                     return KohdeTyyppi.ASUINKIINTEISTO
         else:
-            print("- rakennuksenkayttotarkoitus ei ole annettu")
+            logger.debug("- rakennuksenkayttotarkoitus ei ole annettu")
     except (ValueError, TypeError):
-        print("- kayttotarkoitus ei ole validi numero")
+        logger.debug("- kayttotarkoitus ei ole validi numero")
         pass
 
     # 3. Tarkista huoneistomäärä
     if hasattr(rakennus, 'huoneistomaara'):
         if rakennus.huoneistomaara is not None and rakennus.huoneistomaara > 0:
-            print(f"-> ASUINKIINTEISTO (huoneistomaara: {rakennus.huoneistomaara})")
+            logger.debug("-> ASUINKIINTEISTO (huoneistomaara: %s)", rakennus.huoneistomaara)
             return KohdeTyyppi.ASUINKIINTEISTO
     else:
-        print("- huoneistomaara ei ole annettu")
+        logger.debug("- huoneistomaara ei ole annettu")
 
     # 4. Tarkista rakennuksenolotila
     if hasattr(rakennus, 'rakennuksenolotila') or hasattr(rakennus, 'rakennuksenolotila_koodi'):
@@ -1152,44 +1090,43 @@ def determine_kohdetyyppi(session: "Session", rakennus: "Rakennus", asukkaat: "O
             RakennuksenOlotilaTyyppi.VAKINAINEN_ASUMINEN.value
         ]:
             if hasattr(rakennus, 'rakennuksenolotila'):
-                print(f"-> ASUINKIINTEISTO (rakennuksenolotila: {rakennus.rakennuksenolotila.koodi})")
+                logger.debug("-> ASUINKIINTEISTO (rakennuksenolotila: %s)", rakennus.rakennuksenolotila.koodi)
             elif hasattr(rakennus, 'rakennuksenolotila_koodi'):
-                print(f"-> ASUINKIINTEISTO (rakennuksenolotila: {rakennus.rakennuksenolotila_koodi})")
+                logger.debug("-> ASUINKIINTEISTO (rakennuksenolotila: %s)", rakennus.rakennuksenolotila_koodi)
             return KohdeTyyppi.ASUINKIINTEISTO
     else:
-        print("- rakennuksenolotila ei ole annettu")
+        logger.debug("- rakennuksenolotila ei ole annettu")
 
     # 5. Tarkista asukkaat
     if asukkaat and len(asukkaat) > 0:
-        print(f"-> ASUINKIINTEISTO (asukkaat) {len(asukkaat)}")
+        logger.debug("-> ASUINKIINTEISTO (asukkaat) %s", len(asukkaat))
         return KohdeTyyppi.ASUINKIINTEISTO
 
     # 6. Jos mikään ehto ei täyttynyt, kyseessä on muu kohde
     if hasattr(rakennus, 'prt'):
-        print(f"-> MUU (Asuinrakennuksen ehdot ei täyttynyt) prt: {rakennus.prt}")
+        logger.debug("-> MUU (Asuinrakennuksen ehdot ei täyttynyt) prt: %s", rakennus.prt)
     else:
-        print("- prt ei ole annettu")
+        logger.debug("- prt ei ole annettu")
     if hasattr(rakennus, 'rakennusluokka_2018'):
-        print(f"- rakennusluokka_2018: {rakennus.rakennusluokka_2018}")
+        logger.debug("- rakennusluokka_2018: %s", rakennus.rakennusluokka_2018)
     else:
-        print("- rakennusluokka_2018 ei ole annettu")
+        logger.debug("- rakennusluokka_2018 ei ole annettu")
     if hasattr(rakennus, 'rakennuksenkayttotarkoitus_koodi'):
-        print(f"- rakennuksenkayttotarkoitus: {rakennus.rakennuksenkayttotarkoitus_koodi if rakennus.rakennuksenkayttotarkoitus_koodi else None}")
+        logger.debug("- rakennuksenkayttotarkoitus: %s", rakennus.rakennuksenkayttotarkoitus_koodi if rakennus.rakennuksenkayttotarkoitus_koodi else None)
     else:
-        print("- rakennuksenkayttotarkoitus ei ole annettu")
+        logger.debug("- rakennuksenkayttotarkoitus ei ole annettu")
     if hasattr(rakennus, 'huoneistomaara'):
-        print(f"- huoneistomaara: {rakennus.huoneistomaara}")
+        logger.debug("- huoneistomaara: %s", rakennus.huoneistomaara)
     else:
-        print("- huoneistomaara ei ole annettu")
+        logger.debug("- huoneistomaara ei ole annettu")
     if hasattr(rakennus, 'rakennuksenolotila'):
-        print(f"- rakennuksenolotila: {rakennus.rakennuksenolotila.koodi if rakennus.rakennuksenolotila else None}")
+        logger.debug("- rakennuksenolotila: %s", rakennus.rakennuksenolotila.koodi if rakennus.rakennuksenolotila else None)
     else:
-        print("- rakennuksenolotila ei ole annettu")
+        logger.debug("- rakennuksenolotila ei ole annettu")
     if asukkaat:
-        print(f"- asukkaat: {len(asukkaat) if asukkaat else 0}")
+        logger.debug("- asukkaat: %s", len(asukkaat) if asukkaat else 0)
     else:
-        print("- ei asukkaita")
-    print("")
+        logger.debug("- ei asukkaita")
     return KohdeTyyppi.MUU
 
 
@@ -1292,6 +1229,118 @@ def parse_alkupvm_for_kohde(
         raise
 
 
+class KohdeBatch:
+    """
+    Kerää uudet kohteet riippuvuuksineen ja lisää ne monirivisillä inserteillä.
+
+    Rivit kirjoitetaan tietokantaan `flush()`-kutsussa, joka on tehtävä ennen
+    kuin kohteita tai niiden rakennuksia haetaan tietokannasta (ks.
+    `has_rakennus`). Kohteiden id:t varataan sekvenssistä vasta
+    `flush()`-kutsussa kerättyjen kohteiden määrän verran, joten sekvenssin
+    arvoja ei jää käyttämättä. Palautetut Kohde-oliot eivät ole istunnossa;
+    ne sisältävät vain lisätyt sarakkeet, ja niiden id asetetaan
+    `flush()`-kutsussa.
+    """
+
+    def __init__(self, session: Session, chunk_size: int = 1000):
+        self.session = session
+        self.chunk_size = chunk_size
+        self._kohteet: List[Kohde] = []
+        self._kohteen_rakennukset: List[List[int]] = []
+        self._kohteen_osapuolet: List[List[Tuple[int, int]]] = []
+        self._rakennus_ids: Set[int] = set()
+
+    def has_rakennus(self, rakennus_ids: Iterable[int]) -> bool:
+        """Onko jokin rakennuksista lisäämättömän kohteen rakennus."""
+        return not self._rakennus_ids.isdisjoint(rakennus_ids)
+
+    def add(
+        self,
+        nimi: str,
+        kohdetyyppi,
+        alkupvm: Optional[datetime.date],
+        loppupvm: Optional[datetime.date],
+        lukittu: bool,
+        rakennus_ids: Iterable[int],
+        asukkaat: Iterable[Osapuoli],
+        omistajat: Iterable[Osapuoli],
+    ) -> Kohde:
+        rakennus_ids = list(rakennus_ids)
+        asukas_rooli = codes.osapuolenroolit[OsapuolenrooliTyyppi.VANHIN_ASUKAS].id
+        omistaja_rooli = codes.osapuolenroolit[OsapuolenrooliTyyppi.OMISTAJA].id
+
+        # Kohdetyyppi annetaan id:nä, jotta kohde ei päädy istuntoon
+        # kohdetyyppiolion kautta.
+        kohde = Kohde(
+            nimi=nimi,
+            kohdetyyppi_id=kohdetyyppi.id,
+            alkupvm=alkupvm,
+            loppupvm=loppupvm,
+            lukittu=lukittu,
+        )
+        self._kohteet.append(kohde)
+        self._kohteen_rakennukset.append(rakennus_ids)
+        self._kohteen_osapuolet.append(
+            [(osapuoli.id, asukas_rooli) for osapuoli in asukkaat]
+            + [(osapuoli.id, omistaja_rooli) for osapuoli in omistajat]
+        )
+        self._rakennus_ids.update(rakennus_ids)
+        return kohde
+
+    def flush(self) -> None:
+        """Lisää kerätyt kohteet, kohteen rakennukset ja osapuolet tietokantaan."""
+        if not self._kohteet:
+            return
+        # Istunnon odottavat muutokset ensin, jotta järjestys vastaa
+        # kohdekohtaista lisäystä.
+        self.session.flush()
+
+        kohteet = []
+        kohteen_rakennukset = []
+        kohteen_osapuolet = []
+        ids = reserve_ids(self.session, "jkr.kohde", len(self._kohteet))
+        for kohde_id, kohde, rakennus_ids, osapuolet in zip(
+            ids, self._kohteet, self._kohteen_rakennukset, self._kohteen_osapuolet
+        ):
+            kohde.id = kohde_id
+            kohteet.append(
+                {
+                    "id": kohde_id,
+                    "nimi": kohde.nimi,
+                    "kohdetyyppi_id": kohde.kohdetyyppi_id,
+                    "alkupvm": kohde.alkupvm,
+                    "loppupvm": kohde.loppupvm,
+                    "lukittu": kohde.lukittu,
+                }
+            )
+            kohteen_rakennukset.extend(
+                {"rakennus_id": rakennus_id, "kohde_id": kohde_id}
+                for rakennus_id in rakennus_ids
+            )
+            kohteen_osapuolet.extend(
+                {"osapuoli_id": osapuoli_id, "kohde_id": kohde_id, "osapuolenrooli_id": rooli_id}
+                for osapuoli_id, rooli_id in osapuolet
+            )
+
+        for table, rows in (
+            (Kohde.__table__, kohteet),
+            (KohteenRakennukset.__table__, kohteen_rakennukset),
+            (KohteenOsapuolet.__table__, kohteen_osapuolet),
+        ):
+            for start in range(0, len(rows), self.chunk_size):
+                self.session.execute(insert(table).values(rows[start:start + self.chunk_size]))
+        logger.info(
+            "Lisätty %s kohdetta, %s kohteen rakennusta ja %s kohteen osapuolta",
+            len(kohteet),
+            len(kohteen_rakennukset),
+            len(kohteen_osapuolet),
+        )
+        self._kohteet = []
+        self._kohteen_rakennukset = []
+        self._kohteen_osapuolet = []
+        self._rakennus_ids = set()
+
+
 def create_new_kohde_from_buildings(
     session: Session,
     rakennus_ids: List[int],
@@ -1300,7 +1349,10 @@ def create_new_kohde_from_buildings(
     vanhat_kohteet: List[Kohde],
     poimintapvm: Optional[datetime.date],
     loppupvm: Optional[datetime.date],
-    lukittu: bool = False
+    lukittu: bool = False,
+    rakennukset: "Optional[Iterable[Rakennus]]" = None,
+    batch: "Optional[KohdeBatch]" = None,
+    rakennus_kohdetyypit: "Optional[Dict[int, KohdeTyyppi]]" = None,
 ):
     """
     Luo uuden kohteen annettujen rakennusten perusteella ja yhdistää niihin liittyvät tiedot.
@@ -1329,6 +1381,14 @@ def create_new_kohde_from_buildings(
         poimintapvm: Uuden kohteen alkupäivämäärä
         loppupvm: Uuden kohteen loppupäivämäärä
         old_kohde: Vanha kohde, jos kyseessä on päivitys (vapaaehtoinen)
+        rakennukset: Jo ladatut rakennusoliot (vapaaehtoinen). Jos annettu,
+            kohdetyyppiä varten ei haeta rakennuksia uudelleen.
+        batch: Joukkolisäys (vapaaehtoinen). Jos annettu, kohde saa id:n
+            varatuista id-arvoista ja rivit lisätään tietokantaan vasta
+            `batch.flush()`-kutsussa.
+        rakennus_kohdetyypit: Rakennusten valmiiksi lasketut kohdetyypit
+            (vapaaehtoinen, ks. classify_rakennukset). Puuttuvat rakennukset
+            luokitellaan yhdellä kertaa.
 
     Returns:
         Kohde: Luotu kohdeobjekti kaikkine riippuvuuksineen
@@ -1383,20 +1443,40 @@ def create_new_kohde_from_buildings(
 
         
     # Määritä kohdetyyppi rakennusten perusteella
-    kohdetyyppi = KohdeTyyppi.MUU  # Oletuksena MUU
-    found_asuinkiinteisto = False
-    for rakennus_id in rakennus_ids:
-        rakennus = session.query(Rakennus).filter(Rakennus.id == rakennus_id).first()
-        if rakennus:
-            building_type = determine_kohdetyyppi(session, rakennus, asukkaat)
-            if building_type == KohdeTyyppi.ASUINKIINTEISTO:
-                found_asuinkiinteisto = True
-                break
-
-    if not found_asuinkiinteisto:
-        kohdetyyppi = KohdeTyyppi.MUU
-    else:
-        kohdetyyppi = KohdeTyyppi.ASUINKIINTEISTO
+    if rakennus_kohdetyypit is None:
+        rakennus_kohdetyypit = {}
+    puuttuvat = {
+        rakennus_id for rakennus_id in rakennus_ids if rakennus_id not in rakennus_kohdetyypit
+    }
+    if puuttuvat:
+        rakennukset_by_id = {
+            rakennus.id: rakennus
+            for rakennus in rakennukset or ()
+            if rakennus.id in puuttuvat
+        }
+        haettavat = puuttuvat - rakennukset_by_id.keys()
+        if haettavat:
+            rakennukset_by_id.update(
+                (rakennus.id, rakennus)
+                for rakennus in session.query(Rakennus).filter(Rakennus.id.in_(haettavat))
+            )
+        rakennus_kohdetyypit = {
+            **rakennus_kohdetyypit,
+            **classify_rakennukset(rakennukset_by_id.values()),
+        }
+    kohdetyyppi = kohdetyyppi_for_rakennukset(rakennus_ids, asukkaat, rakennus_kohdetyypit)
+
+    if batch is not None:
+        return batch.add(
+            nimi=kohde_display_name,
+            kohdetyyppi=codes.kohdetyypit[kohdetyyppi],
+            alkupvm=alkupvm,
+            loppupvm=loppupvm,
+            lukittu=lukittu,
+            rakennus_ids=rakennus_ids,
+            asukkaat=asukkaat,
+            omistajat=omistajat,
+        )
 
     kohde = Kohde(
         nimi=kohde_display_name,
@@ -1556,96 +1636,91 @@ def check_and_update_old_other_building_kohde_kohdetyyppi(
     poimintapvm: Optional[datetime.date]
 ) -> List[int]:
     """
-    Etsii vanhat kohteet joilla on kohdetyyppi MUU
+    Tarkistaa vanhojen kohteiden kohdetyypin rakennusten perusteella
 
     Toiminta:
-    1. Hakee kannasta ennen poimintavuotta tuodut kohteet joilla on kohdetyyppinä MUU
-    2. Tarkistaa kohteisiin kohdistettujen rakennusten avulla kohdetyypin
-    3. Päivittää kohdetyypin vastaamaan oikeaa tilannetta
+    1. Hakee yhdellä kyselyllä ennen poimintavuotta alkaneiden, silloin
+       voimassa olevien kohteiden rakennukset
+    2. Hakee yhdellä kyselyllä rakennukset, joilla on vanhin asukas
+    3. Luokittelee kaikki rakennukset kerralla (classify_rakennukset).
+       Kohde on asuinkiinteistö, jos yksikin sen rakennuksista on
+       asuinrakennus tai sillä on asukas, muuten MUU.
+    4. Päivittää kohdetyypin joukkopäivityksellä niille kohteille, joiden
+       tyyppi muuttuu
     
     Args:
         session: Tietokantaistunto
         poimintapvm: Tarkasteltavien kohteiden alkupäivämäärä on ennen tämän päivän vuotta
 
     Returns:
-        Kohteet: päivitetyt kohteet
+        Kohteet: päivitettyjen kohteiden id:t
     """
 
-    maxYear = poimintapvm.year
+    vuoden_alku = datetime.date(poimintapvm.year, 1, 1)
+    print(f"\n\nEtsitään kohteita, joiden alkupvm on < {vuoden_alku}")
 
+    vanhat_kohde_ids = select(Kohde.id).where(
+        Kohde.alkupvm < vuoden_alku,
+        or_(
+            Kohde.loppupvm.is_(None),
+            Kohde.loppupvm > vuoden_alku
+        ),
+    )
+    rivit = session.execute(
+        select(
+            KohteenRakennukset.kohde_id,
+            Kohde.kohdetyyppi_id,
+            Rakennus.id,
+            Rakennus.rakennusluokka_2018,
+            Rakennus.rakennuksenkayttotarkoitus_koodi,
+            Rakennus.huoneistomaara,
+            Rakennus.rakennuksenolotila_koodi,
+        )
+        .join(Kohde, Kohde.id == KohteenRakennukset.kohde_id)
+        .join(Rakennus, Rakennus.id == KohteenRakennukset.rakennus_id)
+        .where(KohteenRakennukset.kohde_id.in_(vanhat_kohde_ids))
+    ).all()
 
-    print(f"\n\nEtsitään kohteita, joiden alkupvm on < {datetime.date(maxYear, 1, 1)}")
-
-    updated_kohteet = set()
-
-    try:
-        # Hae olemassa olevat kohteet ennen poimintapäivän vuotta jotka eivät ole silloin päättyneet
-        kohteet = (
-            session.query(Kohde)
-            .join(KohteenRakennukset, KohteenRakennukset.kohde_id == Kohde.id)
-            .filter(
-                Kohde.alkupvm < datetime.date(maxYear, 1, 1),
-                or_(
-                    Kohde.loppupvm.is_(None),
-                    Kohde.loppupvm > datetime.date(maxYear, 1, 1)
-                ),
+    rakennus_ids_by_kohde: DefaultDict[int, List[int]] = defaultdict(list)
+    kohdetyyppi_id_by_kohde: Dict[int, int] = {}
+    for rivi in rivit:
+        rakennus_ids_by_kohde[rivi.kohde_id].append(rivi.id)
+        kohdetyyppi_id_by_kohde[rivi.kohde_id] = rivi.kohdetyyppi_id
+    print(f"Löydetty {len(rakennus_ids_by_kohde)} vanhaa kohdetta")
+
+    rakennus_kohdetyypit = classify_rakennukset(rivit)
+    # Rakennus, jolla on vanhin asukas, on asuinrakennus
+    for rakennus_id in session.execute(
+        select(RakennuksenVanhimmat.rakennus_id)
+        .where(
+            RakennuksenVanhimmat.rakennus_id.in_(
+                select(KohteenRakennukset.rakennus_id)
+                .where(KohteenRakennukset.kohde_id.in_(vanhat_kohde_ids))
             )
-            .all()
         )
+        .distinct()
+    ).scalars():
+        rakennus_kohdetyypit[rakennus_id] = KohdeTyyppi.ASUINKIINTEISTO
+
+    paivitettavat: DefaultDict[KohdeTyyppi, List[int]] = defaultdict(list)
+    for kohde_id, rakennus_ids in rakennus_ids_by_kohde.items():
+        kohdetyyppi = kohdetyyppi_for_rakennukset(rakennus_ids, None, rakennus_kohdetyypit)
+        if codes.kohdetyypit[kohdetyyppi].id != kohdetyyppi_id_by_kohde[kohde_id]:
+            paivitettavat[kohdetyyppi].append(kohde_id)
+
+    updated_kohteet = []
+    for kohdetyyppi, kohde_ids in paivitettavat.items():
+        session.execute(
+            update(Kohde)
+            .where(Kohde.id.in_(kohde_ids))
+            .values(kohdetyyppi_id=codes.kohdetyypit[kohdetyyppi].id)
+        )
+        logger.info(f"Päivitetty {len(kohde_ids)} kohteen tyypiksi {kohdetyyppi.value}")
+        updated_kohteet.extend(kohde_ids)
 
-        print(f"Löydetty {len(kohteet)} vanhaa muuta kohdetta")
-
-        for kohde in kohteet:
-            print(f"\n\nKohde ID: {kohde.id}, Tyyppi: {kohde.kohdetyyppi_id}")
-            original_kohdetyyppi = kohde.kohdetyyppi_id
-
-            # Hae kohteen rakennukset
-            rakennus_query = (
-                select(
-                    Rakennus.id, 
-                    Rakennus.prt, 
-                    Rakennus.rakennusluokka_2018, 
-                    Rakennus.rakennuksenkayttotarkoitus_koodi, 
-                    Rakennus.huoneistomaara, 
-                    Rakennus.rakennuksenolotila_koodi
-                )
-                .join(KohteenRakennukset, KohteenRakennukset.rakennus_id == Rakennus.id)
-                .where(KohteenRakennukset.kohde_id == kohde.id)
-            )
-            rakennukset = session.execute(rakennus_query).all()
-            print(f"- Rakennukset: {[r[1] for r in rakennukset]}")
-
-            found_asuinkiinteisto = False
-
-            for rakennus_tiedot in rakennukset:
-                # Hae rakennuksen asukkaat suoraan RakennuksenVanhimmat-taulusta
-                asukkaat = set(session.query(RakennuksenVanhimmat)
-                    .filter(RakennuksenVanhimmat.rakennus_id == rakennus_tiedot.id)
-                    .all())
-                building_type = determine_kohdetyyppi(session, rakennus_tiedot, asukkaat)
-                print(f"Tarkastelussa kohdetyypin arvo {original_kohdetyyppi} vs {codes.kohdetyypit[building_type].id} kohteelle {kohde.id} prt:llä {rakennus_tiedot.prt}")
-
-                if building_type == KohdeTyyppi.ASUINKIINTEISTO:
-                    if building_type != original_kohdetyyppi:
-                        print(f"Päivitetään kohdetyypin arvo {original_kohdetyyppi} arvoksi {codes.kohdetyypit[building_type].id} kohteelle {kohde.id} asuinkiinteistö")
-                        kohde.kohdetyyppi_id = codes.kohdetyypit[building_type].id
-                        updated_kohteet.add(kohde.id)
-                    found_asuinkiinteisto = True
-                    break  # Jos löydetään asuinkiinteistö, ei tarvitse tarkistaa muita rakennuksia
-
-                # Jos yksikään rakennus ei ole asuinkiinteistö, asetetaan tyypiksi MUU
-                if not found_asuinkiinteisto:
-                    new_kohdetyyppi = codes.kohdetyypit[KohdeTyyppi.MUU]
-                    if new_kohdetyyppi.id != original_kohdetyyppi:
-                        print(f"Päivitetään kohdetyypin arvo {original_kohdetyyppi} arvoksi {new_kohdetyyppi.id} kohteelle {kohde.id} ei asuinkiinteistö")
-                        setattr(kohde, 'kohdetyyppi_id', new_kohdetyyppi.id)
-                        updated_kohteet.add(kohde.id)
-
-        if len(updated_kohteet) > 0:
-            print(f"Päivitetty {len(updated_kohteet)} kohdetta")
-            session.flush()
-    except NoResultFound:
-        updated_kohteet = []
+    if updated_kohteet:
+        print(f"Päivitetty {len(updated_kohteet)} kohdetta")
+        session.flush()
 
     return updated_kohteet
 
@@ -1660,6 +1735,8 @@ def update_or_create_kohde_from_buildings(
     loppupvm: Optional[datetime.date],
     lukittu: bool = False,
     poistettujen_rakennusten_kohteet: "Optional[List[KohteenRakennukset]]" = None,
+    batch: "Optional[KohdeBatch]" = None,
+    rakennus_kohdetyypit: "Optional[Dict[int, KohdeTyyppi]]" = None,
 ) -> Kohde:
     """
     Optimoitu versio kohteen päivitys/luontifunktiosta.
@@ -1686,12 +1763,16 @@ def update_or_create_kohde_from_buildings(
         poimintapvm: Uuden kohteen alkupäivämäärä
         loppupvm: Uuden kohteen loppupäivämäärä
         lukittu: Valinnainen parametri perusmaksurekisterikohteiden käsittelyyn
+        batch: Joukkolisäys uusille kohteille, joilla ei ole vanhaa kohdetta
+        rakennus_kohdetyypit: Rakennusten valmiiksi lasketut kohdetyypit
+            (vapaaehtoinen, ks. classify_rakennukset)
 
     Returns:
         Kohde: Luotu tai päivitetty kohde
     """
     rakennus_ids = set()
     rakennus_prts = set()
+    rakennus_objs = []
 
     kohteet_rakennuksittain = {
         item.rakennus_id: item.kohde_id
@@ -1702,26 +1783,30 @@ def update_or_create_kohde_from_buildings(
         if isinstance(rakennustiedot, tuple):
             rakennus_ids.add(rakennustiedot[0].id)
             rakennus_prts.add(rakennustiedot[0].prt)
-            print(f"DEBUG: Tuple rakennus data: {rakennustiedot.__dict__}")
+            rakennus_objs.append(rakennustiedot[0])
+            logger.debug("Tuple rakennus data: %s", rakennustiedot)
         else:
-            print(f"DEBUG: not Tuple rakennus {rakennustiedot.id}, {rakennustiedot.prt}")
+            logger.debug("not Tuple rakennus %s, %s", rakennustiedot.id, rakennustiedot.prt)
             rakennus_ids.add(rakennustiedot.id)
             rakennus_prts.add(rakennustiedot.prt)
+            rakennus_objs.append(rakennustiedot)
 
     asukas_ids = {osapuoli.id for osapuoli in asukkaat}
     omistaja_ids = {osapuoli.id for osapuoli in omistajat}
     
-    logger = logging.getLogger(__name__)
-    print("")
-    print(
-        f"Etsitään kohdetta: rakennukset={rakennus_ids}, prts={rakennus_prts}, "
-        f"asukkaat={asukas_ids}, omistajat={omistaja_ids}"
-    )
     logger.debug(
-        f"Etsitään kohdetta: rakennukset={rakennus_ids}, prts={rakennus_prts}, "
-        f"asukkaat={asukas_ids}, omistajat={omistaja_ids}"
+        "Etsitään kohdetta: rakennukset=%s, prts=%s, asukkaat=%s, omistajat=%s",
+        rakennus_ids,
+        rakennus_prts,
+        asukas_ids,
+        omistaja_ids,
     )
 
+    # Rakennus voi kuulua useaan ryhmään (esim. perusmaksurekisterissä), joten
+    # aiemman ryhmän lisäämättömät kohteet kirjoitetaan ennen hakua.
+    if batch is not None and batch.has_rakennus(rakennus_ids):
+        batch.flush()
+
     # Hae olemassa oleva aktiivinen kohde eksplisiittisillä join-määrittelyillä
     kohde_query = (
         select(Kohde.id, Osapuoli.nimi)
@@ -1745,9 +1830,9 @@ def update_or_create_kohde_from_buildings(
     rakennukset_id_prt = []
     try:
         kohteet = session.execute(kohde_query).all()
-        print(f"Löydetty {len(kohteet)} kohdetta")
+        logger.debug("Löydetty %s kohdetta", len(kohteet))
         for kohde in kohteet:
-            print(f"- Kohde ID: {kohde[0]}, Nimi: {kohde[1]}")
+            logger.debug("- Kohde ID: %s, Nimi: %s", kohde[0], kohde[1])
             # Hae kohteen rakennukset
             rakennus_query = (
                 select(Rakennus.id, Rakennus.prt)
@@ -1756,20 +1841,18 @@ def update_or_create_kohde_from_buildings(
             )
             rakennukset_id_prt = session.execute(rakennus_query).all()
             if rakennukset_id_prt:
-                print(f"  Rakennukset: {[r[1] for r in rakennukset_id_prt]}")
-        logger.debug(f"Löydetty {len(kohteet)} kohdetta")
+                logger.debug("  Rakennukset: %s", [r[1] for r in rakennukset_id_prt])
     except NoResultFound:
         kohteet = []
 
     # Jos kohdetta ei löydy, luo uusi
     if len(kohteet) == 0:
-        print("Kohdetta ei löytynyt, luodaan uusi")
         logger.debug("Kohdetta ei löytynyt, luodaan uusi")
 
         # Tarkista mahdollinen vanha kohde
         vanhat_kohteet: List[Kohde] = []
         if poimintapvm:
-            print("Checking for old kohde")
+            logger.debug("Checking for old kohde")
             vanhat_kohteet = old_kohde_for_buildings(session, list(rakennus_ids), poimintapvm, kohteet_rakennuksittain)
 
         # Määritä alkupvm
@@ -1778,6 +1861,11 @@ def update_or_create_kohde_from_buildings(
             session, list(rakennus_ids), vanhat_kohteet, poimintapvm
         )
 
+        # Vanhan kohteen tietojen siirto tarvitsee uuden kohteen tietokannassa,
+        # joten joukkolisäystä käytetään vain kokonaan uusille kohteille.
+        if batch is not None and vanhat_kohteet:
+            batch.flush()
+
         # Luo uusi kohde
         new_kohde = create_new_kohde_from_buildings(
             session,
@@ -1787,16 +1875,18 @@ def update_or_create_kohde_from_buildings(
             vanhat_kohteet,
             alkupvm,
             loppupvm,
-            lukittu=lukittu
+            lukittu=lukittu,
+            rakennukset=rakennus_objs,
+            batch=batch if not vanhat_kohteet else None,
+            rakennus_kohdetyypit=rakennus_kohdetyypit,
         )
 
-        print(f"uusi kohde luotu: {new_kohde.id}")
+        logger.debug("uusi kohde luotu: %s", new_kohde.id)
 
         for old_kohde in vanhat_kohteet:
             # Käsittele vanhan kohteen tiedot
             if new_kohde and old_kohde:
-                logger.debug(f"Päivitetään vanhan kohteen {old_kohde.id} tiedot")
-                print(f"Päivitetään vanhan kohteen {old_kohde.id} tiedot")
+                logger.debug("Päivitetään vanhan kohteen %s tiedot", old_kohde.id)
                 update_old_kohde_data(
                     session,
                     old_kohde,
@@ -1817,13 +1907,14 @@ def update_or_create_kohde_from_buildings(
                 )
 
                 vanhat_linkit: list[KohteenRakennukset] = session.execute(vanhan_kohteen_linkit).scalars().all()
-                print(f"Poistetaan linkitys rakennuksien ja kohteen {old_kohde.id} väliltä. Linkit: {[r.rakennus_id for r in vanhat_linkit]}")
+                logger.debug("Poistetaan linkitys rakennuksien ja kohteen %s väliltä. Linkit: %s", old_kohde.id, [r.rakennus_id for r in vanhat_linkit])
 
                 for linkki in vanhat_linkit:
                     session.delete(linkki)
 
         
-        print(f"Uusi kohde {new_kohde.id} muodostettu {len(rakennus_ids)} rakennukselle")
+        logger.debug("Uusi kohde %s muodostettu %s rakennukselle", new_kohde.id, len(rakennus_ids))
+        kohde_counts["kohteita luotu"] += 1
         return new_kohde
 
     # Jos kohde löytyi, päivitä sen tiedot
@@ -1839,51 +1930,208 @@ def update_or_create_kohde_from_buildings(
         found_kohde.loppupvm = None
         needs_update = True
 
-    original_kohdetyyppi = found_kohde.kohdetyyppi
-    found_asuinkiinteisto = False
-
-    for rakennus_tiedot in rakennukset_id_prt:       
-        # Yritä hakea täydelliset rakennustiedot dvv_rakennustiedot lookup-taulukosta
-        if isinstance(rakennus_tiedot, tuple):
-            rakennus = rakennus_tiedot[0]
-        else:
-            rakennus = rakennus_tiedot
-
-        # Käytä dvv_rakennustiedot lookup-taulukkoa jos mahdollista
-        if rakennus.id in dvv_rakennustiedot:
-            rakennus_tiedot = dvv_rakennustiedot[rakennus.id]
-            rakennus = rakennus_tiedot[0]
-            print(f"Käytetään DVV rakennustietoja rakennukselle {rakennus.id}")
-
-        building_type = determine_kohdetyyppi(session, rakennus, asukkaat)
-        if building_type == KohdeTyyppi.ASUINKIINTEISTO:
-            found_asuinkiinteisto = True
-            new_kohdetyyppi = codes.kohdetyypit[building_type]
-            if new_kohdetyyppi != original_kohdetyyppi:
-                print(f"Päivitetään kohdetyypin arvo {new_kohdetyyppi} kohdeelle {found_kohde.id}")
-                found_kohde.kohdetyyppi = new_kohdetyyppi
-                needs_update = True
-            break
-
-    # Jos yksikään rakennus ei ole asuinkiinteistö, asetetaan tyypiksi MUU
-    if not found_asuinkiinteisto:
-        new_kohdetyyppi = codes.kohdetyypit[KohdeTyyppi.MUU]
-        if new_kohdetyyppi != original_kohdetyyppi:
-            found_kohde.kohdetyyppi = new_kohdetyyppi
-            needs_update = True
+    # Kohteen rakennuksista vain DVV-tiedoissa olevilla on luokittelusarakkeet,
+    # muut luokitellaan pelkkien asukkaiden perusteella.
+    kohteen_rakennus_ids = [rakennus.id for rakennus in rakennukset_id_prt]
+    tunnetut = rakennus_kohdetyypit or {}
+    dvv_ids = [rakennus_id for rakennus_id in kohteen_rakennus_ids if rakennus_id in dvv_rakennustiedot]
+    luokitellut = {rakennus_id: KohdeTyyppi.MUU for rakennus_id in kohteen_rakennus_ids}
+    luokitellut.update(
+        classify_rakennukset(
+            dvv_rakennustiedot[rakennus_id][0] for rakennus_id in dvv_ids if rakennus_id not in tunnetut
+        )
+    )
+    luokitellut.update((rakennus_id, tunnetut[rakennus_id]) for rakennus_id in dvv_ids if rakennus_id in tunnetut)
+    new_kohdetyyppi = codes.kohdetyypit[
+        kohdetyyppi_for_rakennukset(kohteen_rakennus_ids, asukkaat, luokitellut)
+    ]
+    if new_kohdetyyppi != found_kohde.kohdetyyppi:
+        logger.debug("Päivitetään kohdetyypin arvo %s kohdeelle %s", new_kohdetyyppi, found_kohde.id)
+        found_kohde.kohdetyyppi = new_kohdetyyppi
+        needs_update = True
 
     if needs_update:
-        print(f"Päivitetty kohde: ID={found_kohde.id}, Alkupvm={found_kohde.alkupvm}, Loppupvm={found_kohde.loppupvm}")
+        logger.debug("Päivitetty kohde: ID=%s, Alkupvm=%s, Loppupvm=%s", found_kohde.id, found_kohde.alkupvm, found_kohde.loppupvm)
+        kohde_counts["kohteita päivitetty"] += 1
         session.flush()
+    else:
+        kohde_counts["kohteita ennallaan"] += 1
 
     return found_kohde
 
+def group_kiinteiston_rakennukset(
+    rakennustiedot: "List[Rakennustiedot]",
+    owners_by_rakennus_id: "Dict[int, Set[Osapuoli]]",
+    addresses_by_rakennus_id: "Dict[int, Set[Osoite]]",
+) -> List[List[int]]:
+    """
+    Jakaa yhden kiinteistön rakennukset rakennusryhmiksi, joista kustakin
+    muodostetaan kohde.
+
+    1. Rakennukset jaetaan klustereihin etäisyyden perusteella.
+    2. Klusteri jaetaan omistajittain, eniten rakennuksia omistavasta alkaen.
+    3. Muiden kuin asunto-osakeyhtiöiden rakennukset jaetaan vielä osoitteen
+       mukaan.
+
+    Funktio ei käytä tietokantaa, joten kiinteistöt voidaan käsitellä
+    rinnakkain eri prosesseissa (ks. `_group_kiinteistot`). Tulos on sama
+    samoilla syötteillä: rakennustiedot lisätään joukkoihin annetussa
+    järjestyksessä.
+
+    Args:
+        rakennustiedot: Kiinteistön rakennustiedot
+        owners_by_rakennus_id: Kiinteistön rakennusten omistajat
+        addresses_by_rakennus_id: Kiinteistön rakennusten osoitteet
+
+    Returns:
+        Rakennusryhmien rakennus-id:t
+    """
+    dvv_rakennustiedot = {tiedot[0].id: tiedot for tiedot in rakennustiedot}
+    building_sets: List[List[int]] = []
+
+    # 1. Jaa rakennukset klustereihin etäisyyden perusteella
+    clustered_rakennustiedot = _cluster_rakennustiedot(
+        set(rakennustiedot), DISTANCE_LIMIT
+    )
+
+    # Käsittele klusterit yksitellen
+    for rakennustiedot_cluster in clustered_rakennustiedot:
+        logger.debug(
+            "Käsitellään klusteri: %s",
+            [(rakennus.id, rakennus.prt) for rakennus, _, _, _ in rakennustiedot_cluster],
+        )
+
+        cluster_ids = {rakennus.id for rakennus, _, _, _ in rakennustiedot_cluster}
+
+        # Kerää klusterin omistajat ja niiden omistamat rakennukset
+        cluster_owners_buildings = defaultdict(set)
+        for rakennus_id in cluster_ids:
+            for owner in owners_by_rakennus_id.get(rakennus_id, ()):
+                cluster_owners_buildings[owner].add(rakennus_id)
+
+        # Järjestä omistajat sen mukaan kuinka monta rakennusta omistavat
+        sorted_owners = sorted(
+            cluster_owners_buildings.items(),
+            key=lambda x: len(x[1]),
+            reverse=True
+        )
+
+        for owner, buildings in sorted_owners:
+            logger.debug(
+                "- %s omistaa %s rakennusta: %s",
+                owner.nimi,
+                len(buildings),
+                [dvv_rakennustiedot[id][0].prt for id in buildings],
+            )
+
+        # 2. Jaa klusteri omistajittain
+        remaining_ids = set(cluster_ids)
+
+        while remaining_ids:
+            # 2.1 Jaa ensin omistajien mukaan
+            if cluster_owners_buildings:
+                # Aloita suurimmasta omistajaryhmästä
+                owner_id, owner_buildings = max(
+                    cluster_owners_buildings.items(),
+                    key=lambda x: len(x[1])
+                )
+                if owner_buildings:  # Varmista että rakennuksia löytyy
+                    buildings_to_process = remaining_ids & owner_buildings
+
+                    # Tarkista omistaja asoy
+                    owner = next(
+                        (owner for owner in owners_by_rakennus_id.get(next(iter(owner_buildings)), ())
+                        if owner.id == owner_id),
+                        None  # Default arvo jos omistajaa ei löydy
+                    )
+                    is_owner_asoy = is_asoy(owner.nimi) if owner else False
+                else:
+                    owner = None
+                    is_owner_asoy = False
+            else:
+                # Jos ei omistajia, käsittele kaikki jäljellä olevat
+                buildings_to_process = remaining_ids
+                is_owner_asoy = False
+
+            # 2.2 Jos ei ole asoy, jaa vielä osoitteen mukaan
+            if not is_owner_asoy:
+                buildings_by_address = defaultdict(set)
+                for building_id in buildings_to_process:
+                    for address in addresses_by_rakennus_id.get(building_id, set()):
+                        key = (address.katu_id, address.osoitenumero)
+                        buildings_by_address[key].add(building_id)
+
+                # Käsittele osoiteryhmät suuruusjärjestyksessä
+                while buildings_to_process:
+                    if buildings_by_address:
+                        # Aloita suurimmasta osoiteryhmästä
+                        _, address_group = max(
+                            buildings_by_address.items(),
+                            key=lambda x: len(x[1])
+                        )
+                        current_group = buildings_to_process & address_group
+                    else:
+                        # Jos ei osoitteita, käsittele kaikki kerralla
+                        current_group = buildings_to_process
+
+                    # Luo rakennusryhmä
+                    rakennus_group = [id for id in current_group if id in dvv_rakennustiedot]
+                    if rakennus_group:
+                        building_sets.append(rakennus_group)
+
+                    # Päivitä jäljellä olevat rakennukset
+                    buildings_to_process -= current_group
+                    remaining_ids -= current_group
+
+                    # Päivitä osoiteryhmät
+                    if buildings_by_address:
+                        buildings_by_address = {
+                            addr: buildings - current_group
+                            for addr, buildings in buildings_by_address.items()
+                            if buildings - current_group
+                        }
+            else:
+                # Asoy - kaikki omistajan rakennukset samaan ryhmään
+                rakennus_group = [id for id in buildings_to_process if id in dvv_rakennustiedot]
+                if rakennus_group:
+                    building_sets.append(rakennus_group)
+                remaining_ids -= buildings_to_process
+
+            # Päivitä omistajaryhmät
+            if cluster_owners_buildings:
+                cluster_owners_buildings.pop(owner_id, None)
+
+    return building_sets
+
+
+def _group_kiinteisto(kiinteisto) -> List[List[int]]:
+    return group_kiinteiston_rakennukset(*kiinteisto)
+
+
+def _group_kiinteistot(kiinteistot: list, workers: int = 1) -> List[List[List[int]]]:
+    """
+    Ryhmittelee kiinteistöjen rakennukset `group_kiinteiston_rakennukset`-
+    funktiolla. Jos `workers` > 1, kiinteistöt jaetaan prosessipoolille.
+    Tulokset palautetaan kiinteistöjen järjestyksessä.
+    """
+    if workers <= 1 or len(kiinteistot) < 2:
+        return [_group_kiinteisto(kiinteisto) for kiinteisto in kiinteistot]
+
+    chunksize = max(1, min(500, len(kiinteistot) // (workers * 4)))
+    logger.info(f"Ryhmitellään {len(kiinteistot)} kiinteistöä {workers} prosessilla")
+    with ProcessPoolExecutor(max_workers=workers) as executor:
+        return list(executor.map(_group_kiinteisto, kiinteistot, chunksize=chunksize))
+
+
 def get_or_create_kohteet_from_kiinteistot(
     session: Session,
     kiinteistotunnukset: "Select",
     poimintapvm: "Optional[datetime.date]",
     loppupvm: "Optional[datetime.date]",
     poistettujen_rakennusten_kohteet: "Optional[List[KohteenRakennukset]]" = None,
+    workers: int = 1,
+    kiinteistorajaus: "Optional[Select]" = None,
+    dvv: "Optional[DvvRakennustiedot]" = None,
 ) -> "List[Kohde]":
     """
     Luo vähintään yksi kohde jokaisesta kiinteistötunnuksesta, jonka select-kysely palauttaa,
@@ -1910,6 +2158,14 @@ def get_or_create_kohteet_from_kiinteistot(
         kiinteistotunnukset: Select-kysely joka palauttaa kiinteistötunnukset
         poimintapvm: Uusien kohteiden alkupäivämäärä
         loppupvm: Uusien kohteiden loppupäivämäärä
+        workers: Rakennusryhmittelyn prosessien määrä. Kohteet kirjoitetaan
+            aina tästä prosessista.
+        kiinteistorajaus: Select-kysely, joka palauttaa käsiteltävät
+            kiinteistötunnukset. Jos annettu, DVV-tiedot ladataan vain näiltä
+            kiinteistöiltä.
+        dvv: Aiemmassa vaiheessa ladatut DVV-tiedot (vapaaehtoinen). Ne
+            päivitetään vastaamaan nykyisiä kohteettomia rakennuksia sen
+            sijaan, että kaikki tiedot haettaisiin uudelleen.
 
     Returns:
         Lista luoduista kohteista
@@ -1927,182 +2183,52 @@ def get_or_create_kohteet_from_kiinteistot(
     print(f"{len(kiinteistotunnukset)} tuotavaa kiinteistötunnusta löydetty")
 
     # Hae DVV:n rakennustiedot ilman kohdetta ja logita määrä
-    dvv_rakennustiedot = get_dvv_rakennustiedot_without_kohde(
-        session, poimintapvm, loppupvm
-    )
+    if dvv is None:
+        dvv = DvvRakennustiedot.load(session, poimintapvm, loppupvm, kiinteistorajaus)
+    else:
+        dvv.refresh(session, poimintapvm, loppupvm, kiinteistorajaus)
+    dvv_rakennustiedot = dvv.rakennustiedot
     logger.info(
         f"Löydetty {len(dvv_rakennustiedot)} DVV-rakennusta ilman voimassaolevaa kohdetta"
     )
     print(f"Löydetty {len(dvv_rakennustiedot)} DVV-rakennusta ilman voimassaolevaa kohdetta")
 
     # Ryhmittele rakennustiedot kiinteistötunnuksittain
-    rakennustiedot_by_kiinteistotunnus = defaultdict(set)
-    for rakennus, vanhimmat, omistajat, osoitteet in dvv_rakennustiedot.values():
-        rakennustiedot_by_kiinteistotunnus[rakennus.kiinteistotunnus].add(
-            (rakennus, vanhimmat, omistajat, osoitteet)
+    rakennustiedot_by_kiinteistotunnus = defaultdict(list)
+    for rakennustiedot in dvv_rakennustiedot.values():
+        rakennustiedot_by_kiinteistotunnus[rakennustiedot[0].kiinteistotunnus].append(
+            rakennustiedot
         )
 
-    # Hae omistajatiedot ja muodosta lookup-taulut
-    rakennus_owners = session.execute(
-        select(RakennuksenOmistajat.rakennus_id, Osapuoli).join(
-            Osapuoli, RakennuksenOmistajat.osapuoli_id == Osapuoli.id
-        )
-    ).all()
-    
-    owners_by_rakennus_id = defaultdict(set)  # rakennus_id -> {omistajat}
-    rakennus_ids_by_owner_id = defaultdict(set)  # omistaja.id -> {rakennus_id:t}
-    for (rakennus_id, owner) in rakennus_owners:
-        owners_by_rakennus_id[rakennus_id].add(owner)
-        rakennus_ids_by_owner_id[owner.id].add(rakennus_id)
-
-    rakennus_inhabitants = session.execute(
-        select(RakennuksenVanhimmat.rakennus_id, Osapuoli).join(
-            Osapuoli, RakennuksenVanhimmat.osapuoli_id == Osapuoli.id
-        )
-    ).all()
-    
-    inhabitants_by_rakennus_id = defaultdict(set)  # rakennus_id -> {asukkaat}
-    for (rakennus_id, inhabitant) in rakennus_inhabitants:
-        inhabitants_by_rakennus_id[rakennus_id].add(inhabitant)
+    # Omistajat, asukkaat ja osoitteet rakennuksittain samasta muistikuvasta
+    owners_by_rakennus_id = dvv.owners_by_rakennus_id  # rakennus_id -> {omistajat}
+    inhabitants_by_rakennus_id = dvv.inhabitants_by_rakennus_id  # rakennus_id -> {asukkaat}
+    addresses_by_rakennus_id = dvv.addresses_by_rakennus_id  # rakennus_id -> {osoitteet}
 
-    rakennus_addresses = session.execute(
-        select(Rakennus.id, Osoite)
-        .join(Osoite, Rakennus.id == Osoite.rakennus_id)
-    ).all()
-    
-    addresses_by_rakennus_id = defaultdict(set)  # rakennus_id -> {osoitteet}
-    for (rakennus_id, address) in rakennus_addresses:
-        addresses_by_rakennus_id[rakennus_id].add(address)
-
-    # Lista muodostettavista rakennusryhmistä
-    building_sets: List[Set[Rakennustiedot]] = []
-
-    # Käsittele kaikki kiinteistöt
+    # Kiinteistöt ryhmitellään toisistaan riippumatta, joten jokaiselle
+    # kiinteistölle kootaan vain sen omat tiedot.
+    kiinteistot = []
     for kiinteistotunnus in kiinteistotunnukset:
-
-        # Kerää kiinteistön rakennukset
-        rakennustiedot_to_add = rakennustiedot_by_kiinteistotunnus[kiinteistotunnus]
+        rakennustiedot_to_add = rakennustiedot_by_kiinteistotunnus.get(kiinteistotunnus)
         if not rakennustiedot_to_add:
-            print(f"Ei rakennuksia kiinteistötunnukselle: {kiinteistotunnus}")
+            logger.debug("Ei rakennuksia kiinteistötunnukselle: %s", kiinteistotunnus)
             continue
-        else:
-            print(f"lisätään kiinteistotunnus {kiinteistotunnus}")
-
-        # 1. Jaa rakennukset klustereihin etäisyyden perusteella
-        clustered_rakennustiedot = _cluster_rakennustiedot(
-            rakennustiedot_to_add, DISTANCE_LIMIT
-        )
-
-        # Käsittele klusterit yksitellen
-        for rakennustiedot_cluster in clustered_rakennustiedot:
-            print(f"\nKäsitellään klusteri:")
-            for rakennus, _, _, _ in rakennustiedot_cluster:
-                print(f"- Rakennus {rakennus.id} (PRT: {rakennus.prt})")
-            
-            cluster_ids = {rakennus.id for rakennus, _, _, _ in rakennustiedot_cluster}
-            
-            # Kerää klusterin omistajat ja niiden omistamat rakennukset
-            cluster_owners_buildings = defaultdict(set)
-            for rakennus_id in cluster_ids:
-                for owner in owners_by_rakennus_id[rakennus_id]:
-                    cluster_owners_buildings[owner].add(rakennus_id)
-            
-            # Järjestä omistajat sen mukaan kuinka monta rakennusta omistavat
-            sorted_owners = sorted(
-                cluster_owners_buildings.items(),
-                key=lambda x: len(x[1]),
-                reverse=True
+        rakennus_ids = [rakennustiedot[0].id for rakennustiedot in rakennustiedot_to_add]
+        kiinteistot.append(
+            (
+                rakennustiedot_to_add,
+                {id: owners_by_rakennus_id[id] for id in rakennus_ids if id in owners_by_rakennus_id},
+                {id: addresses_by_rakennus_id[id] for id in rakennus_ids if id in addresses_by_rakennus_id},
             )
-            
-            print("\nOmistajat:")
-            for owner, buildings in sorted_owners:
-                print(f"- {owner.nimi} omistaa {len(buildings)} rakennusta: {[session.get(Rakennus, id).prt for id in buildings]}")
-            
-            # 2. Jaa klusteri omistajittain
-            remaining_ids = set(cluster_ids)
-            
-            while remaining_ids:
-                # 2.1 Jaa ensin omistajien mukaan
-                if cluster_owners_buildings:
-                    # Aloita suurimmasta omistajaryhmästä
-                    owner_id, owner_buildings = max(
-                        cluster_owners_buildings.items(),
-                        key=lambda x: len(x[1])
-                    )
-                    if owner_buildings:  # Varmista että rakennuksia löytyy
-                        buildings_to_process = remaining_ids & owner_buildings
-                        
-                        # Tarkista omistaja asoy
-                        owner = next(
-                            (owner for owner in owners_by_rakennus_id[next(iter(owner_buildings))]
-                            if owner.id == owner_id),
-                            None  # Default arvo jos omistajaa ei löydy
-                        )
-                        is_owner_asoy = is_asoy(owner.nimi) if owner else False
-                    else:
-                        owner = None
-                        is_owner_asoy = False
-                else:
-                    # Jos ei omistajia, käsittele kaikki jäljellä olevat
-                    buildings_to_process = remaining_ids
-                    is_owner_asoy = False
-
-                # 2.2 Jos ei ole asoy, jaa vielä osoitteen mukaan
-                if not is_owner_asoy:
-                    buildings_by_address = defaultdict(set)
-                    for building_id in buildings_to_process:
-                        for address in addresses_by_rakennus_id.get(building_id, set()):
-                            key = (address.katu_id, address.osoitenumero)
-                            buildings_by_address[key].add(building_id)
-
-                    # Käsittele osoiteryhmät suuruusjärjestyksessä
-                    while buildings_to_process:
-                        if buildings_by_address:
-                            # Aloita suurimmasta osoiteryhmästä
-                            _, address_group = max(
-                                buildings_by_address.items(),
-                                key=lambda x: len(x[1])
-                            )
-                            current_group = buildings_to_process & address_group
-                        else:
-                            # Jos ei osoitteita, käsittele kaikki kerralla
-                            current_group = buildings_to_process
-
-                        # Luo rakennusryhmä
-                        rakennustiedot_group = {
-                            dvv_rakennustiedot[id] 
-                            for id in current_group 
-                            if id in dvv_rakennustiedot
-                        }
-
-                        if rakennustiedot_group:
-                            building_sets.append(rakennustiedot_group)
-
-                        # Päivitä jäljellä olevat rakennukset
-                        buildings_to_process -= current_group
-                        remaining_ids -= current_group
+        )
 
-                        # Päivitä osoiteryhmät
-                        if buildings_by_address:
-                            buildings_by_address = {
-                                addr: buildings - current_group
-                                for addr, buildings in buildings_by_address.items()
-                                if buildings - current_group
-                            }
-                else:
-                    # Asoy - kaikki omistajan rakennukset samaan ryhmään
-                    rakennustiedot_group = {
-                        dvv_rakennustiedot[id] 
-                        for id in buildings_to_process 
-                        if id in dvv_rakennustiedot
-                    }
-                    if rakennustiedot_group:
-                        building_sets.append(rakennustiedot_group)
-                    remaining_ids -= buildings_to_process
-
-                # Päivitä omistajaryhmät
-                if cluster_owners_buildings:
-                    cluster_owners_buildings.pop(owner_id, None)
+    # Lista muodostettavista rakennusryhmistä
+    building_sets: List[Set[Rakennustiedot]] = [
+        {dvv_rakennustiedot[id] for id in group}
+        for groups in _group_kiinteistot(kiinteistot, workers)
+        for group in groups
+    ]
+    logger.info(f"Muodostettu {len(building_sets)} rakennusryhmää {len(kiinteistot)} kiinteistöltä")
 
     # Luo kohteet rakennusryhmien perusteella
     kohteet = get_or_create_kohteet_from_rakennustiedot(
@@ -2114,6 +2240,7 @@ def get_or_create_kohteet_from_kiinteistot(
         poimintapvm,
         loppupvm,
         poistettujen_rakennusten_kohteet=poistettujen_rakennusten_kohteet,
+        rakennus_kohdetyypit=dvv.kohdetyypit,
     )
 
 
@@ -2124,12 +2251,18 @@ def get_or_create_single_asunto_kohteet(
     poimintapvm: "Optional[datetime.date]",
     loppupvm: "Optional[datetime.date]",
     poistettujen_rakennusten_kohteet: "Optional[List[KohteenRakennukset]]" = None,
+    workers: int = 1,
+    kiinteistorajaus: "Optional[Select]" = None,
+    dvv: "Optional[DvvRakennustiedot]" = None,
 ) -> "List[Kohde]":
     """
     Hae tai luo kohteet kaikille yhden asunnon taloille ja paritaloille, joilla ei ole
     kohdetta määritellyllä aikavälillä. Huomioi myös talot, joissa ei ole asukkaita.
 
     Jos kiinteistöllä on useita asuttuja rakennuksia, sitä ei tuoda tässä.
+
+    Jos kiinteistorajaus on annettu, käsitellään vain sen palauttamat
+    kiinteistöt (DVV-päivityksen muutosjoukko).
     """
     logger = logging.getLogger(__name__)
     logger.info("\n----- LUODAAN YHDEN ASUNNON KOHTEET -----")
@@ -2201,8 +2334,20 @@ def get_or_create_single_asunto_kohteet(
         .having(func.count(Rakennus.id) == 1)
     )
 
+    if kiinteistorajaus is not None:
+        single_asunto_kiinteistotunnus = single_asunto_kiinteistotunnus.filter(
+            Rakennus.kiinteistotunnus.in_(kiinteistorajaus)
+        )
+
     return get_or_create_kohteet_from_kiinteistot(
-        session, single_asunto_kiinteistotunnus, poimintapvm, loppupvm, poistettujen_rakennusten_kohteet
+        session,
+        single_asunto_kiinteistotunnus,
+        poimintapvm,
+        loppupvm,
+        poistettujen_rakennusten_kohteet,
+        workers=workers,
+        kiinteistorajaus=kiinteistorajaus,
+        dvv=dvv,
     )
 
 
@@ -2211,6 +2356,9 @@ def get_or_create_multiple_and_uninhabited_kohteet(
     poimintapvm: "Optional[datetime.date]",
     loppupvm: "Optional[datetime.date]",
     poistettujen_rakennusten_kohteet: "Optional[List[KohteenRakennukset]]" = None,
+    workers: int = 1,
+    kiinteistorajaus: "Optional[Select]" = None,
+    dvv: "Optional[DvvRakennustiedot]" = None,
 ) -> "List[Kohde]":
     """
     Luo kohteet kaikille kiinteistötunnuksille, joilla on rakennuksia ilman kohdetta
@@ -2219,6 +2367,9 @@ def get_or_create_multiple_and_uninhabited_kohteet(
     - Useita rakennuksia sisältävät kiinteistöt
     - Yhden asunnon talot jotka ovat samalla kiinteistöllä muiden rakennusten kanssa
     - Asumattomat rakennukset
+
+    Jos kiinteistorajaus on annettu, käsitellään vain sen palauttamat
+    kiinteistöt (DVV-päivityksen muutosjoukko).
     """
     logger = logging.getLogger(__name__)
     logger.info("\n----- LUODAAN JÄLJELLÄ OLEVAT KOHTEET -----")
@@ -2249,8 +2400,20 @@ def get_or_create_multiple_and_uninhabited_kohteet(
         .group_by(Rakennus.kiinteistotunnus)
     )
 
+    if kiinteistorajaus is not None:
+        kiinteistotunnus_without_kohde = kiinteistotunnus_without_kohde.filter(
+            Rakennus.kiinteistotunnus.in_(kiinteistorajaus)
+        )
+
     return get_or_create_kohteet_from_kiinteistot(
-        session, kiinteistotunnus_without_kohde, poimintapvm, loppupvm, poistettujen_rakennusten_kohteet
+        session,
+        kiinteistotunnus_without_kohde,
+        poimintapvm,
+        loppupvm,
+        poistettujen_rakennusten_kohteet,
+        workers=workers,
+        kiinteistorajaus=kiinteistorajaus,
+        dvv=dvv,
     )
 
 
@@ -2386,15 +2549,22 @@ def create_perusmaksurekisteri_kohteet(
     perusmaksutiedosto: Path,
     poimintapvm: Optional[datetime.date],
     loppupvm: Optional[datetime.date] = None,
+    dvv: "Optional[DvvRakennustiedot]" = None,
 ) -> List[Kohde]:
     """
     Luo kohteet perusmaksurekisterin tietojen perusteella.
+
+    Perusmaksurekisteri luetaan rivi kerrallaan (openpyxl read_only), joten
+    koko työkirjaa solutyyleineen ei ladata muistiin.
     
     Args:
         session: Tietokantaistunto
         perusmaksutiedosto: Polku perusmaksurekisterin Excel-tiedostoon
         poimintapvm: Uuden kohteen alkupäivämäärä
         loppupvm: Uuden kohteen loppupäivämäärä
+        dvv: Juuri ladatut kohteettomien rakennusten DVV-tiedot
+            (vapaaehtoinen), joita käytetään myös myöhemmissä vaiheissa.
+            Jos None, tiedot ladataan.
         
     Returns:
         Lista luoduista kohteista
@@ -2407,9 +2577,9 @@ def create_perusmaksurekisteri_kohteet(
     logger.info("\nLuodaan perusmaksurekisterin kohteet...")
 
     # Hae DVV:n rakennustiedot rakennuksista joilla ei vielä ole kohdetta
-    dvv_rakennustiedot = get_dvv_rakennustiedot_without_kohde(
-        session, poimintapvm, loppupvm
-    )
+    if dvv is None:
+        dvv = DvvRakennustiedot.load(session, poimintapvm, loppupvm)
+    dvv_rakennustiedot = dvv.rakennustiedot
     logger.info(f"Löydetty {len(dvv_rakennustiedot)} DVV-rakennusta ilman kohdetta")
 
     # Luo lookup PRT -> Rakennustiedot jatkojalostusta varten
@@ -2424,7 +2594,7 @@ def create_perusmaksurekisteri_kohteet(
     
     # Avaa perusmaksurekisteri
     logger.info("Avataan perusmaksurekisteri...")
-    perusmaksut = load_workbook(filename=perusmaksutiedosto)
+    perusmaksut = load_workbook(filename=perusmaksutiedosto, read_only=True)
     
     # Käytä ensimmäistä sheetiä jos "Tietopyyntö asiakasrekisteristä" ei löydy
     sheet_name = "Tietopyyntö asiakasrekisteristä"
@@ -2434,25 +2604,28 @@ def create_perusmaksurekisteri_kohteet(
     
     sheet = perusmaksut[sheet_name]
 
-    # Käsittele rivit ja kerää rakennukset asiakasnumeron mukaan
+    # Kerää rivien (asiakasnumero, prt)-parit
     logger.info("Käsitellään perusmaksurekisterin rivit...")
     rows_processed = 0
     buildings_found = 0
+    rivit = []
 
-    for index, row in enumerate(sheet.values):
-        if index == 0:  # Ohita otsikkorivi
-            continue
-        
-        rows_processed += 1
-        asiakasnumero = str(row[2])
-        prt = str(row[0])
+    try:
+        for row in sheet.iter_rows(min_row=2, values_only=True):
+            rows_processed += 1
+            rivit.append((str(row[2]), str(row[0])))
+    finally:
+        perusmaksut.close()
 
-        # Hae rakennus
-        rakennus = session.query(Rakennus).filter(
-            Rakennus.prt == prt
-        ).first()
+    # Hae rivien rakennukset yhdellä kyselyllä
+    olemassa_olevat_prt = set(
+        session.execute(
+            select(Rakennus.prt).where(Rakennus.prt.in_({prt for _, prt in rivit}))
+        ).scalars()
+    ) if rivit else set()
 
-        if not rakennus:
+    for asiakasnumero, prt in rivit:
+        if prt not in olemassa_olevat_prt:
             continue
 
         # Lisää rakennus asiakasnumeron mukaiseen ryhmään
@@ -2483,42 +2656,19 @@ def create_perusmaksurekisteri_kohteet(
 
     logger.info(f"Muodostettu {valid_sets:,} rakennusryhmää")
 
-    # Luo omistaja- ja asukastiedot lookupeja varten
-    owners_by_rakennus_id = defaultdict(set)
-    rakennus_owners = session.execute(
-        select(RakennuksenOmistajat.rakennus_id, Osapuoli).join(
-            Osapuoli, RakennuksenOmistajat.osapuoli_id == Osapuoli.id
-        )
-    ).all()
-    
-    owners_by_rakennus_id = defaultdict(set)  # rakennus_id -> {omistajat}
-    rakennus_ids_by_owner_id = defaultdict(set)  # omistaja.id -> {rakennus_id:t}
-    for (rakennus_id, owner) in rakennus_owners:
-        owners_by_rakennus_id[rakennus_id].add(owner)
-        rakennus_ids_by_owner_id[owner.id].add(rakennus_id)
-
-    inhabitants_by_rakennus_id = defaultdict(set)
-    rakennus_inhabitants = session.execute(
-        select(RakennuksenVanhimmat.rakennus_id, Osapuoli).join(
-            Osapuoli, RakennuksenVanhimmat.osapuoli_id == Osapuoli.id
-        )
-    ).all()
-    
-    inhabitants_by_rakennus_id = defaultdict(set)  # rakennus_id -> {asukkaat}
-    for (rakennus_id, inhabitant) in rakennus_inhabitants:
-        inhabitants_by_rakennus_id[rakennus_id].add(inhabitant)
-
-    # Luo kohteet
+    # Luo kohteet. Omistajat ja asukkaat tulevat samasta muistikuvasta,
+    # koska ryhmissä on vain kohteettomia rakennuksia.
     logger.info("\nLuodaan kohteet...")
     kohteet = get_or_create_kohteet_from_rakennustiedot(
         session,
         dvv_rakennustiedot,
         building_sets,
-        owners_by_rakennus_id,
-        inhabitants_by_rakennus_id,
+        dvv.owners_by_rakennus_id,
+        dvv.inhabitants_by_rakennus_id,
         poimintapvm,
         loppupvm,
-        lukittu=True
+        lukittu=True,
+        rakennus_kohdetyypit=dvv.kohdetyypit,
     )
 
     logger.info(f"\nLuotu {len(kohteet):,} kohdetta perusmaksurekisterin perusteella")
@@ -2535,14 +2685,28 @@ def get_or_create_kohteet_from_rakennustiedot(
     loppupvm: Optional[datetime.date],
     lukittu: bool = False,
     poistettujen_rakennusten_kohteet: "Optional[List[KohteenRakennukset]]" = None,
+    rakennus_kohdetyypit: "Optional[Dict[int, KohdeTyyppi]]" = None,
 ) -> List[Kohde]:
     """
     Luo kohteet rakennusryhmien perusteella.
+
+    Rakennusten kohdetyypit luokitellaan kerralla kaikille ryhmien
+    rakennuksille, ellei niitä ole annettu valmiiksi.
     """
     logger = logging.getLogger(__name__)
     logger.info(f"\nLuodaan kohteet {len(building_sets)} rakennusryhmälle...")
     
     kohteet = []
+    batch = KohdeBatch(session)
+
+    if rakennus_kohdetyypit is None:
+        rakennus_kohdetyypit = classify_rakennukset(
+            {
+                tiedot[0] if isinstance(tiedot, tuple) else tiedot
+                for building_set in building_sets
+                for tiedot in building_set
+            }
+        )
 
     for i, building_set in enumerate(building_sets, 1):
         # Kerää rakennusten ID:t ja rakennustiedot
@@ -2582,6 +2746,8 @@ def get_or_create_kohteet_from_rakennustiedot(
             loppupvm,
             lukittu=lukittu,
             poistettujen_rakennusten_kohteet=poistettujen_rakennusten_kohteet,
+            batch=batch,
+            rakennus_kohdetyypit=rakennus_kohdetyypit,
         )
         
         if kohde:
@@ -2591,6 +2757,7 @@ def get_or_create_kohteet_from_rakennustiedot(
         if i % 100 == 0:
             logger.info(f"Käsitelty {i}/{len(building_sets)} rakennusryhmää...")
 
+    batch.flush()
     logger.info(f"Käsitelty kaikki {len(building_sets)} rakennusryhmää.")
     return kohteet
 
@@ -2607,16 +2774,26 @@ def _cluster_rakennustiedot(
     - Sama osoite TAI kiinteistötunnus
     """
     clusters: List[set[Rakennustiedot]] = []
+    # Rakennusten väliset etäisyydet lasketaan kerran, klusterin halkaisijaa
+    # päivitetään rakennuksia lisättäessä.
+    distances = ClusterDistances(
+        [rakennustiedot[0] for rakennustiedot in rakennustiedot_to_cluster]
+        + [rakennustiedot[0] for rakennustiedot in existing_cluster or ()],
+        distance_limit,
+    )
     # Aloita klusteri ensimmäisestä rakennuksesta (tai olemassaolevasta klusterista)
     cluster = existing_cluster.copy() if existing_cluster else None
+    if cluster:
+        distances.start(rakennustiedot[0] for rakennustiedot in cluster)
     
     while rakennustiedot_to_cluster:
         if not cluster:
             first_building = rakennustiedot_to_cluster.pop()
             cluster = set([first_building])
-            print(f"\nAloitetaan uusi klusteri: {first_building[0].prt} \nRakennuksia jäljellä: {len(rakennustiedot_to_cluster)}")
+            distances.start([first_building[0]])
+            logger.debug("Aloitetaan uusi klusteri: %s  Rakennuksia jäljellä: %s", first_building[0].prt, len(rakennustiedot_to_cluster))
             if first_building[0].prt is None:
-                print("\nRakennuksen tunnus puuttuu, ohitetaan")
+                logger.debug("Rakennuksen tunnus puuttuu, ohitetaan")
                 continue
 
         other_rakennustiedot_to_cluster = rakennustiedot_to_cluster.copy()
@@ -2624,46 +2801,49 @@ def _cluster_rakennustiedot(
             found_match = False
             for other_rakennustiedot in other_rakennustiedot_to_cluster:
                 if not other_rakennustiedot[0].prt:
-                    print("\nRakennuksen tunnus puuttuu, ohitetaan")
+                    logger.debug("Rakennuksen tunnus puuttuu, ohitetaan")
                     break
 
-                print(f"\nVerrataan rakennuksia {[r[0].prt for r in cluster]} ja {other_rakennustiedot[0].prt}")
+                kohde_counts["klusteroinnin vertailuja"] += 1
+                if logger.isEnabledFor(logging.DEBUG):
+                    logger.debug("Verrataan rakennuksia %s ja %s", [r[0].prt for r in cluster], other_rakennustiedot[0].prt)
                 
                 # Tarkista etäisyys kaikkiin klusterin rakennuksiin
-                all_buildings = [rakennustiedot[0] for rakennustiedot in cluster] + [other_rakennustiedot[0]]
-                max_distance = maximum_distance_of_buildings(all_buildings)
-                if max_distance >= distance_limit:
-                    print(f"- Etäisyys liian suuri: {max_distance}m >= {distance_limit}m")
+                if not distances.fits(other_rakennustiedot[0]):
+                    if logger.isEnabledFor(logging.DEBUG):
+                        max_distance = distances.max_distance_to(other_rakennustiedot[0])
+                        logger.debug("- Etäisyys liian suuri: %sm >= %sm", max_distance, distance_limit)
                     continue
 
                 # Tarkista omistajat/asukkaat
                 match_found = False
                 if _match_ownership_or_residents(cluster, other_rakennustiedot):
                     match_found = True
-                    print(f"- Omistaja tai asukkaat täsmää")
+                    logger.debug("- Omistaja tai asukkaat täsmää")
 
                 if not match_found:
-                    print("- Ei yhteisiä omistajia/asukkaita")
+                    logger.debug("- Ei yhteisiä omistajia/asukkaita")
                     continue
 
                 # Tarkista osoite TAI kiinteistötunnus
                 match_found = False
                 for cluster_building in cluster:
                     if _match_addresses(cluster_building[3], other_rakennustiedot[3]):
-                        print(f"- Osoite täsmää")
+                        logger.debug("- Osoite täsmää")
                         match_found = True
                         break
                     if cluster_building[0].kiinteistotunnus == other_rakennustiedot[0].kiinteistotunnus:
-                        print(f"- Kiinteistötunnus täsmää: {cluster_building[0].kiinteistotunnus}")
+                        logger.debug("- Kiinteistötunnus täsmää: %s", cluster_building[0].kiinteistotunnus)
                         match_found = True
                         break
                 if not match_found:
-                    print("- Ei samaa osoitetta/kiinteistötunnusta")
+                    logger.debug("- Ei samaa osoitetta/kiinteistötunnusta")
                     continue
 
                 # Kaikki ehdot täyttyvät, lisää rakennus klusteriin
-                print(f"=> Lisätään {other_rakennustiedot[0].prt} klusteriin")
+                logger.debug("=> Lisätään %s klusteriin", other_rakennustiedot[0].prt)
                 cluster.add(other_rakennustiedot)
+                distances.add(other_rakennustiedot[0])
                 found_match = True
                 break
 
@@ -2676,90 +2856,128 @@ def _cluster_rakennustiedot(
 
         # Klusteri on valmis! Poista klusteroidut rakennukset ja aloita silmukka alusta
         clusters.append(cluster)
+        kohde_counts["klustereita"] += 1
         rakennustiedot_to_cluster -= cluster
         cluster = None
 
     return clusters
 
 def remove_buildings_from_kohde(session: Session, rakennukset: list[RakennusData], poistosyy: str, poimintapvm: date | None = datetime.date.today()) -> List[KohteenRakennukset]:
+    """
+    Irrottaa päättyneet tai muuttuneet rakennukset kohteiltaan.
+
+    Jos kohteella on muita rakennuksia, rakennuksen linkki kohteeseen
+    poistetaan ja rakennuksen viranomaispäätökset päätetään ja irrotetaan
+    rakennuksesta. Muuten kohde päätetään rakennuksen loppupäivämäärään.
+
+    Rakennukset käsitellään listan järjestyksessä kuten yksitellen
+    käsiteltäessä, mutta tiedot haetaan ja muutokset tallennetaan muutamalla
+    joukko-operaatiolla.
+
+    Returns:
+        Poistetut kohteen rakennukset -linkit (rakennus_id, kohde_id).
+    """
+    rakennus_ids = {rakennus["id"] for rakennus in rakennukset}
+    if not rakennus_ids:
+        return []
+
+    # Rakennusten kohteet ja näiden kohteiden kaikki rakennukset
+    kohteet_by_rakennus: DefaultDict[int, Set[int]] = defaultdict(set)
+    for rakennus_id, kohde_id in session.execute(
+        select(KohteenRakennukset.rakennus_id, KohteenRakennukset.kohde_id)
+        .join(Rakennus, Rakennus.id == KohteenRakennukset.rakennus_id)
+        .where(KohteenRakennukset.rakennus_id.in_(rakennus_ids))
+    ):
+        kohteet_by_rakennus[rakennus_id].add(kohde_id)
+
+    kohde_ids = set().union(*kohteet_by_rakennus.values())
+    rakennukset_by_kohde: DefaultDict[int, Set[int]] = defaultdict(set)
+    kohteet_by_id: Dict[int, Kohde] = {}
+    if kohde_ids:
+        for kohde_id, rakennus_id in session.execute(
+            select(KohteenRakennukset.kohde_id, KohteenRakennukset.rakennus_id)
+            .where(KohteenRakennukset.kohde_id.in_(kohde_ids))
+        ):
+            rakennukset_by_kohde[kohde_id].add(rakennus_id)
+        kohteet_by_id = {
+            kohde.id: kohde
+            for kohde in session.execute(
+                select(Kohde).where(Kohde.id.in_(kohde_ids))
+            ).scalars()
+        }
 
     rakennus_kohde_list: List[KohteenRakennukset] = []
+    irrotettavat_rakennus_ids = set()
+    paatettyja_kohteita = 0
     for rakennus in rakennukset:
-        rakennuksen_kohde_query = (
-            select(KohteenRakennukset)
-            .join(Rakennus, Rakennus.id == KohteenRakennukset.rakennus_id)
-            .where(KohteenRakennukset.rakennus_id == rakennus["id"])
-        )
-
-        rakennuksen_kohteet = session.execute(rakennuksen_kohde_query).scalars().all()
+        rakennuksen_kohteet = kohteet_by_rakennus[rakennus["id"]]
         if len(rakennuksen_kohteet) != 1:
-            print(f"Rakennuksella {rakennus['id']} ei ole odotettua määrää kohteita: {len(rakennuksen_kohteet)}")
-            print(rakennuksen_kohteet)
+            logger.debug(
+                "Rakennuksella %s ei ole odotettua määrää kohteita: %s",
+                rakennus["id"],
+                len(rakennuksen_kohteet),
+            )
             continue
-        
-        rakennuksen_kohde = rakennuksen_kohteet[0]
 
-        kohde_id = rakennuksen_kohde.kohde_id
+        kohde_id = next(iter(rakennuksen_kohteet))
+        muut_rakennukset = rakennukset_by_kohde[kohde_id] - {rakennus["id"]}
 
-        kohteen_muut_rakennukset_query = (
-            select(KohteenRakennukset)
-            .where(
-                and_(
-                    KohteenRakennukset.kohde_id == kohde_id,
-                    KohteenRakennukset.rakennus_id != rakennus["id"]
-                )
+        if muut_rakennukset:
+            logger.debug("Poistetaan vain rakennus %s kohteelta: %s", rakennus["id"], kohde_id)
+            rakennuksen_kohteet.discard(kohde_id)
+            rakennukset_by_kohde[kohde_id].discard(rakennus["id"])
+            rakennus_kohde_list.append(
+                KohteenRakennukset(rakennus_id=rakennus["id"], kohde_id=kohde_id)
             )
-        )
-
-        muut_rakennukset = session.execute(kohteen_muut_rakennukset_query).all()
-
-        if len(muut_rakennukset) > 0:
-            print(f"\nPoistetaan vain rakennus {rakennuksen_kohde.rakennus.prt} kohteelta: {kohde_id}")
-            session.delete(rakennuksen_kohde)
-            rakennus_kohde_list.append(rakennuksen_kohde)
-            
-            # Aseta loppupvm vanhoille päätöksille ja irrota ne rakennuksesta
-            stmt = (
-                update(Viranomaispaatokset)
-                .where(
-                    Viranomaispaatokset.rakennus_id == rakennuksen_kohde.rakennus_id,
-                )
-                .values(
-                    loppupvm=poimintapvm,
-                    rakennus_id = None  # Irroita rakennuksesta
-                )
-                .execution_options(synchronize_session=False)
-            )
-            result = session.execute(stmt)
-            print(f"Päivitetty {result.rowcount} viranomaispäätöksen loppupvm")
-
+            irrotettavat_rakennus_ids.add(rakennus["id"])
         else:
-            kohde_query = (
-                select(Kohde)
-                .where(
-                    Kohde.id== kohde_id,
-                )
-            )
-
-            kohde = session.execute(kohde_query).scalar_one()
-            print(f"\nLopetetaan rakennuksen {rakennuksen_kohde.rakennus.prt}, {rakennuksen_kohde.rakennus.kiinteistotunnus} kohde {kohde.id}, syy: {poistosyy}")
-
-            print("Valitaan loppupvm kohteelle:")
+            kohde = kohteet_by_id[kohde_id]
             uusi_loppupvm = rakennus["loppupvm"]
-            print(uusi_loppupvm)
-            print(kohde.alkupvm)
 
             if poimintapvm and uusi_loppupvm >= poimintapvm: # loppupvm tulee olla ennen poimintapvm:ää
                 uusi_loppupvm = poimintapvm - timedelta(days=1)
             if kohde.alkupvm >= uusi_loppupvm: # alkupvm ei saa olla suurempi kuin loppupvm
-                print(f"alkupäivä asetettu tulos: {uusi_loppupvm}")
                 kohde.alkupvm = uusi_loppupvm
-                
-
-            print(f"Loppupäivä tulos: {uusi_loppupvm}")
 
+            logger.debug(
+                "Lopetetaan rakennuksen %s kohde %s %s, syy: %s",
+                rakennus["id"],
+                kohde.id,
+                uusi_loppupvm,
+                poistosyy,
+            )
             kohde.loppupvm = uusi_loppupvm
             kohde.loppumisen_syy = kohde.loppumisen_syy + f" Syy: {poistosyy} Loppu_pwm: {uusi_loppupvm}" if kohde.loppumisen_syy else f"Syy: {poistosyy} Loppu_pwm: {uusi_loppupvm}"
-            #session.delete(rakennuksen_kohde)
+            paatettyja_kohteita += 1
+
+    if rakennus_kohde_list:
+        session.execute(
+            delete(KohteenRakennukset)
+            .where(
+                tuple_(KohteenRakennukset.kohde_id, KohteenRakennukset.rakennus_id).in_(
+                    [(linkki.kohde_id, linkki.rakennus_id) for linkki in rakennus_kohde_list]
+                )
+            )
+            .execution_options(synchronize_session=False)
+        )
+
+        # Aseta loppupvm vanhoille päätöksille ja irrota ne rakennuksesta
+        stmt = (
+            update(Viranomaispaatokset)
+            .where(
+                Viranomaispaatokset.rakennus_id.in_(irrotettavat_rakennus_ids),
+            )
+            .values(
+                loppupvm=poimintapvm,
+                rakennus_id = None  # Irroita rakennuksesta
+            )
+            .execution_options(synchronize_session=False)
+        )
+        result = session.execute(stmt)
+        logger.info(f"Päivitetty {result.rowcount} viranomaispäätöksen loppupvm")
 
-    return rakennus_kohde_list
\ No newline at end of file
+    logger.info(
+        f"Syy {poistosyy}: poistettu {len(rakennus_kohde_list)} rakennusta kohteilta, "
+        f"päätetty {paatettyja_kohteita} kohdetta"
+    )
+    return rakennus_kohde_list
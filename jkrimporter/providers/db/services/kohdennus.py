@@ -0,0 +1,162 @@
+"""
+Kuljetustietojen kohdennusindeksi.
+
+Ladataan kerran tuonnin alussa, jotta asiakaskohtainen kohteen haku
+rakennustunnuksella tai asiakasnumerolla on muistihaku tietokantakyselyn
+sijaan.
+"""
+
+import datetime
+import logging
+from collections import defaultdict
+from typing import TYPE_CHECKING, DefaultDict, Dict, Iterable, Optional, Set, Tuple
+
+from sqlalchemy import select
+
+if TYPE_CHECKING:
+    from sqlalchemy.orm import Session
+
+    from jkrimporter.model import Asiakas, Tunnus
+
+    from ..models import Kohde
+
+logger = logging.getLogger(__name__)
+
+
+class KohdeLookup:
+    """
+    Muistissa pidettävä hakemisto kuljetusten kohdentamiseen.
+
+    - rakennustunnus -> päättymättömät kohteet, joihin rakennus kuuluu
+    - (tiedontuottaja_tunnus, ulkoinen_id) -> kohde
+
+    Hakemisto vastaa tuonnin alun tilannetta. Kuljetusten tuonti ei luo
+    kohteita, mutta muuttaa niiden voimassaoloa ja lisää asiakastietoja.
+    Muutokset päivitetään hakemistoon `update_kohde`- ja
+    `add_ulkoinen_asiakastieto`-metodeilla.
+    """
+
+    def __init__(self):
+        self._kohteet_by_prt: DefaultDict[str, Set[int]] = defaultdict(set)
+        self._voimassaolot: Dict[int, Tuple[Optional[datetime.date], Optional[datetime.date]]] = {}
+        self._kohteet_by_asiakasnumero: Dict[Tuple[str, str], int] = {}
+        self.hits = 0
+        self.misses = 0
+
+    @classmethod
+    def build(
+        cls, session: "Session", tiedontuottajat: Optional[Iterable[str]] = None
+    ) -> "KohdeLookup":
+        """
+        Lataa päättymättömien kohteiden rakennukset ja ulkoiset asiakastiedot.
+
+        Args:
+            session: Tietokantaistunto
+            tiedontuottajat: Rajaa ulkoiset asiakastiedot näihin tiedontuottajiin
+        """
+        # Mallit heijastetaan kannasta, joten ne tuodaan vasta tarvittaessa.
+        # Näin hakemistoa voi käyttää from_rows-metodilla ilman tietokantaa.
+        from ..models import Kohde, KohteenRakennukset, Rakennus, UlkoinenAsiakastieto
+
+        kohde_query = (
+            select(Rakennus.prt, Kohde.id, Kohde.alkupvm, Kohde.loppupvm)
+            .join(KohteenRakennukset, KohteenRakennukset.kohde_id == Kohde.id)
+            .join(Rakennus, Rakennus.id == KohteenRakennukset.rakennus_id)
+            .where(Kohde.loppupvm.is_(None), Rakennus.prt.is_not(None))
+        )
+        asiakastieto_query = select(
+            UlkoinenAsiakastieto.tiedontuottaja_tunnus,
+            UlkoinenAsiakastieto.ulkoinen_id,
+            UlkoinenAsiakastieto.kohde_id,
+        )
+        if tiedontuottajat is not None:
+            asiakastieto_query = asiakastieto_query.where(
+                UlkoinenAsiakastieto.tiedontuottaja_tunnus.in_(list(tiedontuottajat))
+            )
+        lookup = cls.from_rows(
+            session.execute(kohde_query), session.execute(asiakastieto_query)
+        )
+
+        logger.info(
+            f"Kohdennusindeksi: {len(lookup._kohteet_by_prt)} rakennusta, "
+            f"{len(lookup._voimassaolot)} kohdetta, "
+            f"{len(lookup._kohteet_by_asiakasnumero)} asiakastietoa"
+        )
+        return lookup
+
+    @classmethod
+    def from_rows(
+        cls,
+        kohde_rows: Iterable[Tuple[str, int, Optional[datetime.date], Optional[datetime.date]]],
+        asiakastieto_rows: Iterable[Tuple[str, str, int]],
+    ) -> "KohdeLookup":
+        """
+        Muodostaa hakemiston riveistä.
+
+        Args:
+            kohde_rows: (prt, kohde_id, alkupvm, loppupvm)
+            asiakastieto_rows: (tiedontuottaja_tunnus, ulkoinen_id, kohde_id)
+        """
+        lookup = cls()
+        for prt, kohde_id, alkupvm, loppupvm in kohde_rows:
+            lookup._kohteet_by_prt[prt].add(kohde_id)
+            lookup._voimassaolot[kohde_id] = (alkupvm, loppupvm)
+        for tiedontuottaja, ulkoinen_id, kohde_id in asiakastieto_rows:
+            lookup._kohteet_by_asiakasnumero[(tiedontuottaja.strip(), ulkoinen_id)] = kohde_id
+        return lookup
+
+    def find_kohde_id_by_prt(self, asiakas: "Asiakas") -> Optional[int]:
+        """
+        Vastaa `find_kohde_by_prt`-hakua: päättymätön kohde, jonka
+        voimassaolo leikkaa asiakkaan voimassaolon. Useasta osumasta
+        palautetaan pienin kohde-id.
+        """
+        alku = asiakas.voimassa.lower or datetime.date.min
+        loppu = asiakas.voimassa.upper or datetime.date.max
+        # Asiakkaan aikaväli on puoliavoin kuten DateRange-haussa.
+        if alku >= loppu:
+            self.misses += 1
+            return None
+
+        kohde_ids = set()
+        for prt in asiakas.rakennukset:
+            for kohde_id in self._kohteet_by_prt.get(prt, ()):
+                if kohde_id not in self._voimassaolot:
+                    continue
+                alkupvm, loppupvm = self._voimassaolot[kohde_id]
+                if loppupvm is not None:
+                    continue
+                if alkupvm is None or alkupvm < loppu:
+                    kohde_ids.add(kohde_id)
+
+        if not kohde_ids:
+            self.misses += 1
+            return None
+        self.hits += 1
+        if len(kohde_ids) > 1:
+            logger.debug(
+                f"Löytyi {len(kohde_ids)} kohdetta kuljetuksen rakennuksille "
+                f"{asiakas.rakennukset}. Käytetään pienintä, ID: {min(kohde_ids)}"
+            )
+        return min(kohde_ids)
+
+    def find_kohde_id_by_asiakasnumero(self, tunnus: "Tunnus") -> Optional[int]:
+        kohde_id = self._kohteet_by_asiakasnumero.get((tunnus.jarjestelma, tunnus.tunnus))
+        if kohde_id is None:
+            self.misses += 1
+        else:
+            self.hits += 1
+        return kohde_id
+
+    def has_ulkoinen_asiakastieto(self, tunnus: "Tunnus") -> bool:
+        return (tunnus.jarjestelma, tunnus.tunnus) in self._kohteet_by_asiakasnumero
+
+    def update_kohde(self, kohde: "Kohde"):
+        """Päivittää kohteen voimassaolon, esim. `update_kohde`-kutsun jälkeen."""
+        if kohde.id in self._voimassaolot:
+            self._voimassaolot[kohde.id] = (kohde.alkupvm, kohde.loppupvm)
+
+    def add_ulkoinen_asiakastieto(self, tunnus: "Tunnus", kohde_id: int):
+        self._kohteet_by_asiakasnumero.setdefault(
+            (tunnus.jarjestelma, tunnus.tunnus), kohde_id
+        )
@@ -0,0 +1,133 @@
+"""
+Kohdetyypin päättely joukolle rakennuksia kerralla.
+
+Säännöt ovat samat kuin kohde.determine_kohdetyyppi-funktiossa. Rakennus on
+asuinrakennus, jos
+
+1. rakennusluokka 2018 on välillä 0110-0211,
+2. käyttötarkoitus on välillä 011-041,
+3. huoneistomäärä on suurempi kuin nolla tai
+4. rakennuksen olotila on vakinainen asuminen.
+
+Koodit muunnetaan luvuiksi kerran kutakin eri koodiarvoa kohden ja ehdot
+lasketaan NumPy-taulukoina kaikille rakennuksille yhtä aikaa. Asukkaat eivät
+ole rakennuksen ominaisuus, vaan ne huomioidaan kohteen tyyppiä
+päätettäessä (kohdetyyppi_for_rakennukset).
+"""
+
+import logging
+from typing import Dict, Iterable, Optional, Sequence
+
+import numpy as np
+
+from ..codes import KohdeTyyppi, RakennuksenOlotilaTyyppi
+
+logger = logging.getLogger(__name__)
+
+RAKENNUSLUOKKA_2018_ASUIN = (110, 211)
+KAYTTOTARKOITUS_ASUIN = (11, 41)
+
+
+def _parse_koodi(value) -> Optional[int]:
+    try:
+        return int(value)
+    except (ValueError, TypeError):
+        return None
+
+
+def _koodit_to_array(values: Sequence) -> np.ndarray:
+    """
+    Muuntaa koodit kokonaislukutaulukoksi. Puuttuvat ja virheelliset koodit
+    ovat -1, joka ei osu millekään asuinrakennusten välille.
+    """
+    parsed = {}
+    for value in set(values):
+        koodi = _parse_koodi(value)
+        parsed[value] = -1 if koodi is None else koodi
+    return np.fromiter((parsed[value] for value in values), dtype=np.int64, count=len(values))
+
+
+def _between(values: np.ndarray, bounds) -> np.ndarray:
+    return (values >= bounds[0]) & (values <= bounds[1])
+
+
+def asuinrakennus_mask(
+    rakennusluokat: Sequence,
+    kayttotarkoitukset: Sequence,
+    huoneistomaarat: Sequence,
+    olotilat: Sequence,
+) -> np.ndarray:
+    """
+    Palauttaa totuusarvotaulukon, jonka alkio on tosi asuinrakennuksille.
+    Kaikki parametrit ovat yhtä pitkiä sarakkeita samassa rakennusjärjestyksessä.
+    """
+    huoneistot = np.fromiter(
+        (0 if maara is None else maara for maara in huoneistomaarat),
+        dtype=np.float64,
+        count=len(huoneistomaarat),
+    )
+    vakinainen_asuminen = RakennuksenOlotilaTyyppi.VAKINAINEN_ASUMINEN.value
+    olotila_asuin = np.fromiter(
+        (olotila == vakinainen_asuminen for olotila in olotilat),
+        dtype=bool,
+        count=len(olotilat),
+    )
+    return (
+        _between(_koodit_to_array(rakennusluokat), RAKENNUSLUOKKA_2018_ASUIN)
+        | _between(_koodit_to_array(kayttotarkoitukset), KAYTTOTARKOITUS_ASUIN)
+        | (huoneistot > 0)
+        | olotila_asuin
+    )
+
+
+def classify_rakennukset(rakennukset: Iterable) -> Dict[int, KohdeTyyppi]:
+    """
+    Luokittelee rakennukset asuinkiinteistöiksi tai muiksi ilman asukkaita.
+
+    Args:
+        rakennukset: Rakennusoliot tai rivit, joilla on id sekä
+            determine_kohdetyyppi-funktion käyttämät sarakkeet. Puuttuvat
+            sarakkeet tulkitaan tyhjiksi.
+
+    Returns:
+        rakennus_id -> KohdeTyyppi.ASUINKIINTEISTO tai KohdeTyyppi.MUU
+    """
+    rakennukset = list(rakennukset)
+    if not rakennukset:
+        return {}
+    mask = asuinrakennus_mask(
+        [getattr(r, "rakennusluokka_2018", None) for r in rakennukset],
+        [getattr(r, "rakennuksenkayttotarkoitus_koodi", None) for r in rakennukset],
+        [getattr(r, "huoneistomaara", None) for r in rakennukset],
+        [getattr(r, "rakennuksenolotila_koodi", None) for r in rakennukset],
+    )
+    logger.debug(
+        "Luokiteltu %s rakennusta, joista %s asuinrakennuksia",
+        len(rakennukset),
+        int(mask.sum()),
+    )
+    return {
+        rakennus.id: KohdeTyyppi.ASUINKIINTEISTO if asuin else KohdeTyyppi.MUU
+        for rakennus, asuin in zip(rakennukset, mask.tolist())
+    }
+
+
+def kohdetyyppi_for_rakennukset(
+    rakennus_ids: Iterable[int],
+    asukkaat,
+    rakennus_kohdetyypit: Dict[int, KohdeTyyppi],
+) -> KohdeTyyppi:
+    """
+    Kohteen tyyppi sen rakennusten luokittelun perusteella. Kohde on
+    asuinkiinteistö, jos yksikin rakennus on asuinrakennus tai jos kohteella
+    on asukkaita ja vähintään yksi luokiteltu rakennus. Luokittelemattomat
+    rakennukset ohitetaan.
+    """
+    tyypit = [
+        rakennus_kohdetyypit[rakennus_id]
+        for rakennus_id in rakennus_ids
+        if rakennus_id in rakennus_kohdetyypit
+    ]
+    if KohdeTyyppi.ASUINKIINTEISTO in tyypit or (asukkaat and tyypit):
+        return KohdeTyyppi.ASUINKIINTEISTO
+    return KohdeTyyppi.MUU
@@ -0,0 +1,933 @@
+"""
+Kuljetustietojen joukkotuonti.
+
+Vaihtoehto asiakaskohtaiselle tuonnille (`import_asiakastiedot`). Koko
+JkrData viedään COPY:llä väliaikaisiin tauluihin, minkä jälkeen kohteet,
+haltijaosapuolet, sopimukset ja kuljetukset kohdennetaan muutamalla
+joukko-operaatiolla yhden transaktion sisällä.
+"""
+
+import csv
+import io
+import logging
+from collections import defaultdict
+from dataclasses import dataclass, field
+from datetime import date
+from typing import TYPE_CHECKING, Dict, Iterable, List, Optional, Sequence, Tuple
+
+from sqlalchemy import text
+
+from jkrimporter.model import KimppaSopimus, SopimusTyyppi
+from jkrimporter.model import Tyhjennysvali as JkrTyhjennysvali
+
+from .. import codes
+from ..codes import KohdeTyyppi, OsapuolenlajiTyyppi
+from ..database import json_dumps
+from ..utils import is_asoy, reserve_ids
+from .kohde import get_or_create_pseudokohde
+from .osapuoli import get_haltija_rooli, get_haltija_sopimukset
+from .sopimus import merge_alkupvm, merge_loppupvm, overlap, unique_sopimukset
+
+if TYPE_CHECKING:
+    from sqlalchemy.orm import Session
+
+    from jkrimporter.model import Asiakas, JkrData
+    from jkrimporter.model import Tyhjennystapahtuma as JkrTyhjennystapahtuma
+
+logger = logging.getLogger(__name__)
+
+# COPY:n NULL-merkintä, jota ei voi esiintyä aineistossa sellaisenaan.
+COPY_NULL = "\\N"
+
+STAGING_TABLES = """
+CREATE TEMPORARY TABLE bulk_asiakas (
+    idx integer PRIMARY KEY,
+    tiedontuottaja_tunnus text NOT NULL,
+    ulkoinen_id text NOT NULL,
+    alkupvm date,
+    loppupvm date,
+    ulkoinen_asiakastieto jsonb,
+    kohde_id integer
+) ON COMMIT DROP;
+
+CREATE TEMPORARY TABLE bulk_asiakas_prt (
+    idx integer NOT NULL,
+    prt text NOT NULL
+) ON COMMIT DROP;
+
+CREATE TEMPORARY TABLE bulk_haltija (
+    idx integer NOT NULL,
+    jarjestys integer NOT NULL,
+    osapuolenrooli_id smallint,
+    nimi text,
+    katuosoite text,
+    postinumero text,
+    postitoimipaikka text,
+    ytunnus text,
+    tiedontuottaja_tunnus text,
+    osapuolenlaji_koodi text,
+    osapuoli_id integer
+) ON COMMIT DROP;
+
+CREATE TEMPORARY TABLE bulk_kuljetus (
+    idx integer NOT NULL,
+    jarjestys integer NOT NULL,
+    jatetyyppi_id integer NOT NULL,
+    alkupvm date,
+    loppupvm date,
+    tyhjennyskerrat numeric,
+    massa numeric,
+    tilavuus numeric,
+    tiedontuottaja_tunnus text NOT NULL,
+    lietteentyhjennyspaiva date,
+    jatteen_kuvaus text
+) ON COMMIT DROP;
+
+CREATE TEMPORARY TABLE bulk_sopimus (
+    id integer NOT NULL,
+    uusi boolean NOT NULL,
+    kohde_id integer NOT NULL,
+    sopimustyyppi_id integer,
+    jatetyyppi_id integer,
+    kimppaisanta_kohde_id integer,
+    alkupvm date,
+    loppupvm date,
+    tiedontuottaja_tunnus text
+) ON COMMIT DROP;
+
+CREATE TEMPORARY TABLE bulk_tyhjennysvali (
+    sopimus_id integer NOT NULL,
+    alkuvko integer,
+    loppuvko integer,
+    tyhjennysvali numeric,
+    kertaaviikossa integer
+) ON COMMIT DROP;
+
+CREATE TEMPORARY TABLE bulk_keskeytys (
+    id integer,
+    sopimus_id integer NOT NULL,
+    alkupvm date,
+    loppupvm date,
+    selite text
+) ON COMMIT DROP;
+
+CREATE TEMPORARY TABLE bulk_keraysvaline (
+    sopimus_id integer NOT NULL,
+    pvm date,
+    tilavuus integer,
+    maara integer,
+    keraysvalinetyyppi_id integer
+) ON COMMIT DROP;
+"""
+
+# Kohdennus rakennustunnuksilla. Vastaa `find_kohde_by_prt`-hakua: päättymätön
+# kohde, jonka voimassaolo leikkaa asiakkaan voimassaolon. Jos kohteita löytyy
+# useampi, käytetään pienintä id:tä.
+RESOLVE_KOHDE_BY_PRT = """
+UPDATE bulk_asiakas a
+SET kohde_id = osumat.kohde_id
+FROM (
+    SELECT p.idx, min(k.id) AS kohde_id
+    FROM bulk_asiakas_prt p
+    JOIN bulk_asiakas ba ON ba.idx = p.idx
+    JOIN jkr.rakennus r ON r.prt = p.prt
+    JOIN jkr.kohteen_rakennukset kr ON kr.rakennus_id = r.id
+    JOIN jkr.kohde k ON k.id = kr.kohde_id
+    WHERE k.loppupvm IS NULL
+        AND coalesce(ba.alkupvm, DATE '0001-01-01')
+            <= coalesce(ba.loppupvm, DATE '9999-12-31')
+        AND k.voimassaolo && daterange(
+            coalesce(ba.alkupvm, DATE '0001-01-01'),
+            coalesce(ba.loppupvm, DATE '9999-12-31')
+        )
+    GROUP BY p.idx
+) osumat
+WHERE a.idx = osumat.idx
+"""
+
+RESOLVE_KOHDE_BY_ASIAKASNUMERO = """
+UPDATE bulk_asiakas a
+SET kohde_id = u.kohde_id
+FROM jkr.ulkoinen_asiakastieto u
+WHERE a.kohde_id IS NULL
+    AND u.tiedontuottaja_tunnus = a.tiedontuottaja_tunnus
+    AND u.ulkoinen_id = a.ulkoinen_id
+"""
+
+# Sama kohde voi osua useammalle asiakkaalle, jolloin viimeisenä käsitelty
+# asiakas määrää kohteen voimassaolon kuten asiakaskohtaisessa tuonnissa.
+UPDATE_KOHDE_DATES = """
+UPDATE jkr.kohde k
+SET alkupvm = v.alkupvm, loppupvm = v.loppupvm
+FROM (
+    SELECT DISTINCT ON (kohde_id) kohde_id, alkupvm, loppupvm
+    FROM bulk_asiakas
+    WHERE kohde_id IS NOT NULL
+    ORDER BY kohde_id, idx DESC
+) v
+WHERE k.id = v.kohde_id
+    AND (
+        k.alkupvm IS DISTINCT FROM v.alkupvm
+        OR k.loppupvm IS DISTINCT FROM v.loppupvm
+    )
+"""
+
+INSERT_ULKOISET_ASIAKASTIEDOT = """
+INSERT INTO jkr.ulkoinen_asiakastieto (
+    tiedontuottaja_tunnus, ulkoinen_id, ulkoinen_asiakastieto, kohde_id
+)
+SELECT a.tiedontuottaja_tunnus, a.ulkoinen_id, a.ulkoinen_asiakastieto, a.kohde_id
+FROM bulk_asiakas a
+WHERE a.kohde_id IS NOT NULL
+    AND NOT EXISTS (
+        SELECT 1
+        FROM jkr.ulkoinen_asiakastieto u
+        WHERE u.tiedontuottaja_tunnus = a.tiedontuottaja_tunnus
+            AND u.ulkoinen_id = a.ulkoinen_id
+    )
+"""
+
+# Saman tiedontuottajan aiemmat haltijat poistetaan kaikilta kohteilta
+# samalla nimellä, osoitteella ja roolilla, kuten
+# `create_or_update_haltija_osapuoli` tekee.
+DELETE_OLD_HALTIJAT = """
+DELETE FROM jkr.kohteen_osapuolet ko
+USING jkr.osapuoli o, bulk_haltija h, bulk_asiakas a
+WHERE a.idx = h.idx
+    AND a.kohde_id IS NOT NULL
+    AND o.id = ko.osapuoli_id
+    AND o.tiedontuottaja_tunnus = h.tiedontuottaja_tunnus
+    AND o.nimi = h.nimi
+    AND o.katuosoite = h.katuosoite
+    AND ko.osapuolenrooli_id IS NOT DISTINCT FROM h.osapuolenrooli_id
+"""
+
+# Asiakaskohtaisessa tuonnissa myöhempi asiakas poistaa aiemman asiakkaan
+# samannimisen haltijan, joten kustakin haltijasta luodaan vain viimeinen.
+RESERVE_HALTIJA_IDS = """
+UPDATE bulk_haltija h
+SET osapuoli_id = nextval(pg_get_serial_sequence('jkr.osapuoli', 'id'))
+FROM (
+    SELECT DISTINCT ON (
+        h.tiedontuottaja_tunnus, h.nimi, h.katuosoite, h.osapuolenrooli_id
+    ) h.idx, h.jarjestys
+    FROM bulk_haltija h
+    JOIN bulk_asiakas a ON a.idx = h.idx
+    WHERE a.kohde_id IS NOT NULL
+    ORDER BY
+        h.tiedontuottaja_tunnus, h.nimi, h.katuosoite, h.osapuolenrooli_id,
+        h.idx DESC
+) v
+WHERE h.idx = v.idx AND h.jarjestys = v.jarjestys
+"""
+
+INSERT_HALTIJAT = """
+INSERT INTO jkr.osapuoli (
+    id, nimi, katuosoite, postinumero, postitoimipaikka, ytunnus,
+    tiedontuottaja_tunnus, osapuolenlaji_koodi
+)
+SELECT
+    osapuoli_id, nimi, katuosoite, postinumero, postitoimipaikka, ytunnus,
+    tiedontuottaja_tunnus, osapuolenlaji_koodi
+FROM bulk_haltija
+WHERE osapuoli_id IS NOT NULL
+"""
+
+INSERT_KOHTEEN_HALTIJAT = """
+INSERT INTO jkr.kohteen_osapuolet (kohde_id, osapuoli_id, osapuolenrooli_id)
+SELECT a.kohde_id, h.osapuoli_id, h.osapuolenrooli_id
+FROM bulk_haltija h
+JOIN bulk_asiakas a ON a.idx = h.idx
+WHERE h.osapuoli_id IS NOT NULL
+"""
+
+SELECT_KIMPPAISANNAT = """
+SELECT u.tiedontuottaja_tunnus, u.ulkoinen_id, u.kohde_id
+FROM jkr.ulkoinen_asiakastieto u
+JOIN unnest(CAST(:jarjestelmat AS text[]), CAST(:tunnukset AS text[]))
+    AS i(jarjestelma, tunnus)
+    ON u.tiedontuottaja_tunnus = i.jarjestelma AND u.ulkoinen_id = i.tunnus
+"""
+
+SELECT_SOPIMUKSET = """
+SELECT
+    s.id, s.kohde_id, s.sopimustyyppi_id, s.jatetyyppi_id,
+    s.kimppaisanta_kohde_id, s.alkupvm, s.loppupvm
+FROM jkr.sopimus s
+WHERE s.kohde_id IN (SELECT kohde_id FROM bulk_asiakas)
+ORDER BY s.id
+"""
+
+SELECT_TYHJENNYSVALIT = """
+SELECT t.id, t.sopimus_id, t.alkuvko, t.loppuvko, t.tyhjennysvali, t.kertaaviikossa
+FROM jkr.tyhjennysvali t
+JOIN jkr.sopimus s ON s.id = t.sopimus_id
+WHERE s.kohde_id IN (SELECT kohde_id FROM bulk_asiakas)
+ORDER BY t.id
+"""
+
+SELECT_KESKEYTYKSET = """
+SELECT k.id, k.sopimus_id, k.alkupvm, k.loppupvm, k.selite
+FROM jkr.keskeytys k
+JOIN jkr.sopimus s ON s.id = k.sopimus_id
+WHERE s.kohde_id IN (SELECT kohde_id FROM bulk_asiakas)
+ORDER BY k.id
+"""
+
+SELECT_KERAYSVALINEET = """
+SELECT v.sopimus_id, v.tilavuus, v.maara
+FROM jkr.keraysvaline v
+JOIN jkr.sopimus s ON s.id = v.sopimus_id
+WHERE s.kohde_id IN (SELECT kohde_id FROM bulk_asiakas)
+ORDER BY v.id
+"""
+
+INSERT_SOPIMUKSET = """
+INSERT INTO jkr.sopimus (
+    id, kohde_id, sopimustyyppi_id, jatetyyppi_id, kimppaisanta_kohde_id,
+    alkupvm, loppupvm, tiedontuottaja_tunnus
+)
+SELECT
+    id, kohde_id, sopimustyyppi_id, jatetyyppi_id, kimppaisanta_kohde_id,
+    alkupvm, loppupvm, tiedontuottaja_tunnus
+FROM bulk_sopimus
+WHERE uusi
+"""
+
+UPDATE_SOPIMUKSET = """
+UPDATE jkr.sopimus s
+SET alkupvm = b.alkupvm, loppupvm = b.loppupvm
+FROM bulk_sopimus b
+WHERE NOT b.uusi AND s.id = b.id
+"""
+
+INSERT_TYHJENNYSVALIT = """
+INSERT INTO jkr.tyhjennysvali (
+    sopimus_id, alkuvko, loppuvko, tyhjennysvali, kertaaviikossa
+)
+SELECT sopimus_id, alkuvko, loppuvko, tyhjennysvali, kertaaviikossa
+FROM bulk_tyhjennysvali
+"""
+
+INSERT_KESKEYTYKSET = """
+INSERT INTO jkr.keskeytys (sopimus_id, alkupvm, loppupvm, selite)
+SELECT sopimus_id, alkupvm, loppupvm, selite
+FROM bulk_keskeytys
+WHERE id IS NULL
+"""
+
+UPDATE_KESKEYTYKSET = """
+UPDATE jkr.keskeytys k
+SET selite = b.selite
+FROM bulk_keskeytys b
+WHERE b.id IS NOT NULL AND k.id = b.id
+"""
+
+INSERT_KERAYSVALINEET = """
+INSERT INTO jkr.keraysvaline (
+    sopimus_id, pvm, tilavuus, maara, keraysvalinetyyppi_id
+)
+SELECT sopimus_id, pvm, tilavuus, maara, keraysvalinetyyppi_id
+FROM bulk_keraysvaline
+"""
+
+# Kohteelle ei lisätä kuljetusta, jos sillä on jo saman jätetyypin kuljetus
+# samalle aikavälille. Saman ajon päällekkäisistä kuljetuksista säilytetään
+# ensimmäinen.
+INSERT_KULJETUKSET = """
+INSERT INTO jkr.kuljetus (
+    kohde_id, jatetyyppi_id, alkupvm, loppupvm, tyhjennyskerrat, massa,
+    tilavuus, tiedontuottaja_tunnus, lietteentyhjennyspaiva, jatteen_kuvaus
+)
+SELECT DISTINCT ON (a.kohde_id, t.jatetyyppi_id, t.alkupvm, t.loppupvm)
+    a.kohde_id, t.jatetyyppi_id, t.alkupvm, t.loppupvm, t.tyhjennyskerrat,
+    t.massa, t.tilavuus, t.tiedontuottaja_tunnus, t.lietteentyhjennyspaiva,
+    t.jatteen_kuvaus
+FROM bulk_kuljetus t
+JOIN bulk_asiakas a ON a.idx = t.idx
+WHERE a.kohde_id IS NOT NULL
+    AND NOT EXISTS (
+        SELECT 1
+        FROM jkr.kuljetus k
+        WHERE k.kohde_id = a.kohde_id
+            AND k.jatetyyppi_id = t.jatetyyppi_id
+            AND k.alkupvm IS NOT DISTINCT FROM t.alkupvm
+            AND k.loppupvm IS NOT DISTINCT FROM t.loppupvm
+    )
+ORDER BY a.kohde_id, t.jatetyyppi_id, t.alkupvm, t.loppupvm, t.idx, t.jarjestys
+"""
+
+
+def get_kuljetuksen_pvmt_ja_massa(
+    tyhjennys: "JkrTyhjennystapahtuma",
+    raportointi_alkupvm: Optional[date],
+    raportointi_loppupvm: Optional[date],
+) -> Tuple[Optional[date], Optional[date], Optional[int]]:
+    """
+    Palauttaa tyhjennystapahtumasta tallennettavan kuljetuksen alku- ja
+    loppupäivämäärän sekä massan.
+    """
+    if not tyhjennys.alkupvm:
+        # In many cases, only one date is known for tyhjennys. Looks like
+        # in those cases the date is marked as the end date.
+        alkupvm = tyhjennys.loppupvm or raportointi_alkupvm
+    else:
+        alkupvm = tyhjennys.alkupvm
+    loppupvm = tyhjennys.loppupvm or raportointi_loppupvm
+
+    if tyhjennys.jatelaji not in codes.KiinteatJatelajit:
+        massa = None
+    else:
+        massa = tyhjennys.massa
+
+    return alkupvm, loppupvm, massa
+
+
+def _code_id(code) -> Optional[int]:
+    return code.id if code is not None else None
+
+
+def _copy_rows(cursor, table: str, columns: Sequence[str], rows: Iterable[tuple]):
+    """Kirjoittaa rivit väliaikaiseen tauluun COPY FROM STDIN -komennolla."""
+    buffer = io.StringIO()
+    writer = csv.writer(buffer)
+    for row in rows:
+        writer.writerow(COPY_NULL if value is None else value for value in row)
+    buffer.seek(0)
+    cursor.copy_expert(
+        f"COPY {table} ({', '.join(columns)}) "
+        f"FROM STDIN WITH (FORMAT csv, NULL '{COPY_NULL}')",
+        buffer,
+    )
+
+
+@dataclass
+class _Tyhjennysvali:
+    id: Optional[int]
+    arvot: JkrTyhjennysvali
+
+
+@dataclass
+class _Keskeytys:
+    id: Optional[int]
+    alkupvm: Optional[date]
+    loppupvm: Optional[date]
+    selite: Optional[str]
+    muuttunut: bool = False
+
+
+@dataclass(eq=False)
+class _Sopimus:
+    """Sopimuksen tiedot joukkotuonnin aikana, uusi tai kannasta ladattu."""
+
+    id: Optional[int]
+    kohde_id: int
+    sopimustyyppi_id: Optional[int]
+    jatetyyppi_id: Optional[int]
+    kimppaisanta_kohde_id: Optional[int]
+    alkupvm: Optional[date]
+    loppupvm: Optional[date]
+    tiedontuottaja_tunnus: Optional[str] = None
+    uusi: bool = False
+    tyhjennysvalit: List[_Tyhjennysvali] = field(default_factory=list)
+    keskeytykset: List[_Keskeytys] = field(default_factory=list)
+    keraysvalineet: List[Tuple[Optional[int], int]] = field(default_factory=list)
+    alkuperaiset_pvmt: tuple = field(init=False)
+
+    def __post_init__(self):
+        self.alkuperaiset_pvmt = (self.alkupvm, self.loppupvm)
+
+    @property
+    def pvmt_muuttuneet(self) -> bool:
+        return (self.alkupvm, self.loppupvm) != self.alkuperaiset_pvmt
+
+
+class _SopimusKohdistus:
+    """
+    Päivittää kohteiden sopimukset muistissa samoin säännöin kuin
+    `update_sopimukset_for_kohde`, ja kirjoittaa muutokset kantaan
+    joukko-operaatioina.
+    """
+
+    def __init__(self, session: "Session", kimppaisannat: Dict[Tuple[str, str], int]):
+        self.session = session
+        self.kimppaisannat = kimppaisannat
+        self.sopimukset: Dict[int, List[_Sopimus]] = defaultdict(list)
+        self.poistettavat_tyhjennysvalit: List[int] = []
+        self.uudet_keraysvalineet: List[Tuple[_Sopimus, date, Optional[int], int, Optional[int]]] = []
+        self._lataa()
+
+    def _lataa(self):
+        sopimukset_by_id = {}
+        for row in self.session.execute(text(SELECT_SOPIMUKSET)):
+            sopimus = _Sopimus(
+                id=row.id,
+                kohde_id=row.kohde_id,
+                sopimustyyppi_id=row.sopimustyyppi_id,
+                jatetyyppi_id=row.jatetyyppi_id,
+                kimppaisanta_kohde_id=row.kimppaisanta_kohde_id,
+                alkupvm=row.alkupvm,
+                loppupvm=row.loppupvm,
+            )
+            sopimukset_by_id[sopimus.id] = sopimus
+            self.sopimukset[sopimus.kohde_id].append(sopimus)
+
+        for row in self.session.execute(text(SELECT_TYHJENNYSVALIT)):
+            sopimukset_by_id[row.sopimus_id].tyhjennysvalit.append(
+                _Tyhjennysvali(
+                    id=row.id,
+                    arvot=JkrTyhjennysvali(
+                        alkuvko=row.alkuvko,
+                        loppuvko=row.loppuvko,
+                        tyhjennysvali=row.tyhjennysvali,
+                        kertaaviikossa=row.kertaaviikossa,
+                    ),
+                )
+            )
+        for row in self.session.execute(text(SELECT_KESKEYTYKSET)):
+            sopimukset_by_id[row.sopimus_id].keskeytykset.append(
+                _Keskeytys(
+                    id=row.id,
+                    alkupvm=row.alkupvm,
+                    loppupvm=row.loppupvm,
+                    selite=row.selite,
+                )
+            )
+        for row in self.session.execute(text(SELECT_KERAYSVALINEET)):
+            sopimukset_by_id[row.sopimus_id].keraysvalineet.append(
+                (row.tilavuus, row.maara)
+            )
+
+    def _kimppaisanta_kohde_id(self, jkr_sopimus) -> Optional[int]:
+        if not isinstance(jkr_sopimus, KimppaSopimus):
+            return None
+        if jkr_sopimus.sopimustyyppi == SopimusTyyppi.aluekerayssopimus:
+            pseudokohde = get_or_create_pseudokohde(
+                self.session, "Aluekeräys (Pseudo)", KohdeTyyppi.ALUEKERAYS
+            )
+        elif jkr_sopimus.sopimustyyppi == SopimusTyyppi.putkikerayssopimus:
+            pseudokohde = get_or_create_pseudokohde(
+                self.session,
+                f"{jkr_sopimus.isannan_asiakasnumero.tunnus} (Pseudo)",
+                KohdeTyyppi.PUTKIKERAYS,
+            )
+        else:
+            isanta = jkr_sopimus.isannan_asiakasnumero
+            if not isanta:
+                return None
+            return self.kimppaisannat.get((isanta.jarjestelma, isanta.tunnus))
+
+        if pseudokohde.id is None:
+            self.session.flush()
+        return pseudokohde.id
+
+    def kohdista(
+        self,
+        kohde_id: int,
+        asiakas: "Asiakas",
+        raportointi_loppupvm: Optional[date],
+    ):
+        for jkr_sopimus in unique_sopimukset(asiakas):
+            sopimustyyppi_id = _code_id(codes.sopimustyypit[jkr_sopimus.sopimustyyppi])
+            if jkr_sopimus.jatelaji:
+                jatetyyppi = codes.jatetyypit[jkr_sopimus.jatelaji]
+                if not jatetyyppi:
+                    logger.warning(
+                        f"Skipping sopimus. Jätetyyppi '{jkr_sopimus.jatelaji.value}' unknown"
+                    )
+                    continue
+                jatetyyppi_id = jatetyyppi.id
+            else:
+                jatetyyppi_id = None
+            kimppaisanta_kohde_id = self._kimppaisanta_kohde_id(jkr_sopimus)
+
+            sopimus = next(
+                (
+                    sopimus
+                    for sopimus in self.sopimukset[kohde_id]
+                    if sopimus.sopimustyyppi_id == sopimustyyppi_id
+                    and sopimus.kimppaisanta_kohde_id == kimppaisanta_kohde_id
+                    and sopimus.jatetyyppi_id == jatetyyppi_id
+                    and overlap(sopimus, jkr_sopimus)
+                ),
+                None,
+            )
+            if sopimus:
+                merge_alkupvm(sopimus, jkr_sopimus)
+                merge_loppupvm(sopimus, jkr_sopimus)
+            else:
+                sopimus = _Sopimus(
+                    id=None,
+                    kohde_id=kohde_id,
+                    sopimustyyppi_id=sopimustyyppi_id,
+                    jatetyyppi_id=jatetyyppi_id,
+                    kimppaisanta_kohde_id=kimppaisanta_kohde_id,
+                    alkupvm=jkr_sopimus.alkupvm,
+                    loppupvm=jkr_sopimus.loppupvm,
+                    tiedontuottaja_tunnus=asiakas.asiakasnumero.jarjestelma,
+                    uusi=True,
+                )
+                self.sopimukset[kohde_id].append(sopimus)
+
+            self._paivita_keskeytykset(sopimus, jkr_sopimus.keskeytykset)
+            self._paivita_keraysvalineet(
+                sopimus,
+                jkr_sopimus.keraysvalineet,
+                raportointi_loppupvm if raportointi_loppupvm else asiakas.voimassa.upper,
+            )
+            self._paivita_tyhjennysvalit(asiakas, sopimus, jkr_sopimus)
+
+    def _paivita_keskeytykset(self, sopimus: _Sopimus, keskeytykset):
+        for jkr_keskeytys in keskeytykset:
+            keskeytys = next(
+                (
+                    keskeytys
+                    for keskeytys in sopimus.keskeytykset
+                    if keskeytys.alkupvm == jkr_keskeytys.alkupvm
+                    and keskeytys.loppupvm == jkr_keskeytys.loppupvm
+                ),
+                None,
+            )
+            if keskeytys:
+                if keskeytys.selite != jkr_keskeytys.selite:
+                    keskeytys.selite = jkr_keskeytys.selite
+                    keskeytys.muuttunut = True
+            else:
+                sopimus.keskeytykset.append(
+                    _Keskeytys(
+                        id=None,
+                        alkupvm=jkr_keskeytys.alkupvm,
+                        loppupvm=jkr_keskeytys.loppupvm,
+                        selite=jkr_keskeytys.selite,
+                    )
+                )
+
+    def _paivita_keraysvalineet(self, sopimus: _Sopimus, keraysvalineet, pvm: date):
+        for keraysvaline in keraysvalineet:
+            avain = (keraysvaline.tilavuus, keraysvaline.maara)
+            if avain in sopimus.keraysvalineet:
+                continue
+            sopimus.keraysvalineet.append(avain)
+            self.uudet_keraysvalineet.append(
+                (
+                    sopimus,
+                    pvm,
+                    keraysvaline.tilavuus,
+                    keraysvaline.maara,
+                    _code_id(codes.keraysvalinetyypit.get(keraysvaline.tyyppi, None)),
+                )
+            )
+
+    def _paivita_tyhjennysvalit(self, asiakas: "Asiakas", sopimus: _Sopimus, jkr_sopimus):
+        sailyvat = []
+        for tyhjennysvali in sopimus.tyhjennysvalit:
+            if tyhjennysvali.arvot in jkr_sopimus.tyhjennysvalit:
+                sailyvat.append(tyhjennysvali)
+            elif tyhjennysvali.id is None:
+                logger.warning(
+                    "Tyhjennysvälit sekaisin asiakkaalla: "
+                    f"{asiakas.asiakasnumero.tunnus} ({jkr_sopimus.jatelaji.value})"
+                )
+                sailyvat.append(tyhjennysvali)
+            else:
+                self.poistettavat_tyhjennysvalit.append(tyhjennysvali.id)
+        sopimus.tyhjennysvalit = sailyvat
+
+        for jkr_tyhjennysvali in jkr_sopimus.tyhjennysvalit:
+            if not any(
+                tyhjennysvali.arvot == jkr_tyhjennysvali
+                for tyhjennysvali in sopimus.tyhjennysvalit
+            ):
+                sopimus.tyhjennysvalit.append(
+                    _Tyhjennysvali(id=None, arvot=jkr_tyhjennysvali)
+                )
+
+    def tallenna(self, cursor) -> int:
+        """Kirjoittaa muuttuneet sopimukset ja niiden tiedot kantaan."""
+        kaikki = [
+            sopimus
+            for sopimukset in self.sopimukset.values()
+            for sopimus in sopimukset
+        ]
+        uudet = [sopimus for sopimus in kaikki if sopimus.uusi]
+        for sopimus, sopimus_id in zip(
+            uudet, reserve_ids(self.session, "jkr.sopimus", len(uudet))
+        ):
+            sopimus.id = sopimus_id
+
+        _copy_rows(
+            cursor,
+            "bulk_sopimus",
+            (
+                "id", "uusi", "kohde_id", "sopimustyyppi_id", "jatetyyppi_id",
+                "kimppaisanta_kohde_id", "alkupvm", "loppupvm",
+                "tiedontuottaja_tunnus",
+            ),
+            (
+                (
+                    sopimus.id,
+                    sopimus.uusi,
+                    sopimus.kohde_id,
+                    sopimus.sopimustyyppi_id,
+                    sopimus.jatetyyppi_id,
+                    sopimus.kimppaisanta_kohde_id,
+                    sopimus.alkupvm,
+                    sopimus.loppupvm,
+                    sopimus.tiedontuottaja_tunnus,
+                )
+                for sopimus in kaikki
+                if sopimus.uusi or sopimus.pvmt_muuttuneet
+            ),
+        )
+        _copy_rows(
+            cursor,
+            "bulk_tyhjennysvali",
+            ("sopimus_id", "alkuvko", "loppuvko", "tyhjennysvali", "kertaaviikossa"),
+            (
+                (sopimus.id, *tyhjennysvali.arvot)
+                for sopimus in kaikki
+                for tyhjennysvali in sopimus.tyhjennysvalit
+                if tyhjennysvali.id is None
+            ),
+        )
+        _copy_rows(
+            cursor,
+            "bulk_keskeytys",
+            ("id", "sopimus_id", "alkupvm", "loppupvm", "selite"),
+            (
+                (
+                    keskeytys.id,
+                    sopimus.id,
+                    keskeytys.alkupvm,
+                    keskeytys.loppupvm,
+                    keskeytys.selite,
+                )
+                for sopimus in kaikki
+                for keskeytys in sopimus.keskeytykset
+                if keskeytys.id is None or keskeytys.muuttunut
+            ),
+        )
+        _copy_rows(
+            cursor,
+            "bulk_keraysvaline",
+            ("sopimus_id", "pvm", "tilavuus", "maara", "keraysvalinetyyppi_id"),
+            (
+                (sopimus.id, pvm, tilavuus, maara, tyyppi_id)
+                for sopimus, pvm, tilavuus, maara, tyyppi_id in self.uudet_keraysvalineet
+            ),
+        )
+
+        self.session.execute(text(INSERT_SOPIMUKSET))
+        self.session.execute(text(UPDATE_SOPIMUKSET))
+        if self.poistettavat_tyhjennysvalit:
+            self.session.execute(
+                text("DELETE FROM jkr.tyhjennysvali WHERE id = ANY(:ids)"),
+                {"ids": self.poistettavat_tyhjennysvalit},
+            )
+        self.session.execute(text(INSERT_TYHJENNYSVALIT))
+        self.session.execute(text(INSERT_KESKEYTYKSET))
+        self.session.execute(text(UPDATE_KESKEYTYKSET))
+        self.session.execute(text(INSERT_KERAYSVALINEET))
+
+        return len(uudet)
+
+
+def _stage_asiakkaat(
+    cursor,
+    asiakkaat: List["Asiakas"],
+    raportointi_alkupvm: Optional[date],
+    raportointi_loppupvm: Optional[date],
+):
+    asiakas_rows = []
+    prt_rows = []
+    haltija_rows = []
+    kuljetus_rows = []
+    for idx, asiakas in enumerate(asiakkaat):
+        urakoitsija_tunnus = asiakas.asiakasnumero.jarjestelma
+        asiakas_rows.append(
+            (
+                idx,
+                urakoitsija_tunnus,
+                asiakas.asiakasnumero.tunnus,
+                asiakas.voimassa.lower,
+                asiakas.voimassa.upper,
+                json_dumps(asiakas.ulkoinen_asiakastieto),
+            )
+        )
+        prt_rows.extend((idx, prt) for prt in asiakas.rakennukset)
+
+        osapuolenlaji = (
+            codes.osapuolenlajit[OsapuolenlajiTyyppi.ASOY]
+            if is_asoy(asiakas.haltija.nimi)
+            else None
+        )
+        for jarjestys, sopimus in enumerate(get_haltija_sopimukset(asiakas)):
+            rooli = get_haltija_rooli(sopimus)
+            if rooli is None:
+                logger.warning(
+                    f"Ohitetaan haltija, tuntematon jätelaji {sopimus.jatelaji}"
+                )
+                continue
+            haltija_rows.append(
+                (
+                    idx,
+                    jarjestys,
+                    _code_id(codes.osapuolenroolit[rooli]),
+                    asiakas.haltija.nimi,
+                    str(asiakas.haltija.osoite),
+                    asiakas.haltija.osoite.postinumero,
+                    asiakas.haltija.osoite.postitoimipaikka,
+                    asiakas.haltija.ytunnus,
+                    urakoitsija_tunnus,
+                    osapuolenlaji.koodi if osapuolenlaji else None,
+                )
+            )
+
+        for jarjestys, tyhjennys in enumerate(asiakas.tyhjennystapahtumat):
+            jatetyyppi = codes.jatetyypit[tyhjennys.jatelaji]
+            if not jatetyyppi:
+                logger.warning(
+                    f"Ohitetaan tyhjennystapahtuma. Jätetyyppi "
+                    f"'{tyhjennys.jatelaji}' unknown"
+                )
+                continue
+            alkupvm, loppupvm, massa = get_kuljetuksen_pvmt_ja_massa(
+                tyhjennys, raportointi_alkupvm, raportointi_loppupvm
+            )
+            kuljetus_rows.append(
+                (
+                    idx,
+                    jarjestys,
+                    jatetyyppi.id,
+                    alkupvm,
+                    loppupvm,
+                    tyhjennys.tyhjennyskerrat,
+                    massa,
+                    tyhjennys.tilavuus,
+                    urakoitsija_tunnus,
+                    tyhjennys.lietteentyhjennyspaiva,
+                    tyhjennys.jatteen_kuvaus,
+                )
+            )
+
+    _copy_rows(
+        cursor,
+        "bulk_asiakas",
+        (
+            "idx", "tiedontuottaja_tunnus", "ulkoinen_id", "alkupvm", "loppupvm",
+            "ulkoinen_asiakastieto",
+        ),
+        asiakas_rows,
+    )
+    _copy_rows(cursor, "bulk_asiakas_prt", ("idx", "prt"), prt_rows)
+    _copy_rows(
+        cursor,
+        "bulk_haltija",
+        (
+            "idx", "jarjestys", "osapuolenrooli_id", "nimi", "katuosoite",
+            "postinumero", "postitoimipaikka", "ytunnus", "tiedontuottaja_tunnus",
+            "osapuolenlaji_koodi",
+        ),
+        haltija_rows,
+    )
+    _copy_rows(
+        cursor,
+        "bulk_kuljetus",
+        (
+            "idx", "jarjestys", "jatetyyppi_id", "alkupvm", "loppupvm",
+            "tyhjennyskerrat", "massa", "tilavuus", "tiedontuottaja_tunnus",
+            "lietteentyhjennyspaiva", "jatteen_kuvaus",
+        ),
+        kuljetus_rows,
+    )
+
+
+def _get_kimppaisannat(session: "Session", asiakkaat: List["Asiakas"]) -> Dict[Tuple[str, str], int]:
+    isannat = {
+        (sopimus.isannan_asiakasnumero.jarjestelma, sopimus.isannan_asiakasnumero.tunnus)
+        for asiakas in asiakkaat
+        for sopimus in asiakas.sopimukset
+        if isinstance(sopimus, KimppaSopimus)
+        and sopimus.sopimustyyppi == SopimusTyyppi.kimppasopimus
+        and sopimus.isannan_asiakasnumero
+    }
+    if not isannat:
+        return {}
+    jarjestelmat, tunnukset = zip(*isannat)
+    rows = session.execute(
+        text(SELECT_KIMPPAISANNAT),
+        {"jarjestelmat": list(jarjestelmat), "tunnukset": list(tunnukset)},
+    )
+    return {
+        (row.tiedontuottaja_tunnus.strip(), row.ulkoinen_id): row.kohde_id
+        for row in rows
+    }
+
+
+def import_asiakastiedot_bulk(
+    session: "Session",
+    jkr_data: "JkrData",
+    do_update_kohde: bool,
+) -> List["Asiakas"]:
+    """
+    Tuo kaikki siirtotiedoston asiakkaat joukko-operaatioina.
+
+    Asiakkaat kohdennetaan tuontia edeltävän tilanteen mukaan samoin säännöin
+    kuin `import_asiakastiedot`: ensin rakennustunnuksilla ja sitten
+    asiakasnumerolla. Kaikki muutokset tehdään istunnon transaktiossa, ja
+    väliaikaiset taulut poistuvat commitissa.
+
+    Args:
+        session: Tietokantaistunto
+        jkr_data: Tuotava aineisto
+        do_update_kohde: Päivitetäänkö kohteen voimassaolo asiakkaan mukaan
+
+    Returns:
+        Kohdentumattomat asiakkaat aineiston järjestyksessä
+    """
+    asiakkaat = list(jkr_data.asiakkaat.values())
+    cursor = session.connection().connection.cursor()
+
+    session.execute(text(STAGING_TABLES))
+    _stage_asiakkaat(cursor, asiakkaat, jkr_data.alkupvm, jkr_data.loppupvm)
+    session.execute(text("ANALYZE bulk_asiakas, bulk_asiakas_prt"))
+    logger.info("Viety %s asiakasta väliaikaisiin tauluihin", len(asiakkaat))
+
+    kohdennetut_prt = session.execute(text(RESOLVE_KOHDE_BY_PRT)).rowcount
+    kohdennetut_asiakasnumero = session.execute(
+        text(RESOLVE_KOHDE_BY_ASIAKASNUMERO)
+    ).rowcount
+    logger.info(
+        "Kohdennettu %s asiakasta rakennustunnuksilla ja %s asiakasnumerolla",
+        kohdennetut_prt,
+        kohdennetut_asiakasnumero,
+    )
+
+    if do_update_kohde:
+        session.execute(text(UPDATE_KOHDE_DATES))
+    session.execute(text(INSERT_ULKOISET_ASIAKASTIEDOT))
+
+    session.execute(text(DELETE_OLD_HALTIJAT))
+    session.execute(text(RESERVE_HALTIJA_IDS))
+    haltijat = session.execute(text(INSERT_HALTIJAT)).rowcount
+    session.execute(text(INSERT_KOHTEEN_HALTIJAT))
+    logger.info("Lisätty %s haltijaa", haltijat)
+
+    kohde_ids = dict(
+        session.execute(
+            text("SELECT idx, kohde_id FROM bulk_asiakas WHERE kohde_id IS NOT NULL")
+        ).all()
+    )
+    sopimukset = _SopimusKohdistus(session, _get_kimppaisannat(session, asiakkaat))
+    for idx, asiakas in enumerate(asiakkaat):
+        if idx in kohde_ids:
+            sopimukset.kohdista(kohde_ids[idx], asiakas, jkr_data.loppupvm)
+    uudet_sopimukset = sopimukset.tallenna(cursor)
+    logger.info("Lisätty %s sopimusta", uudet_sopimukset)
+
+    kuljetukset = session.execute(text(INSERT_KULJETUKSET)).rowcount
+    logger.info("Lisätty %s kuljetusta", kuljetukset)
+
+    return [
+        asiakas for idx, asiakas in enumerate(asiakkaat) if idx not in kohde_ids
+    ]
@@ -1,6 +1,9 @@
+import logging
+from collections import defaultdict
 from sqlalchemy import select, desc
 from sqlalchemy.exc import NoResultFound
 from datetime import datetime, date
+from typing import Iterable, Optional, Set
 from jkrimporter.model import Asiakas, Jatelaji, JkrIlmoitukset, SopimusTyyppi
 from jkrimporter.providers.db.models import (
     Kohde,
@@ -14,13 +17,62 @@ from .. import codes
 from ..codes import OsapuolenlajiTyyppi, OsapuolenrooliTyyppi
 from ..utils import is_asoy
 
+logger = logging.getLogger(__name__)
+
+
+KIMPPAISANNAN_ROOLIT = {
+    Jatelaji.sekajate: OsapuolenrooliTyyppi.SEKAJATE_KIMPPAISANTA,
+    Jatelaji.bio: OsapuolenrooliTyyppi.BIOJATE_KIMPPAISANTA,
+    Jatelaji.lasi: OsapuolenrooliTyyppi.LASI_KIMPPAISANTA,
+    Jatelaji.kartonki: OsapuolenrooliTyyppi.KARTONKI_KIMPPAISANTA,
+    Jatelaji.metalli: OsapuolenrooliTyyppi.METALLI_KIMPPAISANTA,
+    Jatelaji.monilokero: OsapuolenrooliTyyppi.MONILOKERO_KIMPPAOSAKAS,
+    Jatelaji.muovi: OsapuolenrooliTyyppi.MUOVI_KIMPPAISANTA,
+}
+
+KIMPPAOSAKKAAN_ROOLIT = {
+    Jatelaji.sekajate: OsapuolenrooliTyyppi.SEKAJATE_KIMPPAOSAKAS,
+    Jatelaji.bio: OsapuolenrooliTyyppi.BIOJATE_KIMPPAOSAKAS,
+    Jatelaji.lasi: OsapuolenrooliTyyppi.LASI_KIMPPAOSAKAS,
+    Jatelaji.kartonki: OsapuolenrooliTyyppi.KARTONKI_KIMPPAOSAKAS,
+    Jatelaji.metalli: OsapuolenrooliTyyppi.METALLI_KIMPPAOSAKAS,
+    Jatelaji.monilokero: OsapuolenrooliTyyppi.MONILOKERO_KIMPPAOSAKAS,
+    Jatelaji.muovi: OsapuolenrooliTyyppi.MUOVI_KIMPPAOSAKAS,
+}
+
+TILAAJAN_ROOLIT = {
+    Jatelaji.sekajate: OsapuolenrooliTyyppi.SEKAJATE_TILAAJA,
+    Jatelaji.bio: OsapuolenrooliTyyppi.BIOJATE_TILAAJA,
+    Jatelaji.lasi: OsapuolenrooliTyyppi.LASI_TILAAJA,
+    Jatelaji.kartonki: OsapuolenrooliTyyppi.KARTONKI_TILAAJA,
+    Jatelaji.liete: OsapuolenrooliTyyppi.LIETE_TILAAJA,
+    Jatelaji.metalli: OsapuolenrooliTyyppi.METALLI_TILAAJA,
+    Jatelaji.monilokero: OsapuolenrooliTyyppi.MONILOKERO_TILAAJA,
+    Jatelaji.muovi: OsapuolenrooliTyyppi.MUOVI_TILAAJA,
+    Jatelaji.aluekerays: OsapuolenrooliTyyppi.ALUEKERAYS_TILAAJA,
+}
+
+
+def get_haltija_rooli(sopimus) -> "Optional[OsapuolenrooliTyyppi]":
+    """
+    Palauttaa haltijan osapuolenroolin sopimuksen tyypin ja jätelajin
+    perusteella. Tuntemattomalle jätelajille palautetaan None.
+    """
+    if sopimus.sopimustyyppi == SopimusTyyppi.kimppasopimus:
+        if sopimus.asiakas_on_isanta:
+            roolit = KIMPPAISANNAN_ROOLIT
+        else:
+            roolit = KIMPPAOSAKKAAN_ROOLIT
+    else:
+        roolit = TILAAJAN_ROOLIT
 
+    return roolit.get(sopimus.jatelaji)
 
-def create_or_update_haltija_osapuoli(
-    session, kohde, asiakas: "Asiakas", update_contacts: bool
-):
+
+def get_haltija_sopimukset(asiakas: "Asiakas"):
     """
-    Luo kohteelle haltijaosapuolet jätelajeittain
+    Palauttaa asiakkaan sopimukset, joista muodostetaan haltijaosapuolet.
+    Sopimukset yksilöidään nimen, osoitteen ja jätelajin perusteella.
     """
 
     # Dictionary containing unique entries based on nimi, osoite and jatelaji.
@@ -36,66 +88,22 @@ def create_or_update_haltija_osapuoli(
             # Prefer kimppasopimus.
             unique_entries[key] = sopimus
 
-    for sopimus in unique_entries.values():
-        if sopimus.sopimustyyppi == SopimusTyyppi.kimppasopimus:
-            if sopimus.asiakas_on_isanta:
-                if sopimus.jatelaji == Jatelaji.sekajate:
-                    asiakasrooli = codes.osapuolenroolit[OsapuolenrooliTyyppi.SEKAJATE_KIMPPAISANTA]
-                elif sopimus.jatelaji == Jatelaji.bio:
-                    asiakasrooli = codes.osapuolenroolit[OsapuolenrooliTyyppi.BIOJATE_KIMPPAISANTA]
-                elif sopimus.jatelaji == Jatelaji.lasi:
-                    asiakasrooli = codes.osapuolenroolit[OsapuolenrooliTyyppi.LASI_KIMPPAISANTA]
-                elif sopimus.jatelaji == Jatelaji.kartonki:
-                    asiakasrooli = codes.osapuolenroolit[OsapuolenrooliTyyppi.KARTONKI_KIMPPAISANTA]
-                elif sopimus.jatelaji == Jatelaji.metalli:
-                    asiakasrooli = codes.osapuolenroolit[OsapuolenrooliTyyppi.METALLI_KIMPPAISANTA]
-                elif sopimus.jateli == Jatelaji.monilokero:
-                    asiakasrooli = codes.osapuolenroolit[OsapuolenrooliTyyppi.MONILOKERO_KIMPPAOSAKAS]
-                elif sopimus.jatelaji == Jatelaji.muovi:
-                    asiakasrooli = codes.osapuolenroolit[OsapuolenrooliTyyppi.MUOVI_KIMPPAISANTA]
-                else:
-                    print("Skipping sopimus with unknown jätelaji " + sopimus.jatelaji + " in kimppasopimus")
-                    continue
-            else:
-                if sopimus.jatelaji == Jatelaji.sekajate:
-                    asiakasrooli = codes.osapuolenroolit[OsapuolenrooliTyyppi.SEKAJATE_KIMPPAOSAKAS]
-                elif sopimus.jatelaji == Jatelaji.bio:
-                    asiakasrooli = codes.osapuolenroolit[OsapuolenrooliTyyppi.BIOJATE_KIMPPAOSAKAS]
-                elif sopimus.jatelaji == Jatelaji.lasi:
-                    asiakasrooli = codes.osapuolenroolit[OsapuolenrooliTyyppi.LASI_KIMPPAOSAKAS]
-                elif sopimus.jatelaji == Jatelaji.kartonki:
-                    asiakasrooli = codes.osapuolenroolit[OsapuolenrooliTyyppi.KARTONKI_KIMPPAOSAKAS]
-                elif sopimus.jatelaji == Jatelaji.metalli:
-                    asiakasrooli = codes.osapuolenroolit[OsapuolenrooliTyyppi.METALLI_KIMPPAOSAKAS]
-                elif sopimus.jatelaji == Jatelaji.monilokero:
-                    asiakasrooli = codes.osapuolenroolit[OsapuolenrooliTyyppi.MONILOKERO_KIMPPAOSAKAS]
-                elif sopimus.jatelaji == Jatelaji.muovi:
-                    asiakasrooli = codes.osapuolenroolit[OsapuolenrooliTyyppi.MUOVI_KIMPPAOSAKAS]
-                else:
-                    print("Skipping sopimus with unknown jätelaji " + sopimus.jatelaji + " in kimppasopimus")
-                    continue
-        else:
-            if sopimus.jatelaji == Jatelaji.sekajate:
-                asiakasrooli = codes.osapuolenroolit[OsapuolenrooliTyyppi.SEKAJATE_TILAAJA]
-            elif sopimus.jatelaji == Jatelaji.bio:
-                asiakasrooli = codes.osapuolenroolit[OsapuolenrooliTyyppi.BIOJATE_TILAAJA]
-            elif sopimus.jatelaji == Jatelaji.lasi:
-                asiakasrooli = codes.osapuolenroolit[OsapuolenrooliTyyppi.LASI_TILAAJA]
-            elif sopimus.jatelaji == Jatelaji.kartonki:
-                asiakasrooli = codes.osapuolenroolit[OsapuolenrooliTyyppi.KARTONKI_TILAAJA]
-            elif sopimus.jatelaji == Jatelaji.liete:
-                asiakasrooli = codes.osapuolenroolit[OsapuolenrooliTyyppi.LIETE_TILAAJA]
-            elif sopimus.jatelaji == Jatelaji.metalli:
-                asiakasrooli = codes.osapuolenroolit[OsapuolenrooliTyyppi.METALLI_TILAAJA]
-            elif sopimus.jatelaji == Jatelaji.monilokero:
-                asiakasrooli = codes.osapuolenroolit[OsapuolenrooliTyyppi.MONILOKERO_TILAAJA]
-            elif sopimus.jatelaji == Jatelaji.muovi:
-                asiakasrooli = codes.osapuolenroolit[OsapuolenrooliTyyppi.MUOVI_TILAAJA]
-            elif sopimus.jatelaji == Jatelaji.aluekerays:
-                asiakasrooli = codes.osapuolenroolit[OsapuolenrooliTyyppi.ALUEKERAYS_TILAAJA]
-            else:
-                print("Skipping sopimus with unknown jätelaji " + sopimus.jatelaji + " in sopimus")
-                continue
+    return list(unique_entries.values())
+
+
+def create_or_update_haltija_osapuoli(
+    session, kohde, asiakas: "Asiakas", update_contacts: bool
+):
+    """
+    Luo kohteelle haltijaosapuolet jätelajeittain
+    """
+
+    for sopimus in get_haltija_sopimukset(asiakas):
+        rooli = get_haltija_rooli(sopimus)
+        if rooli is None:
+            print("Skipping sopimus with unknown jätelaji " + sopimus.jatelaji + " in sopimus")
+            continue
+        asiakasrooli = codes.osapuolenroolit[rooli]
 
         # Filter osapuoli by the same tiedontuottaja. This way, we don't
         # override data coming from other tiedontuottajat, including DVV.
@@ -187,167 +195,178 @@ def extract_identifier(rakennuksen_vanhin):
         return rakennuksen_vanhin.osapuoli.henkilotunnus or rakennuksen_vanhin.osapuoli.nimi
     return None
 
-def should_remove_from_kohde_via_asukas(
-    session, rakennus_id: int, poimintapvm: date | None, vanha_dvv_poimintapvm: date | None
-) -> bool:
-    """
-    Hae rakennuksen nykyiset ja menneet asukkaat 
-    sekä tarkista onko niissä yhtäläisyyksiä. 
-    Palauttaa Truen jos asukkaissa ei ole päällekkäisyyksiä
-    tai jos uusi asukas on aloittanut ennen edellistä poiminta päivämäärää
+def _fetch_osapuolirivit(session, model, rakennus_ids, loppupvm_column, alkupvm_column):
     """
+    Hakee rakennusten asukas- tai omistajarivit yhdellä kyselyllä.
 
-    # Haetaan rakennuksesta poistuneet asukkaat (loppupvm IS NOT NULL)
-    poistuneet_query = (
-        select(RakennuksenVanhimmat)
-        .join(Osapuoli)
-        .where(
-            RakennuksenVanhimmat.rakennus_id == rakennus_id,
-            RakennuksenVanhimmat.loppupvm.isnot(None)
+    Palauttaa rakennus_id -> [(alkupvm, loppupvm, tunniste)], missä tunniste
+    on sama kuin `extract_identifier` palauttaisi.
+    """
+    rivit = defaultdict(list)
+    if not rakennus_ids:
+        return rivit
+    query = (
+        select(
+            model.rakennus_id,
+            alkupvm_column,
+            loppupvm_column,
+            Osapuoli.henkilotunnus,
+            Osapuoli.nimi,
         )
+        .join(Osapuoli)
+        .where(model.rakennus_id.in_(rakennus_ids))
     )
-    poistuneet = session.execute(poistuneet_query).scalars().all()
+    for rakennus_id, alkupvm, loppupvm, henkilotunnus, nimi in session.execute(query):
+        rivit[rakennus_id].append((alkupvm, loppupvm, henkilotunnus or nimi))
+    return rivit
 
-    # Haetaan yhä rakennuksessa asuvat (loppupvm IS NULL)
-    asuvat_query = (
-        select(RakennuksenVanhimmat)
-        .join(Osapuoli)
-        .where(
-            RakennuksenVanhimmat.rakennus_id == rakennus_id,
-            RakennuksenVanhimmat.loppupvm.is_(None)
-        )
+
+def find_buildings_to_remove_via_asukas(
+    session,
+    rakennus_ids: Iterable[int],
+    poimintapvm: date | None,
+    vanha_dvv_poimintapvm: date | None,
+) -> Set[int]:
+    """
+    Palauttaa ne rakennukset, jotka poistetaan kohteelta asukasmuutoksen
+    perusteella. Päätös on sama kuin `should_remove_from_kohde_via_asukas`,
+    mutta asukkaat ja omistajat haetaan kaikille rakennuksille kerralla.
+    """
+    rakennus_ids = list(rakennus_ids)
+    vanhimmat = _fetch_osapuolirivit(
+        session,
+        RakennuksenVanhimmat,
+        rakennus_ids,
+        RakennuksenVanhimmat.loppupvm,
+        RakennuksenVanhimmat.alkupvm,
+    )
+    omistajat = _fetch_osapuolirivit(
+        session,
+        RakennuksenOmistajat,
+        rakennus_ids,
+        RakennuksenOmistajat.omistuksen_loppupvm,
+        RakennuksenOmistajat.omistuksen_alkupvm,
     )
-    asuvat = session.execute(asuvat_query).scalars().all()
-
-    # Luodaan setti henkilötunnuksista
-    poistuneet_tunnisteet = set()
-    for rv in poistuneet:
-        tunniste = extract_identifier(rv)
-        if tunniste:
-            poistuneet_tunnisteet.add(tunniste)
-
-    asuvat_tunnisteet = set()
-    for rv in asuvat:
-        tunniste = extract_identifier(rv)
-        if tunniste:
-            asuvat_tunnisteet.add(tunniste)
-
-    # Tarkistetaan, onko yksikin sama, jos on, ei tulisi poistaa kohteelta
-    poistetaan_kohteelta = not bool(poistuneet_tunnisteet & asuvat_tunnisteet)
-    if not poistetaan_kohteelta:
-        print(f"Ei poisteta kohteelta, asukkaissa on yhtäläisyys {poistuneet_tunnisteet & asuvat_tunnisteet}")
-
-    # Jos asukkaissa ei ole yhtäläisyyksiä, tarkistetaan onko joku asukkaista muuttanut taloon ennen edellistä poimintapäivää.
-    # Tämä voi tapahtua esimerkiksi kahden henkilön asuessa samassa taloudessa josta toinen muuttaa pois
-    if  poistetaan_kohteelta and len(asuvat) != 0:
-        
-
-        for asukas in asuvat:
-            vertailupvm = vanha_dvv_poimintapvm or poimintapvm
-            if asukas.alkupvm and asukas.alkupvm < vertailupvm:
-                poistetaan_kohteelta = False
-                break
-    
-    # Onko joku poistuneista asukkaista yhä nykyinen omistaja jos uutta asukasta ei ole?
-    if poistetaan_kohteelta and len(asuvat) == 0:
-        rakennuksen_omistajat_query = (
-            select(RakennuksenOmistajat)
-            .join(Osapuoli)
-            .where(
-                RakennuksenOmistajat.rakennus_id == rakennus_id,
-                RakennuksenOmistajat.omistuksen_loppupvm.is_(None)
-            )
-        )
-        rakennuksen_omistajat = session.execute(rakennuksen_omistajat_query).scalars().all()
-        omistaja_tunnisteet = set()
-        for ro in rakennuksen_omistajat:
-            tunniste = extract_identifier(ro)
-            if tunniste:
-                omistaja_tunnisteet.add(tunniste)
 
+    poistettavat = set()
+    for rakennus_id in rakennus_ids:
+        rivit = vanhimmat.get(rakennus_id, [])
+        poistuneet_tunnisteet = {
+            tunniste for _, loppupvm, tunniste in rivit if loppupvm is not None and tunniste
+        }
+        asuvat = [(alkupvm, tunniste) for alkupvm, loppupvm, tunniste in rivit if loppupvm is None]
+        asuvat_tunnisteet = {tunniste for _, tunniste in asuvat if tunniste}
 
         # Tarkistetaan, onko yksikin sama, jos on, ei tulisi poistaa kohteelta
-        poistetaan_kohteelta = not bool(poistuneet_tunnisteet & omistaja_tunnisteet)
+        poistetaan_kohteelta = not bool(poistuneet_tunnisteet & asuvat_tunnisteet)
         if not poistetaan_kohteelta:
-            print(f"Ei poisteta kohteelta, asukas on sama kuin edellinen omistaja {poistuneet_tunnisteet & omistaja_tunnisteet}")
+            logger.debug(
+                "Ei poisteta kohteelta, asukkaissa on yhtäläisyys %s",
+                poistuneet_tunnisteet & asuvat_tunnisteet,
+            )
+
+        # Jos asukkaissa ei ole yhtäläisyyksiä, tarkistetaan onko joku asukkaista
+        # muuttanut taloon ennen edellistä poimintapäivää. Tämä voi tapahtua
+        # esimerkiksi kahden henkilön asuessa samassa taloudessa josta toinen
+        # muuttaa pois.
+        if poistetaan_kohteelta and len(asuvat) != 0:
+            vertailupvm = vanha_dvv_poimintapvm or poimintapvm
+            for alkupvm, _ in asuvat:
+                if alkupvm and alkupvm < vertailupvm:
+                    poistetaan_kohteelta = False
+                    break
+
+        # Onko joku poistuneista asukkaista yhä nykyinen omistaja jos uutta asukasta ei ole?
+        if poistetaan_kohteelta and len(asuvat) == 0:
+            omistaja_tunnisteet = {
+                tunniste
+                for _, loppupvm, tunniste in omistajat.get(rakennus_id, [])
+                if loppupvm is None and tunniste
+            }
+            poistetaan_kohteelta = not bool(poistuneet_tunnisteet & omistaja_tunnisteet)
+            if not poistetaan_kohteelta:
+                logger.debug(
+                    "Ei poisteta kohteelta, asukas on sama kuin edellinen omistaja %s",
+                    poistuneet_tunnisteet & omistaja_tunnisteet,
+                )
 
         if poistetaan_kohteelta:
-            print(f"Poistetaan rakennus asukkailla kohteelta rakennus_id:llä: {rakennus_id}")
-        else:
-            print(f"Ei poisteta rakennusta asukkailla kohteelta rakennus_id:llä: {rakennus_id}")
-    return poistetaan_kohteelta
+            logger.debug("Poistetaan rakennus asukkailla kohteelta rakennus_id:llä: %s", rakennus_id)
+            poistettavat.add(rakennus_id)
+    return poistettavat
 
 
-def should_remove_from_kohde_via_omistaja(
-    session, rakennus_id: int,
+def find_buildings_to_remove_via_omistaja(
+    session,
+    rakennus_ids: Iterable[int],
     poimintapvm: date | None,
-    vanha_dvv_poimintapvm: date | None
-) -> bool:
+    vanha_dvv_poimintapvm: date | None,
+) -> Set[int]:
     """
-    Hae rakennuksen nykyiset omistajat, jotka ovat omistaneet sen
-    jo ennen edellistä poimintapäivää
-    Palauttaa Truen jos tällaisia omistajia ei löydy (Ei ole yhtään samaa omistajaa)
+    Palauttaa ne rakennukset, jotka poistetaan kohteelta omistajamuutoksen
+    perusteella. Päätös on sama kuin `should_remove_from_kohde_via_omistaja`,
+    mutta omistajat haetaan kaikille rakennuksille kerralla.
     """
-
-    # Haetaan rakennuksen omistajat jotka ovat omistaneet sen ennen edellistä poimintaa
-    # (loppupvm IS NULL ja omistuksen_alkupwm pienempi kuin edellinen poiminta)
+    rakennus_ids = list(rakennus_ids)
     vertailupoimintapvm = vanha_dvv_poimintapvm or poimintapvm
-
-    aikaisemmat_omistajat_query = (
-        select(RakennuksenOmistajat)
-        .join(Osapuoli)
-        .where(
-            RakennuksenOmistajat.rakennus_id == rakennus_id,
-            RakennuksenOmistajat.omistuksen_loppupvm.is_(None),
-            RakennuksenOmistajat.omistuksen_alkupvm <= vertailupoimintapvm
-        )
+    omistajat = _fetch_osapuolirivit(
+        session,
+        RakennuksenOmistajat,
+        rakennus_ids,
+        RakennuksenOmistajat.omistuksen_loppupvm,
+        RakennuksenOmistajat.omistuksen_alkupvm,
     )
-    samoja_omistajia_pvm = session.execute(aikaisemmat_omistajat_query).scalars().all()
 
-    poistetaan_kohteelta = True
+    poistettavat = set()
+    for rakennus_id in rakennus_ids:
+        rivit = omistajat.get(rakennus_id, [])
 
-    if len(samoja_omistajia_pvm) > 0:
-        return False
-    
-    # Haetaan rakennuksesta poistuneet omistajat (loppupvm IS NOT NULL)
-    poistuneet_omistajat_query = (
-        select(RakennuksenOmistajat)
-        .join(Osapuoli)
-        .where(
-            RakennuksenOmistajat.rakennus_id == rakennus_id,
-            RakennuksenOmistajat.omistuksen_loppupvm.isnot(None)
-        )
-    )
-    poistuneet_omistajat = session.execute(poistuneet_omistajat_query).scalars().all()
+        # Nykyinen omistaja, joka on omistanut rakennuksen jo ennen edellistä
+        # poimintaa, pitää rakennuksen kohteella.
+        if vertailupoimintapvm is not None and any(
+            loppupvm is None and alkupvm is not None and alkupvm <= vertailupoimintapvm
+            for alkupvm, loppupvm, _ in rivit
+        ):
+            continue
 
-    # Haetaan nykyiset omistajat (loppupvm IS NULL)
-    nykyiset_omistajat_query = (
-        select(RakennuksenOmistajat)
-        .join(Osapuoli)
-        .where(
-            RakennuksenOmistajat.rakennus_id == rakennus_id,
-            RakennuksenOmistajat.omistuksen_loppupvm.is_(None)
-        )
-    )
-    nykyiset_omistajat = session.execute(nykyiset_omistajat_query).scalars().all()
+        poistuneet_tunnisteet = {
+            tunniste for _, loppupvm, tunniste in rivit if loppupvm is not None and tunniste
+        }
+        omistaja_tunnisteet = {
+            tunniste for _, loppupvm, tunniste in rivit if loppupvm is None and tunniste
+        }
 
-    # Luodaan setti henkilötunnuksista tai nimistä
-    poistuneet_tunnisteet = set()
-    for rv in poistuneet_omistajat:
-        tunniste = extract_identifier(rv)
-        if tunniste:
-            poistuneet_tunnisteet.add(tunniste)
+        # Tarkistetaan, onko yksikin sama
+        if not (poistuneet_tunnisteet & omistaja_tunnisteet):
+            logger.debug("Poistetaan rakennus omistajilla kohteelta id:llä: %s", rakennus_id)
+            poistettavat.add(rakennus_id)
+    return poistettavat
 
-    omistaja_tunnisteet = set()
-    for rv in nykyiset_omistajat:
-        tunniste = extract_identifier(rv)
-        if tunniste:
-            omistaja_tunnisteet.add(tunniste)
 
-    # Tarkistetaan, onko yksikin sama
-    poistetaan_kohteelta = not bool(poistuneet_tunnisteet & omistaja_tunnisteet)
+def should_remove_from_kohde_via_asukas(
+    session, rakennus_id: int, poimintapvm: date | None, vanha_dvv_poimintapvm: date | None
+) -> bool:
+    """
+    Hae rakennuksen nykyiset ja menneet asukkaat 
+    sekä tarkista onko niissä yhtäläisyyksiä. 
+    Palauttaa Truen jos asukkaissa ei ole päällekkäisyyksiä
+    tai jos uusi asukas on aloittanut ennen edellistä poiminta päivämäärää
+    """
+    return rakennus_id in find_buildings_to_remove_via_asukas(
+        session, [rakennus_id], poimintapvm, vanha_dvv_poimintapvm
+    )
 
-    if poistetaan_kohteelta:
-            print(f"Poistetaan rakennus omistajilla kohteelta id:llä: {rakennus_id}")
 
-    return poistetaan_kohteelta
+def should_remove_from_kohde_via_omistaja(
+    session, rakennus_id: int,
+    poimintapvm: date | None,
+    vanha_dvv_poimintapvm: date | None
+) -> bool:
+    """
+    Hae rakennuksen nykyiset omistajat, jotka ovat omistaneet sen
+    jo ennen edellistä poimintapäivää
+    Palauttaa Truen jos tällaisia omistajia ei löydy (Ei ole yhtään samaa omistajaa)
+    """
+    return rakennus_id in find_buildings_to_remove_via_omistaja(
+        session, [rakennus_id], poimintapvm, vanha_dvv_poimintapvm
+    )
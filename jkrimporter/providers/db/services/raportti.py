@@ -0,0 +1,292 @@
+"""
+Kohderaportin (jkr.print_report) haku ja kirjoitus tiedostoon.
+
+jkr.print_report lukee tarkastelupäivän rivit taulusta jkr.raportti_kohde, jos
+päivän rivit on laskettu valmiiksi. Muuten rivit lasketaan lähdetauluista
+jokaisella kutsulla. Valmiiksi lasketut päivät eivät päivity tuonnin
+yhteydessä, vaan ne päivitetään erikseen (raportti_laske-komento tai
+--paivita-raportit-valinta), jotta tuonnin transaktio ei pitene.
+
+Useita raportteja voidaan ajaa rinnakkain (aja_raportit). Kukin raportti
+käyttää omaa yhteyttään yhteyspoolista ja kirjoitetaan omaan tiedostoonsa.
+"""
+
+import csv
+import logging
+import re
+import time
+from concurrent.futures import ThreadPoolExecutor
+from dataclasses import dataclass
+from datetime import date
+from pathlib import Path
+from typing import Dict, List, Optional
+
+from sqlalchemy import text
+from sqlalchemy.exc import SQLAlchemyError
+from sqlalchemy.orm import Session
+
+from jkrimporter.utils.date import parse_date_string
+from jkrimporter.utils.raportti import (
+    Raporttimuoto,
+    copy_csv,
+    write_parquet,
+    write_xlsx,
+)
+
+from ..database import engine, stream_options
+
+logger = logging.getLogger(__name__)
+
+PRINT_REPORT = text(
+    "SELECT * FROM jkr.print_report(:tarkastelupvm, :kunta, :huoneistomaara, "
+    ":taajama_10000, :taajama_200, :kohde_tyyppi_id, :onko_viemari)"
+)
+
+# Raporttiajojen tiedoston sarakkeet. Arvot ovat samat kuin raportti-komennon
+# argumenteilla.
+RAPORTTIAJO_SARAKKEET = (
+    "tarkastelupvm",
+    "kunta",
+    "huoneistomaara",
+    "taajama",
+    "kohde_tyyppi",
+    "onko_viemari",
+)
+# Kunnan arvo, joka korvataan kaikilla kunnilla
+KAIKKI_KUNNAT = "*"
+
+
+def raportin_parametrit(
+    tarkastelupvm: Optional[date],
+    kunta: Optional[str],
+    huoneistomaara: int,
+    taajama: Optional[int],
+    kohde_tyyppi: Optional[int],
+    onko_viemari: Optional[int],
+) -> dict:
+    """
+    Muuntaa raportti-komennon hakuehdot print_report-funktion parametreiksi.
+    Arvo 0 tarkoittaa, ettei ehdolla rajata.
+    """
+    # Convert "0" to None for kunta
+    kunta_filter = None if kunta == "0" else kunta
+
+    # Convert "0" to None for taajama
+    taajama_filter = None if taajama == "0" else taajama
+
+    # Convert "0" to None for onko_viemari
+    onko_viemari_filter = None if onko_viemari == 0 else (True if onko_viemari == 1 else False)
+
+    # Convert "0" to None for kohdetyyppi
+    kohde_filter = None if kohde_tyyppi == 0 else kohde_tyyppi
+
+    taajama_10000_filter = None if taajama_filter == None else (None if taajama_filter not in (2,3, 10000) else (taajama_filter in (2,3, 10000)))
+    taajama_200_filter = None if taajama_filter == None else (None if taajama_filter not in (1,3, 200) else (taajama_filter in (1,3, 200)))
+
+    return {
+        "tarkastelupvm": tarkastelupvm,
+        "kunta": kunta_filter,
+        "huoneistomaara": huoneistomaara,
+        "taajama_10000": taajama_10000_filter,  # is_taajama_yli_10000
+        "taajama_200": taajama_200_filter,  # is_taajama_yli_200
+        "kohde_tyyppi_id": kohde_filter,
+        "onko_viemari": onko_viemari_filter
+    }
+
+
+def kirjoita_raportti(
+    session: Session, params: dict, output_path: Path, formaatti: Raporttimuoto
+) -> int:
+    """
+    Hakee raportin annetuilla parametreilla ja kirjoittaa sen tiedostoon.
+
+    Returns:
+        int: Raportin rivien määrä
+    """
+    if formaatti == Raporttimuoto.csv:
+        # CSV kirjoitetaan suoraan tietokannasta COPY-komennolla
+        compiled = PRINT_REPORT.compile(dialect=session.get_bind().dialect)
+        return copy_csv(session.connection().connection, compiled.string, params, output_path)
+
+    result = session.execute(PRINT_REPORT, params, execution_options=stream_options())
+
+    # Rivit kirjoitetaan tiedostoon sitä mukaa kuin ne luetaan kursorilta
+    if formaatti == Raporttimuoto.parquet:
+        type_codes = [column[1] for column in result.cursor.description]
+        return write_parquet(output_path, list(result.keys()), type_codes, result)
+    return write_xlsx(output_path, list(result.keys()), result)
+
+
+def paivita_raportin_kohteet(session: Session, tarkastelupvm: date) -> int:
+    """
+    Laskee tarkastelupäivän raporttirivit kaikille kohteille.
+
+    Returns:
+        int: Laskettujen kohteiden määrä
+    """
+    kohteita = session.execute(
+        text("SELECT jkr.paivita_raportin_kohteet(:tarkastelupvm)"),
+        {"tarkastelupvm": tarkastelupvm},
+    ).scalar_one()
+    session.commit()
+    logger.info(f"Raportin rivit laskettu {tarkastelupvm}: {kohteita} kohdetta")
+    return kohteita
+
+
+def poista_raportin_kohteet(session: Session, tarkastelupvm: Optional[date] = None) -> None:
+    """
+    Poistaa tarkastelupäivän valmiiksi lasketut rivit tai kaikki rivit, jos
+    päivää ei anneta.
+    """
+    session.execute(
+        text("SELECT jkr.poista_raportin_kohteet(:tarkastelupvm)"),
+        {"tarkastelupvm": tarkastelupvm},
+    )
+    session.commit()
+
+
+def lasketut_tarkastelupvmt(session: Session) -> List[date]:
+    return list(
+        session.execute(
+            text(
+                "SELECT tarkastelupvm FROM jkr.raportti_kohde_paivitys "
+                "ORDER BY tarkastelupvm"
+            )
+        ).scalars()
+    )
+
+
+def paivita_lasketut_raportit(session: Session) -> Dict[date, int]:
+    """
+    Laskee uudelleen kaikki valmiiksi lasketut tarkastelupäivät. Kukin päivä
+    lasketaan omassa transaktiossaan. Jos laskenta epäonnistuu, lasketut rivit
+    poistetaan, jotta raportti ei näytä vanhentuneita tietoja.
+
+    Returns:
+        Dict[date, int]: tarkastelupvm -> laskettujen kohteiden määrä
+    """
+    paivitetyt = {}
+    try:
+        for tarkastelupvm in lasketut_tarkastelupvmt(session):
+            paivitetyt[tarkastelupvm] = paivita_raportin_kohteet(session, tarkastelupvm)
+    except SQLAlchemyError:
+        logger.exception(
+            "Raportin rivien päivitys epäonnistui, valmiiksi lasketut rivit poistetaan"
+        )
+        session.rollback()
+        poista_raportin_kohteet(session)
+        return {}
+    return paivitetyt
+
+
+@dataclass
+class Raporttiajo:
+    nimi: str
+    params: dict
+
+
+@dataclass
+class Raporttitulos:
+    ajo: Raporttiajo
+    polku: Path
+    riveja: Optional[int]
+    kesto: float
+    virhe: Optional[str] = None
+
+
+def kunnat(session: Session) -> List[str]:
+    """Kuntien nimet, joissa on rakennuksia."""
+    return list(
+        session.execute(
+            text(
+                "SELECT ku.nimi_fi FROM jkr_osoite.kunta ku "
+                "WHERE EXISTS (SELECT 1 FROM jkr.rakennus r WHERE r.kunta = ku.koodi) "
+                "ORDER BY ku.nimi_fi"
+            )
+        ).scalars()
+    )
+
+
+def _tiedostonimi(*osat) -> str:
+    return re.sub(r"[^\w.-]+", "_", "_".join(str(osa) for osa in osat))
+
+
+def lue_raporttiajot(path: Path, kaikki_kunnat: List[str]) -> List[Raporttiajo]:
+    """
+    Lukee raporttiajot puolipisteellä erotetusta CSV-tiedostosta, jonka
+    sarakkeet ovat RAPORTTIAJO_SARAKKEET. Rivi, jonka kunta on "*", tuottaa
+    ajon jokaiselle kunnalle. Tyhjä solu tarkoittaa samaa kuin 0, eli ettei
+    ehdolla rajata.
+
+    Args:
+        path: Raporttiajojen tiedosto
+        kaikki_kunnat: Kunnat, joilla "*" korvataan
+
+    Returns:
+        List[Raporttiajo]: Ajot tiedoston järjestyksessä. Nimet ovat
+            yksikäsitteisiä ja kelpaavat tiedostonimiksi.
+    """
+    ajot = []
+    with open(path, encoding="utf-8-sig", newline="") as f:
+        reader = csv.DictReader(f, delimiter=";")
+        puuttuvat = [s for s in RAPORTTIAJO_SARAKKEET if s not in (reader.fieldnames or [])]
+        if puuttuvat:
+            raise ValueError(f"Raporttiajojen tiedostosta puuttuu sarakkeita: {puuttuvat}")
+        for rivi in reader:
+            arvot = {
+                sarake: (rivi[sarake] or "").strip() or "0"
+                for sarake in RAPORTTIAJO_SARAKKEET
+            }
+            tarkastelupvm = arvot["tarkastelupvm"]
+            kunta = arvot["kunta"]
+            for ajon_kunta in kaikki_kunnat if kunta == KAIKKI_KUNNAT else [kunta]:
+                params = raportin_parametrit(
+                    parse_date_string(tarkastelupvm) if tarkastelupvm != "0" else None,
+                    ajon_kunta,
+                    int(arvot["huoneistomaara"]),
+                    int(arvot["taajama"]),
+                    int(arvot["kohde_tyyppi"]),
+                    int(arvot["onko_viemari"]),
+                )
+                nimi = _tiedostonimi(
+                    f"{len(ajot) + 1:03d}",
+                    tarkastelupvm,
+                    ajon_kunta,
+                    *(arvot[sarake] for sarake in RAPORTTIAJO_SARAKKEET[2:]),
+                )
+                ajot.append(Raporttiajo(nimi=nimi, params=params))
+    return ajot
+
+
+def _aja_raportti(ajo: Raporttiajo, kansio: Path, formaatti: Raporttimuoto) -> Raporttitulos:
+    polku = kansio / f"{ajo.nimi}.{formaatti.value}"
+    alku = time.perf_counter()
+    try:
+        with Session(engine) as session:
+            riveja = kirjoita_raportti(session, ajo.params, polku, formaatti)
+    except Exception as e:
+        logger.exception(f"Raportin {polku} luonti epäonnistui")
+        return Raporttitulos(ajo, polku, None, time.perf_counter() - alku, str(e))
+    kesto = time.perf_counter() - alku
+    logger.info(f"Raportti {polku} valmis: {riveja} riviä, {kesto:.1f} s")
+    return Raporttitulos(ajo, polku, riveja, kesto)
+
+
+def aja_raportit(
+    ajot: List[Raporttiajo],
+    kansio: Path,
+    formaatti: Raporttimuoto,
+    rinnakkain: int,
+) -> List[Raporttitulos]:
+    """
+    Ajaa raportit rinnakkain, enintään rinnakkain kappaletta kerrallaan.
+    Yhden raportin virhe ei keskeytä muita.
+
+    Returns:
+        List[Raporttitulos]: Tulokset ajojen järjestyksessä
+    """
+    kansio.mkdir(parents=True, exist_ok=True)
+    with ThreadPoolExecutor(max_workers=max(1, rinnakkain)) as executor:
+        return list(
+            executor.map(lambda ajo: _aja_raportti(ajo, kansio, formaatti), ajot)
+        )
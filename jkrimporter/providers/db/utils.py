@@ -5,10 +5,13 @@ from datetime import date, datetime
 from typing import TYPE_CHECKING
 
 from pydantic import BaseModel
+from sqlalchemy import text
 
 logger = logging.getLogger(__name__)
 
 if TYPE_CHECKING:
+    from typing import List
+
     from jkrimporter.model import Yhteystieto
 
 oy_strings = ("oy", "ab")
@@ -106,3 +109,21 @@ class JSONEncoderWithDateSupport(json.JSONEncoder):
             logger.error(f"Json encoding failed with value: {v}")
 
         return v
+
+
+def reserve_ids(session, table: str, count: int) -> "List[int]":
+    """
+    Varaa taulun serial-sekvenssistä `count` kappaletta id-arvoja yhdellä
+    kyselyllä, jotta rivit voidaan lisätä monirivisinä inserteinä ja niihin
+    voidaan viitata ennen lisäystä.
+    """
+    if count <= 0:
+        return []
+    result = session.execute(
+        text(
+            "SELECT nextval(pg_get_serial_sequence(:table, 'id')) "
+            "FROM generate_series(1, :count)"
+        ),
+        {"table": table, "count": count},
+    )
+    return list(result.scalars())
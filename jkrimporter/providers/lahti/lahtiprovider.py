@@ -1,11 +1,10 @@
 import datetime
 import logging
 import re
+from collections import defaultdict
 from datetime import date
 from typing import TYPE_CHECKING, Optional, Union
 
-from addrparser import AddressParser
-
 from jkrimporter.model import AKPPoistoSyy
 from jkrimporter.model import Asiakas as JkrAsiakas
 from jkrimporter.model import IlmoituksenHenkilo
@@ -33,7 +32,7 @@ from jkrimporter.model import Yhteystieto
 # from jkrimporter.providers.db.models import Ilmoitus as JkrIlmoitus
 from jkrimporter.providers.lahti.models import Asiakas, Jatelaji
 from jkrimporter.utils.intervals import Interval
-from jkrimporter.utils.osoite import osoite_from_parsed_address
+from jkrimporter.utils.osoite import address_parser, osoite_from_parsed_address
 
 from .ilmoitustiedosto import Ilmoitustiedosto, LopetusIlmoitustiedosto, LieteIlmoitustiedosto
 from .paatostiedosto import Paatostiedosto
@@ -44,8 +43,6 @@ if TYPE_CHECKING:
 
 logger = logging.getLogger(__name__)
 
-address_parser = AddressParser("fi")
-
 
 def overlap(a: TyhjennysSopimus, b: TyhjennysSopimus) -> bool:
     a1 = a.alkupvm or datetime.date.min
@@ -60,14 +57,14 @@ def create_haltija(row: "Asiakas"):
     try:
         postinumero, postitoimipaikka = row.Kiinteistonposti.split(" ", maxsplit=1)
     except ValueError:
-        print(f"Ei voitu jakaa arvoa {row.Kiinteistonposti}")
+        logger.debug("Ei voitu jakaa arvoa %s", row.Kiinteistonposti)
         if row.Kiinteistonposti.isdigit():
             postinumero, postitoimipaikka = row.Kiinteistonposti, None
         else:
             postinumero, postitoimipaikka = None, row.Kiinteistonposti
     kohteen_osoite = Osoite(postinumero=postinumero, postitoimipaikka=postitoimipaikka)
     if row.Kiinteistonkatuosoite:
-        print(f"katuosoite {row.Kiinteistonkatuosoite}")
+        logger.debug("katuosoite %s", row.Kiinteistonkatuosoite)
         try:
             parsed_address = address_parser.parse(row.Kiinteistonkatuosoite)
         except ValueError:
@@ -76,29 +73,28 @@ def create_haltija(row: "Asiakas"):
             try:
                 parsed_address = address_parser.parse(normalized)
             except ValueError:
-                print(f"epäonnistunut parse, tallennetaan erikoiseksi")
+                logger.debug("epäonnistunut parse, tallennetaan erikoiseksi")
                 kohteen_osoite.erikoisosoite = row.Kiinteistonkatuosoite
             else:
                 o = osoite_from_parsed_address(parsed_address)
-                print(f"parsittu osoite (normalized) {o}")
+                logger.debug("parsittu osoite (normalized) %s", o)
                 kohteen_osoite.katunimi = o.katunimi
                 kohteen_osoite.osoitenumero = o.osoitenumero
                 kohteen_osoite.huoneistotunnus = o.huoneistotunnus
         else:
             o = osoite_from_parsed_address(parsed_address)
-            print(f"parsittu osoite {o}")
+            logger.debug("parsittu osoite %s", o)
             kohteen_osoite.katunimi = o.katunimi
             kohteen_osoite.osoitenumero = o.osoitenumero
             kohteen_osoite.huoneistotunnus = o.huoneistotunnus
         kohteen_osoite.kunta = row.Kuntatun
 
-    print(f"kohteen osoite {kohteen_osoite}")
+    logger.debug("kohteen osoite %s", kohteen_osoite)
     haltija = Yhteystieto(
         nimi=row.Haltijannimi.title(),
         osoite=kohteen_osoite,
     )
-    print("got haltija")
-    print(haltija)
+    logger.debug("got haltija %s", haltija)
     return haltija
 
 
@@ -163,8 +159,7 @@ def create_yhteyshenkilo(row: "Asiakas"):
         nimi=nimi,
         osoite=yhteyshenkilon_osoite,
     )
-    print("got yhteyshenkilö")
-    print(yhteyshenkilo)
+    logger.debug("got yhteyshenkilö %s", yhteyshenkilo)
     return yhteyshenkilo
 
 
@@ -240,22 +235,26 @@ class LahtiTranslator:
     def _append_asiakkaat(
         self, data: JkrData, alkupvm: Union[None, date], loppupvm: Union[None, date]
     ):
+        counts = defaultdict(int)
         for row in self._source.asiakastiedot:
-            print("-------")
-            print("got asiakastiedot")
-            print(row)
-            if alkupvm:
-                print(f"syötteen alkupvm {alkupvm}")
-                print(f"sopimuksen loppupvm {row.Pvmasti}")
-                if row.Pvmasti < alkupvm:
-                    print("skipping, too early")
-                    continue
-            if loppupvm:
-                print(f"syötteen loppupvm {loppupvm}")
-                print(f"sopimuksen alkupvm {row.Pvmalk}")
-                if row.Pvmalk > loppupvm:
-                    print("skipping, too late")
-                    continue
+            logger.debug("got asiakastiedot %s", row)
+            counts["rivejä"] += 1
+            if alkupvm and row.Pvmasti < alkupvm:
+                logger.debug(
+                    "skipping, too early: syötteen alkupvm %s, sopimuksen loppupvm %s",
+                    alkupvm,
+                    row.Pvmasti,
+                )
+                counts["ohitettu, liian aikainen"] += 1
+                continue
+            if loppupvm and row.Pvmalk > loppupvm:
+                logger.debug(
+                    "skipping, too late: syötteen loppupvm %s, sopimuksen alkupvm %s",
+                    loppupvm,
+                    row.Pvmalk,
+                )
+                counts["ohitettu, liian myöhäinen"] += 1
+                continue
             tunnus = self.tunnus_from_urakoitsija_and_asiakasnumero(
                 row.UrakoitsijaId, row.UrakoitsijankohdeId
             )
@@ -267,9 +266,10 @@ class LahtiTranslator:
             # will always only have a single kohde and its sopimukset.
             if tunnus not in data.asiakkaat.keys():
                 data.asiakkaat[tunnus] = self._create_asiakas(tunnus, row)
-                print(f"Added new asiakas {tunnus}")
+                logger.debug("Added new asiakas %s", tunnus)
+                counts["uusia asiakkaita"] += 1
             else:
-                print(f"Asiakas {tunnus} found already")
+                logger.debug("Asiakas %s found already", tunnus)
 
             # Lahti saves aluekeräys in the same field as jätelajit
             if row.tyyppiIdEWC == Jatelaji.aluekerays:
@@ -288,9 +288,10 @@ class LahtiTranslator:
                     data.asiakkaat[isannan_asiakasnumero] = self._create_asiakas(
                         isannan_asiakasnumero, row
                     )
-                    print(f"Added new kimppaisäntä {isannan_asiakasnumero}")
+                    logger.debug("Added new kimppaisäntä %s", isannan_asiakasnumero)
+                    counts["uusia kimppaisäntiä"] += 1
                 else:
-                    print(f"Kimppaisäntä {isannan_asiakasnumero} found already")
+                    logger.debug("Kimppaisäntä %s found already", isannan_asiakasnumero)
                 sopimus = KimppaSopimus(
                     sopimustyyppi=SopimusTyyppi.kimppasopimus,
                     jatelaji=jatelaji,
@@ -329,7 +330,8 @@ class LahtiTranslator:
                 )
 
             data.asiakkaat[tunnus].sopimukset.append(sopimus)
-            print(f"Lisätty tunnuksen {tunnus} sopimuksiin {sopimus}")
+            logger.debug("Lisätty tunnuksen %s sopimuksiin %s", tunnus, sopimus)
+            counts["sopimuksia"] += 1
 
             keraysvaline = Keraysvaline(
                 maara=row.astiamaara,
@@ -348,8 +350,8 @@ class LahtiTranslator:
                     massa=row.get_paino(),
                 )
             )
-            print("------")
 
+        logger.info("Asiakastiedot: %s", dict(counts))
         return data
 
 
@@ -79,7 +79,6 @@ class AsiakasRow(BaseModel):
 
     @validator("Haltijannimi", pre=True)
     def construct_missing_name(value: Union[str, None], values: Dict):
-        print(values)
         if not value:
             try:
                 value = str(values["UrakoitsijankohdeId"])
@@ -234,6 +233,44 @@ class AsiakasRow(BaseModel):
         return values
 
 
+# Kentät, joiden on oltava samat, jotta rivi voidaan yhdistää asiakkaaseen
+# (ks. Asiakas.check_and_add_row).
+ASIAKAS_TUNNISTEKENTAT = (
+    "UrakoitsijaId",
+    "UrakoitsijankohdeId",
+    "Kiinteistotunnus",
+    "Kiinteistonkatuosoite",
+    "Kiinteistonposti",
+    "Haltijannimi",
+    "Haltijanyhteyshlo",
+    "Haltijankatuosoite",
+    "Haltijanposti",
+    "Haltijanmaakoodi",
+    "Haltijanulkomaanpaikkakunta",
+    "Pvmalk",
+    "Pvmasti",
+    "tyyppiIdEWC",
+    "astiamaara",
+    "koko",
+    "Kuntatun",
+    "palveluKimppakohdeId",
+    "kimpanNimi",
+    "Kimpanyhteyshlo",
+    "Kimpankatuosoite",
+    "Kimpanposti",
+    "Keskeytysalkaen",
+    "Keskeytysasti",
+)
+
+
+def asiakas_tunniste(obj: Union["Asiakas", AsiakasRow]) -> tuple:
+    """
+    Palauttaa asiakkaan tai asiakasrivin tunnistekentät hajautusavaimena.
+    Rivi voi yhdistyä asiakkaaseen vain, jos avaimet ovat samat.
+    """
+    return tuple(getattr(obj, kentta) for kentta in ASIAKAS_TUNNISTEKENTAT)
+
+
 class Asiakas(BaseModel):
     UrakoitsijaId: str
     UrakoitsijankohdeId: str
@@ -1,12 +1,14 @@
 import logging
 import csv
+import io
+from collections import defaultdict
 from pathlib import Path
-from typing import List
+from typing import BinaryIO, Callable, Dict, Iterable, Iterator, List, TextIO
 
 from jkrimporter.conf import get_kohdentumattomat_siirtotiedosto_filename
 from jkrimporter.datasheets import SiirtotiedostoSheet
 from jkrimporter.datasheets import get_siirtotiedosto_headers
-from jkrimporter.providers.lahti.models import Asiakas, AsiakasRow
+from jkrimporter.providers.lahti.models import Asiakas, AsiakasRow, asiakas_tunniste
 from pydantic import ValidationError
 
 logger = logging.getLogger(__name__)
@@ -32,32 +34,27 @@ class LahtiSiirtotiedosto:
 
     @property
     def asiakastiedot(self):
-        all_data = []
-        asiakas_list = []
-        asiakas_rows = []
-        failed_validations = []
-        missing_headers_list = []
         expected_headers = get_siirtotiedosto_headers()
-        # Map lowercase -> canonical casing for case-insensitive matching
-        header_map = {h.lower(): h for h in expected_headers}
-
-        # Iterate through all CSV files in the directory to check headers
-        for csv_file_path in Path(self._path).glob("*.csv"):
-            with open(csv_file_path, mode="rb") as csv_file:
-                # Read the content and handle BOM
-                content = csv_file.read()
-                if content.startswith(b'\xef\xbb\xbf'):
-                    content = content[3:]
-                content = content.decode("cp1252")
-                csv_reader = csv.DictReader(content.splitlines(), delimiter=";", quotechar='"', skipinitialspace=True)
-                headers_lower = {h.lower() for h in (csv_reader.fieldnames or [])}
-                missing_headers = [header for header in expected_headers if header.lower() not in headers_lower]
-
-                if missing_headers:
-                    missing_headers_list.append({
-                        'file_path': csv_file_path,
-                        'headers': missing_headers
-                    })
+        output_file_path = Path(self._path) / get_kohdentumattomat_siirtotiedosto_filename()
+        # Edellisen ajon kohdentumattomat kirjoitetaan samaan hakemistoon,
+        # sitä ei lueta syötteeksi.
+        csv_file_paths = [
+            csv_file_path
+            for csv_file_path in Path(self._path).glob("*.csv")
+            if csv_file_path.name != output_file_path.name
+        ]
+
+        # Check headers of all files before reading any data
+        missing_headers_list = []
+        for csv_file_path in csv_file_paths:
+            headers_lower = {h.lower() for h in _read_headers(csv_file_path)}
+            missing_headers = [header for header in expected_headers if header.lower() not in headers_lower]
+
+            if missing_headers:
+                missing_headers_list.append({
+                    'file_path': csv_file_path,
+                    'headers': missing_headers
+                })
 
         # Print information after the loop through all files
         for file in missing_headers_list:
@@ -66,54 +63,90 @@ class LahtiSiirtotiedosto:
         if missing_headers_list:
             raise RuntimeError("Osassa tiedostoissa oletetut sarakeotsikot puuttuvat.")
 
-        # Iterate through all CSV files in the directory
-        for csv_file_path in Path(self._path).glob("*.csv"):
-            with open(csv_file_path, mode="rb") as csv_file:
-                # Read the content and handle BOM
-                content = csv_file.read()
-                if content.startswith(b'\xef\xbb\xbf'):
-                    content = content[3:]
-                content = content.decode("cp1252")
-                csv_reader = csv.DictReader(content.splitlines(), delimiter=";", quotechar='"', skipinitialspace=True)
-                for row in csv_reader:
-                    normalized = {header_map.get(k.lower(), k): v for k, v in row.items()}
-                    all_data.append(normalized)
-
-        for data in all_data:
-            # Validate AsiakasRow, if validation fails, append to failed_validations
-            try:
-                asiakas_obj = AsiakasRow.parse_obj(data)
-                asiakas_rows.append(asiakas_obj)
-            except ValidationError as e:
-                logger.warning(f"\n\nAsiakas-objektin luonti epäonnistui datalla: {data}. \nVirhe: {e}")
-                failed_validations.append(data)
-
-        # Save failed validations to a new CSV file.
-        output_directory = csv_file_path.parent
-        output_file_path = output_directory / get_kohdentumattomat_siirtotiedosto_filename()
-
+        # Failed validations are written to a new CSV file while reading.
         with open(output_file_path, mode="w", encoding="cp1252", newline="") as output_csv_file:
             csv_writer = csv.DictWriter(output_csv_file, expected_headers, delimiter=";", quotechar='"')
             csv_writer.writeheader()
-            if failed_validations:
+
+            failed_count = 0
+
+            def write_failed(data: Dict[str, str]):
+                nonlocal failed_count
+                failed_count += 1
                 # Filter out columns not in expected_headers
-                filtered_failed_validations = [
+                csv_writer.writerow(
                     {key: value for key, value in data.items() if key in expected_headers}
-                    for data in failed_validations
-                ]
-                print(f"validaatioon kaatuneita rivejä: {len(filtered_failed_validations)}")
-
-                csv_writer.writerows(filtered_failed_validations)
-
-        # Create asiakas objects from rows
-        for asiakas_row in asiakas_rows:
-            asiakas_found = False
-            for asiakas in asiakas_list:
-                if asiakas.check_and_add_row(asiakas_row):
-                    asiakas_found = True
-                    break
-            if not asiakas_found:
-                asiakas_list.append(Asiakas(asiakas_row))
+                )
+
+            asiakas_list = group_asiakas_rows(
+                iter_asiakas_rows(csv_file_paths, write_failed)
+            )
+            if failed_count:
+                print(f"validaatioon kaatuneita rivejä: {failed_count}")
 
         return asiakas_list
 
+
+def _open_csv(csv_file: BinaryIO) -> TextIO:
+    # Handle BOM
+    if csv_file.read(3) != b'\xef\xbb\xbf':
+        csv_file.seek(0)
+    return io.TextIOWrapper(csv_file, encoding="cp1252", newline="")
+
+
+def _read_headers(csv_file_path: Path) -> List[str]:
+    with open(csv_file_path, mode="rb") as csv_file:
+        csv_reader = csv.reader(
+            _open_csv(csv_file), delimiter=";", quotechar='"', skipinitialspace=True
+        )
+        return next(csv_reader, [])
+
+
+def iter_asiakas_rows(
+    csv_file_paths: Iterable[Path],
+    on_failed: Callable[[Dict[str, str]], None],
+) -> Iterator[AsiakasRow]:
+    """
+    Lukee siirtotiedostot rivi kerrallaan ja palauttaa validoidut rivit.
+    Validoinnissa kaatuneet rivit annetaan `on_failed`-funktiolle.
+    """
+    # Map lowercase -> canonical casing for case-insensitive matching
+    header_map = {h.lower(): h for h in get_siirtotiedosto_headers()}
+
+    for csv_file_path in csv_file_paths:
+        with open(csv_file_path, mode="rb") as csv_file:
+            csv_reader = csv.DictReader(
+                _open_csv(csv_file), delimiter=";", quotechar='"', skipinitialspace=True
+            )
+            for row in csv_reader:
+                data = {header_map.get(k.lower(), k): v for k, v in row.items()}
+                try:
+                    yield AsiakasRow.parse_obj(data)
+                except ValidationError as e:
+                    logger.warning(f"\n\nAsiakas-objektin luonti epäonnistui datalla: {data}. \nVirhe: {e}")
+                    on_failed(data)
+
+
+def group_asiakas_rows(asiakas_rows: Iterable[AsiakasRow]) -> List[Asiakas]:
+    """
+    Yhdistää asiakasrivit asiakkaiksi.
+
+    Rivi yhdistetään ensimmäiseen aiemmin luotuun asiakkaaseen, jonka
+    `check_and_add_row` hyväksyy sen, muuten rivistä luodaan uusi asiakas.
+    Ehdokkaat haetaan tunnistekenttien hajautusavaimella, joten kaikkia
+    asiakkaita ei tarvitse käydä läpi jokaiselle riville.
+    """
+    asiakas_list = []
+    asiakkaat_by_tunniste: Dict[tuple, List[Asiakas]] = defaultdict(list)
+    for asiakas_row in asiakas_rows:
+        ehdokkaat = asiakkaat_by_tunniste[asiakas_tunniste(asiakas_row)]
+        for asiakas in ehdokkaat:
+            if asiakas.check_and_add_row(asiakas_row):
+                break
+        else:
+            asiakas = Asiakas(asiakas_row)
+            ehdokkaat.append(asiakas)
+            asiakas_list.append(asiakas)
+
+    return asiakas_list
+
@@ -3,8 +3,6 @@ import warnings
 from datetime import date
 from typing import Union
 
-from addrparser import AddressParser
-
 from jkrimporter.model import Asiakas as JkrAsiakas
 from jkrimporter.model import Jatelaji as JkrJatelaji
 from jkrimporter.model import JkrData, Keraysvaline
@@ -20,12 +18,10 @@ from jkrimporter.model import (
 from jkrimporter.providers.nokia.models import Asiakas, Jatelaji, KaivoTyyppi
 from jkrimporter.providers.nokia.siirtotiedosto import NokiaSiirtotiedosto
 from jkrimporter.utils.intervals import Interval
-from jkrimporter.utils.osoite import osoite_from_parsed_address
+from jkrimporter.utils.osoite import address_parser, osoite_from_parsed_address
 
 logger = logging.getLogger(__name__)
 
-address_parser = AddressParser("fi")
-
 
 def create_haltija(row: "Asiakas"):
     kohteen_osoite = Osoite(kunta=row.kohde_kunta)
@@ -3,8 +3,6 @@ import logging
 from datetime import date
 from typing import TYPE_CHECKING, Union
 
-from addrparser import AddressParser
-
 from jkrimporter.model import Asiakas as JkrAsiakas
 from jkrimporter.model import Jatelaji as JkrJatelaji
 from jkrimporter.model import JkrData
@@ -22,7 +20,7 @@ from jkrimporter.model import Tyhjennystapahtuma as JkrTyhjennystapahtuma
 from jkrimporter.model import Tyhjennysvali as JkrTyhjennysvali
 from jkrimporter.model import Yhteystieto
 from jkrimporter.utils.intervals import Interval
-from jkrimporter.utils.osoite import osoite_from_parsed_address
+from jkrimporter.utils.osoite import address_parser, osoite_from_parsed_address
 
 from .siirtotiedosto import PjhSiirtotiedosto
 
@@ -31,8 +29,6 @@ if TYPE_CHECKING:
 
 logger = logging.getLogger(__name__)
 
-address_parser = AddressParser("fi")
-
 
 def overlap(a: TyhjennysSopimus, b: TyhjennysSopimus) -> bool:
     a1 = a.alkupvm or datetime.date.min
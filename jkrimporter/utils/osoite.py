@@ -1,4 +1,7 @@
-from typing import TYPE_CHECKING
+from collections import OrderedDict
+from typing import TYPE_CHECKING, Union
+
+from addrparser import AddressParser
 
 from jkrimporter.model import Osoite
 
@@ -6,6 +9,53 @@ if TYPE_CHECKING:
     from addrparser import Address
 
 
+class CachedAddressParser:
+    """
+    Rajatun kokoinen LRU-välimuisti osoitejäsentimen edessä.
+
+    Samat katuosoitteet toistuvat siirtotiedostoissa tuhansia kertoja, joten
+    sekä onnistuneet että epäonnistuneet jäsennykset tallennetaan. Välimuistista
+    palautettua `Address`-oliota ei saa muokata.
+    """
+
+    def __init__(self, parser: AddressParser, maxsize: int = 100_000):
+        self._parser = parser
+        self._maxsize = maxsize
+        self._cache: "OrderedDict[str, Union[Address, ValueError]]" = OrderedDict()
+        self.hits = 0
+        self.misses = 0
+
+    def parse(self, address: str) -> "Address":
+        try:
+            result = self._cache[address]
+        except KeyError:
+            self.misses += 1
+            try:
+                result = self._parser.parse(address)
+            except ValueError as e:
+                result = e
+            self._cache[address] = result
+            if len(self._cache) > self._maxsize:
+                self._cache.popitem(last=False)
+        else:
+            self.hits += 1
+            self._cache.move_to_end(address)
+
+        if isinstance(result, ValueError):
+            raise result.with_traceback(None)
+        return result
+
+    def stats(self) -> str:
+        return (
+            f"osumat: {self.hits}, ohitukset: {self.misses}, "
+            f"välimuistissa: {len(self._cache)}"
+        )
+
+
+# Kaikkien tiedontuottajien yhteinen jäsennin.
+address_parser = CachedAddressParser(AddressParser("fi"))
+
+
 def osoite_from_parsed_address(address: "Address") -> Osoite:
 
     huoneistotunnus = (
@@ -0,0 +1,223 @@
+"""
+Raporttien kirjoitus tiedostoon.
+
+Rivit kirjoitetaan sitä mukaa kuin ne luetaan tietokannan kursorilta, joten
+koko raporttia ei pidetä muistissa. Tuetut muodot ovat xlsx, csv ja parquet.
+Parquet-muoto vaatii valinnaisen pyarrow-paketin.
+"""
+
+import logging
+from enum import Enum
+from itertools import islice
+from pathlib import Path
+from typing import Iterable, List, Optional, Sequence
+
+from openpyxl import Workbook
+from openpyxl.utils import get_column_letter
+
+logger = logging.getLogger(__name__)
+
+# Sarakeleveydet lasketaan otsikosta ja näin monesta ensimmäisestä rivistä
+WIDTH_SAMPLE_ROWS = 1000
+WIDTH_PADDING = 2
+
+# Parquet-tiedostoon kirjoitettavan rivierän koko
+PARQUET_CHUNK_SIZE = 10000
+
+
+class Raporttimuoto(str, Enum):
+    xlsx = "xlsx"
+    csv = "csv"
+    parquet = "parquet"
+
+
+def raporttimuoto_polusta(
+    path: Path, formaatti: Optional[Raporttimuoto] = None
+) -> Raporttimuoto:
+    """
+    Päättelee raportin tiedostomuodon polun päätteestä, jos muotoa ei anneta.
+    Annetun muodon on vastattava päätettä, jos päätteenä on jokin tuetuista
+    muodoista.
+    """
+    paate = path.suffix.lower().lstrip(".")
+    polun_muoto = Raporttimuoto(paate) if paate in Raporttimuoto.__members__ else None
+    if formaatti is None:
+        if polun_muoto is None:
+            raise ValueError(
+                f"Tiedostomuotoa ei voi päätellä polusta {path}. "
+                "Käytä päätettä .xlsx, .csv tai .parquet tai anna --format."
+            )
+        return polun_muoto
+    if polun_muoto is not None and polun_muoto != formaatti:
+        raise ValueError(
+            f"Tiedostomuoto {formaatti.value} ei vastaa polun {path} päätettä."
+        )
+    return formaatti
+
+
+def _column_widths(columns: Sequence[str], sample: List[Sequence]) -> List[int]:
+    widths = [len(str(column)) for column in columns]
+    for row in sample:
+        for i, value in enumerate(row):
+            if value is not None:
+                widths[i] = max(widths[i], len(str(value)))
+    return [width + WIDTH_PADDING for width in widths]
+
+
+def write_xlsx(path: Path, columns: Sequence[str], rows: Iterable[Sequence]) -> int:
+    """
+    Kirjoittaa raportin Excel-tiedostoon yhdellä läpikäynnillä.
+
+    Työkirja avataan write-only-tilassa, jossa rivit kirjoitetaan suoraan
+    tiedostoon. Sarakeleveydet täytyy asettaa ennen ensimmäistä riviä, joten
+    ne lasketaan otsikosta ja WIDTH_SAMPLE_ROWS ensimmäisestä rivistä.
+
+    Args:
+        path: Tallennuspolku
+        columns: Sarakkeiden nimet
+        rows: Raportin rivit, esim. tietokantakyselyn tulos
+
+    Returns:
+        int: Kirjoitettujen rivien määrä
+    """
+    rows = iter(rows)
+    sample = [tuple(row) for row in islice(rows, WIDTH_SAMPLE_ROWS)]
+
+    wb = Workbook(write_only=True)
+    ws = wb.create_sheet()
+    for i, width in enumerate(_column_widths(columns, sample), start=1):
+        ws.column_dimensions[get_column_letter(i)].width = width
+
+    ws.append(list(columns))
+    count = 0
+    for row in sample:
+        ws.append(row)
+        count += 1
+    for row in rows:
+        ws.append(tuple(row))
+        count += 1
+
+    wb.save(path)
+    logger.debug(f"Raporttiin {path} kirjoitettu {count} riviä")
+    return count
+
+
+def copy_csv(dbapi_connection, query: str, params: dict, path: Path) -> int:
+    """
+    Kirjoittaa kyselyn tuloksen CSV-tiedostoon PostgreSQL:n COPY-komennolla.
+    Tietokanta muotoilee rivit itse, joten Pythonissa ei käsitellä yksittäisiä
+    rivejä. Erottimena on puolipiste kuten muissakin jkr:n CSV-tiedostoissa.
+
+    Args:
+        dbapi_connection: psycopg2-yhteys
+        query: SELECT-kysely psycopg2:n parametrimuodossa (%(nimi)s)
+        params: Kyselyn parametrit
+        path: Tallennuspolku
+
+    Returns:
+        int: Kirjoitettujen rivien määrä
+    """
+    with dbapi_connection.cursor() as cursor:
+        select = cursor.mogrify(query, params)
+        copy = (
+            b"COPY (" + select + b") TO STDOUT "
+            b"WITH (FORMAT csv, HEADER true, DELIMITER ';', ENCODING 'UTF8')"
+        )
+        with open(path, "w", encoding="utf-8", newline="") as f:
+            cursor.copy_expert(copy, f)
+        count = cursor.rowcount
+    logger.debug(f"Raporttiin {path} kirjoitettu {count} riviä")
+    return count
+
+
+def import_pyarrow():
+    """
+    Tuo pyarrow-paketin. Paketti ei ole jkr:n pakollinen riippuvuus, joten
+    sen puuttuessa annetaan asennusohje.
+    """
+    try:
+        import pyarrow
+        import pyarrow.parquet  # noqa: F401
+    except ImportError:
+        raise ImportError(
+            "Parquet-muoto vaatii pyarrow-paketin. "
+            "Asenna se komennolla: pip install pyarrow"
+        ) from None
+    return pyarrow
+
+
+# PostgreSQL-tyyppien oid:t ja niitä vastaavat Parquet-tyypit. Muut tyypit
+# kirjoitetaan merkkijonoina.
+_ARROW_TYPES = {
+    16: lambda pa: pa.bool_(),
+    20: lambda pa: pa.int64(),
+    21: lambda pa: pa.int16(),
+    23: lambda pa: pa.int32(),
+    700: lambda pa: pa.float32(),
+    701: lambda pa: pa.float64(),
+    1700: lambda pa: pa.float64(),
+    1082: lambda pa: pa.date32(),
+    1114: lambda pa: pa.timestamp("us"),
+    1184: lambda pa: pa.timestamp("us", tz="UTC"),
+}
+
+
+def _arrow_schema(pa, columns: Sequence[str], type_codes: Sequence[Optional[int]]):
+    return pa.schema(
+        [
+            pa.field(
+                str(column),
+                _ARROW_TYPES[type_code](pa) if type_code in _ARROW_TYPES else pa.string(),
+            )
+            for column, type_code in zip(columns, type_codes)
+        ]
+    )
+
+
+def _arrow_values(pa, field_type, values: Sequence) -> list:
+    if pa.types.is_string(field_type):
+        return [None if value is None else str(value) for value in values]
+    if pa.types.is_floating(field_type):
+        return [None if value is None else float(value) for value in values]
+    return list(values)
+
+
+def write_parquet(
+    path: Path,
+    columns: Sequence[str],
+    type_codes: Sequence[Optional[int]],
+    rows: Iterable[Sequence],
+) -> int:
+    """
+    Kirjoittaa raportin Parquet-tiedostoon PARQUET_CHUNK_SIZE rivin erissä.
+
+    Sarakkeiden tyypit päätellään kyselyn tulosjoukon kuvauksesta
+    (cursor.description), jotta kaikilla erillä on sama skeema, vaikka
+    sarakkeen ensimmäiset arvot olisivat tyhjiä.
+
+    Args:
+        path: Tallennuspolku
+        columns: Sarakkeiden nimet
+        type_codes: Sarakkeiden PostgreSQL-tyyppien oid:t
+        rows: Raportin rivit
+
+    Returns:
+        int: Kirjoitettujen rivien määrä
+    """
+    pa = import_pyarrow()
+    schema = _arrow_schema(pa, columns, type_codes)
+    rows = iter(rows)
+    count = 0
+    with pa.parquet.ParquetWriter(str(path), schema) as writer:
+        while True:
+            chunk = list(islice(rows, PARQUET_CHUNK_SIZE))
+            if not chunk:
+                break
+            arrays = [
+                pa.array(_arrow_values(pa, field.type, values), type=field.type)
+                for field, values in zip(schema, zip(*chunk))
+            ]
+            writer.write_table(pa.Table.from_arrays(arrays, schema=schema))
+            count += len(chunk)
+    logger.debug(f"Raporttiin {path} kirjoitettu {count} riviä")
+    return count
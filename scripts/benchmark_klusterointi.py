@@ -0,0 +1,134 @@
+#!/usr/bin/env python3
+import argparse
+import random
+import sys
+import time
+from pathlib import Path
+
+from geoalchemy2.shape import from_shape
+from shapely.geometry import Point
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+from jkrimporter.providers.db.services.buildings import (  # noqa: E402
+    DISTANCE_LIMIT,
+    maximum_distance_of_buildings,
+)
+from jkrimporter.providers.db.services.kohde import (  # noqa: E402
+    _cluster_rakennustiedot,
+    _match_addresses,
+    _match_ownership_or_residents,
+)
+
+#   Mittaa DVV-kohteiden muodostuksen rakennusklusteroinnin keston
+#   pahimman tapauksen kiinteistöllä: kaikilla rakennuksilla on sama omistaja
+#   ja kiinteistötunnus, mutta ne ovat hajallaan laajalla alueella.
+#
+#   python benchmark_klusterointi.py --rakennukset 1000 --alue 3000
+#   python benchmark_klusterointi.py --rakennukset 300 --vertaa
+#
+#   Args:
+#      rakennukset: Kiinteistön rakennusten määrä
+#      alue: Alueen sivun pituus metreinä
+#      vertaa: Aja myös vanha, etäisyydet joka kerta uudelleen laskeva
+#              klusterointi ja tarkista, että tulos on sama.
+#
+#   Skripti tuo jkrimporterin tietokantamallit, joten tietokantayhteyden
+#   täytyy olla määritelty kuten muissakin komennoissa.
+
+
+class _Malli:
+    """Kevyt korvike tietokantamalleille, tunnistetaan identiteetin perusteella."""
+
+    def __init__(self, **kwargs):
+        self.__dict__.update(kwargs)
+
+
+def generate_rakennustiedot(count: int, area: float, seed: int):
+    rnd = random.Random(seed)
+    omistaja = _Malli(id=1, ytunnus="1234567-8", henkilotunnus=None)
+    rakennustiedot = []
+    for i in range(count):
+        rakennus = _Malli(
+            id=i,
+            prt=f"{i:09d}A",
+            kiinteistotunnus="39800000010001",
+            geom=from_shape(Point(rnd.uniform(0, area), rnd.uniform(0, area)), srid=3067),
+        )
+        rakennustiedot.append((rakennus, frozenset(), frozenset([omistaja]), frozenset()))
+    return rakennustiedot
+
+
+def cluster_rakennustiedot_naive(rakennustiedot_to_cluster, distance_limit):
+    """Klusterointi ennen etäisyyksien esilaskentaa vertailua varten."""
+    clusters = []
+    cluster = None
+    while rakennustiedot_to_cluster:
+        if not cluster:
+            cluster = {rakennustiedot_to_cluster.pop()}
+        others = rakennustiedot_to_cluster.copy()
+        while others:
+            found_match = False
+            for other in others:
+                if not other[0].prt:
+                    break
+                all_buildings = [r[0] for r in cluster] + [other[0]]
+                if maximum_distance_of_buildings(all_buildings) >= distance_limit:
+                    continue
+                if not _match_ownership_or_residents(cluster, other):
+                    continue
+                if not any(
+                    _match_addresses(c[3], other[3])
+                    or c[0].kiinteistotunnus == other[0].kiinteistotunnus
+                    for c in cluster
+                ):
+                    continue
+                cluster.add(other)
+                found_match = True
+                break
+            if not found_match:
+                break
+            others.remove(other)
+        clusters.append(cluster)
+        rakennustiedot_to_cluster -= cluster
+        cluster = None
+    return clusters
+
+
+def timed(label, func, *args):
+    start = time.perf_counter()
+    result = func(*args)
+    print(f"{label}: {time.perf_counter() - start:.2f} s, {len(result)} klusteria")
+    return result
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description="Mittaa rakennusten klusteroinnin pahimmalla kiinteistöllä."
+    )
+    parser.add_argument("--rakennukset", type=int, default=1000)
+    parser.add_argument("--alue", type=float, default=3000)
+    parser.add_argument("--siemen", type=int, default=1)
+    parser.add_argument("--vertaa", action="store_true")
+    args = parser.parse_args()
+
+    rakennustiedot = generate_rakennustiedot(args.rakennukset, args.alue, args.siemen)
+
+    clusters = timed(
+        "Klusterointi", _cluster_rakennustiedot, set(rakennustiedot), DISTANCE_LIMIT
+    )
+    if args.vertaa:
+        naive = timed(
+            "Klusterointi ilman esilaskentaa",
+            cluster_rakennustiedot_naive,
+            set(rakennustiedot),
+            DISTANCE_LIMIT,
+        )
+        if [{r[0].id for r in c} for c in clusters] != [{r[0].id for r in c} for c in naive]:
+            print("Tulokset eroavat!")
+            sys.exit(1)
+        print("Tulokset ovat samat.")
+
+
+if __name__ == "__main__":
+    main()
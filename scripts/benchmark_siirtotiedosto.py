@@ -0,0 +1,149 @@
+#!/usr/bin/env python3
+import argparse
+import contextlib
+import csv
+import io
+import random
+import sys
+import tempfile
+import time
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+from jkrimporter.datasheets import get_siirtotiedosto_headers  # noqa: E402
+from jkrimporter.providers.lahti.models import Asiakas, AsiakasRow  # noqa: E402
+from jkrimporter.providers.lahti.siirtotiedosto import (  # noqa: E402
+    LahtiSiirtotiedosto,
+    group_asiakas_rows,
+)
+
+#   Mittaa Lahden siirtotiedoston asiakasrivien yhdistämisen keston
+#   synteettisellä aineistolla.
+#
+#   python benchmark_siirtotiedosto.py --rivit 200000
+#   python benchmark_siirtotiedosto.py --rivit 20000 --vertaa
+#
+#   Args:
+#      rivit: Synteettisen tiedoston rivimäärä
+#      vertaa: Aja myös vanha, kaikki asiakkaat läpikäyvä yhdistäminen ja
+#              tarkista, että tulos on sama. Vanha toteutus on O(n²), joten
+#              käytä pienempää rivimäärää.
+
+JATELAJIT = ["Sekaj", "Bio", "Kartonki", "Lasi", "Metalli", "Muovi"]
+
+
+def generate_rows(count: int, seed: int):
+    """
+    Tuottaa siirtotiedoston rivejä. Samalla asiakkaalla on 1-4 riviä, joista
+    osa eroaa vain tyhjennysvälin osalta (yhdistyvät) ja osa on täysin
+    samoja (muodostavat uuden asiakkaan saman avaimen alle).
+    """
+    rnd = random.Random(seed)
+    headers = get_siirtotiedosto_headers()
+    rows = []
+    asiakas_nro = 0
+    while len(rows) < count:
+        asiakas_nro += 1
+        base = {header: "" for header in headers}
+        base.update({
+            "UrakoitsijaId": f"{rnd.randint(1, 5):07d}-9",
+            "UrakoitsijankohdeId": f"01-{asiakas_nro:07d}-00",
+            "Kiinteistotunnus": f"{rnd.randint(1, 999999):09d}A",
+            "Kiinteistonkatuosoite": f"TESTIKATU {rnd.randint(1, 200)}",
+            "Kiinteistonposti": "15100 LAHTI",
+            "Haltijannimi": f"ASIAKAS {asiakas_nro}",
+            "Haltijankatuosoite": f"POSTIKATU {rnd.randint(1, 200)}",
+            "Haltijanposti": "15100 LAHTI",
+            "Haltijanmaakoodi": "FI",
+            "Pvmalk": "1.1.2023",
+            "Pvmasti": "31.12.2023",
+            "tyyppiIdEWC": rnd.choice(JATELAJIT),
+            "SUM(astiamaara)": "1",
+            "koko": "0,24",
+            "Voimassaoloviikotalkaen": "1",
+            "Voimassaoloviikotasti": "53",
+            "Kuntatun": "398",
+        })
+        for i in range(rnd.choice([1, 1, 2, 2, 3, 4])):
+            row = dict(base)
+            row["COUNT(kaynnit)"] = str(rnd.randint(1, 52))
+            row["SUM(paino)"] = str(rnd.randint(1, 500))
+            row["tyhjennysvali"] = str(rnd.choice([1, 2, 4]) + i * 10)
+            row["kertaaviikossa"] = str(rnd.randint(1, 2))
+            rows.append(row)
+        if rnd.random() < 0.05:
+            rows.append(dict(rows[-1]))
+    return rows[:count]
+
+
+def group_asiakas_rows_naive(asiakas_rows):
+    asiakas_list = []
+    for asiakas_row in asiakas_rows:
+        asiakas_found = False
+        for asiakas in asiakas_list:
+            if asiakas.check_and_add_row(asiakas_row):
+                asiakas_found = True
+                break
+        if not asiakas_found:
+            asiakas_list.append(Asiakas(asiakas_row))
+    return asiakas_list
+
+
+def write_csv(rows, directory: Path) -> Path:
+    path = directory / "kuljetustiedot.csv"
+    with open(path, mode="w", encoding="cp1252", newline="") as csv_file:
+        writer = csv.DictWriter(
+            csv_file, get_siirtotiedosto_headers(), delimiter=";", quotechar='"'
+        )
+        writer.writeheader()
+        writer.writerows(rows)
+    return path
+
+
+def timed(label, func, *args):
+    start = time.perf_counter()
+    # AsiakasRow-validaattori tulostaa rivit, ei mitata niitä.
+    with contextlib.redirect_stdout(io.StringIO()):
+        result = func(*args)
+    print(f"{label}: {time.perf_counter() - start:.2f} s")
+    return result
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description="Mittaa siirtotiedoston asiakasrivien yhdistämisen."
+    )
+    parser.add_argument("--rivit", type=int, default=200000)
+    parser.add_argument("--siemen", type=int, default=1)
+    parser.add_argument("--vertaa", action="store_true")
+    args = parser.parse_args()
+
+    rows = generate_rows(args.rivit, args.siemen)
+
+    with tempfile.TemporaryDirectory() as tmp:
+        write_csv(rows, Path(tmp))
+        asiakkaat = timed(
+            f"LahtiSiirtotiedosto.asiakastiedot ({len(rows)} riviä)",
+            lambda: LahtiSiirtotiedosto(tmp).asiakastiedot,
+        )
+    print(f"Asiakkaita: {len(asiakkaat)}")
+
+    asiakas_rows = timed(
+        "AsiakasRow-validointi",
+        lambda: [AsiakasRow.parse_obj(row) for row in rows],
+    )
+    grouped = timed("Yhdistäminen hajautusavaimella", group_asiakas_rows, asiakas_rows)
+
+    if args.vertaa:
+        naive = timed(
+            "Yhdistäminen läpikäymällä", group_asiakas_rows_naive, asiakas_rows
+        )
+        if [a.dict() for a in grouped] != [a.dict() for a in naive]:
+            print("Tulokset eroavat!")
+            sys.exit(1)
+        print("Tulokset ovat samat.")
+
+
+if __name__ == "__main__":
+    main()
@@ -7,6 +7,29 @@ insert into jkr_koodistot.tiedontuottaja values
 on conflict do nothing;
 
 
+-- Save the state before import to record the change set (jkr.dvv_muutos) at the end.
+create temporary table dvv_rakennus_ennen as
+select
+    id,
+    kiinteistotunnus,
+    geom,
+    rakennuksenkayttotarkoitus_koodi,
+    rakennuksenolotila_koodi,
+    rakennusluokka_2018,
+    kaytostapoisto_pvm
+from jkr.rakennus;
+
+create temporary table dvv_omistajat_ennen as
+select rakennus_id, osapuoli_id
+from jkr.rakennuksen_omistajat
+where omistuksen_loppupvm is null;
+
+create temporary table dvv_vanhimmat_ennen as
+select rakennus_id, osapuoli_id
+from jkr.rakennuksen_vanhimmat
+where loppupvm is null;
+
+
 -- Add temporary column to easily sort buildings that exists in the dvv.
 alter table jkr.rakennus add column found_in_dvv boolean;
 
@@ -570,3 +593,81 @@ where jkr.rakennuksen_vanhimmat.osapuoli_id = excluded.osapuoli_id
 
 select jkr.update_vanhin_loppupvm(:'poimintapvm');
 alter table jkr.rakennuksen_vanhimmat drop column found_in_dvv;
+
+
+-- Record the change set of this poimintapvm. create_dvv_kohteet --incremental
+-- only processes the kiinteistöt of these buildings.
+delete from jkr.dvv_muutos where poimintapvm = :'poimintapvm'::date;
+
+
+-- New buildings
+insert into jkr.dvv_muutos (poimintapvm, rakennus_id, muutos, kiinteistotunnus)
+select :'poimintapvm'::date, r.id, 'uusi', r.kiinteistotunnus
+from jkr.rakennus r
+where not exists (select 1 from dvv_rakennus_ennen e where e.id = r.id)
+on conflict do nothing;
+
+
+-- Buildings whose data used in kohde creation changed
+insert into jkr.dvv_muutos (poimintapvm, rakennus_id, muutos, kiinteistotunnus, vanha_kiinteistotunnus)
+select
+    :'poimintapvm'::date,
+    r.id,
+    'muuttunut',
+    r.kiinteistotunnus,
+    nullif(e.kiinteistotunnus, r.kiinteistotunnus) as vanha_kiinteistotunnus
+from jkr.rakennus r
+join dvv_rakennus_ennen e on e.id = r.id
+where
+    r.kiinteistotunnus is distinct from e.kiinteistotunnus or
+    r.geom is distinct from e.geom or
+    r.rakennuksenkayttotarkoitus_koodi is distinct from e.rakennuksenkayttotarkoitus_koodi or
+    r.rakennuksenolotila_koodi is distinct from e.rakennuksenolotila_koodi or
+    r.rakennusluokka_2018 is distinct from e.rakennusluokka_2018
+on conflict do nothing;
+
+
+-- Buildings that are no longer in use
+insert into jkr.dvv_muutos (poimintapvm, rakennus_id, muutos, kiinteistotunnus)
+select :'poimintapvm'::date, r.id, 'poistunut', r.kiinteistotunnus
+from jkr.rakennus r
+join dvv_rakennus_ennen e on e.id = r.id
+where e.kaytostapoisto_pvm is null and r.kaytostapoisto_pvm is not null
+on conflict do nothing;
+
+
+-- Buildings with new or ended owners
+insert into jkr.dvv_muutos (poimintapvm, rakennus_id, muutos, kiinteistotunnus)
+select distinct :'poimintapvm'::date, r.id, 'omistaja', r.kiinteistotunnus
+from (
+    (select rakennus_id, osapuoli_id from jkr.rakennuksen_omistajat where omistuksen_loppupvm is null
+     except
+     select rakennus_id, osapuoli_id from dvv_omistajat_ennen)
+    union
+    (select rakennus_id, osapuoli_id from dvv_omistajat_ennen
+     except
+     select rakennus_id, osapuoli_id from jkr.rakennuksen_omistajat where omistuksen_loppupvm is null)
+) muuttuneet
+join jkr.rakennus r on r.id = muuttuneet.rakennus_id
+on conflict do nothing;
+
+
+-- Buildings with new or ended elders
+insert into jkr.dvv_muutos (poimintapvm, rakennus_id, muutos, kiinteistotunnus)
+select distinct :'poimintapvm'::date, r.id, 'asukas', r.kiinteistotunnus
+from (
+    (select rakennus_id, osapuoli_id from jkr.rakennuksen_vanhimmat where loppupvm is null
+     except
+     select rakennus_id, osapuoli_id from dvv_vanhimmat_ennen)
+    union
+    (select rakennus_id, osapuoli_id from dvv_vanhimmat_ennen
+     except
+     select rakennus_id, osapuoli_id from jkr.rakennuksen_vanhimmat where loppupvm is null)
+) muuttuneet
+join jkr.rakennus r on r.id = muuttuneet.rakennus_id
+on conflict do nothing;
+
+
+drop table dvv_rakennus_ennen;
+drop table dvv_omistajat_ennen;
+drop table dvv_vanhimmat_ennen;
@@ -0,0 +1,88 @@
+"""
+Komentorivivalintojen oletus- ja annetut arvot CliRunnerilla.
+"""
+
+from contextlib import nullcontext
+from unittest.mock import MagicMock, patch
+
+import pytest
+from typer.testing import CliRunner
+
+from jkrimporter.cli.jkr import Provider, app
+
+runner = CliRunner()
+
+
+@pytest.fixture
+def db():
+    db = MagicMock()
+    with patch("jkrimporter.cli.jkr.sisaanlukutapahtuma", nullcontext), patch(
+        "jkrimporter.cli.jkr._db_provider", return_value=db
+    ):
+        yield db
+
+
+@pytest.mark.parametrize(
+    "valinnat, kutsuttu, ei_kutsuttu",
+    [([], "write", "write_bulk"), (["--bulk"], "write_bulk", "write")],
+)
+def test_import_bulk(tmp_path, db, valinnat, kutsuttu, ei_kutsuttu):
+    """Tavallinen import vie asiakkaat write-metodilla, --bulk write_bulkilla."""
+    provider = Provider(Translator=MagicMock(), Siirtotiedosto=MagicMock())
+
+    with patch.dict("jkrimporter.cli.jkr.PROVIDERS", {"LSJ": provider}), patch(
+        "jkrimporter.cli.jkr._get_tiedontuottaja", return_value=MagicMock()
+    ):
+        result = runner.invoke(app, ["import", str(tmp_path), "LSJ", *valinnat])
+
+    assert result.exit_code == 0, result.output
+    getattr(db, kutsuttu).assert_called_once()
+    getattr(db, ei_kutsuttu).assert_not_called()
+
+
+@pytest.fixture
+def raportti():
+    with patch("jkrimporter.cli.jkr.Session"), patch(
+        "jkrimporter.providers.db.services.raportti.paivita_raportin_kohteet",
+        return_value=1,
+    ) as paivita, patch(
+        "jkrimporter.providers.db.services.raportti.poista_raportin_kohteet"
+    ) as poista:
+        yield paivita, poista
+
+
+@pytest.mark.parametrize(
+    "valinnat, paivitetaan", [([], False), (["--paivita-raportit"], True)]
+)
+def test_paivita_raportit(raportti, valinnat, paivitetaan):
+    """Lasketut raportit päivitetään komennon jälkeen vain valinnalla."""
+    with patch("jkrimporter.cli.jkr._paivita_lasketut_raportit") as paivita:
+        result = runner.invoke(app, [*valinnat, "raportti_laske", "2024-01-01"])
+
+    assert result.exit_code == 0, result.output
+    assert paivita.called == paivitetaan
+
+
+@pytest.mark.parametrize(
+    "valinnat, poistetaan", [([], False), (["--poista"], True)]
+)
+def test_raportti_laske_poista(raportti, valinnat, poistetaan):
+    """raportti_laske laskee rivit, --poista poistaa ne."""
+    paivita, poista = raportti
+
+    result = runner.invoke(app, ["raportti_laske", "2024-01-01", *valinnat])
+
+    assert result.exit_code == 0, result.output
+    assert poista.called == poistetaan
+    assert paivita.called != poistetaan
+
+
+@pytest.mark.parametrize(
+    "valinnat, incremental", [([], False), (["--incremental"], True)]
+)
+def test_create_dvv_kohteet_incremental(db, valinnat, incremental):
+    """DVV-kohteet luodaan oletuksena täydellä ajolla."""
+    result = runner.invoke(app, ["create_dvv_kohteet", "28.1.2022", *valinnat])
+
+    assert result.exit_code == 0, result.output
+    assert db.write_dvv_kohteet.call_args.args[4] is incremental
@@ -0,0 +1,104 @@
+from datetime import date
+
+import pytest
+from sqlalchemy import create_engine, event, text
+from sqlalchemy.orm import Session
+
+from jkrimporter import conf
+from jkrimporter.providers.db import codes
+from jkrimporter.providers.db.database import json_dumps
+from jkrimporter.providers.db.models import Kohde, Kohdetyyppi
+
+
+@pytest.fixture(scope="module", autouse=True)
+def engine():
+    engine = create_engine(
+        "postgresql://{username}:{password}@{host}:{port}/{dbname}".format(
+            **conf.dbconf
+        ),
+        future=True,
+        json_serializer=json_dumps,
+    )
+    return engine
+
+
+@pytest.fixture(autouse=True)
+def tyhja_valimuisti():
+    codes._koodistot_by_engine.clear()
+    yield
+    codes._koodistot_by_engine.clear()
+
+
+def _muuta_tarkistussummaa(engine, muutos):
+    """Muuttaa ensimmäisen koodistomigraation tarkistussummaa kuten
+    migraation uudelleenajo."""
+    with engine.connect() as conn:
+        conn.execute(
+            text(
+                """
+                UPDATE jkr.flyway_schema_history
+                SET checksum = checksum + :muutos
+                WHERE installed_rank = (
+                    SELECT min(installed_rank)
+                    FROM jkr.flyway_schema_history
+                    WHERE script LIKE 'R!_!_import!_koodisto%' ESCAPE '!' AND success
+                )
+                """
+            ),
+            {"muutos": muutos},
+        )
+        conn.commit()
+
+
+def test_koodistot_luetaan_uudelleen_kun_tarkistussumma_muuttuu(engine):
+    versio = codes.koodisto_version(engine)
+    assert versio, "Testikannassa ei ole koodistomigraatioita"
+
+    koodistot = codes._load_koodistot(engine)
+    assert codes._load_koodistot(engine) is koodistot
+
+    _muuta_tarkistussummaa(engine, 1)
+    try:
+        assert codes.koodisto_version(engine) != versio
+        uudet = codes._load_koodistot(engine)
+        assert uudet is not koodistot
+        assert uudet.keys() == koodistot.keys()
+        assert codes._load_koodistot(engine) is uudet
+    finally:
+        _muuta_tarkistussummaa(engine, -1)
+
+    assert codes.koodisto_version(engine) == versio
+
+
+def test_koodit_kaytettavissa_uudessa_istunnossa(engine):
+    muu = codes.KohdeTyyppi.MUU.value
+    with Session(engine) as session:
+        ensimmainen = codes.get_koodistot(session)[Kohdetyyppi][muu]
+
+    lauseet = []
+
+    def laske_lauseet(conn, cursor, statement, parameters, context, executemany):
+        lauseet.append(statement)
+
+    event.listen(engine, "before_cursor_execute", laske_lauseet)
+    try:
+        with Session(engine) as session:
+            koodi = codes.get_koodistot(session)[Kohdetyyppi][muu]
+            # Välimuistista liitetään oliot ilman koodistokyselyjä, vain
+            # koodistojen versio tarkistetaan.
+            assert len(lauseet) == 1
+            assert koodi is not ensimmainen
+            assert koodi in session
+            assert (koodi.id, koodi.selite) == (ensimmainen.id, ensimmainen.selite)
+
+            # Koodia voi käyttää uuden rivin viitteenä
+            kohde = Kohde(nimi="Testikohde", kohdetyyppi=koodi, alkupvm=date(2022, 1, 1))
+            session.add(kohde)
+            session.flush()
+            assert session.execute(
+                text("SELECT kohdetyyppi_id FROM jkr.kohde WHERE id = :id"),
+                {"id": kohde.id},
+            ).scalar_one() == koodi.id
+            session.rollback()
+    finally:
+        event.remove(engine, "before_cursor_execute", laske_lauseet)
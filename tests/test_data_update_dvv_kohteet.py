@@ -7,7 +7,7 @@ from pathlib import Path
 from shutil import copytree
 
 import pytest
-from sqlalchemy import and_, create_engine, distinct, func, or_, select, text
+from sqlalchemy import and_, create_engine, distinct, event, func, or_, select, text
 from sqlalchemy.orm import Session
 
 from jkrimporter import conf
@@ -20,6 +20,7 @@ from jkrimporter.cli.jkr import (
 from jkrimporter.providers.db.codes import init_code_objects
 from jkrimporter.providers.db.database import json_dumps
 from jkrimporter.providers.db.dbprovider import import_dvv_kohteet
+from jkrimporter.providers.db.services.dvv_muutos import count_dvv_muutokset
 from jkrimporter.providers.db.models import (
     Jatetyyppi,
     Keskeytys,
@@ -52,15 +53,6 @@ def engine():
     return engine
 
 
-@pytest.fixture
-def datadir(tmpdir):
-    """Käytetään test_data_import-kansiota testidatana."""
-    source = Path(__file__).parent / "data" / "test_data_import"
-    if source.is_dir():
-        copytree(source, tmpdir, dirs_exist_ok=True)
-    return tmpdir
-
-
 def _cleanup_all(engine):
     """Poistaa testin luomat tiedot kannasta FK-järjestyksessä.
 
@@ -114,17 +106,25 @@ def _assert_kohteen_loppupvm(session, pvmstr, nimi):
         f"Ei löytynyt loppupäivää {pvmstr} ja nimeä {nimi} vastaavaa kohdetta"
 
 
-def test_update_dvv_kohteet(engine, datadir):
-    """Testaa DVV-kohteiden päivitys uudella DVV-poiminnalla.
+PAIVITYKSEN_POIMINTAPVM = datetime.strptime("31.1.2023", "%d.%m.%Y").date()
+
+
+@pytest.fixture(scope="module")
+def paivitetty_kanta(engine, tmp_path_factory):
+    """Luo kohteet alkuperäisestä DVV-aineistosta, tuo kuljetukset, päätökset
+    ja ilmoitukset ja päivittää DVV-raakadatan (DVV_update.xlsx).
 
     Vaiheet:
     1. Luodaan kohteet ensimmäisellä import_dvv_kohteet-ajolla (poimintapvm 28.1.2022)
-    2. Päivitetään DVV-raakadata (DVV_update.xlsx → update_database-skripti)
-    3. Ajetaan import_dvv_kohteet uudelleen (poimintapvm 31.1.2023)
-    4. Tarkistetaan kohteiden päivitykset (loppupvm:t, uudet kohteet, osapuolet)
+    2. Tuodaan kuljetukset, päätökset ja ilmoitukset
+    3. Päivitetään DVV-raakadata (DVV_update.xlsx → update_database-skripti),
+       joka kirjaa myös poimintapäivän muutosjoukon (jkr.dvv_muutos)
 
     Lopussa siivotaan kaikki luodut tietueet.
     """
+    datadir = tmp_path_factory.mktemp("test_data_import")
+    copytree(Path(__file__).parent / "data" / "test_data_import", datadir, dirs_exist_ok=True)
+
     _cleanup_all(engine)
     try:
         # --- Vaihe 1: Ensimmäinen import_dvv_kohteet ---
@@ -169,117 +169,223 @@ def test_update_dvv_kohteet(engine, datadir):
             cwd=str(Path(__file__).parent),
         )
 
-        # --- Vaihe 4: Toinen import_dvv_kohteet ---
-        with Session(engine) as session:
+        yield datadir
+    finally:
+        _cleanup_all(engine)
+
+
+# Kohteiden id:t vaihtelevat ajojen välillä, joten kohde tunnistetaan
+# nimestä, alkupäivästä ja rakennustunnuksista.
+KOHDE_AVAIN = """
+WITH avain AS (
+    SELECT
+        k.id,
+        k.nimi || ':' || k.alkupvm || ':'
+            || coalesce(string_agg(r.prt, ',' ORDER BY r.prt), '') AS avain
+    FROM jkr.kohde k
+    LEFT JOIN jkr.kohteen_rakennukset kr ON kr.kohde_id = k.id
+    LEFT JOIN jkr.rakennus r ON r.id = kr.rakennus_id
+    GROUP BY k.id
+)
+"""
+
+SNAPSHOT_QUERIES = {
+    "kohde": """
+        SELECT a.avain, k.loppupvm, k.kohdetyyppi_id
+        FROM jkr.kohde k JOIN avain a ON a.id = k.id
+    """,
+    "osapuolet": """
+        SELECT a.avain, ko.osapuolenrooli_id, o.nimi
+        FROM jkr.kohteen_osapuolet ko
+        JOIN jkr.osapuoli o ON o.id = ko.osapuoli_id
+        JOIN avain a ON a.id = ko.kohde_id
+    """,
+    "sopimus": """
+        SELECT a.avain, s.jatetyyppi_id, s.alkupvm, s.loppupvm
+        FROM jkr.sopimus s JOIN avain a ON a.id = s.kohde_id
+    """,
+    "kuljetus": """
+        SELECT a.avain, k.jatetyyppi_id, k.alkupvm, k.loppupvm
+        FROM jkr.kuljetus k JOIN avain a ON a.id = k.kohde_id
+    """,
+    "viranomaispaatokset": """
+        SELECT v.paatosnumero, r.prt, v.alkupvm, v.loppupvm
+        FROM jkr.viranomaispaatokset v
+        LEFT JOIN jkr.rakennus r ON r.id = v.rakennus_id
+    """,
+    "kompostori": """
+        SELECT a.avain, k.alkupvm, k.loppupvm
+        FROM jkr.kompostorin_kohteet kk
+        JOIN jkr.kompostori k ON k.id = kk.kompostori_id
+        JOIN avain a ON a.id = kk.kohde_id
+    """,
+}
+
+
+def _import_dvv_kohteet_ja_peru(engine, incremental):
+    """Ajaa kohteiden päivityksen transaktiossa, joka perutaan lopuksi.
+    Palauttaa kannan tilan ennen perumista."""
+    with engine.connect() as conn:
+        trans = conn.begin()
+        nested = conn.begin_nested()
+        session = Session(bind=conn)
+
+        # import_dvv_kohteet committaa vaiheittain: aloitetaan jokaisen
+        # commitin jälkeen uusi savepoint, jotta ulompi transaktio säilyy.
+        @event.listens_for(session, "after_transaction_end")
+        def end_savepoint(session, transaction):
+            nonlocal nested
+            if not nested.is_active:
+                nested = conn.begin_nested()
+
+        try:
             init_code_objects(session)
+            if incremental:
+                assert count_dvv_muutokset(session, PAIVITYKSEN_POIMINTAPVM) > 0, \
+                    "DVV-päivitys ei kirjannut muutosjoukkoa"
             import_dvv_kohteet(
                 session,
-                poimintapvm=datetime.strptime("31.1.2023", "%d.%m.%Y").date(),
+                poimintapvm=PAIVITYKSEN_POIMINTAPVM,
+                incremental=incremental,
             )
+            session.flush()
+            return {
+                taulu: sorted(
+                    (tuple(row) for row in conn.execute(text(KOHDE_AVAIN + kysely))),
+                    key=repr,
+                )
+                for taulu, kysely in SNAPSHOT_QUERIES.items()
+            }
+        finally:
+            session.close()
+            trans.rollback()
 
-            # === Kohteiden lukumäärä ===
-            assert session.query(func.count(Kohde.id)).scalar() == 12
 
-            # === Päättyneet kohteet ===
-            paattyneet = session.query(func.count(Kohde.id)).filter(
-                Kohde.loppupvm != None
-            ).scalar()
-            assert paattyneet == 3, f"Päättyneitä kohteita: {paattyneet}, odotettiin 3"
+def test_incremental_vastaa_taytta_ajoa(engine, paivitetty_kanta):
+    """Muutosjoukon rakennuksiin rajattu päivitys tuottaa samat kohteet kuin
+    koko rekisterin käsittely."""
+    taysi = _import_dvv_kohteet_ja_peru(engine, incremental=False)
+    inkrementaalinen = _import_dvv_kohteet_ja_peru(engine, incremental=True)
 
-            # Päättyneille kohteille oikeat loppupäivämäärät
-            _assert_kohteen_loppupvm(session, "2023-01-30", "Granström")
-            _assert_kohteen_loppupvm(session, "2023-01-22", "Pohjonen")
-            _assert_kohteen_loppupvm(session, "2023-01-30", "Kauko")
+    assert any(loppupvm for _, loppupvm, _ in taysi["kohde"]), \
+        "Päivitys ei päättänyt yhtään kohdetta"
+    for taulu in SNAPSHOT_QUERIES:
+        assert inkrementaalinen[taulu] == taysi[taulu], taulu
 
-            # === Uusi Granström-kohde (alkupvm 2015-04-01, ei loppupvm) ===
-            granstrom_new = session.execute(
-                select(Kohde.id).where(
-                    and_(Kohde.nimi == "Granström", Kohde.loppupvm == None)
-                )
-            ).scalars().all()
-            assert len(granstrom_new) == 1, "Uutta Granström-kohdetta ei löydy"
-            granstrom_id = granstrom_new[0]
-
-            # Uudella Granström-kohteella osapuolina Granström (omistaja) ja Kemp (vanhin asukas + kompostointi)
-            granstrom_osapuolet = session.execute(
-                select(Osapuolenrooli.selite, Osapuoli.nimi).
-                select_from(KohteenOsapuolet).
-                join(Osapuolenrooli, KohteenOsapuolet.osapuolenrooli_id == Osapuolenrooli.id).
-                join(Osapuoli, KohteenOsapuolet.osapuoli_id == Osapuoli.id).
-                where(KohteenOsapuolet.kohde_id == granstrom_id)
-            ).all()
-            granstrom_roolit = [r[0] for r in granstrom_osapuolet]
-            granstrom_nimet = [r[1] for r in granstrom_osapuolet]
-            assert "Omistaja" in granstrom_roolit, "Granström-kohteella ei omistajaa"
-            assert any("Granström" in n for n in granstrom_nimet), "Granström-omistajaa ei löydy"
-            assert "Vanhin asukas" in granstrom_roolit, "Granström-kohteella ei vanhinta asukasta"
-            assert any("Kemp" in n for n in granstrom_nimet), "Kemp-asukasta ei löydy"
-
-            # === Uusi Pohjonen-kohde (alkupvm 2023-01-23, ei loppupvm) ===
-            _assert_kohteen_alkupvm(session, "2023-01-23", "Pohjonen")
-
-            # === Riipinen pysyy aktiivisena (ei pääty, ei uutta kohdetta) ===
-            riipinen_all = session.query(Kohde.id, Kohde.loppupvm).filter(
-                Kohde.nimi == "Riipinen"
-            ).all()
-            assert len(riipinen_all) == 1, \
-                f"Riipinen-kohteita odotettiin 1, löytyi {len(riipinen_all)}"
-            assert riipinen_all[0][1] is None, "Riipinen-kohteen loppupvm ei saa olla asetettu"
-
-            # === Sopimukset siirtyneet uudelle Granström-kohteelle ===
-            granstrom_sopimukset = session.query(func.count(Sopimus.id)).filter(
-                Sopimus.kohde_id == granstrom_id
-            ).scalar()
-            assert granstrom_sopimukset == 5, \
-                f"Granström-kohteella sopimuksia: {granstrom_sopimukset}, odotettiin 5"
-
-            # Granström-kohteella kuljetuksia
-            granstrom_kuljetukset = session.query(func.count(Kuljetus.id)).filter(
-                Kuljetus.kohde_id == granstrom_id
-            ).scalar()
-            assert granstrom_kuljetukset == 5, \
-                f"Granström-kohteella kuljetuksia: {granstrom_kuljetukset}, odotettiin 5"
-
-            # === Sopimukset yhteensä ===
-            assert session.query(func.count(Sopimus.id)).scalar() == 5
-
-            # === Kuljetukset yhteensä ===
-            assert session.query(func.count(Kuljetus.id)).scalar() == 5
-
-            # === Tyhjennysvälit yhteensä ===
-            assert session.query(func.count(Tyhjennysvali.id)).scalar() == 5
-
-            # === Viranomaispaatokset ===
-            assert session.query(func.count(Viranomaispaatokset.id)).scalar() == 2
-
-            # === Kompostorit ===
-            assert session.query(func.count(Kompostori.id)).scalar() == 3
-
-            # Forsström-kohteella on kompostori
-            forstrom_id = session.query(Kohde.id).filter(
-                Kohde.nimi == "Forsström"
-            ).scalar()
-            assert forstrom_id is not None, "Forsström-kohdetta ei löydy"
-            forstrom_komp_count = session.query(func.count(KompostorinKohteet.kohde_id)).filter(
-                KompostorinKohteet.kohde_id == forstrom_id
-            ).scalar()
-            assert forstrom_komp_count == 1, \
-                f"Forsström-kohteella kompostoreita: {forstrom_komp_count}, odotettiin 1"
-
-            # Uudella Granström-kohteella on kompostoreita
-            granstrom_komp_count = session.query(func.count(KompostorinKohteet.kohde_id)).filter(
-                KompostorinKohteet.kohde_id == granstrom_id
-            ).scalar()
-            assert granstrom_komp_count >= 1, \
-                f"Granström-kohteella kompostoreita: {granstrom_komp_count}, odotettiin >= 1"
-
-            # === Kohdentumattomat kuljetukset CSV ===
-            for kuljdir in ["kuljetus1", "kuljetus2"]:
-                csv_path = os.path.join(
-                    str(datadir), kuljdir, "kohdentumattomat_kuljetukset.csv"
-                )
-                assert os.path.isfile(csv_path), \
-                    f"Kohdentumattomat CSV ei löydy: {csv_path}"
 
-    finally:
-        _cleanup_all(engine)
+def test_update_dvv_kohteet(engine, paivitetty_kanta):
+    """Testaa DVV-kohteiden päivitys uudella DVV-poiminnalla.
+
+    Ajetaan import_dvv_kohteet uudelleen (poimintapvm 31.1.2023) ja
+    tarkistetaan kohteiden päivitykset (loppupvm:t, uudet kohteet, osapuolet).
+    """
+    datadir = paivitetty_kanta
+
+    # --- Vaihe 4: Toinen import_dvv_kohteet ---
+    with Session(engine) as session:
+        init_code_objects(session)
+        import_dvv_kohteet(session, poimintapvm=PAIVITYKSEN_POIMINTAPVM)
+
+        # === Kohteiden lukumäärä ===
+        assert session.query(func.count(Kohde.id)).scalar() == 12
+
+        # === Päättyneet kohteet ===
+        paattyneet = session.query(func.count(Kohde.id)).filter(
+            Kohde.loppupvm != None
+        ).scalar()
+        assert paattyneet == 3, f"Päättyneitä kohteita: {paattyneet}, odotettiin 3"
+
+        # Päättyneille kohteille oikeat loppupäivämäärät
+        _assert_kohteen_loppupvm(session, "2023-01-30", "Granström")
+        _assert_kohteen_loppupvm(session, "2023-01-22", "Pohjonen")
+        _assert_kohteen_loppupvm(session, "2023-01-30", "Kauko")
+
+        # === Uusi Granström-kohde (alkupvm 2015-04-01, ei loppupvm) ===
+        granstrom_new = session.execute(
+            select(Kohde.id).where(
+                and_(Kohde.nimi == "Granström", Kohde.loppupvm == None)
+            )
+        ).scalars().all()
+        assert len(granstrom_new) == 1, "Uutta Granström-kohdetta ei löydy"
+        granstrom_id = granstrom_new[0]
+
+        # Uudella Granström-kohteella osapuolina Granström (omistaja) ja Kemp (vanhin asukas + kompostointi)
+        granstrom_osapuolet = session.execute(
+            select(Osapuolenrooli.selite, Osapuoli.nimi).
+            select_from(KohteenOsapuolet).
+            join(Osapuolenrooli, KohteenOsapuolet.osapuolenrooli_id == Osapuolenrooli.id).
+            join(Osapuoli, KohteenOsapuolet.osapuoli_id == Osapuoli.id).
+            where(KohteenOsapuolet.kohde_id == granstrom_id)
+        ).all()
+        granstrom_roolit = [r[0] for r in granstrom_osapuolet]
+        granstrom_nimet = [r[1] for r in granstrom_osapuolet]
+        assert "Omistaja" in granstrom_roolit, "Granström-kohteella ei omistajaa"
+        assert any("Granström" in n for n in granstrom_nimet), "Granström-omistajaa ei löydy"
+        assert "Vanhin asukas" in granstrom_roolit, "Granström-kohteella ei vanhinta asukasta"
+        assert any("Kemp" in n for n in granstrom_nimet), "Kemp-asukasta ei löydy"
+
+        # === Uusi Pohjonen-kohde (alkupvm 2023-01-23, ei loppupvm) ===
+        _assert_kohteen_alkupvm(session, "2023-01-23", "Pohjonen")
+
+        # === Riipinen pysyy aktiivisena (ei pääty, ei uutta kohdetta) ===
+        riipinen_all = session.query(Kohde.id, Kohde.loppupvm).filter(
+            Kohde.nimi == "Riipinen"
+        ).all()
+        assert len(riipinen_all) == 1, \
+            f"Riipinen-kohteita odotettiin 1, löytyi {len(riipinen_all)}"
+        assert riipinen_all[0][1] is None, "Riipinen-kohteen loppupvm ei saa olla asetettu"
+
+        # === Sopimukset siirtyneet uudelle Granström-kohteelle ===
+        granstrom_sopimukset = session.query(func.count(Sopimus.id)).filter(
+            Sopimus.kohde_id == granstrom_id
+        ).scalar()
+        assert granstrom_sopimukset == 5, \
+            f"Granström-kohteella sopimuksia: {granstrom_sopimukset}, odotettiin 5"
+
+        # Granström-kohteella kuljetuksia
+        granstrom_kuljetukset = session.query(func.count(Kuljetus.id)).filter(
+            Kuljetus.kohde_id == granstrom_id
+        ).scalar()
+        assert granstrom_kuljetukset == 5, \
+            f"Granström-kohteella kuljetuksia: {granstrom_kuljetukset}, odotettiin 5"
+
+        # === Sopimukset yhteensä ===
+        assert session.query(func.count(Sopimus.id)).scalar() == 5
+
+        # === Kuljetukset yhteensä ===
+        assert session.query(func.count(Kuljetus.id)).scalar() == 5
+
+        # === Tyhjennysvälit yhteensä ===
+        assert session.query(func.count(Tyhjennysvali.id)).scalar() == 5
+
+        # === Viranomaispaatokset ===
+        assert session.query(func.count(Viranomaispaatokset.id)).scalar() == 2
+
+        # === Kompostorit ===
+        assert session.query(func.count(Kompostori.id)).scalar() == 3
+
+        # Forsström-kohteella on kompostori
+        forstrom_id = session.query(Kohde.id).filter(
+            Kohde.nimi == "Forsström"
+        ).scalar()
+        assert forstrom_id is not None, "Forsström-kohdetta ei löydy"
+        forstrom_komp_count = session.query(func.count(KompostorinKohteet.kohde_id)).filter(
+            KompostorinKohteet.kohde_id == forstrom_id
+        ).scalar()
+        assert forstrom_komp_count == 1, \
+            f"Forsström-kohteella kompostoreita: {forstrom_komp_count}, odotettiin 1"
+
+        # Uudella Granström-kohteella on kompostoreita
+        granstrom_komp_count = session.query(func.count(KompostorinKohteet.kohde_id)).filter(
+            KompostorinKohteet.kohde_id == granstrom_id
+        ).scalar()
+        assert granstrom_komp_count >= 1, \
+            f"Granström-kohteella kompostoreita: {granstrom_komp_count}, odotettiin >= 1"
+
+        # === Kohdentumattomat kuljetukset CSV ===
+        for kuljdir in ["kuljetus1", "kuljetus2"]:
+            csv_path = os.path.join(
+                str(datadir), kuljdir, "kohdentumattomat_kuljetukset.csv"
+            )
+            assert os.path.isfile(csv_path), \
+                f"Kohdentumattomat CSV ei löydy: {csv_path}"
@@ -0,0 +1,155 @@
+from datetime import date
+
+import pytest
+from sqlalchemy import create_engine, literal, select, text
+from sqlalchemy.orm import Session
+
+from jkrimporter import conf
+from jkrimporter.providers.db.database import json_dumps
+from jkrimporter.providers.db.services.dvv_rakennustiedot import (
+    DvvRakennustiedot,
+    rakennus_ids_without_kohde,
+)
+
+POIMINTAPVM = date(2022, 1, 28)
+
+
+@pytest.fixture(scope="module", autouse=True)
+def engine():
+    engine = create_engine(
+        "postgresql://{username}:{password}@{host}:{port}/{dbname}".format(
+            **conf.dbconf
+        ),
+        future=True,
+        json_serializer=json_dumps,
+    )
+    return engine
+
+
+def _kuvaus(dvv: DvvRakennustiedot) -> dict:
+    """Muistikuvan sisältö vertailukelpoisessa muodossa."""
+
+    def osapuolet(osapuolet):
+        return sorted((o.id, o.nimi, o.katuosoite, o.ytunnus) for o in osapuolet)
+
+    def osoitteet(osoitteet):
+        return sorted(
+            (o.id, o.katu.katunimi_fi if o.katu else None, o.osoitenumero)
+            for o in osoitteet
+        )
+
+    return {
+        rakennus_id: (
+            rakennus.prt,
+            rakennus.kiinteistotunnus,
+            rakennus.huoneistomaara,
+            rakennus.rakennuksenkayttotarkoitus_koodi,
+            osapuolet(asukkaat),
+            osapuolet(omistajat),
+            osoitteet(rakennuksen_osoitteet),
+            osapuolet(dvv.inhabitants_by_rakennus_id.get(rakennus_id, ())),
+            osapuolet(dvv.owners_by_rakennus_id.get(rakennus_id, ())),
+            osoitteet(dvv.addresses_by_rakennus_id.get(rakennus_id, ())),
+            dvv.kohdetyypit[rakennus_id],
+        )
+        for rakennus_id, (rakennus, asukkaat, omistajat, rakennuksen_osoitteet)
+        in dvv.rakennustiedot.items()
+    }
+
+
+def _lisaa_kohde(session, rakennus_ids) -> int:
+    kohde_id = session.execute(
+        text(
+            "INSERT INTO jkr.kohde (nimi, kohdetyyppi_id, alkupvm) "
+            "VALUES ('Testikohde', 7, :alkupvm) RETURNING id"
+        ),
+        {"alkupvm": POIMINTAPVM},
+    ).scalar_one()
+    for rakennus_id in rakennus_ids:
+        session.execute(
+            text(
+                "INSERT INTO jkr.kohteen_rakennukset (kohde_id, rakennus_id) "
+                "VALUES (:kohde_id, :rakennus_id)"
+            ),
+            {"kohde_id": kohde_id, "rakennus_id": rakennus_id},
+        )
+    return kohde_id
+
+
+def _poista_kohde(session, kohde_id):
+    session.execute(
+        text("DELETE FROM jkr.kohteen_rakennukset WHERE kohde_id = :kohde_id"),
+        {"kohde_id": kohde_id},
+    )
+    session.execute(text("DELETE FROM jkr.kohde WHERE id = :kohde_id"), {"kohde_id": kohde_id})
+
+
+def test_refresh_vastaa_loadia(engine):
+    """Muutosten jälkeen päivitetty muistikuva on sama kuin uusi haku."""
+    with Session(engine) as session:
+        try:
+            dvv = DvvRakennustiedot.load(session, POIMINTAPVM, None)
+            assert len(dvv.rakennustiedot) > 2, "Testikannassa ei ole kohteettomia rakennuksia"
+
+            # Kohteen saaneet rakennukset poistuvat muistikuvasta
+            rakennus_ids = sorted(dvv.rakennustiedot)[:2]
+            kohde_id = _lisaa_kohde(session, rakennus_ids)
+            dvv.refresh(session, POIMINTAPVM, None)
+
+            uusi = DvvRakennustiedot.load(session, POIMINTAPVM, None)
+            assert not set(rakennus_ids) & dvv.rakennustiedot.keys()
+            assert _kuvaus(dvv) == _kuvaus(uusi)
+
+            # Kohteelta vapautuneet rakennukset haetaan uudelleen
+            _poista_kohde(session, kohde_id)
+            dvv.refresh(session, POIMINTAPVM, None)
+
+            uusi = DvvRakennustiedot.load(session, POIMINTAPVM, None)
+            assert set(rakennus_ids) <= dvv.rakennustiedot.keys()
+            assert _kuvaus(dvv) == _kuvaus(uusi)
+        finally:
+            session.rollback()
+
+
+def test_refresh_kiinteistorajaus(engine):
+    """Rajauksen ulkopuoliset rakennukset poistuvat päivityksessä."""
+    with Session(engine) as session:
+        dvv = DvvRakennustiedot.load(session, POIMINTAPVM, None)
+        kiinteistotunnus = next(
+            rakennus.kiinteistotunnus
+            for rakennus, *_ in dvv.rakennustiedot.values()
+            if rakennus.kiinteistotunnus
+        )
+        rajaus = select(literal(kiinteistotunnus))
+
+        dvv.refresh(session, POIMINTAPVM, None, rajaus)
+
+        uusi = DvvRakennustiedot.load(session, POIMINTAPVM, None, rajaus)
+        assert _kuvaus(dvv) == _kuvaus(uusi)
+        assert {
+            rakennus.kiinteistotunnus for rakennus, *_ in dvv.rakennustiedot.values()
+        } == {kiinteistotunnus}
+        assert set(
+            session.execute(
+                rakennus_ids_without_kohde(POIMINTAPVM, None, rajaus)
+            ).scalars()
+        ) == dvv.rakennustiedot.keys()
+
+
+def test_osapuolet_jaetaan(engine):
+    """Sama osapuoli on kaikissa rakennuksissa sama olio myös päivityksen jälkeen."""
+    with Session(engine) as session:
+        try:
+            dvv = DvvRakennustiedot.load(session, POIMINTAPVM, None)
+            rakennus_ids = sorted(dvv.rakennustiedot)[:2]
+            kohde_id = _lisaa_kohde(session, rakennus_ids)
+            dvv.refresh(session, POIMINTAPVM, None)
+            _poista_kohde(session, kohde_id)
+            dvv.refresh(session, POIMINTAPVM, None)
+
+            osapuolet = {}
+            for _, asukkaat, omistajat, _ in dvv.rakennustiedot.values():
+                for osapuoli in asukkaat | omistajat:
+                    assert osapuolet.setdefault(osapuoli.id, osapuoli) is osapuoli
+        finally:
+            session.rollback()
@@ -0,0 +1,148 @@
+from geoalchemy2 import WKTElement
+
+from jkrimporter.providers.db.services.dvv_rakennustiedot import (
+    DvvKatu,
+    DvvOsapuoli,
+    DvvOsoite,
+    DvvRakennus,
+)
+from jkrimporter.providers.db.services.kohde import (
+    _group_kiinteistot,
+    group_kiinteiston_rakennukset,
+)
+
+KIINTEISTOTUNNUS = "39800100010001"
+
+
+def _rakennus(id, x, y, kiinteistotunnus=KIINTEISTOTUNNUS):
+    return DvvRakennus(
+        id=id,
+        prt=f"1000000{id:02d}A",
+        kiinteistotunnus=kiinteistotunnus,
+        geom=WKTElement(f"POINT({x} {y})", srid=3067),
+        rakennusluokka_2018="0110",
+        rakennuksenkayttotarkoitus_koodi="011",
+        huoneistomaara=1,
+        rakennuksenolotila_koodi="01",
+    )
+
+
+def _osoite(id, katu, numero):
+    return DvvOsoite(id=id, katu_id=katu.id, katu=katu, osoitenumero=numero)
+
+
+def _kiinteisto(rakennukset):
+    """
+    Kokoaa `group_kiinteiston_rakennukset`-funktion syötteet listasta
+    (rakennus, omistajat, osoitteet).
+    """
+    return (
+        [
+            (rakennus, frozenset(), frozenset(omistajat), frozenset(osoitteet))
+            for rakennus, omistajat, osoitteet in rakennukset
+        ],
+        {rakennus.id: set(omistajat) for rakennus, omistajat, _ in rakennukset},
+        {rakennus.id: set(osoitteet) for rakennus, _, osoitteet in rakennukset},
+    )
+
+
+def _ryhmat(kiinteisto):
+    return sorted(sorted(ryhma) for ryhma in group_kiinteiston_rakennukset(*kiinteisto))
+
+
+KATU = DvvKatu(1, "Testikatu")
+
+
+def test_muut_omistajat_jaetaan_osoitteittain():
+    omistaja = DvvOsapuoli(1, "Meikäläinen Matti", "Testikatu 1", None, "010101-123A")
+    kiinteisto = _kiinteisto(
+        [
+            (_rakennus(1, 0, 0), [omistaja], [_osoite(1, KATU, "1")]),
+            (_rakennus(2, 10, 0), [omistaja], [_osoite(2, KATU, "1")]),
+            (_rakennus(3, 20, 0), [omistaja], [_osoite(3, KATU, "3")]),
+        ]
+    )
+
+    assert _ryhmat(kiinteisto) == [[1, 2], [3]]
+
+
+def test_omistajat_eri_ryhmiin():
+    omistaja1 = DvvOsapuoli(1, "Meikäläinen Matti", "Testikatu 1", None, "010101-123A")
+    omistaja2 = DvvOsapuoli(2, "Asunto Oy Testitalo", "Testikatu 1", "1234567-8", None)
+    kiinteisto = _kiinteisto(
+        [
+            (_rakennus(1, 0, 0), [omistaja1], [_osoite(1, KATU, "1")]),
+            (_rakennus(2, 10, 0), [omistaja1], [_osoite(2, KATU, "1")]),
+            (_rakennus(3, 20, 0), [omistaja2], [_osoite(3, KATU, "1")]),
+        ]
+    )
+
+    assert _ryhmat(kiinteisto) == [[1, 2], [3]]
+
+
+def test_kaukaiset_rakennukset_eri_ryhmiin():
+    asoy = DvvOsapuoli(1, "Asunto Oy Testitalo", "Testikatu 1", "1234567-8", None)
+    kiinteisto = _kiinteisto(
+        [
+            (_rakennus(1, 0, 0), [asoy], [_osoite(1, KATU, "1")]),
+            (_rakennus(2, 10, 0), [asoy], [_osoite(2, KATU, "1")]),
+            (_rakennus(3, 500, 0), [asoy], [_osoite(3, KATU, "1")]),
+        ]
+    )
+
+    assert _ryhmat(kiinteisto) == [[1, 2], [3]]
+
+
+def test_rakennukset_ilman_omistajia_ja_osoitteita():
+    kiinteisto = _kiinteisto(
+        [
+            (_rakennus(1, 0, 0), [], []),
+            (_rakennus(2, 10, 0), [], []),
+        ]
+    )
+
+    # Rakennukset ilman yhteisiä omistajia eivät klusteroidu yhteen
+    assert _ryhmat(kiinteisto) == [[1], [2]]
+
+
+def _kiinteistot(maara):
+    """Joukko kiinteistöjä, joilla on eri omistaja- ja osoiteyhdistelmiä."""
+    kiinteistot = []
+    osapuoli_id = 0
+    rakennus_id = 0
+    for i in range(maara):
+        kiinteistotunnus = f"3980010001{i:04d}"
+        osapuolet = []
+        for j in range(1 + i % 3):
+            osapuoli_id += 1
+            nimi = (
+                f"Asunto Oy Testitalo {osapuoli_id}" if (i + j) % 2
+                else f"Meikäläinen Matti {osapuoli_id}"
+            )
+            osapuolet.append(DvvOsapuoli(osapuoli_id, nimi, None, None, None))
+        rakennukset = []
+        for j in range(2 + i % 5):
+            rakennus_id += 1
+            omistajat = [osapuolet[j % len(osapuolet)]]
+            if j % 4 == 3:
+                omistajat.append(osapuolet[0])
+            osoitteet = [_osoite(rakennus_id, KATU, str(1 + j % 3))]
+            rakennukset.append(
+                (
+                    _rakennus(rakennus_id, i * 1000 + j * 120, (j % 2) * 50, kiinteistotunnus),
+                    omistajat,
+                    osoitteet,
+                )
+            )
+        kiinteistot.append(_kiinteisto(rakennukset))
+    return kiinteistot
+
+
+def test_rinnakkainen_ryhmittely_sama_tulos():
+    kiinteistot = _kiinteistot(40)
+
+    tulos = _group_kiinteistot(kiinteistot, workers=1)
+
+    assert len(tulos) == len(kiinteistot)
+    assert _group_kiinteistot(kiinteistot, workers=2) == tulos
+    assert _group_kiinteistot(kiinteistot, workers=3) == tulos
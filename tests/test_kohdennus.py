@@ -0,0 +1,79 @@
+from datetime import date
+from types import SimpleNamespace
+
+from jkrimporter.model import Tunnus
+from jkrimporter.providers.db.services.kohdennus import KohdeLookup
+from jkrimporter.utils.intervals import Interval
+
+
+def _asiakas(rakennukset, alku=date(2023, 1, 1), loppu=date(2023, 12, 31)):
+    return SimpleNamespace(voimassa=Interval(alku, loppu), rakennukset=rakennukset)
+
+
+def _lookup():
+    return KohdeLookup.from_rows(
+        [
+            ("100000001A", 1, date(2022, 1, 1), None),
+            ("100000002B", 2, date(2022, 1, 1), None),
+            ("100000002B", 3, date(2022, 6, 1), None),
+            ("100000003C", 4, date(2024, 1, 1), None),
+        ],
+        [
+            ("LSJ ", "01-0000001-00", 1),
+            ("LSJ", "01-0000002-00", 2),
+        ],
+    )
+
+
+def test_find_kohde_id_by_prt():
+    lookup = _lookup()
+
+    assert lookup.find_kohde_id_by_prt(_asiakas(["100000001A"])) == 1
+    # Useasta kohteesta valitaan pienin id
+    assert lookup.find_kohde_id_by_prt(_asiakas(["100000002B"])) == 2
+    # Kohde alkaa vasta asiakkaan voimassaolon jälkeen
+    assert lookup.find_kohde_id_by_prt(_asiakas(["100000003C"])) is None
+    assert lookup.find_kohde_id_by_prt(_asiakas(["999999999X"])) is None
+    assert (lookup.hits, lookup.misses) == (2, 2)
+
+
+def test_find_kohde_id_by_prt_tyhja_voimassaolo():
+    lookup = _lookup()
+
+    asiakas = _asiakas(["100000001A"], date(2023, 1, 1), date(2023, 1, 1))
+
+    assert lookup.find_kohde_id_by_prt(asiakas) is None
+
+
+def test_update_kohde_paattaa_kohteen():
+    lookup = _lookup()
+
+    lookup.update_kohde(
+        SimpleNamespace(id=2, alkupvm=date(2022, 1, 1), loppupvm=date(2022, 12, 31))
+    )
+
+    assert lookup.find_kohde_id_by_prt(_asiakas(["100000002B"])) == 3
+    # Hakemistossa olemattoman kohteen päivitys ei lisää sitä
+    lookup.update_kohde(SimpleNamespace(id=99, alkupvm=None, loppupvm=None))
+    assert 99 not in lookup._voimassaolot
+
+
+def test_find_kohde_id_by_asiakasnumero():
+    lookup = _lookup()
+
+    # Tiedontuottajan tunnuksen välilyönnit poistetaan
+    assert lookup.find_kohde_id_by_asiakasnumero(Tunnus("LSJ", "01-0000001-00")) == 1
+    assert lookup.find_kohde_id_by_asiakasnumero(Tunnus("PJH", "01-0000001-00")) is None
+    assert lookup.has_ulkoinen_asiakastieto(Tunnus("LSJ", "01-0000002-00"))
+    assert not lookup.has_ulkoinen_asiakastieto(Tunnus("LSJ", "01-0000003-00"))
+
+
+def test_add_ulkoinen_asiakastieto():
+    lookup = _lookup()
+
+    lookup.add_ulkoinen_asiakastieto(Tunnus("LSJ", "01-0000003-00"), 4)
+    # Olemassa olevaa asiakastietoa ei korvata
+    lookup.add_ulkoinen_asiakastieto(Tunnus("LSJ", "01-0000001-00"), 4)
+
+    assert lookup.find_kohde_id_by_asiakasnumero(Tunnus("LSJ", "01-0000003-00")) == 4
+    assert lookup.find_kohde_id_by_asiakasnumero(Tunnus("LSJ", "01-0000001-00")) == 1
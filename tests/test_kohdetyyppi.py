@@ -0,0 +1,64 @@
+from types import SimpleNamespace
+
+import pytest
+
+from jkrimporter.providers.db.codes import KohdeTyyppi
+from jkrimporter.providers.db.services.kohdetyyppi import (
+    classify_rakennukset,
+    kohdetyyppi_for_rakennukset,
+)
+
+
+def _rakennus(id, luokka=None, kayttotarkoitus=None, huoneistomaara=None, olotila=None):
+    return SimpleNamespace(
+        id=id,
+        prt=str(id),
+        rakennusluokka_2018=luokka,
+        rakennuksenkayttotarkoitus_koodi=kayttotarkoitus,
+        huoneistomaara=huoneistomaara,
+        rakennuksenolotila_koodi=olotila,
+    )
+
+
+ASUIN = KohdeTyyppi.ASUINKIINTEISTO
+MUU = KohdeTyyppi.MUU
+
+# Rakennus ja determine_kohdetyyppi-funktion sääntöjen mukainen tyyppi
+LUOKITTELUT = [
+    (_rakennus(1), MUU),
+    (_rakennus(2, luokka="0110"), ASUIN),
+    (_rakennus(3, luokka="0211"), ASUIN),
+    (_rakennus(4, luokka="0212"), MUU),
+    (_rakennus(5, luokka="abc", kayttotarkoitus="011"), ASUIN),
+    (_rakennus(6, kayttotarkoitus="041"), ASUIN),
+    (_rakennus(7, kayttotarkoitus="042"), MUU),
+    (_rakennus(8, kayttotarkoitus=""), MUU),
+    (_rakennus(9, huoneistomaara=0), MUU),
+    (_rakennus(10, huoneistomaara=2), ASUIN),
+    (_rakennus(11, olotila="01"), ASUIN),
+    (_rakennus(12, olotila="02"), MUU),
+    (_rakennus(13, luokka="0109", kayttotarkoitus="010"), MUU),
+]
+RAKENNUKSET = [rakennus for rakennus, _ in LUOKITTELUT]
+
+
+@pytest.mark.parametrize(
+    "rakennus,odotettu", LUOKITTELUT, ids=[str(r.id) for r in RAKENNUKSET]
+)
+def test_classify_rakennukset(rakennus, odotettu):
+    assert classify_rakennukset(RAKENNUKSET)[rakennus.id] == odotettu
+
+
+def test_classify_rakennukset_ilman_sarakkeita():
+    # Puuttuvat sarakkeet tulkitaan tyhjiksi
+    assert classify_rakennukset([SimpleNamespace(id=1, huoneistomaara=1)]) == {1: ASUIN}
+    assert classify_rakennukset([]) == {}
+
+
+def test_kohdetyyppi_for_rakennukset():
+    tyypit = classify_rakennukset(RAKENNUKSET)
+    assert kohdetyyppi_for_rakennukset([1, 4], set(), tyypit) == KohdeTyyppi.MUU
+    assert kohdetyyppi_for_rakennukset([1, 2], set(), tyypit) == KohdeTyyppi.ASUINKIINTEISTO
+    assert kohdetyyppi_for_rakennukset([1], {"asukas"}, tyypit) == KohdeTyyppi.ASUINKIINTEISTO
+    # Asukkaat eivät riitä, jos kohteella ei ole luokiteltuja rakennuksia
+    assert kohdetyyppi_for_rakennukset([99], {"asukas"}, tyypit) == KohdeTyyppi.MUU
@@ -0,0 +1,190 @@
+from datetime import datetime
+from pathlib import Path
+from shutil import copytree
+
+import pytest
+from sqlalchemy import create_engine, text
+from sqlalchemy.orm import Session
+
+from jkrimporter import conf
+from jkrimporter.cli.jkr import import_data
+from jkrimporter.conf import get_kohdentumattomat_siirtotiedosto_filename
+from jkrimporter.providers.db.codes import init_code_objects
+from jkrimporter.providers.db.database import json_dumps
+from jkrimporter.providers.db.dbprovider import import_dvv_kohteet
+
+
+@pytest.fixture(scope="module", autouse=True)
+def engine():
+    engine = create_engine(
+        "postgresql://{username}:{password}@{host}:{port}/{dbname}".format(
+            **conf.dbconf
+        ),
+        future=True,
+        json_serializer=json_dumps,
+    )
+    return engine
+
+
+@pytest.fixture
+def datadir(tmpdir):
+    """Käytetään test_data_import-kansiota testidatana."""
+    source = Path(__file__).parent / "data" / "test_data_import"
+    if source.is_dir():
+        copytree(source, tmpdir, dirs_exist_ok=True)
+    return tmpdir
+
+
+def _cleanup_all(engine):
+    """Poistaa testin luomat tiedot kannasta FK-järjestyksessä."""
+    with engine.connect() as conn:
+        conn.execute(text("DELETE FROM jkr.keraysvaline"))
+        conn.execute(text("DELETE FROM jkr.keskeytys"))
+        conn.execute(text("DELETE FROM jkr.kuljetus"))
+        conn.execute(text("DELETE FROM jkr.tyhjennysvali"))
+        conn.execute(text("DELETE FROM jkr.sopimus"))
+        conn.execute(text("DELETE FROM jkr.ulkoinen_asiakastieto"))
+        conn.execute(text("DELETE FROM jkr.kohteen_osapuolet"))
+        conn.execute(text("DELETE FROM jkr.kohteen_rakennukset"))
+        conn.execute(text("DELETE FROM jkr.kohde"))
+        conn.execute(text("DELETE FROM jkr.dvv_poimintapvm"))
+        conn.execute(text(
+            "DELETE FROM jkr.osapuoli "
+            "WHERE tiedontuottaja_tunnus NOT IN ('dvv', 'ilmoitus')"
+        ))
+        conn.execute(text(
+            "DELETE FROM jkr_koodistot.tiedontuottaja "
+            "WHERE tunnus NOT IN ('dvv', 'ilmoitus')"
+        ))
+        conn.commit()
+
+
+# Kohteiden id:t vaihtelevat ajojen välillä, joten kohde tunnistetaan
+# nimestä ja rakennustunnuksista.
+KOHDE_AVAIN = """
+WITH avain AS (
+    SELECT
+        k.id,
+        k.nimi || ':' || coalesce(string_agg(r.prt, ',' ORDER BY r.prt), '') AS avain
+    FROM jkr.kohde k
+    LEFT JOIN jkr.kohteen_rakennukset kr ON kr.kohde_id = k.id
+    LEFT JOIN jkr.rakennus r ON r.id = kr.rakennus_id
+    GROUP BY k.id
+)
+"""
+
+SNAPSHOT_QUERIES = {
+    "kohde": """
+        SELECT a.avain, k.alkupvm, k.loppupvm
+        FROM jkr.kohde k JOIN avain a ON a.id = k.id
+    """,
+    "ulkoinen_asiakastieto": """
+        SELECT a.avain, u.tiedontuottaja_tunnus, u.ulkoinen_id,
+            u.ulkoinen_asiakastieto::jsonb::text
+        FROM jkr.ulkoinen_asiakastieto u JOIN avain a ON a.id = u.kohde_id
+    """,
+    "haltija": """
+        SELECT a.avain, ko.osapuolenrooli_id, o.nimi, o.katuosoite,
+            o.postinumero, o.postitoimipaikka, o.ytunnus,
+            o.tiedontuottaja_tunnus, o.osapuolenlaji_koodi
+        FROM jkr.kohteen_osapuolet ko
+        JOIN jkr.osapuoli o ON o.id = ko.osapuoli_id
+        JOIN avain a ON a.id = ko.kohde_id
+        WHERE o.tiedontuottaja_tunnus NOT IN ('dvv', 'ilmoitus')
+    """,
+    "sopimus": """
+        SELECT a.avain, s.sopimustyyppi_id, s.jatetyyppi_id, ka.avain,
+            s.alkupvm, s.loppupvm, s.tiedontuottaja_tunnus
+        FROM jkr.sopimus s
+        JOIN avain a ON a.id = s.kohde_id
+        LEFT JOIN avain ka ON ka.id = s.kimppaisanta_kohde_id
+    """,
+    "tyhjennysvali": """
+        SELECT a.avain, s.jatetyyppi_id, s.alkupvm, t.alkuvko, t.loppuvko,
+            t.tyhjennysvali, t.kertaaviikossa
+        FROM jkr.tyhjennysvali t
+        JOIN jkr.sopimus s ON s.id = t.sopimus_id
+        JOIN avain a ON a.id = s.kohde_id
+    """,
+    "keskeytys": """
+        SELECT a.avain, s.jatetyyppi_id, s.alkupvm, k.alkupvm, k.loppupvm, k.selite
+        FROM jkr.keskeytys k
+        JOIN jkr.sopimus s ON s.id = k.sopimus_id
+        JOIN avain a ON a.id = s.kohde_id
+    """,
+    "keraysvaline": """
+        SELECT a.avain, s.jatetyyppi_id, s.alkupvm, v.pvm, v.tilavuus, v.maara,
+            v.keraysvalinetyyppi_id
+        FROM jkr.keraysvaline v
+        JOIN jkr.sopimus s ON s.id = v.sopimus_id
+        JOIN avain a ON a.id = s.kohde_id
+    """,
+    "kuljetus": """
+        SELECT a.avain, k.jatetyyppi_id, k.alkupvm, k.loppupvm,
+            k.tyhjennyskerrat, k.massa, k.tilavuus, k.tiedontuottaja_tunnus,
+            k.lietteentyhjennyspaiva, k.jatteen_kuvaus
+        FROM jkr.kuljetus k JOIN avain a ON a.id = k.kohde_id
+    """,
+}
+
+
+def _snapshot(engine):
+    with engine.connect() as conn:
+        return {
+            taulu: sorted(
+                (tuple(row) for row in conn.execute(text(KOHDE_AVAIN + kysely))),
+                key=repr,
+            )
+            for taulu, kysely in SNAPSHOT_QUERIES.items()
+        }
+
+
+def _import(engine, datadir, bulk):
+    """Luo DVV-kohteet ja tuo kuljetukset tyhjään kantaan. Palauttaa kannan
+    tilan ja kohdentumattomien CSV-tiedoston sisällön."""
+    _cleanup_all(engine)
+    with Session(engine) as session:
+        init_code_objects(session)
+        import_dvv_kohteet(
+            session,
+            poimintapvm=datetime.strptime("28.1.2022", "%d.%m.%Y").date(),
+            perusmaksutiedosto=Path(datadir) / "perusmaksurekisteri.xlsx",
+        )
+    with engine.connect() as conn:
+        conn.execute(text(
+            "INSERT INTO jkr_koodistot.tiedontuottaja (tunnus, nimi) "
+            "VALUES ('LSJ', 'Testituottaja') ON CONFLICT DO NOTHING"
+        ))
+        conn.commit()
+
+    kohdentumattomat = []
+    for kansio, alkupvm, loppupvm in (
+        ("kuljetus1", "1.1.2022", "31.12.2022"),
+        ("kuljetus2", "1.1.2023", "31.12.2023"),
+    ):
+        siirtotiedosto = Path(datadir) / kansio
+        csv_path = siirtotiedosto / get_kohdentumattomat_siirtotiedosto_filename()
+        csv_path.unlink(missing_ok=True)
+        import_data(siirtotiedosto, "LSJ", alkupvm, loppupvm, bulk=bulk)
+        if csv_path.exists():
+            kohdentumattomat.append(csv_path.read_text(encoding="cp1252"))
+            csv_path.unlink()
+        else:
+            kohdentumattomat.append(None)
+
+    return _snapshot(engine), kohdentumattomat
+
+
+def test_write_bulk_vastaa_writea(engine, datadir):
+    """Joukkotuonti tuottaa samat rivit ja kohdentumattomat kuin
+    asiakaskohtainen tuonti."""
+    try:
+        tila, kohdentumattomat = _import(engine, datadir, bulk=False)
+        bulk_tila, bulk_kohdentumattomat = _import(engine, datadir, bulk=True)
+    finally:
+        _cleanup_all(engine)
+
+    assert tila["kuljetus"], "Testiaineisto ei kohdentanut yhtään kuljetusta"
+    for taulu in SNAPSHOT_QUERIES:
+        assert bulk_tila[taulu] == tila[taulu], taulu
+    assert bulk_kohdentumattomat == kohdentumattomat
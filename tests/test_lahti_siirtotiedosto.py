@@ -1,17 +1,23 @@
 from datetime import date
+from pathlib import Path
 
 import pytest
 from sqlalchemy import create_engine, func, or_
 from sqlalchemy.orm import Session
 
 from jkrimporter import conf
+from jkrimporter.conf import get_kohdentumattomat_siirtotiedosto_filename
 from jkrimporter.cli.jkr import import_data, tiedontuottaja_add_new
 from jkrimporter.providers.db.database import json_dumps
 from jkrimporter.providers.db.models import (
     Kohde,
     Tiedontuottaja,
 )
-from jkrimporter.providers.lahti.siirtotiedosto import LahtiSiirtotiedosto
+from jkrimporter.providers.lahti.models import AsiakasRow
+from jkrimporter.providers.lahti.siirtotiedosto import (
+    LahtiSiirtotiedosto,
+    group_asiakas_rows,
+)
 
 
 @pytest.fixture(scope="module", autouse=True)
@@ -47,3 +53,102 @@ def test_kohteet(datadir):
 def test_import_faulty_data(faulty_datadir):
     with pytest.raises(RuntimeError):
         import_data(faulty_datadir, 'LSJ', '1.1.2023', '31.3.2023')
+
+
+def test_group_asiakas_rows():
+    row = {
+        "UrakoitsijaId": "0000000-9",
+        "UrakoitsijankohdeId": "01-0000001-00",
+        "Kiinteistonposti": "15100 LAHTI",
+        "Haltijannimi": "Testi",
+        "Haltijanposti": "15100 LAHTI",
+        "Pvmalk": "1.1.2023",
+        "Pvmasti": "31.12.2023",
+        "tyyppiIdEWC": "Sekaj",
+        "COUNT(kaynnit)": "1",
+        "SUM(astiamaara)": "1",
+        "koko": "0,24",
+        "SUM(paino)": "",
+        "tyhjennysvali": "1",
+        "Voimassaoloviikotalkaen": "1",
+        "Voimassaoloviikotasti": "53",
+        "Keskeytysalkaen": "",
+        "Keskeytysasti": "",
+    }
+    eri_vali = {**row, "tyhjennysvali": "2"}
+    toinen_asiakas = {**row, "UrakoitsijankohdeId": "01-0000002-00"}
+    rows = [
+        AsiakasRow.parse_obj(data)
+        for data in (row, toinen_asiakas, eri_vali, row)
+    ]
+
+    asiakkaat = group_asiakas_rows(rows)
+
+    # Eri tyhjennysväli yhdistyy ensimmäiseen asiakkaaseen, täysin sama
+    # rivi muodostaa uuden asiakkaan.
+    assert [a.UrakoitsijankohdeId for a in asiakkaat] == [
+        "01-0000001-00",
+        "01-0000002-00",
+        "01-0000001-00",
+    ]
+    assert asiakkaat[0].tyhjennysvali == [1, None, 2, None]
+    assert asiakkaat[2].tyhjennysvali == [1, None]
+
+
+ORIGINAL_CSV = (
+    Path(__file__).parent
+    / "data"
+    / "test_lahti_siirtotiedosto"
+    / "kuljetustiedot_original_csv.csv"
+)
+
+
+def _write_siirtotiedosto(directory, content: bytes, name="kuljetustiedot.csv"):
+    directory.mkdir(exist_ok=True)
+    (directory / name).write_bytes(content)
+    return directory
+
+
+def _asiakastunnukset(directory):
+    return [
+        a.UrakoitsijankohdeId for a in LahtiSiirtotiedosto(directory).asiakastiedot
+    ]
+
+
+def test_bom(tmp_path):
+    content = ORIGINAL_CSV.read_bytes()
+    ilman_bomia = _write_siirtotiedosto(tmp_path / "ilman", content)
+    bomilla = _write_siirtotiedosto(tmp_path / "bom", b"\xef\xbb\xbf" + content)
+
+    # BOM ei päädy ensimmäisen sarakkeen nimeen, joten otsikot löytyvät
+    assert _asiakastunnukset(bomilla) == _asiakastunnukset(ilman_bomia)
+
+
+def test_failed_rows_written_to_csv(tmp_path):
+    content = ORIGINAL_CSV.read_bytes()
+    header, first_row = content.splitlines()[:2]
+    failed_row = first_row.replace(b";1.1.2023;31.12.2023;", b";huono;31.12.2023;", 1)
+    assert failed_row != first_row
+    directory = _write_siirtotiedosto(tmp_path, content.rstrip(b"\r\n") + b"\r\n" + failed_row)
+
+    asiakastunnukset = _asiakastunnukset(directory)
+
+    assert asiakastunnukset == _asiakastunnukset(
+        _write_siirtotiedosto(tmp_path / "ehja", content)
+    )
+    output = directory / get_kohdentumattomat_siirtotiedosto_filename()
+    rows = output.read_text(encoding="cp1252").splitlines()
+    assert len(rows) == 2
+    assert rows[0].startswith("UrakoitsijaId;")
+    assert "huono" in rows[1]
+
+
+def test_kohdentumattomat_not_read(tmp_path):
+    content = ORIGINAL_CSV.read_bytes()
+    directory = _write_siirtotiedosto(tmp_path, content)
+    expected = _asiakastunnukset(directory)
+
+    # Edellisen ajon kohdentumattomat samassa hakemistossa eivät ole syötettä
+    (directory / get_kohdentumattomat_siirtotiedosto_filename()).write_bytes(content)
+
+    assert _asiakastunnukset(directory) == expected
@@ -0,0 +1,90 @@
+import ast
+import os
+from pathlib import Path
+
+import pytest
+from sqlalchemy import Column, Integer, MetaData, Table
+
+from jkrimporter.providers.db import models
+
+CHECKSUM = "0123456789abcdef0123456789abcdef"
+
+
+@pytest.fixture
+def cache_path(tmp_path, monkeypatch):
+    monkeypatch.setattr(models.conf, "get_cache_dir", lambda: tmp_path)
+    return models._metadata_cache_path(CHECKSUM)
+
+
+@pytest.fixture
+def metadata():
+    metadata = MetaData()
+    Table("testi", metadata, Column("id", Integer, primary_key=True), schema="jkr")
+    return metadata
+
+
+def test_all_kattaa_luokat():
+    luokat = {*models._AUTOMAP_CLASSES, *models._DECLARED_CLASSES}
+
+    assert set(models.__all__) == luokat
+    # Staattiset tarkistimet näkevät nimet moduulin tyyppimäärittelyistä
+    tree = ast.parse(Path(models.__file__).read_text(encoding="utf-8"))
+    maaritellyt = {
+        node.target.id
+        for node in tree.body
+        if isinstance(node, ast.AnnAssign) and isinstance(node.target, ast.Name)
+    }
+    assert luokat | {"Base"} <= maaritellyt
+
+
+def test_valimuisti_luetaan(cache_path, metadata):
+    models._save_cached_metadata(cache_path, CHECKSUM, metadata)
+
+    luettu = models._load_cached_metadata(cache_path, CHECKSUM)
+
+    assert list(luettu.tables) == ["jkr.testi"]
+    if hasattr(os, "getuid"):
+        assert cache_path.stat().st_mode & 0o077 == 0
+
+
+def test_valimuisti_eri_tarkistussumma(cache_path, metadata):
+    models._save_cached_metadata(cache_path, CHECKSUM, metadata)
+
+    assert models._load_cached_metadata(cache_path, "f" * 32) is None
+    assert not cache_path.exists()
+
+
+@pytest.mark.parametrize(
+    "muokkaus",
+    [
+        lambda data: data[:-1] + bytes([data[-1] ^ 1]),
+        lambda data: b"ei metadataa",
+        lambda data: b"",
+    ],
+    ids=["muokattu", "roska", "tyhja"],
+)
+def test_valimuisti_viallinen(cache_path, metadata, muokkaus):
+    models._save_cached_metadata(cache_path, CHECKSUM, metadata)
+    cache_path.write_bytes(muokkaus(cache_path.read_bytes()))
+
+    assert models._load_cached_metadata(cache_path, CHECKSUM) is None
+    assert not cache_path.exists()
+
+
+def test_valimuisti_muiden_kirjoitettavissa(cache_path, metadata):
+    if not hasattr(os, "getuid"):
+        pytest.skip("Tiedosto-oikeuksia ei tarkisteta tällä alustalla")
+    models._save_cached_metadata(cache_path, CHECKSUM, metadata)
+    cache_path.chmod(0o666)
+
+    assert models._load_cached_metadata(cache_path, CHECKSUM) is None
+
+
+def test_vanhat_valimuistit_poistetaan(cache_path, metadata):
+    models._save_cached_metadata(cache_path, CHECKSUM, metadata)
+    uusi = models._metadata_cache_path("f" * 32)
+
+    models._save_cached_metadata(uusi, "f" * 32, metadata)
+
+    assert not cache_path.exists()
+    assert models._load_cached_metadata(uusi, "f" * 32) is not None
@@ -0,0 +1,33 @@
+import pytest
+from addrparser import AddressParser
+
+from jkrimporter.utils.osoite import CachedAddressParser
+
+
+def test_cached_address_parser():
+    parser = CachedAddressParser(AddressParser("fi"), maxsize=2)
+
+    first = parser.parse("Testikatu 4 B")
+    assert parser.parse("Testikatu 4 B") is first
+    assert first.street_name == "Testikatu"
+    assert (parser.hits, parser.misses) == (1, 1)
+
+
+def test_cached_address_parser_failure():
+    parser = CachedAddressParser(AddressParser("fi"))
+
+    for _ in range(2):
+        with pytest.raises(ValueError):
+            parser.parse("???")
+    assert (parser.hits, parser.misses) == (1, 1)
+
+
+def test_cached_address_parser_maxsize():
+    parser = CachedAddressParser(AddressParser("fi"), maxsize=2)
+
+    parser.parse("Testikatu 1")
+    parser.parse("Testikatu 2")
+    parser.parse("Testikatu 1")
+    parser.parse("Testikatu 3")
+    parser.parse("Testikatu 2")
+    assert (parser.hits, parser.misses) == (1, 4)
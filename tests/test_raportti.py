@@ -29,18 +29,16 @@ def _make_mock_session(columns=None, rows=None):
     mock_result = MagicMock()
     mock_result.keys.return_value = columns
     mock_result.fetchall.return_value = rows
+    mock_result.__iter__.side_effect = lambda: iter(rows)
 
     mock_session = MagicMock()
     mock_session.execute.return_value = mock_result
     mock_session.__enter__ = MagicMock(return_value=mock_session)
     mock_session.__exit__ = MagicMock(return_value=False)
 
-    mock_session_factory = MagicMock()
-    mock_session_factory.return_value = mock_session
+    mock_session_class = MagicMock(return_value=mock_session)
 
-    mock_scoped = MagicMock(return_value=mock_session_factory)
-
-    return mock_scoped, mock_session
+    return mock_session_class, mock_session
 
 
 runner = CliRunner()
@@ -51,10 +49,10 @@ class TestRaporttiTarkastelupvm:
 
     def test_iso_date_parsed_correctly(self, tmp_path):
         """ISO-muotoinen päivämäärä parsitaan oikein."""
-        mock_scoped, mock_session = _make_mock_session()
+        mock_session_class, mock_session = _make_mock_session()
         output_file = tmp_path / "raportti.xlsx"
 
-        with patch("jkrimporter.cli.jkr.scoped_session", mock_scoped), patch(
+        with patch("jkrimporter.cli.jkr.Session", mock_session_class), patch(
             "jkrimporter.cli.jkr.engine", MagicMock()
         ):
             result = runner.invoke(
@@ -67,10 +65,10 @@ class TestRaporttiTarkastelupvm:
 
     def test_finnish_date_parsed_correctly(self, tmp_path):
         """Suomalainen päivämäärämuoto parsitaan oikein."""
-        mock_scoped, mock_session = _make_mock_session()
+        mock_session_class, mock_session = _make_mock_session()
         output_file = tmp_path / "raportti.xlsx"
 
-        with patch("jkrimporter.cli.jkr.scoped_session", mock_scoped), patch(
+        with patch("jkrimporter.cli.jkr.Session", mock_session_class), patch(
             "jkrimporter.cli.jkr.engine", MagicMock()
         ):
             result = runner.invoke(
@@ -83,10 +81,10 @@ class TestRaporttiTarkastelupvm:
 
     def test_zero_tarkastelupvm_gives_none(self, tmp_path):
         """Arvo '0' tarkastelupvm-parametrille antaa None."""
-        mock_scoped, mock_session = _make_mock_session()
+        mock_session_class, mock_session = _make_mock_session()
         output_file = tmp_path / "raportti.xlsx"
 
-        with patch("jkrimporter.cli.jkr.scoped_session", mock_scoped), patch(
+        with patch("jkrimporter.cli.jkr.Session", mock_session_class), patch(
             "jkrimporter.cli.jkr.engine", MagicMock()
         ):
             result = runner.invoke(
@@ -99,10 +97,10 @@ class TestRaporttiTarkastelupvm:
 
     def test_invalid_date_returns_error(self, tmp_path):
         """Virheellinen päivämäärä aiheuttaa virhepoistumisen."""
-        mock_scoped, mock_session = _make_mock_session()
+        mock_session_class, mock_session = _make_mock_session()
         output_file = tmp_path / "raportti.xlsx"
 
-        with patch("jkrimporter.cli.jkr.scoped_session", mock_scoped), patch(
+        with patch("jkrimporter.cli.jkr.Session", mock_session_class), patch(
             "jkrimporter.cli.jkr.engine", MagicMock()
         ):
             result = runner.invoke(
@@ -113,10 +111,10 @@ class TestRaporttiTarkastelupvm:
 
     def test_invalid_date_format_returns_error(self, tmp_path):
         """Väärässä muodossa oleva päivämäärä aiheuttaa virhepoistumisen."""
-        mock_scoped, mock_session = _make_mock_session()
+        mock_session_class, mock_session = _make_mock_session()
         output_file = tmp_path / "raportti.xlsx"
 
-        with patch("jkrimporter.cli.jkr.scoped_session", mock_scoped), patch(
+        with patch("jkrimporter.cli.jkr.Session", mock_session_class), patch(
             "jkrimporter.cli.jkr.engine", MagicMock()
         ):
             result = runner.invoke(
@@ -131,10 +129,10 @@ class TestRaporttiKuntaFilter:
 
     def test_kunta_zero_string_gives_none(self, tmp_path):
         """Kunta-arvo '0' antaa None-suodattimen."""
-        mock_scoped, mock_session = _make_mock_session()
+        mock_session_class, mock_session = _make_mock_session()
         output_file = tmp_path / "raportti.xlsx"
 
-        with patch("jkrimporter.cli.jkr.scoped_session", mock_scoped), patch(
+        with patch("jkrimporter.cli.jkr.Session", mock_session_class), patch(
             "jkrimporter.cli.jkr.engine", MagicMock()
         ):
             result = runner.invoke(
@@ -147,10 +145,10 @@ class TestRaporttiKuntaFilter:
 
     def test_kunta_name_passed_as_is(self, tmp_path):
         """Kunnan nimi välitetään muuttumattomana."""
-        mock_scoped, mock_session = _make_mock_session()
+        mock_session_class, mock_session = _make_mock_session()
         output_file = tmp_path / "raportti.xlsx"
 
-        with patch("jkrimporter.cli.jkr.scoped_session", mock_scoped), patch(
+        with patch("jkrimporter.cli.jkr.Session", mock_session_class), patch(
             "jkrimporter.cli.jkr.engine", MagicMock()
         ):
             result = runner.invoke(
@@ -163,10 +161,10 @@ class TestRaporttiKuntaFilter:
 
     def test_kunta_other_municipality(self, tmp_path):
         """Muu kunnan nimi välitetään oikein."""
-        mock_scoped, mock_session = _make_mock_session()
+        mock_session_class, mock_session = _make_mock_session()
         output_file = tmp_path / "raportti.xlsx"
 
-        with patch("jkrimporter.cli.jkr.scoped_session", mock_scoped), patch(
+        with patch("jkrimporter.cli.jkr.Session", mock_session_class), patch(
             "jkrimporter.cli.jkr.engine", MagicMock()
         ):
             result = runner.invoke(
@@ -183,10 +181,10 @@ class TestRaporttiOnkoViemariFilter:
 
     def test_onko_viemari_zero_gives_none(self, tmp_path):
         """Arvo 0 antaa None (ei rajausta)."""
-        mock_scoped, mock_session = _make_mock_session()
+        mock_session_class, mock_session = _make_mock_session()
         output_file = tmp_path / "raportti.xlsx"
 
-        with patch("jkrimporter.cli.jkr.scoped_session", mock_scoped), patch(
+        with patch("jkrimporter.cli.jkr.Session", mock_session_class), patch(
             "jkrimporter.cli.jkr.engine", MagicMock()
         ):
             result = runner.invoke(
@@ -199,10 +197,10 @@ class TestRaporttiOnkoViemariFilter:
 
     def test_onko_viemari_one_gives_true(self, tmp_path):
         """Arvo 1 antaa True (viemäriverkossa)."""
-        mock_scoped, mock_session = _make_mock_session()
+        mock_session_class, mock_session = _make_mock_session()
         output_file = tmp_path / "raportti.xlsx"
 
-        with patch("jkrimporter.cli.jkr.scoped_session", mock_scoped), patch(
+        with patch("jkrimporter.cli.jkr.Session", mock_session_class), patch(
             "jkrimporter.cli.jkr.engine", MagicMock()
         ):
             result = runner.invoke(
@@ -215,10 +213,10 @@ class TestRaporttiOnkoViemariFilter:
 
     def test_onko_viemari_two_gives_false(self, tmp_path):
         """Arvo 2 antaa False (ei viemäriverkossa)."""
-        mock_scoped, mock_session = _make_mock_session()
+        mock_session_class, mock_session = _make_mock_session()
         output_file = tmp_path / "raportti.xlsx"
 
-        with patch("jkrimporter.cli.jkr.scoped_session", mock_scoped), patch(
+        with patch("jkrimporter.cli.jkr.Session", mock_session_class), patch(
             "jkrimporter.cli.jkr.engine", MagicMock()
         ):
             result = runner.invoke(
@@ -235,10 +233,10 @@ class TestRaporttiKohdetyyppiFilter:
 
     def test_kohdetyyppi_zero_gives_none(self, tmp_path):
         """Arvo 0 antaa None (ei rajausta)."""
-        mock_scoped, mock_session = _make_mock_session()
+        mock_session_class, mock_session = _make_mock_session()
         output_file = tmp_path / "raportti.xlsx"
 
-        with patch("jkrimporter.cli.jkr.scoped_session", mock_scoped), patch(
+        with patch("jkrimporter.cli.jkr.Session", mock_session_class), patch(
             "jkrimporter.cli.jkr.engine", MagicMock()
         ):
             result = runner.invoke(
@@ -251,10 +249,10 @@ class TestRaporttiKohdetyyppiFilter:
 
     def test_kohdetyyppi_hapa(self, tmp_path):
         """Kohdetyyppi 5 (hapa) välitetään oikein."""
-        mock_scoped, mock_session = _make_mock_session()
+        mock_session_class, mock_session = _make_mock_session()
         output_file = tmp_path / "raportti.xlsx"
 
-        with patch("jkrimporter.cli.jkr.scoped_session", mock_scoped), patch(
+        with patch("jkrimporter.cli.jkr.Session", mock_session_class), patch(
             "jkrimporter.cli.jkr.engine", MagicMock()
         ):
             result = runner.invoke(
@@ -267,10 +265,10 @@ class TestRaporttiKohdetyyppiFilter:
 
     def test_kohdetyyppi_biohapa(self, tmp_path):
         """Kohdetyyppi 6 (biohapa) välitetään oikein."""
-        mock_scoped, mock_session = _make_mock_session()
+        mock_session_class, mock_session = _make_mock_session()
         output_file = tmp_path / "raportti.xlsx"
 
-        with patch("jkrimporter.cli.jkr.scoped_session", mock_scoped), patch(
+        with patch("jkrimporter.cli.jkr.Session", mock_session_class), patch(
             "jkrimporter.cli.jkr.engine", MagicMock()
         ):
             result = runner.invoke(
@@ -283,10 +281,10 @@ class TestRaporttiKohdetyyppiFilter:
 
     def test_kohdetyyppi_asuinkiinteisto(self, tmp_path):
         """Kohdetyyppi 7 (asuinkiinteistö) välitetään oikein."""
-        mock_scoped, mock_session = _make_mock_session()
+        mock_session_class, mock_session = _make_mock_session()
         output_file = tmp_path / "raportti.xlsx"
 
-        with patch("jkrimporter.cli.jkr.scoped_session", mock_scoped), patch(
+        with patch("jkrimporter.cli.jkr.Session", mock_session_class), patch(
             "jkrimporter.cli.jkr.engine", MagicMock()
         ):
             result = runner.invoke(
@@ -299,10 +297,10 @@ class TestRaporttiKohdetyyppiFilter:
 
     def test_kohdetyyppi_muu(self, tmp_path):
         """Kohdetyyppi 8 (muu) välitetään oikein."""
-        mock_scoped, mock_session = _make_mock_session()
+        mock_session_class, mock_session = _make_mock_session()
         output_file = tmp_path / "raportti.xlsx"
 
-        with patch("jkrimporter.cli.jkr.scoped_session", mock_scoped), patch(
+        with patch("jkrimporter.cli.jkr.Session", mock_session_class), patch(
             "jkrimporter.cli.jkr.engine", MagicMock()
         ):
             result = runner.invoke(
@@ -328,10 +326,10 @@ class TestRaporttiTaajamaFilter:
 
     def test_taajama_zero_gives_both_none(self, tmp_path):
         """Taajama-arvo 0 antaa molemmat None."""
-        mock_scoped, mock_session = _make_mock_session()
+        mock_session_class, mock_session = _make_mock_session()
         output_file = tmp_path / "raportti.xlsx"
 
-        with patch("jkrimporter.cli.jkr.scoped_session", mock_scoped), patch(
+        with patch("jkrimporter.cli.jkr.Session", mock_session_class), patch(
             "jkrimporter.cli.jkr.engine", MagicMock()
         ):
             result = runner.invoke(
@@ -345,10 +343,10 @@ class TestRaporttiTaajamaFilter:
 
     def test_taajama_2_gives_10000_true_200_none(self, tmp_path):
         """Taajama-arvo 2 antaa taajama_10000=True ja taajama_200=None."""
-        mock_scoped, mock_session = _make_mock_session()
+        mock_session_class, mock_session = _make_mock_session()
         output_file = tmp_path / "raportti.xlsx"
 
-        with patch("jkrimporter.cli.jkr.scoped_session", mock_scoped), patch(
+        with patch("jkrimporter.cli.jkr.Session", mock_session_class), patch(
             "jkrimporter.cli.jkr.engine", MagicMock()
         ):
             result = runner.invoke(
@@ -362,10 +360,10 @@ class TestRaporttiTaajamaFilter:
 
     def test_taajama_1_gives_10000_none_200_true(self, tmp_path):
         """Taajama-arvo 1 antaa taajama_10000=None ja taajama_200=True."""
-        mock_scoped, mock_session = _make_mock_session()
+        mock_session_class, mock_session = _make_mock_session()
         output_file = tmp_path / "raportti.xlsx"
 
-        with patch("jkrimporter.cli.jkr.scoped_session", mock_scoped), patch(
+        with patch("jkrimporter.cli.jkr.Session", mock_session_class), patch(
             "jkrimporter.cli.jkr.engine", MagicMock()
         ):
             result = runner.invoke(
@@ -379,10 +377,10 @@ class TestRaporttiTaajamaFilter:
 
     def test_taajama_3_gives_both_true(self, tmp_path):
         """Taajama-arvo 3 antaa molemmat True."""
-        mock_scoped, mock_session = _make_mock_session()
+        mock_session_class, mock_session = _make_mock_session()
         output_file = tmp_path / "raportti.xlsx"
 
-        with patch("jkrimporter.cli.jkr.scoped_session", mock_scoped), patch(
+        with patch("jkrimporter.cli.jkr.Session", mock_session_class), patch(
             "jkrimporter.cli.jkr.engine", MagicMock()
         ):
             result = runner.invoke(
@@ -396,10 +394,10 @@ class TestRaporttiTaajamaFilter:
 
     def test_taajama_10000_gives_10000_true_200_none(self, tmp_path):
         """Taajama-arvo 10000 antaa taajama_10000=True ja taajama_200=None."""
-        mock_scoped, mock_session = _make_mock_session()
+        mock_session_class, mock_session = _make_mock_session()
         output_file = tmp_path / "raportti.xlsx"
 
-        with patch("jkrimporter.cli.jkr.scoped_session", mock_scoped), patch(
+        with patch("jkrimporter.cli.jkr.Session", mock_session_class), patch(
             "jkrimporter.cli.jkr.engine", MagicMock()
         ):
             result = runner.invoke(
@@ -413,10 +411,10 @@ class TestRaporttiTaajamaFilter:
 
     def test_taajama_200_gives_10000_none_200_true(self, tmp_path):
         """Taajama-arvo 200 antaa taajama_10000=None ja taajama_200=True."""
-        mock_scoped, mock_session = _make_mock_session()
+        mock_session_class, mock_session = _make_mock_session()
         output_file = tmp_path / "raportti.xlsx"
 
-        with patch("jkrimporter.cli.jkr.scoped_session", mock_scoped), patch(
+        with patch("jkrimporter.cli.jkr.Session", mock_session_class), patch(
             "jkrimporter.cli.jkr.engine", MagicMock()
         ):
             result = runner.invoke(
@@ -434,10 +432,10 @@ class TestRaporttiHuoneistomaara:
 
     def test_huoneistomaara_zero_passed_as_zero(self, tmp_path):
         """Huoneistomäärä 0 välitetään nollana (ei rajausta)."""
-        mock_scoped, mock_session = _make_mock_session()
+        mock_session_class, mock_session = _make_mock_session()
         output_file = tmp_path / "raportti.xlsx"
 
-        with patch("jkrimporter.cli.jkr.scoped_session", mock_scoped), patch(
+        with patch("jkrimporter.cli.jkr.Session", mock_session_class), patch(
             "jkrimporter.cli.jkr.engine", MagicMock()
         ):
             result = runner.invoke(
@@ -450,10 +448,10 @@ class TestRaporttiHuoneistomaara:
 
     def test_huoneistomaara_four_passed_as_four(self, tmp_path):
         """Huoneistomäärä 4 välitetään nelosena (enintään 4 huoneistoa)."""
-        mock_scoped, mock_session = _make_mock_session()
+        mock_session_class, mock_session = _make_mock_session()
         output_file = tmp_path / "raportti.xlsx"
 
-        with patch("jkrimporter.cli.jkr.scoped_session", mock_scoped), patch(
+        with patch("jkrimporter.cli.jkr.Session", mock_session_class), patch(
             "jkrimporter.cli.jkr.engine", MagicMock()
         ):
             result = runner.invoke(
@@ -466,10 +464,10 @@ class TestRaporttiHuoneistomaara:
 
     def test_huoneistomaara_five_passed_as_five(self, tmp_path):
         """Huoneistomäärä 5 välitetään viitosena (vähintään 5 huoneistoa)."""
-        mock_scoped, mock_session = _make_mock_session()
+        mock_session_class, mock_session = _make_mock_session()
         output_file = tmp_path / "raportti.xlsx"
 
-        with patch("jkrimporter.cli.jkr.scoped_session", mock_scoped), patch(
+        with patch("jkrimporter.cli.jkr.Session", mock_session_class), patch(
             "jkrimporter.cli.jkr.engine", MagicMock()
         ):
             result = runner.invoke(
@@ -488,10 +486,10 @@ class TestRaporttiExcelOutput:
         """Excel-tiedosto luodaan onnistuneesti."""
         columns = ["Kohde_id", "Nimi", "Osoite"]
         rows = [(1, "Testi Kohde", "Testikatu 1")]
-        mock_scoped, mock_session = _make_mock_session(columns=columns, rows=rows)
+        mock_session_class, mock_session = _make_mock_session(columns=columns, rows=rows)
         output_file = tmp_path / "raportti.xlsx"
 
-        with patch("jkrimporter.cli.jkr.scoped_session", mock_scoped), patch(
+        with patch("jkrimporter.cli.jkr.Session", mock_session_class), patch(
             "jkrimporter.cli.jkr.engine", MagicMock()
         ):
             result = runner.invoke(
@@ -507,10 +505,10 @@ class TestRaporttiExcelOutput:
 
         columns = ["Kohde_id", "Nimi", "Osoite"]
         rows = [(1, "Testi Kohde", "Testikatu 1")]
-        mock_scoped, mock_session = _make_mock_session(columns=columns, rows=rows)
+        mock_session_class, mock_session = _make_mock_session(columns=columns, rows=rows)
         output_file = tmp_path / "raportti.xlsx"
 
-        with patch("jkrimporter.cli.jkr.scoped_session", mock_scoped), patch(
+        with patch("jkrimporter.cli.jkr.Session", mock_session_class), patch(
             "jkrimporter.cli.jkr.engine", MagicMock()
         ):
             result = runner.invoke(
@@ -528,10 +526,10 @@ class TestRaporttiExcelOutput:
 
         columns = ["Kohde_id", "Nimi"]
         rows = [(42, "Testi"), (99, "Toinen")]
-        mock_scoped, mock_session = _make_mock_session(columns=columns, rows=rows)
+        mock_session_class, mock_session = _make_mock_session(columns=columns, rows=rows)
         output_file = tmp_path / "raportti.xlsx"
 
-        with patch("jkrimporter.cli.jkr.scoped_session", mock_scoped), patch(
+        with patch("jkrimporter.cli.jkr.Session", mock_session_class), patch(
             "jkrimporter.cli.jkr.engine", MagicMock()
         ):
             result = runner.invoke(
@@ -548,10 +546,10 @@ class TestRaporttiExcelOutput:
 
     def test_excel_file_empty_result(self, tmp_path):
         """Excel-tiedosto luodaan myös tyhjällä tuloksella."""
-        mock_scoped, mock_session = _make_mock_session(columns=["id"], rows=[])
+        mock_session_class, mock_session = _make_mock_session(columns=["id"], rows=[])
         output_file = tmp_path / "raportti.xlsx"
 
-        with patch("jkrimporter.cli.jkr.scoped_session", mock_scoped), patch(
+        with patch("jkrimporter.cli.jkr.Session", mock_session_class), patch(
             "jkrimporter.cli.jkr.engine", MagicMock()
         ):
             result = runner.invoke(
@@ -563,10 +561,10 @@ class TestRaporttiExcelOutput:
 
     def test_success_message_printed(self, tmp_path):
         """Onnistumisilmoitus tulostetaan."""
-        mock_scoped, mock_session = _make_mock_session()
+        mock_session_class, mock_session = _make_mock_session()
         output_file = tmp_path / "raportti.xlsx"
 
-        with patch("jkrimporter.cli.jkr.scoped_session", mock_scoped), patch(
+        with patch("jkrimporter.cli.jkr.Session", mock_session_class), patch(
             "jkrimporter.cli.jkr.engine", MagicMock()
         ):
             result = runner.invoke(
@@ -577,15 +575,180 @@ class TestRaporttiExcelOutput:
         assert "onnistuneesti" in result.output
 
 
+class TestWriteXlsx:
+    """Testit raportin Excel-kirjoittimelle."""
+
+    def test_rows_from_generator(self, tmp_path):
+        """Rivit voivat tulla iteraattorista, jota luetaan vain kerran."""
+        import openpyxl
+
+        from jkrimporter.utils import raportti
+
+        output_file = tmp_path / "raportti.xlsx"
+        rows = ((i, f"kohde {i}", date(2024, 1, 1)) for i in range(2500))
+
+        count = raportti.write_xlsx(output_file, ["id", "nimi", "pvm"], rows)
+
+        assert count == 2500
+        ws = openpyxl.load_workbook(output_file).active
+        assert ws.max_row == 2501
+        assert ws.cell(row=2501, column=2).value == "kohde 2499"
+        assert ws.cell(row=2, column=3).value.date() == date(2024, 1, 1)
+
+    def test_column_widths_from_sample(self, tmp_path):
+        """Sarakeleveydet lasketaan otsikosta ja ensimmäisistä riveistä."""
+        import openpyxl
+
+        from jkrimporter.utils import raportti
+
+        output_file = tmp_path / "raportti.xlsx"
+        rows = [(1, None), (2, "pitkä nimi"), (3, "x" * 50)]
+
+        with patch.object(raportti, "WIDTH_SAMPLE_ROWS", 2):
+            raportti.write_xlsx(output_file, ["id", "nimi"], rows)
+
+        ws = openpyxl.load_workbook(output_file).active
+        assert ws.column_dimensions["A"].width == len("id") + 2
+        assert ws.column_dimensions["B"].width == len("pitkä nimi") + 2
+        assert ws.cell(row=4, column=2).value == "x" * 50
+
+
+class TestRaporttiFormaatti:
+    """Testit --format-valinnalle."""
+
+    def test_parquet_without_pyarrow_fails_before_query(self, tmp_path, capsys):
+        """Puuttuvasta pyarrow-paketista kerrotaan ennen kyselyä."""
+        import sys
+
+        import typer
+
+        from jkrimporter.cli.jkr import raportti
+        from jkrimporter.utils.raportti import Raporttimuoto
+
+        mock_session_class, mock_session = _make_mock_session()
+        output_file = tmp_path / "raportti.parquet"
+
+        with patch("jkrimporter.cli.jkr.Session", mock_session_class), patch(
+            "jkrimporter.cli.jkr.engine", MagicMock()
+        ), patch.dict(sys.modules, {"pyarrow": None}):
+            with pytest.raises(typer.Exit) as exc_info:
+                raportti(
+                    output_file, "2024-01-01", "0", 0, 0, 0, 0,
+                    formaatti=Raporttimuoto.parquet,
+                )
+
+        assert exc_info.value.exit_code == 1
+        assert "pip install pyarrow" in capsys.readouterr().err
+        mock_session.execute.assert_not_called()
+        assert not output_file.exists()
+
+    @pytest.mark.parametrize(
+        "polku, formaatti, odotettu",
+        [
+            ("raportti.xlsx", None, "xlsx"),
+            ("raportti.CSV", None, "csv"),
+            ("raportti.parquet", None, "parquet"),
+            ("raportti.csv", "csv", "csv"),
+            ("raportti.txt", "csv", "csv"),
+            ("raportti", "parquet", "parquet"),
+        ],
+    )
+    def test_format_from_suffix(self, polku, formaatti, odotettu):
+        """Tiedostomuoto päätellään päätteestä, jos sitä ei anneta."""
+        from jkrimporter.utils.raportti import Raporttimuoto, raporttimuoto_polusta
+
+        annettu = Raporttimuoto(formaatti) if formaatti else None
+
+        assert raporttimuoto_polusta(Path(polku), annettu) == Raporttimuoto(odotettu)
+
+    @pytest.mark.parametrize(
+        "polku, formaatti",
+        [("raportti.csv", "xlsx"), ("raportti.xlsx", "parquet"), ("raportti.txt", None)],
+    )
+    def test_format_suffix_mismatch(self, polku, formaatti):
+        """Päätettä vastaamaton tai tuntematon muoto hylätään."""
+        from jkrimporter.utils.raportti import Raporttimuoto, raporttimuoto_polusta
+
+        annettu = Raporttimuoto(formaatti) if formaatti else None
+
+        with pytest.raises(ValueError):
+            raporttimuoto_polusta(Path(polku), annettu)
+
+    def test_cli_format_from_suffix(self, tmp_path):
+        """Ilman --format-valintaa CSV-polkuun kirjoitetaan CSV."""
+        from jkrimporter.utils.raportti import Raporttimuoto
+
+        output_file = tmp_path / "raportti.csv"
+
+        with patch("jkrimporter.cli.jkr.Session", MagicMock()), patch(
+            "jkrimporter.cli.jkr.engine", MagicMock()
+        ), patch("jkrimporter.cli.jkr.kirjoita_raportti") as mock_kirjoita:
+            result = runner.invoke(
+                app, ["raportti", str(output_file), "2024-01-01", "0", "0", "0", "0", "0"]
+            )
+
+        assert result.exit_code == 0
+        assert mock_kirjoita.call_args[0][3] == Raporttimuoto.csv
+
+    def test_cli_format_mismatch_fails_before_query(self, tmp_path):
+        """Päätettä vastaamaton --format hylätään ennen kyselyä."""
+        mock_session_class, mock_session = _make_mock_session()
+        output_file = tmp_path / "raportti.csv"
+
+        with patch("jkrimporter.cli.jkr.Session", mock_session_class), patch(
+            "jkrimporter.cli.jkr.engine", MagicMock()
+        ):
+            result = runner.invoke(
+                app,
+                [
+                    "raportti", str(output_file), "2024-01-01", "0", "0", "0", "0", "0",
+                    "--format", "xlsx",
+                ],
+            )
+
+        assert result.exit_code == 1
+        mock_session.execute.assert_not_called()
+        assert not output_file.exists()
+
+    def test_copy_csv(self, tmp_path):
+        """CSV kirjoitetaan COPY-komennolla annetuin parametrein."""
+        from jkrimporter.utils.raportti import copy_csv
+
+        cursor = MagicMock()
+        cursor.mogrify.return_value = b"SELECT * FROM jkr.print_report('2024-01-01')"
+        cursor.copy_expert.side_effect = lambda sql, f: f.write("kohde_id;nimi\n1;Testi\n")
+        cursor.rowcount = 1
+        connection = MagicMock()
+        connection.cursor.return_value.__enter__.return_value = cursor
+        output_file = tmp_path / "raportti.csv"
+
+        count = copy_csv(
+            connection,
+            "SELECT * FROM jkr.print_report(%(tarkastelupvm)s)",
+            {"tarkastelupvm": date(2024, 1, 1)},
+            output_file,
+        )
+
+        assert count == 1
+        cursor.mogrify.assert_called_once_with(
+            "SELECT * FROM jkr.print_report(%(tarkastelupvm)s)",
+            {"tarkastelupvm": date(2024, 1, 1)},
+        )
+        copy_sql = cursor.copy_expert.call_args[0][0]
+        assert copy_sql.startswith(b"COPY (SELECT * FROM jkr.print_report('2024-01-01')) TO STDOUT")
+        assert b"FORMAT csv" in copy_sql and b"HEADER true" in copy_sql
+        assert output_file.read_text(encoding="utf-8") == "kohde_id;nimi\n1;Testi\n"
+
+
 class TestRaporttiKombinoidutSuodattimet:
     """Testit useampien suodattimien yhdistelmille."""
 
     def test_all_filters_set(self, tmp_path):
         """Kaikki suodattimet asetettu kerralla."""
-        mock_scoped, mock_session = _make_mock_session()
+        mock_session_class, mock_session = _make_mock_session()
         output_file = tmp_path / "raportti.xlsx"
 
-        with patch("jkrimporter.cli.jkr.scoped_session", mock_scoped), patch(
+        with patch("jkrimporter.cli.jkr.Session", mock_session_class), patch(
             "jkrimporter.cli.jkr.engine", MagicMock()
         ):
             result = runner.invoke(
@@ -614,10 +777,10 @@ class TestRaporttiKombinoidutSuodattimet:
 
     def test_no_filters_all_none(self, tmp_path):
         """Ilman suodattimia kaikki arvot None/0."""
-        mock_scoped, mock_session = _make_mock_session()
+        mock_session_class, mock_session = _make_mock_session()
         output_file = tmp_path / "raportti.xlsx"
 
-        with patch("jkrimporter.cli.jkr.scoped_session", mock_scoped), patch(
+        with patch("jkrimporter.cli.jkr.Session", mock_session_class), patch(
             "jkrimporter.cli.jkr.engine", MagicMock()
         ):
             result = runner.invoke(
@@ -636,10 +799,10 @@ class TestRaporttiKombinoidutSuodattimet:
 
     def test_kunta_with_viemari_filter(self, tmp_path):
         """Kunta ja viemärisuodatin yhdistettynä."""
-        mock_scoped, mock_session = _make_mock_session()
+        mock_session_class, mock_session = _make_mock_session()
         output_file = tmp_path / "raportti.xlsx"
 
-        with patch("jkrimporter.cli.jkr.scoped_session", mock_scoped), patch(
+        with patch("jkrimporter.cli.jkr.Session", mock_session_class), patch(
             "jkrimporter.cli.jkr.engine", MagicMock()
         ):
             result = runner.invoke(
@@ -663,10 +826,10 @@ class TestRaporttiKombinoidutSuodattimet:
 
     def test_kohdetyyppi_with_taajama_filter(self, tmp_path):
         """Kohdetyyppi ja taajama yhdistettynä."""
-        mock_scoped, mock_session = _make_mock_session()
+        mock_session_class, mock_session = _make_mock_session()
         output_file = tmp_path / "raportti.xlsx"
 
-        with patch("jkrimporter.cli.jkr.scoped_session", mock_scoped), patch(
+        with patch("jkrimporter.cli.jkr.Session", mock_session_class), patch(
             "jkrimporter.cli.jkr.engine", MagicMock()
         ):
             result = runner.invoke(
@@ -695,10 +858,10 @@ class TestRaporttiSqlQuery:
 
     def test_print_report_function_called(self, tmp_path):
         """print_report-funktio kutsutaan tietokannasta."""
-        mock_scoped, mock_session = _make_mock_session()
+        mock_session_class, mock_session = _make_mock_session()
         output_file = tmp_path / "raportti.xlsx"
 
-        with patch("jkrimporter.cli.jkr.scoped_session", mock_scoped), patch(
+        with patch("jkrimporter.cli.jkr.Session", mock_session_class), patch(
             "jkrimporter.cli.jkr.engine", MagicMock()
         ):
             result = runner.invoke(
@@ -712,10 +875,10 @@ class TestRaporttiSqlQuery:
 
     def test_all_required_params_passed_to_sql(self, tmp_path):
         """Kaikki vaaditut parametrit välitetään SQL-kyselylle."""
-        mock_scoped, mock_session = _make_mock_session()
+        mock_session_class, mock_session = _make_mock_session()
         output_file = tmp_path / "raportti.xlsx"
 
-        with patch("jkrimporter.cli.jkr.scoped_session", mock_scoped), patch(
+        with patch("jkrimporter.cli.jkr.Session", mock_session_class), patch(
             "jkrimporter.cli.jkr.engine", MagicMock()
         ):
             result = runner.invoke(
@@ -734,3 +897,176 @@ class TestRaporttiSqlQuery:
             "onko_viemari",
         }
         assert expected_keys == set(params.keys())
+
+
+class TestLasketutRaportit:
+    """Testit valmiiksi laskettujen raporttirivien päivitykselle."""
+
+    def test_paivita_lasketut_raportit(self):
+        """Kaikki lasketut tarkastelupäivät päivitetään."""
+        from jkrimporter.providers.db.services import raportti
+
+        session = MagicMock()
+        pvmt = [date(2024, 1, 1), date(2024, 6, 30)]
+        with patch.object(raportti, "lasketut_tarkastelupvmt", return_value=pvmt), patch.object(
+            raportti, "paivita_raportin_kohteet", side_effect=[10, 12]
+        ) as paivita:
+            assert raportti.paivita_lasketut_raportit(session) == {
+                date(2024, 1, 1): 10,
+                date(2024, 6, 30): 12,
+            }
+        assert [c.args[1] for c in paivita.call_args_list] == pvmt
+
+    def test_epaonnistunut_paivitys_poistaa_rivit(self):
+        """Epäonnistuneen päivityksen jälkeen vanhentuneita rivejä ei jätetä."""
+        from sqlalchemy.exc import OperationalError
+
+        from jkrimporter.providers.db.services import raportti
+
+        session = MagicMock()
+        with patch.object(
+            raportti, "lasketut_tarkastelupvmt", return_value=[date(2024, 1, 1)]
+        ), patch.object(
+            raportti,
+            "paivita_raportin_kohteet",
+            side_effect=OperationalError("SELECT", {}, Exception("timeout")),
+        ), patch.object(raportti, "poista_raportin_kohteet") as poista:
+            assert raportti.paivita_lasketut_raportit(session) == {}
+        session.rollback.assert_called_once()
+        poista.assert_called_once_with(session)
+
+    def test_raportti_laske_ilman_paivaa_paivittaa_kaikki(self):
+        """raportti_laske ilman päivämäärää laskee kaikki lasketut päivät."""
+        with patch("jkrimporter.cli.jkr.Session"), patch(
+            "jkrimporter.providers.db.services.raportti.paivita_lasketut_raportit",
+            return_value={date(2024, 1, 1): 10},
+        ) as paivita:
+            result = runner.invoke(app, ["raportti_laske"])
+
+        assert result.exit_code == 0
+        paivita.assert_called_once()
+        assert "2024-01-01: 10 kohdetta" in result.output
+
+    def test_paivitys_vain_valinnalla(self, tmp_path):
+        """Lasketut raportit päivitetään komennon jälkeen vain --paivita-raportit-valinnalla."""
+        output_file = tmp_path / "raportti.xlsx"
+        komento = ["raportti", str(output_file), "2024-01-01", "0", "0", "0", "0", "0"]
+        jarjestys = []
+
+        with patch("jkrimporter.cli.jkr.Session", MagicMock()), patch(
+            "jkrimporter.cli.jkr.engine", MagicMock()
+        ), patch(
+            "jkrimporter.cli.jkr.kirjoita_raportti",
+            side_effect=lambda *args: jarjestys.append("raportti"),
+        ), patch("jkrimporter.cli.jkr.Session"), patch(
+            "jkrimporter.providers.db.services.raportti.paivita_lasketut_raportit",
+            side_effect=lambda session: jarjestys.append("paivitys") or {},
+        ):
+            assert runner.invoke(app, komento).exit_code == 0
+            assert jarjestys == ["raportti"]
+
+            jarjestys.clear()
+            assert runner.invoke(app, ["--paivita-raportit", *komento]).exit_code == 0
+            assert jarjestys == ["raportti", "paivitys"]
+
+
+class TestRaporttiErat:
+    """Testit useiden raporttien rinnakkaiselle luonnille."""
+
+    def test_lue_raporttiajot(self, tmp_path):
+        """Kunta * tuottaa ajon jokaiselle kunnalle, muut rivit sellaisenaan."""
+        from jkrimporter.providers.db.services.raportti import lue_raporttiajot
+
+        ajot_file = tmp_path / "ajot.csv"
+        ajot_file.write_text(
+            "tarkastelupvm;kunta;huoneistomaara;taajama;kohde_tyyppi;onko_viemari\n"
+            "2024-01-01;*;0;0;0;0\n"
+            "0;Hollola;4;3;7;1\n",
+            encoding="utf-8",
+        )
+
+        ajot = lue_raporttiajot(ajot_file, ["Lahti", "Orimattila"])
+
+        assert [ajo.params["kunta"] for ajo in ajot] == ["Lahti", "Orimattila", "Hollola"]
+        assert ajot[0].params["tarkastelupvm"] == date(2024, 1, 1)
+        assert ajot[2].params == {
+            "tarkastelupvm": None,
+            "kunta": "Hollola",
+            "huoneistomaara": 4,
+            "taajama_10000": True,
+            "taajama_200": True,
+            "kohde_tyyppi_id": 7,
+            "onko_viemari": True,
+        }
+        assert ajot[0].nimi == "001_2024-01-01_Lahti_0_0_0_0"
+        assert len({ajo.nimi for ajo in ajot}) == len(ajot)
+
+    def test_lue_raporttiajot_tyhjat_solut(self, tmp_path):
+        """Tyhjät solut tulkitaan nolliksi eli ilman rajausta."""
+        from jkrimporter.providers.db.services.raportti import lue_raporttiajot
+
+        ajot_file = tmp_path / "ajot.csv"
+        ajot_file.write_text(
+            "tarkastelupvm;kunta;huoneistomaara;taajama;kohde_tyyppi;onko_viemari\n"
+            "2024-01-01;Lahti;;;;\n"
+            "2024-01-01;Lahti;0;0;0;0\n"
+            ";;4\n",
+            encoding="utf-8",
+        )
+
+        ajot = lue_raporttiajot(ajot_file, [])
+
+        assert ajot[0].nimi == "001_2024-01-01_Lahti_0_0_0_0"
+        assert ajot[0].params == ajot[1].params == {
+            "tarkastelupvm": date(2024, 1, 1),
+            "kunta": "Lahti",
+            "huoneistomaara": 0,
+            "taajama_10000": None,
+            "taajama_200": None,
+            "kohde_tyyppi_id": None,
+            "onko_viemari": None,
+        }
+        # Lyhyen rivin puuttuvat solut ovat myös tyhjiä
+        assert ajot[2].nimi == "003_0_0_4_0_0_0"
+        assert ajot[2].params["tarkastelupvm"] is None
+        assert ajot[2].params["kunta"] is None
+        assert ajot[2].params["huoneistomaara"] == 4
+
+    def test_lue_raporttiajot_puuttuva_sarake(self, tmp_path):
+        """Puuttuvasta sarakkeesta kerrotaan."""
+        from jkrimporter.providers.db.services.raportti import lue_raporttiajot
+
+        ajot_file = tmp_path / "ajot.csv"
+        ajot_file.write_text("tarkastelupvm;kunta\n2024-01-01;Lahti\n", encoding="utf-8")
+
+        with pytest.raises(ValueError, match="huoneistomaara"):
+            lue_raporttiajot(ajot_file, [])
+
+    def test_aja_raportit(self, tmp_path):
+        """Jokainen raportti kirjoitetaan omaan tiedostoonsa omalla istunnollaan
+        ja virheellinen raportti ei keskeytä muita."""
+        from jkrimporter.providers.db.services import raportti
+        from jkrimporter.utils.raportti import Raporttimuoto
+
+        ajot = [
+            raportti.Raporttiajo(nimi=f"00{i}_Lahti", params={"kunta": kunta})
+            for i, kunta in enumerate(["Lahti", "virhe", "Hollola"], start=1)
+        ]
+
+        def kirjoita(session, params, output_path, formaatti):
+            if params["kunta"] == "virhe":
+                raise RuntimeError("yhteys katkesi")
+            return len(params["kunta"])
+
+        with patch.object(raportti, "Session") as session, patch.object(
+            raportti, "kirjoita_raportti", side_effect=kirjoita
+        ):
+            tulokset = raportti.aja_raportit(
+                ajot, tmp_path / "raportit", Raporttimuoto.csv, 2
+            )
+
+        assert session.call_count == 3
+        assert [tulos.riveja for tulos in tulokset] == [5, None, 7]
+        assert tulokset[1].virhe == "yhteys katkesi"
+        assert tulokset[0].polku == tmp_path / "raportit" / "001_Lahti.csv"
+        assert (tmp_path / "raportit").is_dir()